@@ -0,0 +1,211 @@
+import contextlib
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+# Admission control: every block reserves CPU and memory on the host before
+# its container starts and gives them back when it exits. Blocks wait while
+# their reservation does not fit, so concurrent pipelines pack the host
+# instead of oversubscribing it. Reservations start from per-language,
+# per-profile estimates and follow the peak memory containers are observed
+# to use; the same numbers become the container's --memory/--cpus limits.
+# A loop host reserves the runtimes its nested blocks start together with its
+# own container, so it never waits on the host while holding a reservation.
+
+def _host_memory_mb() -> int:
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 4096
+
+# Share of the host that blocks may reserve
+HOST_CPUS = float(os.environ.get('POLYGLOT_HOST_CPUS', str(os.cpu_count() or 1)))
+HOST_MEMORY_MB = int(os.environ.get('POLYGLOT_HOST_MEMORY_MB', str(_host_memory_mb() * 8 // 10)))
+
+# A block still waiting after this long is rejected rather than overcommitting the host
+ADMISSION_TIMEOUT = float(os.environ.get('POLYGLOT_ADMISSION_TIMEOUT', '30'))
+
+# (cpus, memory MB) per (language, runtime profile) until peaks are observed
+DEFAULT_ESTIMATES: Dict[Tuple[str, str], Tuple[float, int]] = {
+    ('c', 'fast'): (0.5, 64),
+    ('c', 'optimized'): (1.0, 128),
+    ('py', 'fast'): (0.5, 128),
+    ('py', 'optimized'): (1.0, 256),
+    ('java', 'fast'): (1.0, 512),
+    ('java', 'optimized'): (2.0, 1024),
+}
+
+# Observed peaks are smoothed, then padded so a slightly bigger run is not OOM killed.
+# They only ever raise an estimate: the estimate is also the container's memory
+# limit, and samples about a second apart miss short peaks such as the compiler's.
+PEAK_SMOOTHING = 0.3
+PEAK_HEADROOM = 2.0
+
+
+class AdmissionTimeout(RuntimeError):
+    """A block did not fit on the host within ADMISSION_TIMEOUT"""
+
+
+class Reservation:
+    """
+    CPU and memory held by one block from admission until its container exits.
+    Besides the container's own share it may hold one share per language for
+    the nested runtimes the block starts; those draw from it while it hosts them.
+    """
+
+    def __init__(self, controller: 'AdmissionController', key: Tuple[str, str], cpus: float, memory_mb: int,
+                 shares: Optional[Dict[str, Tuple[float, int]]] = None, parent: Optional['Reservation'] = None):
+        self.controller = controller
+        self.key = key
+        self.cpus = cpus
+        self.memory_mb = memory_mb
+        self.shares = shares or {}
+        self.drawn = set()
+        self.parent = parent
+        self.released = False
+
+    @property
+    def held(self) -> Tuple[float, int]:
+        """CPU and memory taken from the host: the container's share and its nested runtimes'"""
+        return (self.cpus + sum(cpus for cpus, _ in self.shares.values()),
+                self.memory_mb + sum(memory_mb for _, memory_mb in self.shares.values()))
+
+    def draw(self, lang: str, profile: str) -> Optional['Reservation']:
+        """A nested runtime's share of this reservation, if the one for its language is free"""
+        with self.controller.condition:
+            if self.released or lang not in self.shares or lang in self.drawn:
+                return None
+            self.drawn.add(lang)
+            cpus, memory_mb = self.shares[lang]
+            return Reservation(self.controller, (lang, profile), cpus, memory_mb, parent=self)
+
+    def release(self):
+        self.controller.release(self)
+
+
+# Reservation whose nested shares runtimes reserved on this thread draw from (LoopHost.run)
+_hosting = threading.local()
+
+
+@contextlib.contextmanager
+def hosting(reservation: Optional[Reservation]):
+    """Have runtimes reserved on this thread draw from the reservation's nested shares meanwhile"""
+    previous = getattr(_hosting, 'reservation', None)
+    _hosting.reservation = reservation
+    try:
+        yield
+    finally:
+        _hosting.reservation = previous
+
+
+class AdmissionController:
+    """Admits blocks while their estimated CPU and memory fit on the host"""
+
+    def __init__(self, cpus: float = HOST_CPUS, memory_mb: int = HOST_MEMORY_MB, timeout: float = ADMISSION_TIMEOUT):
+        self.cpus = cpus
+        self.memory_mb = memory_mb
+        self.timeout = timeout
+        self.reserved_cpus = 0.0
+        self.reserved_memory_mb = 0
+        self.in_flight = 0
+        self.rejected = 0
+        self.peaks: Dict[Tuple[str, str], float] = {}
+        self.samples: Dict[Tuple[str, str], int] = {}
+        self.condition = threading.Condition()
+
+    def estimate(self, lang: str, profile: str) -> Tuple[float, int]:
+        """CPU and memory a block of this language and profile is expected to need"""
+        key = (lang, profile)
+        cpus, memory_mb = DEFAULT_ESTIMATES.get(key, (1.0, 256))
+        peak = self.peaks.get(key)
+        if peak is not None:
+            memory_mb = max(memory_mb, min(int(peak * PEAK_HEADROOM), memory_mb * 4))
+        return min(cpus, self.cpus), min(memory_mb, self.memory_mb)
+
+    def fits(self, cpus: float, memory_mb: int) -> bool:
+        if self.in_flight == 0:
+            return True
+        return (self.reserved_cpus + cpus <= self.cpus + 1e-9
+                and self.reserved_memory_mb + memory_mb <= self.memory_mb)
+
+    def reserve(self, lang: str, profile: str, nested: Iterable[Tuple[str, str]] = ()) -> Reservation:
+        """
+        Wait until a block fits on the host, then hold its share and one share
+        per language of its nested runtimes (the largest of their estimates).
+        A runtime started while its host's reservation is hosting draws from it
+        instead. Raises AdmissionTimeout if the block does not fit in time.
+        """
+        parent = getattr(_hosting, 'reservation', None)
+        if parent is not None and parent.controller is self:
+            share = parent.draw(lang, profile)
+            if share is not None:
+                return share
+        with self.condition:
+            cpus, memory_mb = self.estimate(lang, profile)
+            shares: Dict[str, Tuple[float, int]] = {}
+            for nested_lang, nested_profile in nested:
+                nested_cpus, nested_memory_mb = self.estimate(nested_lang, nested_profile)
+                previous_cpus, previous_memory_mb = shares.get(nested_lang, (0.0, 0))
+                shares[nested_lang] = (max(nested_cpus, previous_cpus), max(nested_memory_mb, previous_memory_mb))
+            reservation = Reservation(self, (lang, profile), cpus, memory_mb, shares)
+            held_cpus, held_memory_mb = reservation.held
+            deadline = time.monotonic() + self.timeout
+            while not self.fits(held_cpus, held_memory_mb):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected += 1
+                    raise AdmissionTimeout(f"No room on the host for a {lang} block ({held_cpus:g} CPUs, "
+                                           f"{held_memory_mb} MB) after {self.timeout:g}s "
+                                           f"(POLYGLOT_ADMISSION_TIMEOUT)")
+                self.condition.wait(remaining)
+            self.reserved_cpus += held_cpus
+            self.reserved_memory_mb += held_memory_mb
+            self.in_flight += 1
+            return reservation
+
+    def release(self, reservation: Reservation):
+        with self.condition:
+            if reservation.released:
+                return
+            reservation.released = True
+            if reservation.parent is not None:
+                # Back to its host's reservation, which still holds it on the host
+                reservation.parent.drawn.discard(reservation.key[0])
+                return
+            held_cpus, held_memory_mb = reservation.held
+            self.reserved_cpus -= held_cpus
+            self.reserved_memory_mb -= held_memory_mb
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def wants_sample(self, key: Tuple[str, str]) -> bool:
+        """Measure the first few containers of each kind, then one in ten"""
+        with self.condition:
+            count = self.samples.get(key, 0)
+            self.samples[key] = count + 1
+            return count < 5 or count % 10 == 0
+
+    def observe(self, key: Tuple[str, str], peak_memory_mb: float):
+        """Fold a container's observed peak memory into the estimate for its kind"""
+        with self.condition:
+            previous = self.peaks.get(key)
+            self.peaks[key] = peak_memory_mb if previous is None else \
+                previous + PEAK_SMOOTHING * (peak_memory_mb - previous)
+
+    def stats(self) -> Dict:
+        with self.condition:
+            return {
+                'cpus': self.cpus, 'memory_mb': self.memory_mb,
+                'reserved_cpus': round(self.reserved_cpus, 3), 'reserved_memory_mb': self.reserved_memory_mb,
+                'in_flight': self.in_flight, 'rejected': self.rejected,
+                'estimates': {f"{lang}/{profile}": self.estimate(lang, profile) for lang, profile in DEFAULT_ESTIMATES},
+            }
+
+
+# Shared by every pipeline in the server process
+ADMISSION = AdmissionController()
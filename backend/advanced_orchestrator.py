@@ -1,16 +1,31 @@
 import re
+import os
 import json
 import textwrap
-from engine import execute_in_docker
-from typing import Dict, List, Any, Tuple, Optional
+import threading
+import time
+from concurrent.futures import Future
+from engine import PreparedRun, open_channel, prepare_in_docker
+from debug_events import DEBUG, SERVER_LOG, WARNING
+from execution_context import ExecutionContext
+from metrics import BLOCKS, PREPARED_AHEAD, timed
+from run_report import BlockReport
+from sandbox import PipelineSandbox
+from state_codec import encode_state, signature_compatible, state_loaders, state_signature
+from transpiler import NATIVE_FALLBACK, TranspileError, compile_nested_c_program, transpile_statements
+from loop_host import LoopHost, LoopHostError
+from replay_executor import executor_backend
+from runtime_profiles import estimate_loop_trips, parse_block_header, select_profile
+from typing import Callable, Dict, Iterable, List, Any, Tuple, Optional
 
-# Debug configuration
+# Debug configuration: the default for runs started from now on; each run
+# reads it once into its ExecutionContext
 DEBUG_MODE = True
 
 def debug_print(message: str):
-    """Print debug message only if debug mode is enabled"""
+    """Log a debug message to the server console only if debug mode is enabled"""
     if DEBUG_MODE:
-        print(message)
+        SERVER_LOG.log(message)
 
 def set_debug_mode(enabled: bool):
     """Toggle debug mode on/off"""
@@ -22,11 +37,127 @@ def get_debug_mode() -> bool:
     """Get current debug mode status"""
     return DEBUG_MODE
 
+# Pipeline sandbox: run every block of a pipeline in one combined-runtime container
+SANDBOX_MODE = os.environ.get('POLYGLOT_SANDBOX', '').lower() in ('1', 'true', 'yes')
+
+def set_sandbox_mode(enabled: bool):
+    """Toggle pipeline sandbox mode on/off"""
+    global SANDBOX_MODE
+    SANDBOX_MODE = enabled
+    debug_print(f"Pipeline sandbox {'enabled' if enabled else 'disabled'}")
+
+def get_sandbox_mode() -> bool:
+    """Get current pipeline sandbox mode status"""
+    return SANDBOX_MODE
+
+_executor_backend = None
+_executor_backend_resolved = False
+_executor_backend_lock = threading.Lock()
+
+def get_executor_backend():
+    """
+    The record or replay backend every run uses (POLYGLOT_EXECUTOR), None to
+    run blocks on Docker. Resolved on first use, so importing this module
+    never reads a recording or fails on a bad setting.
+    """
+    global _executor_backend, _executor_backend_resolved
+    with _executor_backend_lock:
+        if not _executor_backend_resolved:
+            _executor_backend = executor_backend()
+            _executor_backend_resolved = True
+        return _executor_backend
+
+def default_context(**overrides) -> ExecutionContext:
+    """Execution context for a new run from the current debug and sandbox defaults"""
+    settings = {'debug': DEBUG_MODE, 'sandbox': SANDBOX_MODE}
+    settings.update(overrides)
+    if 'backend' not in settings:
+        settings['backend'] = get_executor_backend()
+    return ExecutionContext(**settings)
+
+def peak_memory(run) -> Optional[float]:
+    """Peak memory of a finished run's program in MiB, if the engine measured it"""
+    channel = getattr(run, 'channel', None)
+    return channel.peak_memory_mb if channel is not None else None
+
+class PreparedBlock:
+    """A block generated for a state signature whose program is compiling or waiting for state"""
+    
+    def __init__(self, block: Dict, signature: Dict, code: str, run: PreparedRun,
+                 codegen_seconds: float = 0.0, start_seconds: float = 0.0):
+        self.block = block
+        self.signature = signature
+        self.code = code
+        self.run = run
+        self.codegen_seconds = codegen_seconds
+        self.start_seconds = start_seconds
+    
+    def discard(self):
+        self.run.discard()
+
 class SharedStateOrchestrator:
     """Revolutionary polyglot orchestrator with nested block processing and cross-language conversion"""
     
-    def __init__(self):
+    def __init__(self, sandbox: Optional[PipelineSandbox] = None, context: Optional[ExecutionContext] = None):
         self.global_state = {}
+        self.sandbox = sandbox
+        self.context = context if context is not None else default_context()
+        # Report entry of the top-level block being executed, when the run keeps a report
+        self.block_report: Optional[BlockReport] = None
+    
+    def debug_print(self, template: str, *args):
+        """Debug event for this run, formatted only if the run keeps debug events"""
+        self.context.log(DEBUG, template, *args)
+    
+    def log_warning(self, template: str, *args):
+        self.context.log(WARNING, template, *args)
+    
+    def report_block(self, lang: str, kind: str = 'block'):
+        """Start the run report entry of a top-level block"""
+        report = self.context.report
+        self.block_report = report.block(lang, kind) if report is not None else None
+    
+    def prepare_code(self, lang: str, code: str, profile: Optional[str] = None) -> PreparedRun:
+        """Start compiling one program in the pipeline sandbox if there is one, else in its own container"""
+        profile = select_profile(lang, code, profile or self.context.profile)
+        if self.context.report is not None:
+            self.context.report.launched(self.sandbox is not None)
+        with self.context.span('prepare', lang=lang, profile=profile):
+            if self.sandbox is not None:
+                return self.sandbox.prepare(lang, code, profile=profile)
+            if self.context.backend is not None:
+                return self.context.backend.prepare(lang, code, profile)
+            return prepare_in_docker(lang, code, profile)
+    
+    def execute_code(self, lang: str, code: str, state_json: str = "{}", profile: Optional[str] = None) -> str:
+        """Run one program in the pipeline sandbox if there is one, else in its own container"""
+        started = time.perf_counter()
+        run = self.prepare_code(lang, code, profile)
+        prepared = time.perf_counter()
+        with timed('execute', lang), self.context.span('execute', lang=lang):
+            output = run.execute(state_json)
+        BLOCKS.inc(lang=lang)
+        if self.block_report is not None:
+            self.block_report.add_run(prepared - started, time.perf_counter() - prepared, state_json, output,
+                                      peak_memory(run))
+        return output
+    
+    def open_channel(self, lang: str, code: str, profile: Optional[str] = None,
+                     nested: Iterable[Tuple[str, str]] = ()):
+        """
+        Start an interactive program in the pipeline sandbox if there is one,
+        else in its own container, reserving the nested (language, profile)
+        runtimes it will start along with it
+        """
+        profile = select_profile(lang, code, profile or self.context.profile)
+        if self.context.report is not None:
+            self.context.report.launched(self.sandbox is not None)
+        with self.context.span('prepare', lang=lang, profile=profile):
+            if self.sandbox is not None:
+                return self.sandbox.open_channel(lang, code, profile, nested)
+            if self.context.backend is not None:
+                return self.context.backend.open_channel(lang, code, profile, nested)
+            return open_channel(lang, code, profile, nested)
     
     def detect_code_structure(self, code_str: str) -> str:
         """Detect what type of code structure we're dealing with"""
@@ -57,7 +188,7 @@ class SharedStateOrchestrator:
             nested_matches = re.findall(nested_pattern, outer_content, re.DOTALL)
             
             if nested_matches:
-                debug_print(f"🔍 Detected nested structure: {outer_lang} containing {[n[0] for n in nested_matches]}")
+                self.debug_print("🔍 Detected nested structure: {} containing {}", outer_lang, [n[0] for n in nested_matches])
                 return 'nested'
         
         return 'sequential'
@@ -65,7 +196,7 @@ class SharedStateOrchestrator:
     def parse_and_execute(self, code_str: str):
         """Main entry point"""
         structure_type = self.detect_code_structure(code_str)
-        debug_print(f"Detected structure: {structure_type}")
+        self.debug_print("Detected structure: {}", structure_type)
         
         if structure_type.startswith('single_'):
             lang = structure_type.split('_')[1]
@@ -77,38 +208,38 @@ class SharedStateOrchestrator:
     
     def execute_single_language(self, code_str: str, lang: str):
         """Execute single language code"""
-        debug_print("=" * 50)
-        debug_print(f"🔄 SINGLE {lang.upper()} EXECUTION")
-        debug_print("=" * 50)
+        self.debug_print("=" * 50)
+        self.debug_print("🔄 SINGLE {} EXECUTION", lang.upper())
+        self.debug_print("=" * 50)
         
         try:
-            output = execute_in_docker(lang, code_str, "{}")
+            output = self.execute_code(lang, code_str, "{}")
             if output.strip():
                 print(output)  # Always show program output
         except Exception as e:
             print(f"Error executing {lang}: {e}")  # Always show errors
         
-        debug_print("\n" + "=" * 50)
-        debug_print("✅ Single language execution completed")
-        debug_print("=" * 50)
+        self.debug_print("\n" + "=" * 50)
+        self.debug_print("✅ Single language execution completed")
+        self.debug_print("=" * 50)
     
     def execute_single_language_with_output(self, code_str: str, lang: str):
         """Execute single language code and return program output for WebSocket"""
-        debug_print("=" * 50)
-        debug_print(f"🔄 SINGLE {lang.upper()} EXECUTION")
-        debug_print("=" * 50)
+        self.debug_print("=" * 50)
+        self.debug_print("🔄 SINGLE {} EXECUTION", lang.upper())
+        self.debug_print("=" * 50)
         
         program_output = []
         try:
-            output = execute_in_docker(lang, code_str, "{}")
+            output = self.execute_code(lang, code_str, "{}")
             if output.strip():
                 program_output = [line for line in output.strip().split('\n') if line.strip()]
         except Exception as e:
             program_output = [f"Error executing {lang}: {e}"]
         
-        debug_print("\n" + "=" * 50)
-        debug_print("✅ Single language execution completed")
-        debug_print("=" * 50)
+        self.debug_print("\n" + "=" * 50)
+        self.debug_print("✅ Single language execution completed")
+        self.debug_print("=" * 50)
         
         return program_output
     
@@ -116,25 +247,32 @@ class SharedStateOrchestrator:
         """Execute sequential blocks with shared state"""
         blocks = self.parse_sequential_blocks(code_str)
         
-        debug_print("=" * 50)
-        debug_print("🔄 SEQUENTIAL BLOCK EXECUTION")
-        debug_print("=" * 50)
+        self.debug_print("=" * 50)
+        self.debug_print("🔄 SEQUENTIAL BLOCK EXECUTION")
+        self.debug_print("=" * 50)
         
+        upcoming = self.prepare_ahead(blocks, 0)
         for i, block in enumerate(blocks):
-            debug_print(f"\n🏗️ === BLOCK {i+1}/{len(blocks)}: {block['lang'].upper()} ===")
+            self.debug_print("\n🏗️ === BLOCK {}/{}: {} ===", i+1, len(blocks), block['lang'].upper())
             
-            self.execute_block_with_state(block)
-        
-        debug_print("\n" + "=" * 50)
-        debug_print("🏁 EXECUTION SUMMARY")
-        debug_print("=" * 50)
+            # Compile the next block while this one runs
+            prepared, upcoming = upcoming, None
+            
+            def prepare_next(index=i + 1):
+                nonlocal upcoming
+                upcoming = self.prepare_ahead(blocks, index)
+            self.execute_block_with_state(block, prepared, prepare_next)
+        
+        self.debug_print("\n" + "=" * 50)
+        self.debug_print("🏁 EXECUTION SUMMARY")
+        self.debug_print("=" * 50)
         clean_state = {k: v for k, v in self.global_state.items() if not k.startswith('_')}
         if clean_state:
-            debug_print(f"📊 Final state: {clean_state}")
+            self.debug_print("📊 Final state: {}", clean_state)
         else:
-            debug_print("📊 No variables persisted")
-        debug_print("✅ Execution completed")
-        debug_print("=" * 50)
+            self.debug_print("📊 No variables persisted")
+        self.debug_print("✅ Execution completed")
+        self.debug_print("=" * 50)
     
     def parse_sequential_blocks(self, code_str: str) -> List[Dict]:
         """Parse sequential language blocks"""
@@ -143,26 +281,25 @@ class SharedStateOrchestrator:
         
         for match in pattern.finditer(code_str):
             lang = match.group(1).strip()
-            code = textwrap.dedent(match.group(2)).strip()
-            blocks.append({'lang': lang, 'code': code})
+            options, code_start = parse_block_header(code_str, match.end(1))
+            code = textwrap.dedent(code_str[max(code_start, match.start(2)):match.end(2)]).strip()
+            blocks.append({'lang': lang, 'code': code, 'profile': options.get('profile')})
         
         return blocks
     
-    def execute_block_with_state(self, block: Dict):
-        """Execute a single block with state management"""
+    def block_variables(self, block: Dict) -> Dict:
+        """Shared-state variables a block reads"""
+        referenced_vars = self.extract_variable_references(block['code'], block['lang'])
+        return {k: v for k, v in self.global_state.items()
+                if k in referenced_vars and not k.startswith('_')}
+    
+    def generate_block_code(self, block: Dict, signature: Dict) -> str:
+        """Generate a block's program from the shape of its state; values are bound when it runs"""
         lang = block['lang']
         code = block['code']
         
-        # Get referenced variables
-        referenced_vars = self.extract_variable_references(code, lang)
-        available_vars = {k: v for k, v in self.global_state.items() 
-                         if k in referenced_vars and not k.startswith('_')}
-        
-        if available_vars:
-            debug_print(f"📥 Available variables: {list(available_vars.keys())}")
-        
-        # Inject variable declarations
-        var_injection = self.inject_variable_declarations(lang, available_vars)
+        # Load variables from the state file
+        var_injection = state_loaders(lang, signature)
         
         # Detect modified variables
         modified_vars = self.extract_modified_variables(code, lang)
@@ -175,69 +312,145 @@ class SharedStateOrchestrator:
             # Filter out obvious loop variables
             modified_vars = {v for v in modified_vars if v not in ['i', 'j', 'k']}
         
-        if modified_vars:
-            debug_print(f"✏️ Variables being modified: {list(modified_vars)}")
-        
         # Add output capture
         output_capture = self.inject_output_capture(lang, modified_vars, code)
         
         # Combine code
-        full_code = var_injection + code + output_capture
+        return var_injection + code + output_capture
+    
+    def prepare_block(self, block: Dict, signature: Dict) -> PreparedBlock:
+        """Generate a block's program and start compiling it with the block's runtime profile"""
+        started = time.perf_counter()
+        with timed('codegen', block['lang']), self.context.span('codegen', lang=block['lang']):
+            # Blocks prepared ahead are generated on the preparation pool, outside the run's own thread
+            with self.context.profiled():
+                code = self.generate_block_code(block, signature)
+        generated = time.perf_counter()
+        profile = select_profile(block['lang'], block['code'], block.get('profile') or self.context.profile)
+        run = self.prepare_code(block['lang'], code, profile)
+        return PreparedBlock(block, signature, code, run, generated - started, time.perf_counter() - generated)
+    
+    def predict_signature(self, block: Dict, upstream: List[Dict]) -> Optional[Dict]:
+        """State signature a block will see once upstream blocks finish, or None if unknowable yet"""
+        lang = block['lang']
+        referenced_vars = self.extract_variable_references(block['code'], lang)
+        pending = set()
+        for upstream_block in upstream:
+            pending |= self.extract_modified_variables(upstream_block['code'], upstream_block['lang'])
+        
+        signature = state_signature(lang, self.block_variables(block))
+        unknown = {v for v in referenced_vars & pending if v not in self.global_state}
+        if unknown:
+            if lang != 'py':
+                # C and Java declarations need the types an upstream block has not produced yet
+                return None
+            signature.update(state_signature(lang, {v: None for v in unknown}))
+        return signature
+    
+    def prepare_ahead(self, blocks: List[Dict], index: int) -> Optional[Future]:
+        """Prepare blocks[index] in the background while the block before it executes
+        
+        Called only once the block before it holds its own runtime: a block prepared ahead keeps its
+        admission reservation, and the block before it must never have to wait for that.
+        """
+        if index >= len(blocks) or blocks[index].get('nested') or blocks[index].get('is_nested'):
+            return None
+        block = blocks[index]
+        signature = self.predict_signature(block, blocks[max(index - 1, 0):index])
+        if signature is None:
+            return None
+        return self.context.executor.submit(self.prepare_block, block, signature)
+    
+    def discard_prepared(self, prepared: Optional[Future]):
+        """Release a block prepared ahead that will not run"""
+        if prepared is not None:
+            prepared.add_done_callback(lambda f: f.exception() is None and f.result().discard())
+    
+    def run_block(self, block: Dict, prepared: Optional[Future] = None,
+                  ready: Optional[Callable[[], None]] = None) -> str:
+        """Bind the current state to a block (prepared ahead if possible) and run it
         
-        debug_print(f"Full {lang} code:\n{full_code}")
+        ready is called once the block holds its runtime, before it executes.
+        """
+        lang = block['lang']
+        available_vars = self.block_variables(block)
         
+        if available_vars:
+            self.debug_print("📥 Available variables: {}", list(available_vars.keys()))
+        
+        signature = state_signature(lang, available_vars)
+        prepared_block = None
         try:
-            output = execute_in_docker(lang, full_code, "{}")
+            if prepared is not None:
+                try:
+                    prepared_block = prepared.result()
+                except Exception as e:
+                    self.log_warning("⚠️ Preparing {} block ahead failed, preparing it now: {}", lang, e)
+            
+            reused = prepared_block is not None and signature_compatible(lang, prepared_block.signature, signature)
+            if reused:
+                self.debug_print("⚡ Using {} block prepared ahead", lang)
+                PREPARED_AHEAD.inc(lang=lang, result='hit')
+            else:
+                if prepared_block is not None:
+                    self.debug_print("♻️ State shape changed, regenerating {} block", lang)
+                    PREPARED_AHEAD.inc(lang=lang, result='miss')
+                    prepared_block.discard()
+                prepared_block = self.prepare_block(block, signature)
+            if ready is not None:
+                ready()
+            
+            modified_vars = self.extract_modified_variables(block['code'], lang)
+            if modified_vars:
+                self.debug_print("✏️ Variables being modified: {}", list(modified_vars))
+            self.debug_print("Full {} code:\n{}", lang, prepared_block.code)
+            
+            state_json = encode_state(available_vars)
+            started = time.perf_counter()
+            with timed('execute', lang), self.context.span('execute', lang=lang):
+                output = prepared_block.run.execute(state_json)
+        except BaseException:
+            # A block that never ran must not keep its container waiting for state, nor its reservation
+            if prepared_block is not None:
+                prepared_block.discard()
+            else:
+                self.discard_prepared(prepared)
+            raise
+        seconds = time.perf_counter() - started
+        BLOCKS.inc(lang=lang)
+        self.context.metric('block_seconds', seconds, lang=lang)
+        if self.block_report is not None:
+            self.block_report.prepared_ahead = reused
+            self.block_report.codegen_seconds += prepared_block.codegen_seconds
+            self.block_report.add_run(prepared_block.start_seconds, seconds, state_json, output,
+                                      peak_memory(prepared_block.run))
+        return output
+    
+    def execute_block_with_state(self, block: Dict, prepared: Optional[Future] = None,
+                                 ready: Optional[Callable[[], None]] = None):
+        """Execute a single block with state management"""
+        lang = block['lang']
+        try:
+            output = self.run_block(block, prepared, ready)
             self.process_execution_output(output)
         except Exception as e:
             print(f"Error executing {lang}: {e}")
     
-    def execute_block_with_state_and_output(self, block: Dict):
+    def execute_block_with_state_and_output(self, block: Dict, prepared: Optional[Future] = None,
+                                            ready: Optional[Callable[[], None]] = None):
         """Execute a single block with state management and return program output for WebSocket"""
         lang = block['lang']
-        code = block['code']
-        
-        # Get referenced variables
-        referenced_vars = self.extract_variable_references(code, lang)
-        available_vars = {k: v for k, v in self.global_state.items() 
-                         if k in referenced_vars and not k.startswith('_')}
-        
-        if available_vars:
-            debug_print(f"📥 Available variables: {list(available_vars.keys())}")
-        
-        # Inject variable declarations
-        var_injection = self.inject_variable_declarations(lang, available_vars)
-        
-        # Detect modified variables
-        modified_vars = self.extract_modified_variables(code, lang)
-        
-        # Filter out loop variables
-        if lang == 'c':
-            loop_vars = set(re.findall(r'for\s*\(\s*int\s+([a-zA-Z_]\w*)', code))
-            modified_vars -= loop_vars
-        elif lang in ['py', 'java']:
-            # Filter out obvious loop variables
-            modified_vars = {v for v in modified_vars if v not in ['i', 'j', 'k']}
-        
-        if modified_vars:
-            debug_print(f"✏️ Variables being modified: {list(modified_vars)}")
-        
-        # Add output capture
-        output_capture = self.inject_output_capture(lang, modified_vars, code)
-        
-        # Combine code
-        full_code = var_injection + code + output_capture
-        
-        debug_print(f"Full {lang} code:\n{full_code}")
-        
         program_output = []
         try:
-            output = execute_in_docker(lang, full_code, "{}")
+            output = self.run_block(block, prepared, ready)
             # Extract only the program output (not JSON state)
-            program_lines, _ = self.process_execution_output_and_return(output)
+            with timed('state_decode', lang), self.context.span('state_decode', lang=lang):
+                program_lines, _ = self.process_execution_output_and_return(output)
             program_output = program_lines
         except Exception as e:
             program_output = [f"Error executing {lang}: {e}"]
+            if self.block_report is not None:
+                self.block_report.error = str(e)
         
         return program_output
     
@@ -254,18 +467,19 @@ class SharedStateOrchestrator:
             if line_clean.startswith('{') and line_clean.endswith('}') and '"' in line_clean:
                 try:
                     new_vars = json.loads(line_clean)
-                    old_state = self.global_state.copy()
+                    # Only debug events need the previous state
+                    old_state = self.global_state.copy() if self.context.enabled() else None
                     self.global_state.update(new_vars)
                     
-                    if DEBUG_MODE:
+                    if old_state is not None:
                         added = {k: v for k, v in new_vars.items() if k not in old_state}
                         modified = {k: v for k, v in new_vars.items() 
                                   if k in old_state and old_state[k] != v}
                         
                         if added:
-                            debug_print(f"➕ Created: {list(added.keys())} = {list(added.values())}")
+                            self.debug_print("➕ Created: {} = {}", list(added.keys()), list(added.values()))
                         if modified:
-                            debug_print(f"🔄 Modified: {list(modified.keys())} = {list(modified.values())}")
+                            self.debug_print("🔄 Modified: {} = {}", list(modified.keys()), list(modified.values()))
                     
                 except json.JSONDecodeError:
                     program_output.append(line)
@@ -291,18 +505,19 @@ class SharedStateOrchestrator:
             if line_clean.startswith('{') and line_clean.endswith('}') and '"' in line_clean:
                 try:
                     new_vars = json.loads(line_clean)
-                    old_state = self.global_state.copy()
+                    # Only debug events need the previous state
+                    old_state = self.global_state.copy() if self.context.enabled() else None
                     self.global_state.update(new_vars)
                     
-                    if DEBUG_MODE:
+                    if old_state is not None:
                         added = {k: v for k, v in new_vars.items() if k not in old_state}
                         modified = {k: v for k, v in new_vars.items() 
                                   if k in old_state and old_state[k] != v}
                         
                         if added:
-                            debug_print(f"➕ Created: {list(added.keys())} = {list(added.values())}")
+                            self.debug_print("➕ Created: {} = {}", list(added.keys()), list(added.values()))
                         if modified:
-                            debug_print(f"🔄 Modified: {list(modified.keys())} = {list(modified.values())}")
+                            self.debug_print("🔄 Modified: {} = {}", list(modified.keys()), list(modified.values()))
                     
                 except json.JSONDecodeError:
                     program_output.append(line)
@@ -315,6 +530,10 @@ class SharedStateOrchestrator:
     
     def extract_variable_references(self, code: str, lang: str) -> set:
         """Extract variable names referenced in code"""
+        return set(self.context.parse_cache.get(('references', lang, code),
+                                                lambda: frozenset(self.scan_variable_references(code, lang))))
+    
+    def scan_variable_references(self, code: str, lang: str) -> set:
         references = set()
         var_pattern = r'\b([a-zA-Z_][a-zA-Z0-9_]*)\b'
         
@@ -335,6 +554,10 @@ class SharedStateOrchestrator:
     
     def extract_modified_variables(self, code: str, lang: str) -> set:
         """Extract variables modified in code"""
+        return set(self.context.parse_cache.get(('modified', lang, code),
+                                                lambda: frozenset(self.scan_modified_variables(code, lang))))
+    
+    def scan_modified_variables(self, code: str, lang: str) -> set:
         modified = set()
         
         if lang == 'c':
@@ -483,34 +706,34 @@ print(json.dumps(_result))"""
 
     def execute_nested_blocks(self, code_str: str):
         """Execute nested blocks with proper language separation and loop execution"""
-        debug_print("=" * 50)
-        debug_print("🔄 NESTED BLOCK EXECUTION")
-        debug_print("=" * 50)
+        self.debug_print("=" * 50)
+        self.debug_print("🔄 NESTED BLOCK EXECUTION")
+        self.debug_print("=" * 50)
         
         # Parse all blocks (nested and sequential)
         all_blocks = self.parse_all_blocks(code_str)
         
-        debug_print(f"🏗️ Found {len(all_blocks)} blocks to process")
+        self.debug_print("🏗️ Found {} blocks to process", len(all_blocks))
         
         # Execute blocks in order
         for i, block in enumerate(all_blocks):
-            debug_print(f"\n🏗️ === BLOCK {i+1}/{len(all_blocks)}: {block['lang'].upper()} {'(NESTED)' if block.get('nested') else ''} ===")
+            self.debug_print("\n🏗️ === BLOCK {}/{}: {} {} ===", i+1, len(all_blocks), block['lang'].upper(), '(NESTED)' if block.get('nested') else '')
             
             if block.get('nested'):
                 self.execute_nested_block_with_loop(block)
             else:
                 self.execute_block_with_state(block)
         
-        debug_print("\n" + "=" * 50)
-        debug_print("🏁 NESTED EXECUTION SUMMARY")
-        debug_print("=" * 50)
+        self.debug_print("\n" + "=" * 50)
+        self.debug_print("🏁 NESTED EXECUTION SUMMARY")
+        self.debug_print("=" * 50)
         clean_state = {k: v for k, v in self.global_state.items() if not k.startswith('_')}
         if clean_state:
-            debug_print(f"📊 Final state: {clean_state}")
+            self.debug_print("📊 Final state: {}", clean_state)
         else:
-            debug_print("📊 No variables persisted")
-        debug_print("✅ Nested execution completed")
-        debug_print("=" * 50)
+            self.debug_print("📊 No variables persisted")
+        self.debug_print("✅ Nested execution completed")
+        self.debug_print("=" * 50)
 
     def process_nested_blocks(self, content: str, outer_lang: str) -> str:
         """Process nested blocks within outer language content with cross-language conversion"""
@@ -520,8 +743,8 @@ print(json.dumps(_result))"""
         if not nested_blocks:
             return content
         
-        if DEBUG_MODE:
-            debug_print(f"🔄 Found {len(nested_blocks)} nested blocks in {outer_lang}")
+        if self.context.enabled():
+            self.debug_print("🔄 Found {} nested blocks in {}", len(nested_blocks), outer_lang)
         
         # Process nested blocks in reverse order to maintain string positions
         processed_content = content
@@ -529,12 +752,12 @@ print(json.dumps(_result))"""
             nested_lang = match.group(1)
             nested_code = match.group(2).strip()
             
-            debug_print(f"🔄 Converting nested {nested_lang} block: {nested_code}")
+            self.debug_print("🔄 Converting nested {} block: {}", nested_lang, nested_code)
             
             # Convert nested code to outer language syntax
             converted_code = self.convert_nested_to_outer(nested_code, nested_lang, outer_lang)
             
-            debug_print(f"🔄 Converted to {outer_lang}: {converted_code}")
+            self.debug_print("🔄 Converted to {}: {}", outer_lang, converted_code)
             
             # Replace the nested block with converted code
             start_pos = match.start()
@@ -553,7 +776,8 @@ print(json.dumps(_result))"""
         
         for match in all_matches:
             lang = match.group(1)
-            content = match.group(2).strip()
+            options, code_start = parse_block_header(code_str, match.end(1))
+            content = code_str[code_start:match.end(2)].strip()
             
             # Check if this block contains nested blocks
             nested_pattern = r'::(\w+)\s+(.*?)\s+::/\1'
@@ -569,10 +793,12 @@ print(json.dumps(_result))"""
                 
                 for nested_match in nested_matches:
                     nested_lang = nested_match.group(1)
-                    nested_code = nested_match.group(2).strip()
+                    nested_options, nested_start = parse_block_header(content, nested_match.end(1))
+                    nested_code = content[max(nested_start, nested_match.start(2)):nested_match.end(2)].strip()
                     nested_info['nested_blocks'].append({
                         'lang': nested_lang,
                         'code': nested_code,
+                        'profile': nested_options.get('profile'),
                         'start': nested_match.start(),
                         'end': nested_match.end()
                     })
@@ -580,6 +806,7 @@ print(json.dumps(_result))"""
                 blocks.append({
                     'lang': lang,
                     'code': content,
+                    'profile': options.get('profile'),
                     'nested': True,
                     'nested_info': nested_info
                 })
@@ -588,6 +815,7 @@ print(json.dumps(_result))"""
                 blocks.append({
                     'lang': lang,
                     'code': content,
+                    'profile': options.get('profile'),
                     'nested': False
                 })
         
@@ -600,7 +828,24 @@ print(json.dumps(_result))"""
         outer_content = nested_info['outer_content']
         nested_blocks = nested_info['nested_blocks']
         
-        debug_print(f"🔄 Executing nested {outer_lang} with {len(nested_blocks)} nested blocks")
+        self.debug_print("🔄 Executing nested {} with {} nested blocks", outer_lang, len(nested_blocks))
+        
+        # Fast path: compile the nested blocks straight into the outer C program
+        native_program = self.compile_nested_block(block)
+        native_lines = None
+        if native_program is not None:
+            native_lines = self.execute_native_nested_block(native_program, block.get('profile'))
+        if native_lines is not None:
+            for line in native_lines:
+                print(line)
+            return
+        
+        # General path: run the outer block for real and serve nested blocks on callback
+        loop_host = self.host_nested_block(block)
+        if loop_host is not None:
+            for line in self.execute_hosted_nested_block(loop_host):
+                print(line)
+            return
         
         # Extract loop information from C code
         if outer_lang == 'c':
@@ -611,7 +856,10 @@ print(json.dumps(_result))"""
                 start_val = int(loop_match.group(2))
                 end_val = int(loop_match.group(3))
                 
-                debug_print(f"🔄 Found C loop: {loop_var} from {start_val} to {end_val-1}")
+                self.debug_print("🔄 Found C loop: {} from {} to {}", loop_var, start_val, end_val-1)
+                if end_val - start_val > self.context.max_iterations:
+                    print(self.iteration_limit_error(start_val, end_val))
+                    return
                 
                 # Get the array variable (assuming 'a' from your example)
                 array_match = re.search(r'int\s+(\w+)\s*\[\s*\]\s*=\s*\{([^}]+)\}', outer_content)
@@ -619,14 +867,14 @@ print(json.dumps(_result))"""
                     array_name = array_match.group(1)
                     array_values = [int(x.strip()) for x in array_match.group(2).split(',')]
                     
-                    debug_print(f"🔄 Found array {array_name}: {array_values}")
+                    self.debug_print("🔄 Found array {}: {}", array_name, array_values)
                     
                     # Store array in global state
                     self.global_state[array_name] = array_values
                     
                     # Execute the loop
                     for i in range(start_val, end_val):
-                        debug_print(f"🔄 Loop iteration {i}")
+                        self.debug_print("🔄 Loop iteration {}", i)
                         
                         # Set loop variable and current array value
                         self.global_state[loop_var] = i
@@ -638,11 +886,11 @@ print(json.dumps(_result))"""
                 
             else:
                 # No loop found - handle simple nested execution
-                debug_print(f"🔄 No loop found - executing simple nested blocks")
+                self.debug_print("🔄 No loop found - executing simple nested blocks")
                 
                 # Extract C variable declarations
                 c_vars = self.extract_c_variables_from_declarations(outer_content)
-                debug_print(f"🔄 Extracted C variables: {c_vars}")
+                self.debug_print("🔄 Extracted C variables: {}", c_vars)
                 
                 # Store C variables in global state
                 for var_name, var_value in c_vars.items():
@@ -652,20 +900,20 @@ print(json.dumps(_result))"""
                 for nested_block in nested_blocks:
                     try:
                         self.execute_simple_nested_block_no_return(nested_block)
-                        debug_print(f"🔄 Nested {nested_block['lang']} completed")
+                        self.debug_print("🔄 Nested {} completed", nested_block['lang'])
                     except Exception as e:
-                        debug_print(f"🔄 Nested {nested_block['lang']} failed: {e}")
+                        self.debug_print("🔄 Nested {} failed: {}", nested_block['lang'], e)
                 
                 # Now execute the remaining C code with access to variables from nested blocks
                 c_code_with_vars = self.prepare_c_code_with_variables(outer_content, nested_blocks)
                 if c_code_with_vars:
                     try:
-                        c_output = execute_in_docker('c', c_code_with_vars, "{}")
+                        c_output = self.execute_code('c', c_code_with_vars, "{}")
                         if c_output.strip():
                             print(c_output.strip())
-                        debug_print(f"🔄 Final C execution completed")
+                        self.debug_print("🔄 Final C execution completed")
                     except Exception as e:
-                        debug_print(f"🔄 Final C execution failed: {e}")
+                        self.debug_print("🔄 Final C execution failed: {}", e)
                 
                 return
     
@@ -678,7 +926,29 @@ print(json.dumps(_result))"""
         
         output_lines = []
         
-        debug_print(f"🔄 Executing nested {outer_lang} with {len(nested_blocks)} nested blocks")
+        self.debug_print("🔄 Executing nested {} with {} nested blocks", outer_lang, len(nested_blocks))
+        
+        # Fast path: compile the nested blocks straight into the outer C program
+        native_program = self.compile_nested_block(block)
+        native_lines = None
+        if native_program is not None:
+            native_lines = self.execute_native_nested_block(native_program, block.get('profile'))
+        if native_lines is not None:
+            if self.block_report is not None:
+                # Iterations run inside one compiled program and are not observed
+                self.block_report.kind, self.block_report.iterations = 'native', None
+            return native_lines
+        
+        # General path: run the outer block for real and serve nested blocks on callback
+        loop_host = self.host_nested_block(block)
+        if loop_host is not None:
+            output_lines = self.execute_hosted_nested_block(loop_host)
+            if self.block_report is not None:
+                self.block_report.kind, self.block_report.iterations = 'hosted', loop_host.calls
+            return output_lines
+        
+        if self.block_report is not None:
+            self.block_report.kind = 'simulated'
         
         # Extract loop information from C code
         if outer_lang == 'c':
@@ -689,7 +959,9 @@ print(json.dumps(_result))"""
                 start_val = int(loop_match.group(2))
                 end_val = int(loop_match.group(3))
                 
-                debug_print(f"🔄 Found C loop: {loop_var} from {start_val} to {end_val-1}")
+                self.debug_print("🔄 Found C loop: {} from {} to {}", loop_var, start_val, end_val-1)
+                if end_val - start_val > self.context.max_iterations:
+                    return [self.iteration_limit_error(start_val, end_val)]
                 
                 # Get the array variable
                 array_match = re.search(r'int\s+(\w+)\s*\[\s*\]\s*=\s*\{([^}]+)\}', outer_content)
@@ -697,34 +969,37 @@ print(json.dumps(_result))"""
                     array_name = array_match.group(1)
                     array_values = [int(x.strip()) for x in array_match.group(2).split(',')]
                     
-                    debug_print(f"🔄 Found array {array_name}: {array_values}")
+                    self.debug_print("🔄 Found array {}: {}", array_name, array_values)
                     
                     # Store array in global state
                     self.global_state[array_name] = array_values
                     
                     # Execute the loop and collect output
                     for i in range(start_val, end_val):
-                        debug_print(f"🔄 Loop iteration {i}")
+                        self.debug_print("🔄 Loop iteration {}", i)
+                        if self.block_report is not None:
+                            self.block_report.iterations += 1
                         
                         # Set loop variable and current array value
                         self.global_state[loop_var] = i
                         self.global_state['current_' + array_name] = array_values[i]
                         
                         # Execute each nested block in this iteration
-                        for nested_block in nested_blocks:
-                            iteration_output = self.execute_nested_iteration_and_return_output(nested_block, i, array_values[i])
-                            output_lines.extend(iteration_output)
+                        with self.context.span('iteration', index=i):
+                            for nested_block in nested_blocks:
+                                iteration_output = self.execute_nested_iteration_and_return_output(nested_block, i, array_values[i])
+                                output_lines.extend(iteration_output)
             else:
                 # No loop found - handle simple nested execution
-                debug_print(f"🔄 No loop found - executing simple nested blocks")
+                self.debug_print("🔄 No loop found - executing simple nested blocks")
                 
                 # First, execute the outer C code without nested blocks to get variables
                 c_code_without_nested = self.remove_nested_blocks(outer_content)
-                debug_print(f"🔄 C code without nested blocks:\n{c_code_without_nested}")
+                self.debug_print("🔄 C code without nested blocks:\n{}", c_code_without_nested)
                 
                 # Extract C variable declarations
                 c_vars = self.extract_c_variables_from_declarations(outer_content)
-                debug_print(f"🔄 Extracted C variables: {c_vars}")
+                self.debug_print("🔄 Extracted C variables: {}", c_vars)
                 
                 # Store C variables in global state
                 for var_name, var_value in c_vars.items():
@@ -736,21 +1011,77 @@ print(json.dumps(_result))"""
                         nested_output = self.execute_simple_nested_block(nested_block)
                         if nested_output.strip():
                             output_lines.append(nested_output.strip())
-                            debug_print(f"🔄 Nested {nested_block['lang']} output: {nested_output.strip()}")
+                            self.debug_print("🔄 Nested {} output: {}", nested_block['lang'], nested_output.strip())
                     except Exception as e:
-                        debug_print(f"🔄 Nested {nested_block['lang']} failed: {e}")
+                        self.debug_print("🔄 Nested {} failed: {}", nested_block['lang'], e)
                 
                 # Now execute the remaining C code with access to variables from nested blocks
                 c_code_with_vars = self.prepare_c_code_with_variables(outer_content, nested_blocks)
                 if c_code_with_vars:
                     try:
-                        c_output = execute_in_docker('c', c_code_with_vars, "{}")
+                        c_output = self.execute_code('c', c_code_with_vars, "{}")
                         if c_output.strip():
                             output_lines.append(c_output.strip())
-                            debug_print(f"🔄 Final C execution output: {c_output.strip()}")
+                            self.debug_print("🔄 Final C execution output: {}", c_output.strip())
                     except Exception as e:
-                        debug_print(f"🔄 Final C execution failed: {e}")
+                        self.debug_print("🔄 Final C execution failed: {}", e)
+        
+        return output_lines
+    
+    def iteration_limit_error(self, start_val: int, end_val: int) -> str:
+        return (f"❌ Error: simulated loop would run {end_val - start_val} iterations, "
+                f"more than the limit of {self.context.max_iterations}")
+    
+    def compile_nested_block(self, block: Dict) -> Optional[str]:
+        """Compile a nested block into one native C program, or None to fall back"""
+        nested_info = block['nested_info']
+        if nested_info['outer_lang'] != 'c':
+            return None
         
+        try:
+            program = compile_nested_c_program(nested_info['outer_content'],
+                                               nested_info['nested_blocks'], self.global_state)
+        except TranspileError as e:
+            self.log_warning("⚠️ Native compilation not possible, falling back to per-iteration execution: {}", e)
+            return None
+        
+        self.debug_print("⚡ Compiled {} nested blocks into native C", len(nested_info['nested_blocks']))
+        return program
+    
+    def execute_native_nested_block(self, program: str, profile: Optional[str] = None) -> Optional[List[str]]:
+        """Run a natively compiled nested block in one container and return its output, or None to fall back"""
+        try:
+            output = self.execute_code('c', program, "{}", profile)
+            with timed('state_decode', 'c'), self.context.span('state_decode', lang='c'):
+                program_lines, _ = self.process_execution_output_and_return(output)
+            return program_lines
+        except Exception as e:
+            if NATIVE_FALLBACK in str(e):
+                # Its output and state are discarded; the block runs again per iteration
+                self.log_warning("⚠️ Native program stopped, falling back to per-iteration execution: {}",
+                                 str(e).split(NATIVE_FALLBACK + ': ', 1)[-1].strip())
+                return None
+            return [f"Error executing c: {e}"]
+    
+    def host_nested_block(self, block: Dict) -> Optional[LoopHost]:
+        """Build a loop host that runs the outer block as a real program, or None to fall back"""
+        try:
+            loop_host = LoopHost(self, block)
+        except LoopHostError as e:
+            self.log_warning("⚠️ Loop host not possible, falling back to loop simulation: {}", e)
+            return None
+        
+        self.debug_print("🔁 Hosting {} nested blocks inside a live {} program", len(loop_host.sites), loop_host.outer_lang)
+        return loop_host
+    
+    def execute_hosted_nested_block(self, loop_host: LoopHost) -> List[str]:
+        """Run a hosted outer program to completion and return its output"""
+        output_lines = []
+        try:
+            for line in loop_host.run():
+                output_lines.append(line)
+        except Exception as e:
+            output_lines.append(f"Error executing {loop_host.outer_lang}: {e}")
         return output_lines
     
     def remove_nested_blocks(self, code: str) -> str:
@@ -765,14 +1096,14 @@ print(json.dumps(_result))"""
         lang = nested_block['lang']
         code = nested_block['code'].strip()
         
-        debug_print(f"🔄 Executing simple nested {lang} block")
+        self.debug_print("🔄 Executing simple nested {} block", lang)
         
         # Get variables that might be referenced
         referenced_vars = self.extract_variable_references(code, lang)
         available_vars = {k: v for k, v in self.global_state.items() 
                          if k in referenced_vars and not k.startswith('_')}
         
-        debug_print(f"🔄 Available variables for {lang}: {available_vars}")
+        self.debug_print("🔄 Available variables for {}: {}", lang, available_vars)
         
         # Inject variable declarations
         var_injection = self.inject_variable_declarations(lang, available_vars)
@@ -780,22 +1111,22 @@ print(json.dumps(_result))"""
         # Create full code with injected variables
         full_code = var_injection + code
         
-        debug_print(f"🔄 Full {lang} code with variables:\n{full_code}")
+        self.debug_print("🔄 Full {} code with variables:\n{}", lang, full_code)
         
         # Execute and capture any new variables
-        output = execute_in_docker(lang, full_code, "{}")
+        output = self.execute_code(lang, full_code, "{}", nested_block.get('profile'))
         
         # Extract any new variables created by this nested block
         modified_vars = self.extract_modified_variables(code, lang)
         if modified_vars:
-            debug_print(f"🔄 Variables modified by nested {lang}: {modified_vars}")
+            self.debug_print("🔄 Variables modified by nested {}: {}", lang, modified_vars)
             # For now, just add 'result' if it was created
             if 'result' in modified_vars and lang == 'py':
                 # We need to extract the actual value - for now assume it's calculable
                 if 'a' in available_vars and 'b' in available_vars:
                     result_value = available_vars['a'] * available_vars['b'] * 2
                     self.global_state['result'] = result_value
-                    debug_print(f"🔄 Calculated result = {result_value}")
+                    self.debug_print("🔄 Calculated result = {}", result_value)
         
         return output
     
@@ -804,14 +1135,14 @@ print(json.dumps(_result))"""
         lang = nested_block['lang']
         code = nested_block['code'].strip()
         
-        debug_print(f"🔄 Executing simple nested {lang} block")
+        self.debug_print("🔄 Executing simple nested {} block", lang)
         
         # Get variables that might be referenced
         referenced_vars = self.extract_variable_references(code, lang)
         available_vars = {k: v for k, v in self.global_state.items() 
                          if k in referenced_vars and not k.startswith('_')}
         
-        debug_print(f"🔄 Available variables for {lang}: {available_vars}")
+        self.debug_print("🔄 Available variables for {}: {}", lang, available_vars)
         
         # Inject variable declarations
         var_injection = self.inject_variable_declarations(lang, available_vars)
@@ -819,24 +1150,24 @@ print(json.dumps(_result))"""
         # Create full code with injected variables
         full_code = var_injection + code
         
-        debug_print(f"🔄 Full {lang} code with variables:\n{full_code}")
+        self.debug_print("🔄 Full {} code with variables:\n{}", lang, full_code)
         
         # Execute and capture any new variables
-        output = execute_in_docker(lang, full_code, "{}")
+        output = self.execute_code(lang, full_code, "{}", nested_block.get('profile'))
         if output.strip():
             print(output.strip())
         
         # Extract any new variables created by this nested block
         modified_vars = self.extract_modified_variables(code, lang)
         if modified_vars:
-            debug_print(f"🔄 Variables modified by nested {lang}: {modified_vars}")
+            self.debug_print("🔄 Variables modified by nested {}: {}", lang, modified_vars)
             # For now, just add 'result' if it was created
             if 'result' in modified_vars and lang == 'py':
                 # We need to extract the actual value - for now assume it's calculable
                 if 'a' in available_vars and 'b' in available_vars:
                     result_value = available_vars['a'] * available_vars['b'] * 2
                     self.global_state['result'] = result_value
-                    debug_print(f"🔄 Calculated result = {result_value}")
+                    self.debug_print("🔄 Calculated result = {}", result_value)
     
     def extract_c_variables_from_declarations(self, c_code: str) -> dict:
         """Extract variable declarations from C code"""
@@ -847,7 +1178,7 @@ print(json.dumps(_result))"""
         for var_name, var_value in int_matches:
             variables[var_name] = int(var_value)
             
-        debug_print(f"🔄 Found C variables: {variables}")
+        self.debug_print("🔄 Found C variables: {}", variables)
         return variables
     
     def prepare_c_code_with_variables(self, outer_content: str, nested_blocks: list) -> str:
@@ -876,7 +1207,7 @@ print(json.dumps(_result))"""
             remaining_code = remaining_code.replace(decl, '')
         
         final_code = '\n'.join(all_declarations) + '\n' + remaining_code.strip()
-        debug_print(f"🔄 Final C code with variables:\n{final_code}")
+        self.debug_print("🔄 Final C code with variables:\n{}", final_code)
         
         return final_code.strip()
     
@@ -885,7 +1216,7 @@ print(json.dumps(_result))"""
         lang = nested_block['lang']
         code = nested_block['code'].strip()
         
-        debug_print(f"🔄 Executing {lang} nested block for iteration {loop_index}")
+        self.debug_print("🔄 Executing {} nested block for iteration {}", lang, loop_index)
         
         if lang == 'py':
             # Replace placeholders in Python code
@@ -917,10 +1248,10 @@ print(json.dumps(_result))"""
             
             full_code = var_injection + clean_processed_code + output_capture
             
-            debug_print(f"Python nested code:\n{full_code}")
+            self.debug_print("Python nested code:\n{}", full_code)
             
             try:
-                output = execute_in_docker(lang, full_code, "{}")
+                output = self.execute_code(lang, full_code, "{}", nested_block.get('profile'))
                 self.process_execution_output(output)
             except Exception as e:
                 print(f"Error executing nested {lang}: {e}")
@@ -946,10 +1277,10 @@ print(json.dumps(_result))"""
     }}
 }}"""
             
-            debug_print(f"Java nested code:\n{java_code}")
+            self.debug_print("Java nested code:\n{}", java_code)
             
             try:
-                output = execute_in_docker(lang, java_code, "{}")
+                output = self.execute_code(lang, java_code, "{}", nested_block.get('profile'))
                 if output.strip():
                     print(output.strip())
             except Exception as e:
@@ -960,7 +1291,7 @@ print(json.dumps(_result))"""
         lang = nested_block['lang']
         code = nested_block['code'].strip()
         
-        debug_print(f"🔄 Executing {lang} nested block for iteration {loop_index}")
+        self.debug_print("🔄 Executing {} nested block for iteration {}", lang, loop_index)
         
         output_lines = []
         
@@ -993,10 +1324,10 @@ print(json.dumps(_result))"""
             
             full_code = var_injection + clean_processed_code + output_capture
             
-            debug_print(f"Python nested code:\n{full_code}")
+            self.debug_print("Python nested code:\n{}", full_code)
             
             try:
-                output = execute_in_docker(lang, full_code, "{}")
+                output = self.execute_code(lang, full_code, "{}", nested_block.get('profile'))
                 program_lines, _ = self.process_execution_output_and_return(output)
                 output_lines.extend(program_lines)
             except Exception as e:
@@ -1023,10 +1354,10 @@ print(json.dumps(_result))"""
     }}
 }}"""
             
-            debug_print(f"Java nested code:\n{java_code}")
+            self.debug_print("Java nested code:\n{}", java_code)
             
             try:
-                output = execute_in_docker(lang, java_code, "{}")
+                output = self.execute_code(lang, java_code, "{}", nested_block.get('profile'))
                 if output.strip():
                     output_lines.extend([line for line in output.strip().split('\n') if line.strip()])
             except Exception as e:
@@ -1036,94 +1367,23 @@ print(json.dumps(_result))"""
 
     def convert_nested_to_outer(self, nested_code: str, nested_lang: str, outer_lang: str) -> str:
         """Convert nested language code to outer language syntax"""
-        
-        if outer_lang == 'c':
-            if nested_lang == 'py':
-                # Handle Python code - can have multiple statements separated by semicolons
-                statements = [stmt.strip() for stmt in nested_code.split(';') if stmt.strip()]
-                c_statements = []
-                
-                for stmt in statements:
-                    # Handle Python print statements
-                    if 'print(' in stmt:
-                        print_match = re.search(r'print\s*\(\s*([^)]+)\s*\)', stmt)
-                        if print_match:
-                            print_args = print_match.group(1)
-                            
-                            # Handle multiple arguments separated by commas
-                            if ',' in print_args:
-                                args = [arg.strip() for arg in print_args.split(',')]
-                                printf_parts = []
-                                for arg in args:
-                                    if arg.startswith('"') and arg.endswith('"'):
-                                        printf_parts.append(f'printf({arg}); printf(" ");')
-                                    else:
-                                        printf_parts.append(f'printf("%d ", {arg});')
-                                c_statements.append(' '.join(printf_parts) + 'printf("\\n");')
-                            else:
-                                # Single argument
-                                if print_args.startswith('"') and print_args.endswith('"'):
-                                    c_statements.append(f'printf({print_args}); printf("\\n");')
-                                else:
-                                    c_statements.append(f'printf("%d\\n", {print_args});')
-                    
-                    # Handle Python list operations (commented out for C)
-                    elif '.append(' in stmt:
-                        c_statements.append(f'/* Python list operation: {stmt} */')
-                    
-                    # Handle other statements
-                    else:
-                        c_statements.append(f'/* Python: {stmt} */')
-                
-                return ' '.join(c_statements)
-                
-            elif nested_lang == 'java':
-                # Convert Java to C
-                if 'System.out.println(' in nested_code or 'System.out.print(' in nested_code:
-                    java_match = re.search(r'System\.out\.print(?:ln)?\s*\(\s*([^)]+)\s*\)', nested_code)
-                    if java_match:
-                        print_arg = java_match.group(1).strip()
-                        
-                        # Handle Java string concatenation
-                        if '+' in print_arg:
-                            parts = [part.strip() for part in print_arg.split('+')]
-                            printf_format = ""
-                            printf_args = []
-                            
-                            for part in parts:
-                                if part.startswith('"') and part.endswith('"'):
-                                    printf_format += part[1:-1]  # Remove quotes
-                                else:
-                                    printf_format += "%d"
-                                    printf_args.append(part)
-                            
-                            if printf_args:
-                                result = f'printf("{printf_format}", {", ".join(printf_args)});'
-                            else:
-                                result = f'printf("{printf_format}");'
-                        else:
-                            # Simple argument
-                            if print_arg.startswith('"') and print_arg.endswith('"'):
-                                result = f'printf({print_arg});'
-                            else:
-                                result = f'printf("%d", {print_arg});'
-                        
-                        # Add newline for println
-                        if 'println' in nested_code:
-                            result += ' printf("\\n");'
-                        
-                        return result
-                
-                return f'/* Java code: {nested_code} */'
+        if outer_lang == 'c' and nested_lang in ('py', 'java'):
+            try:
+                return transpile_statements(nested_code, nested_lang, self.global_state)
+            except TranspileError as e:
+                self.log_warning("⚠️ Cannot convert nested {} to C: {}", nested_lang, e)
         
         # Default: return as comment if no conversion available
         return f'/* {nested_lang} code: {nested_code} */'
 
 
 # Compatibility functions for your existing API
+# Stateless parsing and code generation helpers shared by the functions below
+_HELPERS = SharedStateOrchestrator(context=ExecutionContext())
+
 def parse_code_to_tree(code_str: str) -> list:
     """Parse code structure - returns compatible format with enhanced nested detection"""
-    orchestrator = SharedStateOrchestrator()
+    orchestrator = _HELPERS
     structure_type = orchestrator.detect_code_structure(code_str)
     
     if structure_type.startswith('single_'):
@@ -1135,16 +1395,59 @@ def parse_code_to_tree(code_str: str) -> list:
     else:
         return orchestrator.parse_sequential_blocks(code_str)
 
-def execute_tree_generator(blocks: list, input_state: dict = None):
+# Rough seconds per block (container start and compile) and per nested block iteration
+BLOCK_COSTS = {'c': 1.0, 'py': 0.5, 'java': 2.0}
+NESTED_ITERATION_COST = 0.05
+
+def estimate_pipeline_cost(blocks: list) -> float:
+    """Expected cost of running parse_code_to_tree's blocks, for scheduling short runs first"""
+    cost = 0.0
+    for block in blocks:
+        if not block.get('is_nested'):
+            cost += BLOCK_COSTS.get(block['lang'], 1.0)
+            continue
+        for nested in _HELPERS.parse_all_blocks(block['code']):
+            cost += BLOCK_COSTS.get(nested['lang'], 1.0)
+            if nested.get('nested'):
+                # Loop trip counts of the outer block multiply its nested blocks
+                inner = nested['nested_info']['nested_blocks']
+                trips = estimate_loop_trips(nested['nested_info']['outer_content'])
+                cost += sum(BLOCK_COSTS.get(b['lang'], 1.0) for b in inner)
+                cost += trips * len(inner) * NESTED_ITERATION_COST
+    return cost
+
+def execute_tree_generator(blocks: list, input_state: dict = None, context: Optional[ExecutionContext] = None):
     """Execute blocks using shared state orchestrator with full nested support"""
-    orchestrator = SharedStateOrchestrator()
+    if context is None:
+        context = default_context()
+    if context.report is not None:
+        context.report.begin()
+    # Recorded and replayed runs use one container per block
+    sandbox = PipelineSandbox() if context.sandbox and context.backend is None else None
+    orchestrator = SharedStateOrchestrator(sandbox, context)
     if input_state:
         orchestrator.global_state.update(input_state)
     
+    try:
+        lines = execute_blocks_generator(orchestrator, blocks)
+        if context.cpu_profiler is not None:
+            lines = context.cpu_profiler.lines(lines)
+        with context.span('run', blocks=len(blocks), sandbox=context.sandbox):
+            yield from lines
+    finally:
+        if context.report is not None:
+            context.report.sandbox = sandbox is not None and sandbox.container_id is not None
+            context.report.finish()
+        # One sandbox container per pipeline run, removed even if the client goes away
+        if sandbox is not None:
+            sandbox.close()
+
+def execute_blocks_generator(orchestrator: SharedStateOrchestrator, blocks: list):
+    """Execute parsed blocks with an orchestrator, yielding output lines"""
     # Check if this is nested execution
     if len(blocks) == 1 and blocks[0].get('is_nested'):
         # This is nested code - use the full orchestrator
-        if DEBUG_MODE:
+        if orchestrator.context.debug:
             yield "=" * 50
             yield "🔄 NESTED EXECUTION PIPELINE STARTED"
             yield "=" * 50
@@ -1155,28 +1458,43 @@ def execute_tree_generator(blocks: list, input_state: dict = None):
         # Parse all blocks (nested and sequential)
         all_blocks = orchestrator.parse_all_blocks(code_str)
         
-        if DEBUG_MODE:
+        if orchestrator.context.debug:
             yield f"🏗️ Found {len(all_blocks)} blocks to process"
         
-        # Execute blocks in order
-        for i, block in enumerate(all_blocks):
-            if DEBUG_MODE:
-                nested_marker = "(NESTED)" if block.get('nested') else ""
-                yield f"\n🏗️ === BLOCK {i+1}/{len(all_blocks)}: {block['lang'].upper()} {nested_marker} ==="
-            
-            if block.get('nested'):
-                # Handle nested blocks specially - execute the loop
-                nested_output = orchestrator.execute_nested_block_with_loop_and_return_output(block)
-                for line in nested_output:
-                    yield line
-            else:
-                # Regular sequential block
-                program_output = orchestrator.execute_block_with_state_and_output(block)
-                if program_output:
-                    for line in program_output:
+        # Execute blocks in order, compiling each next block while the current one runs
+        upcoming = orchestrator.prepare_ahead(all_blocks, 0)
+        try:
+            for i, block in enumerate(all_blocks):
+                if orchestrator.context.debug:
+                    nested_marker = "(NESTED)" if block.get('nested') else ""
+                    yield f"\n🏗️ === BLOCK {i+1}/{len(all_blocks)}: {block['lang'].upper()} {nested_marker} ==="
+                
+                prepared, upcoming = upcoming, None
+                
+                def prepare_next(index=i + 1):
+                    nonlocal upcoming
+                    upcoming = orchestrator.prepare_ahead(all_blocks, index)
+                orchestrator.report_block(block['lang'], 'nested' if block.get('nested') else 'block')
+                if block.get('nested'):
+                    # Handle nested blocks specially - execute the loop. Nothing is prepared ahead
+                    # while it runs: its reservation includes its nested runtimes and must not wait
+                    # on a block of this same run.
+                    with orchestrator.context.span('block', index=i, lang=block['lang'], nested=True):
+                        nested_output = orchestrator.execute_nested_block_with_loop_and_return_output(block)
+                    for line in nested_output:
                         yield line
-        
-        if DEBUG_MODE:
+                else:
+                    # Regular sequential block
+                    with orchestrator.context.span('block', index=i, lang=block['lang']):
+                        program_output = orchestrator.execute_block_with_state_and_output(block, prepared,
+                                                                                          prepare_next)
+                    if program_output:
+                        for line in program_output:
+                            yield line
+        finally:
+            orchestrator.discard_prepared(upcoming)
+        
+        if orchestrator.context.debug:
             yield "\n" + "=" * 50
             yield "🏁 NESTED EXECUTION SUMMARY"
             yield "=" * 50
@@ -1190,29 +1508,45 @@ def execute_tree_generator(blocks: list, input_state: dict = None):
         
     elif len(blocks) == 1 and not re.search(r'::(\w+)', blocks[0]['code']):
         # Single language
-        program_output = orchestrator.execute_single_language_with_output(blocks[0]['code'], blocks[0]['lang'])
+        orchestrator.report_block(blocks[0]['lang'])
+        with orchestrator.context.span('block', index=0, lang=blocks[0]['lang']):
+            program_output = orchestrator.execute_single_language_with_output(blocks[0]['code'], blocks[0]['lang'])
         if program_output:
             for line in program_output:
                 yield line
     else:
         # Sequential blocks
-        if DEBUG_MODE:
+        if orchestrator.context.debug:
             yield "=" * 50
             yield "🔄 POLYGLOT EXECUTION PIPELINE STARTED"
             yield "=" * 50
         
-        for i, block in enumerate(blocks):
-            if DEBUG_MODE:
-                yield f"\n🏗️ === BLOCK {i+1}/{len(blocks)}: {block['lang'].upper()} ==="
-            
-            # Execute block and get program output
-            program_output = orchestrator.execute_block_with_state_and_output(block)
-            if program_output:
-                for line in program_output:
-                    yield line
+        upcoming = orchestrator.prepare_ahead(blocks, 0)
+        try:
+            for i, block in enumerate(blocks):
+                if orchestrator.context.debug:
+                    yield f"\n🏗️ === BLOCK {i+1}/{len(blocks)}: {block['lang'].upper()} ==="
+                
+                # Compile the next block while this one runs
+                prepared, upcoming = upcoming, None
+                
+                def prepare_next(index=i + 1):
+                    nonlocal upcoming
+                    upcoming = orchestrator.prepare_ahead(blocks, index)
+                orchestrator.report_block(block['lang'])
+                
+                # Execute block and get program output
+                with orchestrator.context.span('block', index=i, lang=block['lang']):
+                    program_output = orchestrator.execute_block_with_state_and_output(block, prepared,
+                                                                                      prepare_next)
+                if program_output:
+                    for line in program_output:
+                        yield line
+        finally:
+            orchestrator.discard_prepared(upcoming)
         
         # Debug final state only if debug mode is enabled
-        if DEBUG_MODE:
+        if orchestrator.context.debug:
             yield "\n" + "=" * 50
             yield "🏁 PIPELINE EXECUTION SUMMARY" 
             yield "=" * 50
@@ -1223,26 +1557,22 @@ def execute_tree_generator(blocks: list, input_state: dict = None):
                 yield "📊 No variables persisted"
             yield "✅ Pipeline completed successfully"
             yield "=" * 50
-        # IMPORTANT: Final state should NEVER appear when DEBUG_MODE is False
+        # IMPORTANT: Final state should NEVER appear when the run has debug output disabled
         # If you see this in output when debug is off, the server needs to be restarted
 
 # Legacy compatibility
 def extract_variable_references(code: str, lang: str) -> set:
-    orchestrator = SharedStateOrchestrator()
-    return orchestrator.extract_variable_references(code, lang)
+    return _HELPERS.extract_variable_references(code, lang)
 
 def extract_modified_variables(code: str, lang: str) -> set:
-    orchestrator = SharedStateOrchestrator()
-    return orchestrator.extract_modified_variables(code, lang)
+    return _HELPERS.extract_modified_variables(code, lang)
 
 def inject_variable_declarations(lang: str, variables: dict) -> str:
-    orchestrator = SharedStateOrchestrator()
-    return orchestrator.inject_variable_declarations(lang, variables)
+    return _HELPERS.inject_variable_declarations(lang, variables)
 
 def inject_output_capture(lang: str, variables: dict, user_code: str = "") -> str:
-    orchestrator = SharedStateOrchestrator()
     var_set = set(variables.keys()) if isinstance(variables, dict) else variables
-    return orchestrator.inject_output_capture(lang, var_set, user_code)
+    return _HELPERS.inject_output_capture(lang, var_set, user_code)
 
 # Main execution function for backend compatibility
 def execute_polyglot_code(code_str: str) -> None:
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+🏁 End-to-End Benchmark Corpus
+Runs the example programs in benchmark_corpus/ (sample.poly, program_nested.poly,
+nested_examples.md, run_nested_examples.py and tests/test_all.py) through the
+whole pipeline on an executor backend, N times each after one warmup run.
+Reports p50/p95/p99 latency, containers started per run, and whether every
+run printed the program's expected output; exits with 1 if any did not.
+The record backend runs on Docker and saves every block's result to
+POLYGLOT_REPLAY_FILE; the replay backend serves them back without Docker,
+taking POLYGLOT_REPLAY_LATENCY (recorded, none or seconds) per program.
+
+    python benchmark_corpus.py [--executor docker|sandbox|record|replay] [--runs 5]
+                               [--only nested] [--json results.json]
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from advanced_orchestrator import execute_tree_generator, parse_code_to_tree
+from execution_context import ExecutionContext
+from replay_executor import executor_backend
+from run_report import RunReport
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_corpus')
+CORPUS_VERSION = 1
+PERCENTILES = (50, 95, 99)
+
+# Output lines of a block that failed, instead of the program's own output
+ERROR_LINE = re.compile(r'^(❌|Error executing )')
+
+
+def run_in_containers(sandbox: bool) -> Callable[[list, RunReport], List[str]]:
+    """Run parsed blocks through the orchestrator, one container per block or one sandbox per run"""
+    def run(blocks: list, report: RunReport) -> List[str]:
+        context = ExecutionContext(sandbox=sandbox, events=None, report=report)
+        return list(execute_tree_generator(blocks, context=context))
+    return run
+
+
+def run_on_backend(mode: str) -> Callable[[list, RunReport], List[str]]:
+    """Run parsed blocks through the record or replay backend, created on first use"""
+    backends = {}
+
+    def run(blocks: list, report: RunReport) -> List[str]:
+        if mode not in backends:
+            backends[mode] = executor_backend(mode)
+        context = ExecutionContext(events=None, report=report, backend=backends[mode])
+        return list(execute_tree_generator(blocks, context=context))
+    return run
+
+
+# Executor backends by name: parsed blocks and a run report in, output lines out
+EXECUTORS: Dict[str, Callable[[list, RunReport], List[str]]] = {
+    'docker': run_in_containers(sandbox=False),
+    'sandbox': run_in_containers(sandbox=True),
+    'record': run_on_backend('record'),
+    'replay': run_on_backend('replay'),
+}
+
+
+def load_corpus(directory: str = CORPUS_DIR) -> List[Dict]:
+    """The corpus programs with their source read in"""
+    with open(os.path.join(directory, 'corpus.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != CORPUS_VERSION:
+        raise ValueError(f"Unsupported corpus version {manifest.get('version')} (expected {CORPUS_VERSION})")
+    programs = []
+    for entry in manifest['programs']:
+        with open(os.path.join(directory, entry['file']), encoding='utf-8') as f:
+            programs.append({**entry, 'source': f.read()})
+    return programs
+
+
+def normalize(lines: List[str]) -> List[str]:
+    """Output lines without surrounding whitespace and blank lines"""
+    return [line.strip() for line in lines if line.strip()]
+
+
+def check_output(program: Dict, lines: List[str]) -> bool:
+    """Whether output matches the program's expected lines; programs without any only run"""
+    expected = program.get('expected')
+    if expected is None:
+        return True
+    actual = normalize(lines)
+    if len(actual) != len(expected):
+        return False
+    if program.get('compare') == 'regex':
+        return all(re.fullmatch(pattern, line) for pattern, line in zip(expected, actual))
+    return actual == expected
+
+
+def percentile(values: List[float], percent: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)), 1) - 1]
+
+
+def run_once(program: Dict, executor: Callable[[list, RunReport], List[str]]) -> Dict:
+    """Parse and execute one program, timing the whole pipeline"""
+    report = RunReport(f"corpus-{program['name']}")
+    started = time.perf_counter()
+    try:
+        lines = executor(parse_code_to_tree(program['source']), report)
+        error = next((line for line in lines if ERROR_LINE.match(line.strip())), None)
+    except Exception as e:
+        lines, error = [], f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - started
+    launches = report.to_dict()
+    return {'seconds': seconds, 'lines': lines, 'error': error,
+            'containers': launches['container_launches'] + launches['sandbox_execs'],
+            'correct': error is None and check_output(program, lines)}
+
+
+def benchmark_program(program: Dict, executor: Callable[[list, RunReport], List[str]], runs: int) -> Dict:
+    """Latency percentiles, containers per run and correctness over `runs` runs after a warmup"""
+    run_once(program, executor)
+    results = [run_once(program, executor) for _ in range(runs)]
+    latencies = [result['seconds'] * 1000 for result in results]
+    summary = {'name': program['name'], 'runs': runs, 'checked': program.get('expected') is not None,
+               'correct': sum(result['correct'] for result in results),
+               'errors': [result['error'] for result in results if result['error']],
+               'containers_per_run': max(result['containers'] for result in results),
+               'mean_ms': round(sum(latencies) / len(latencies), 2)}
+    for percent in PERCENTILES:
+        summary[f'p{percent}_ms'] = round(percentile(latencies, percent), 2)
+    wrong = next((result for result in results if not result['correct']), None)
+    if wrong is not None:
+        summary['output'] = normalize(wrong['lines'])
+    return summary
+
+
+def run_corpus(executor: str = 'docker', runs: int = 5, only: str = '', stream=sys.stdout) -> List[Dict]:
+    """Benchmark every corpus program whose name contains `only`"""
+    results = []
+    for program in load_corpus():
+        if only and only not in program['name']:
+            continue
+        summary = benchmark_program(program, EXECUTORS[executor], runs)
+        results.append(summary)
+        status = '✅' if summary['correct'] == runs else '❌'
+        print(f"  {status} {summary['name']:<24} p50 {summary['p50_ms']:>9,.1f} ms   "
+              f"p95 {summary['p95_ms']:>9,.1f} ms   p99 {summary['p99_ms']:>9,.1f} ms   "
+              f"containers {summary['containers_per_run']:>3}   correct {summary['correct']}/{runs}"
+              + ('' if summary['checked'] else ' (unchecked)'), file=stream)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the end-to-end benchmark corpus")
+    parser.add_argument('--executor', default='docker', choices=sorted(EXECUTORS), help="executor backend")
+    parser.add_argument('--runs', type=int, default=5, help="measured runs per program, after one warmup")
+    parser.add_argument('--only', default='', help="run programs whose name contains this")
+    parser.add_argument('--json', help="write the results to this JSON file")
+    args = parser.parse_args()
+    if args.runs < 1:
+        parser.error("--runs must be at least 1")
+
+    print(f"🏁 Benchmark corpus v{CORPUS_VERSION} on the {args.executor} executor, {args.runs} runs each")
+    results = run_corpus(args.executor, args.runs, args.only)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'corpus_version': CORPUS_VERSION, 'executor': args.executor, 'runs': args.runs,
+                       'created': time.time(), 'programs': results}, f, indent=2, ensure_ascii=False)
+        print(f"💾 Results saved to {args.json}")
+
+    failed = [result for result in results if result['correct'] < result['runs']]
+    if failed:
+        print(f"❌ {len(failed)} programs printed wrong output or failed:")
+        for result in failed:
+            print(f"  {result['name']}: {result['errors'][0] if result['errors'] else result.get('output')}")
+        sys.exit(1)
+    print(f"✅ All {len(results)} programs printed their expected output")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+☕ Java Startup Benchmark
+Times JVM startup per block in the Java runner image with and without the
+class data sharing archive (java.Dockerfile), after checking that the JVM
+really maps PolyState from the archive instead of silently loading it from
+the jar. Needs a running Docker daemon.
+
+    python benchmark_java_startup.py [runs]
+"""
+
+import statistics
+import sys
+import time
+
+import docker
+
+from engine import WORK_DIR, build_image, exec_in_container, get_client, make_archive, wrap_source
+from runtime_profiles import profile_environment
+from state_codec import encode_state, state_loaders, state_signature
+
+STATE = {'n': 7, 'name': 'polyglot', 'values': [5, 3, 9, 1]}
+BLOCK = state_loaders('java', state_signature('java', STATE)) + \
+    'java.util.Arrays.sort(values);\nSystem.out.println(name + " " + n + " " + java.util.Arrays.toString(values));'
+
+CDS_FLAGS = ['-XX:SharedArchiveFile=/opt/polyglot/polyglot.jsa', '-Xshare:auto', '-XX:-UsePerfData',
+             '-cp', '/opt/polyglot/polyglot-runtime.jar:.']
+VARIANTS = {
+    'no sharing': ['-Xshare:off', '-cp', '.'],
+    'JDK archive only': ['-Xshare:auto', '-cp', '.'],
+    'polyglot archive': CDS_FLAGS,
+}
+
+# -Xlog:class+load line of a class mapped from the archive
+SHARED_SOURCE = 'source: shared objects file'
+
+
+def run_once(container_id: str, command) -> float:
+    start = time.perf_counter()
+    channel = exec_in_container(container_id, ['sh', '-c', f'cd {WORK_DIR} && {command}'])
+    channel.close_stdin()
+    output = channel.read_all()
+    if channel.close() != 0:
+        raise RuntimeError(f"Benchmark command failed: {command}\n{output}{channel.stderr}")
+    return time.perf_counter() - start
+
+
+def check_archive_used(container_id: str):
+    """Fail unless PolyState loads from the archive; -Xshare:auto falls back to the jar without a word"""
+    command = f"cd {WORK_DIR} && java {' '.join(CDS_FLAGS)} -Xlog:class+load=info Main"
+    channel = exec_in_container(container_id, ['sh', '-c', command])
+    channel.close_stdin()
+    output = channel.read_all()
+    channel.close()
+    loads = [line for line in output.splitlines() if ' PolyState ' in line]
+    if not loads or SHARED_SOURCE not in loads[0]:
+        raise RuntimeError(f"PolyState was not loaded from the class data sharing archive: "
+                           f"{loads[0] if loads else 'no class+load line'}")
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    jvm_flags = profile_environment('fast')['POLY_JVMFLAGS']
+    api = get_client().api
+    container_id = api.create_container(build_image('java'), entrypoint=['sleep', 'infinity'],
+                                        environment={'POLY_STATE_FILE': f"{WORK_DIR}/state.json"})['Id']
+    try:
+        api.start(container_id)
+        api.put_archive(container_id, WORK_DIR, make_archive({
+            'Main.java': wrap_source('java', BLOCK).encode(),
+            'state.json': encode_state(STATE).encode(),
+        }))
+        run_once(container_id, 'javac Main.java')
+        check_archive_used(container_id)
+
+        print(f"☕ JVM startup per block, {runs} runs each (fast profile: {jvm_flags})")
+        medians = {}
+        for name, flags in VARIANTS.items():
+            command = f"java {' '.join(flags)} {jvm_flags} Main"
+            run_once(container_id, command)  # warm the page cache
+            timings = [run_once(container_id, command) for _ in range(runs)]
+            medians[name] = statistics.median(timings)
+            print(f"  {name:<18} median {medians[name] * 1000:7.1f} ms   "
+                  f"min {min(timings) * 1000:7.1f} ms   max {max(timings) * 1000:7.1f} ms")
+
+        saved = 1 - medians['polyglot archive'] / medians['no sharing']
+        print(f"⚡ Polyglot archive saves {saved:.0%} of JVM startup per block")
+    except docker.errors.APIError as e:
+        raise RuntimeError(f"Docker command failed.\nStderr: {e.explanation}")
+    finally:
+        api.remove_container(container_id, force=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+⏱️ Orchestrator Hot Path Benchmark
+Microbenchmarks the orchestrator's parsing, variable analysis, code
+generation and output processing on synthetic programs, state and output of
+three sizes. Needs no Docker. Reports calls per second and the memory one
+call allocates: its peak, and the blocks still held afterwards. --save
+writes the results as a baseline JSON; --compare checks a run against a
+baseline taken on the same machine and exits with 1 on regressions.
+
+    python benchmark_orchestrator.py [--sizes small,medium,huge] [--only inject]
+                                     [--save baseline.json] [--compare baseline.json]
+"""
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import timeit
+import tracemalloc
+from typing import Callable, Dict, List
+
+from advanced_orchestrator import SharedStateOrchestrator
+from execution_context import ExecutionContext, ParseCache
+
+# Statements per block; state, output lines and generated variables scale with them
+SIZES = {'small': 10, 'medium': 200, 'huge': 5000}
+LANGS = ('py', 'c', 'java')
+
+STATEMENTS = {
+    'py': ('v{i} = {i}', 'v{i} = v{p} * 2', 'print(v{p}, name)', 'items.append(v{p})'),
+    'c': ('int v{i} = {i};', 'v{p} += {i};', 'printf("%d\\n", v{p});', 'arr[{m}] = v{p};'),
+    'java': ('int v{i} = {i};', 'v{p} *= 2;', 'System.out.println(v{p});', 'list.add(v{p});'),
+}
+
+
+def block_code(lang: str, statements: int) -> str:
+    """A block whose statements define, modify, print and collect variables"""
+    templates = STATEMENTS[lang]
+    return '\n'.join(templates[i % len(templates)].format(i=i, p=max(i - 1, 0), m=i % 8)
+                     for i in range(statements))
+
+
+def program(statements: int) -> str:
+    """A polyglot program: one block per language, then a C loop with a nested Python block"""
+    blocks = [f"::{lang}\n{block_code(lang, max(statements // 3, 1))}\n::/{lang}" for lang in LANGS]
+    blocks.append("::c\nint nums[] = {1, 2, 3};\nfor (int i = 0; i < 3; i++) {\n"
+                  "    ::py\n    print(current_nums * 2)\n    ::/py\n}\n::/c")
+    return '\n\n'.join(blocks)
+
+
+def state(statements: int) -> Dict:
+    """State of ints, floats, strings and int lists, half as many variables as statements"""
+    kinds = (lambda i: i, lambda i: i / 3, lambda i: f"text {i}", lambda i: list(range(i % 8 + 1)))
+    return {f"v{i}": kinds[i % len(kinds)](i) for i in range(max(statements // 2, 1))}
+
+
+def block_output(statements: int) -> str:
+    """Raw block output: program lines, then the JSON state line"""
+    lines = [f"line {i}: value {i * 7}" for i in range(statements)]
+    return '\n'.join(lines + [json.dumps(state(statements))])
+
+
+def benchmarks(statements: int) -> Dict[str, Callable[[], object]]:
+    """Zero-argument calls to measure for one size, inputs built up front"""
+    # No parse cache, so every call does the analysis a cold block does
+    orchestrator = SharedStateOrchestrator(context=ExecutionContext(parse_cache=ParseCache(0), events=None))
+    source = program(statements)
+    variables = state(statements)
+    output = block_output(statements)
+    calls = {
+        'detect_code_structure': lambda: orchestrator.detect_code_structure(source),
+        'parse_all_blocks': lambda: orchestrator.parse_all_blocks(source),
+        'process_execution_output_and_return': lambda: orchestrator.process_execution_output_and_return(output),
+    }
+    for lang in LANGS:
+        code = block_code(lang, statements)
+        names = set(variables)
+        calls[f'extract_variable_references[{lang}]'] = \
+            lambda code=code, lang=lang: orchestrator.extract_variable_references(code, lang)
+        calls[f'extract_modified_variables[{lang}]'] = \
+            lambda code=code, lang=lang: orchestrator.extract_modified_variables(code, lang)
+        calls[f'inject_variable_declarations[{lang}]'] = \
+            lambda lang=lang: orchestrator.inject_variable_declarations(lang, variables)
+        calls[f'inject_output_capture[{lang}]'] = \
+            lambda code=code, lang=lang, names=names: orchestrator.inject_output_capture(lang, names, code)
+    return calls
+
+
+def ops_per_second(call: Callable[[], object], min_time: float, repeat: int) -> float:
+    """Best rate over `repeat` rounds of at least `min_time` seconds each"""
+    timer = timeit.Timer(call)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    return number / min(timer.repeat(repeat=repeat, number=number))
+
+
+def allocations(call: Callable[[], object]) -> Dict[str, float]:
+    """Peak memory one call allocates, and the memory blocks still held once it returns"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        result = call()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    held = sum(stat.count_diff for stat in after.compare_to(before, 'lineno') if stat.count_diff > 0)
+    del result
+    return {'alloc_peak_kb': round((peak - base) / 1024, 1), 'alloc_blocks': held}
+
+
+def run_benchmarks(sizes: List[str], only: str = '', min_time: float = 0.2, repeat: int = 3,
+                   stream=sys.stdout) -> Dict[str, Dict]:
+    """Results by `name/size`"""
+    results = {}
+    for size in sizes:
+        for name, call in benchmarks(SIZES[size]).items():
+            if only and only not in name:
+                continue
+            call()  # warm up regex and format caches
+            result = {'ops_per_sec': round(ops_per_second(call, min_time, repeat), 1), **allocations(call)}
+            results[f'{name}/{size}'] = result
+            print(f"  {name:<42} {size:<6} {result['ops_per_sec']:>13,.1f} ops/s   "
+                  f"peak {result['alloc_peak_kb']:>10,.1f} KiB   held {result['alloc_blocks']:>7,} blocks",
+                  file=stream)
+    return results
+
+
+def compare(baseline: Dict[str, Dict], results: Dict[str, Dict], threshold: float = 0.15) -> List[str]:
+    """Benchmarks slower, or allocating more, than the baseline by more than `threshold`"""
+    regressions = []
+    for key, result in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        speed = result['ops_per_sec'] / old['ops_per_sec'] - 1
+        if speed < -threshold:
+            regressions.append(f"{key}: {speed:+.0%} ops/s ({old['ops_per_sec']:,.1f} → {result['ops_per_sec']:,.1f})")
+        # Ignore changes of a few allocations in otherwise tiny numbers
+        if result['alloc_peak_kb'] > old['alloc_peak_kb'] * (1 + threshold) + 1:
+            regressions.append(f"{key}: peak {old['alloc_peak_kb']:,.1f} → {result['alloc_peak_kb']:,.1f} KiB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark the orchestrator's hot paths")
+    parser.add_argument('--sizes', default=','.join(SIZES), help="comma-separated: " + ', '.join(SIZES))
+    parser.add_argument('--only', default='', help="run benchmarks whose name contains this")
+    parser.add_argument('--min-time', type=float, default=0.2, help="seconds per timing round")
+    parser.add_argument('--repeat', type=int, default=3, help="timing rounds; the best one counts")
+    parser.add_argument('--save', help="write the results as a baseline JSON")
+    parser.add_argument('--compare', help="baseline JSON to check the results against")
+    parser.add_argument('--threshold', type=float, default=0.15, help="relative change that counts as regression")
+    args = parser.parse_args()
+
+    sizes = [size for size in args.sizes.split(',') if size]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"unknown sizes {unknown} (choose from {', '.join(SIZES)})")
+
+    print(f"⏱️ Orchestrator hot paths on Python {platform.python_version()}")
+    results = run_benchmarks(sizes, args.only, args.min_time, args.repeat)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'created': time.time(), 'results': results}, f, indent=2)
+        print(f"💾 Baseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline['results'], results, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} regressions against {args.compare}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"✅ No regressions against {args.compare} (threshold {args.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
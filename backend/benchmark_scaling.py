@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+📈 Scaling Workloads
+Generates synthetic .poly programs along six axes (block count, language mix,
+nesting depth, loop trip count, shared state size and stdout volume) and
+sweeps one axis at a time from a base program, tabulating latency and peak
+allocation of parsing, state handling and nested code generation, and with
+--executor of the whole pipeline. Each step reports its growth exponent over
+the previous one (1 is linear) and flags superlinear steps.
+
+    python benchmark_scaling.py emit --blocks 1000 --depth 10 > big.poly
+    python benchmark_scaling.py sweep [--axes blocks,state] [--values state=10,1000]
+                                      [--executor docker] [--json results.json]
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from advanced_orchestrator import SharedStateOrchestrator
+from benchmark_corpus import EXECUTORS, run_once
+from benchmark_orchestrator import allocations
+from execution_context import ExecutionContext, ParseCache
+
+# The program every sweep starts from; a sweep varies one of these at a time
+BASE = {'blocks': 3, 'langs': 'py,c,java', 'depth': 1, 'trips': 3, 'state': 10, 'stdout': 1}
+AXES = {
+    'blocks': (1, 10, 100, 1000),
+    'langs': ('py', 'c', 'java', 'py,c,java'),
+    'depth': (0, 1, 2, 5, 10),
+    'trips': (1, 10, 100, 1000, 10000),
+    'state': (10, 1000, 100000, 1000000),
+    'stdout': (1, 100, 10000, 100000),
+}
+# Growth exponent above which a step counts as superlinear, and the time below which it is noise
+SUPERLINEAR = 1.3
+MIN_SECONDS = 0.0002
+
+PRINT_LOOP = {
+    'py': 'for k in range({n}):\n    print("block", {i}, "line", k)',
+    'c': 'for (int k = 0; k < {n}; k++) printf("block %d line %d\\n", {i}, k);',
+    'java': 'for (int k = 0; k < {n}; k++) System.out.println("block " + {i} + " line " + k);',
+}
+READ_STATE = {
+    'py': 'total{i} = len(data) + {i}',
+    'c': 'int total{i} = data_size + {i};',
+    'java': 'int total{i} = data.length + {i};',
+}
+INNER = {
+    'py': 'print("inner", current_items)',
+    'c': 'printf("inner %d\\n", current_items);',
+    'java': 'System.out.println("inner " + current_items);',
+}
+
+
+def indent(code: str, level: int) -> str:
+    return '\n'.join('    ' * level + line if line else line for line in code.split('\n'))
+
+
+def state_block(lang: str, state: int) -> str:
+    """Defines the shared array `data` of `state` ints"""
+    if lang == 'py':
+        return f"data = list(range({state}))"
+    values = ', '.join(map(str, range(state)))
+    return f"int data[] = {{{values}}};" if lang == 'c' else f"int[] data = {{{values}}};"
+
+
+def nested_block(langs: List[str], depth: int, trips: int) -> str:
+    """A C loop over `trips` items holding `depth` levels of blocks, one inside the other"""
+    lang = langs[depth % len(langs)]
+    block = f"::{lang}\n{indent(INNER[lang], 1)}\n::/{lang}"
+    for level in range(depth - 1, 0, -1):
+        lang = langs[level % len(langs)]
+        block = f"::{lang}\n{indent(block, 1)}\n::/{lang}"
+    items = ', '.join(map(str, range(trips)))
+    return f"::c\nint items[] = {{{items}}};\nfor (int i = 0; i < {trips}; i++) {{\n{indent(block, 1)}\n}}\n::/c"
+
+
+def generate(blocks: int = 3, langs: str = 'py,c,java', depth: int = 1, trips: int = 3,
+             state: int = 10, stdout: int = 1) -> str:
+    """A .poly program: a block defining the shared array, then blocks that read it and print,
+    then a nested loop block if depth > 0"""
+    mix = [lang for lang in langs.split(',') if lang]
+    unknown = [lang for lang in mix if lang not in PRINT_LOOP]
+    if not mix or unknown:
+        raise ValueError(f"Unknown languages {unknown} (choose from {', '.join(PRINT_LOOP)})")
+    sections = [f"::{mix[0]}\n{state_block(mix[0], state)}\n::/{mix[0]}"]
+    for i in range(1, blocks):
+        lang = mix[i % len(mix)]
+        body = READ_STATE[lang].format(i=i) + '\n' + PRINT_LOOP[lang].format(i=i, n=stdout)
+        sections.append(f"::{lang}\n{body}\n::/{lang}")
+    if depth > 0:
+        sections.append(nested_block(mix, depth, trips))
+    return '\n\n'.join(sections) + '\n'
+
+
+def stages(params: Dict, executor: Optional[str] = None) -> Dict[str, Callable[[], object]]:
+    """Zero-argument calls measuring each stage on the program `params` describe"""
+    # No parse cache, so every call parses the whole program again
+    orchestrator = SharedStateOrchestrator(context=ExecutionContext(parse_cache=ParseCache(0), events=None))
+    source = generate(**params)
+    variables = {'data': list(range(params['state'])),
+                 **{f"total{i}": params['state'] + i for i in range(1, params['blocks'])}}
+    output = '\n'.join(f"block 1 line {k}" for k in range(params['stdout'])) + '\n' + json.dumps(variables)
+    mix = [lang for lang in params['langs'].split(',') if lang]
+
+    def parse():
+        orchestrator.detect_code_structure(source)
+        return orchestrator.parse_all_blocks(source)
+
+    def state():
+        declarations = [orchestrator.inject_variable_declarations(lang, variables) for lang in mix]
+        return declarations, orchestrator.process_execution_output_and_return(output)
+
+    blocks = [block for block in parse() if block['nested']]
+
+    def nested_codegen():
+        return [orchestrator.compile_nested_block(block) for block in blocks]
+
+    calls = {'parse': parse, 'state': state, 'nested_codegen': nested_codegen}
+    if executor is not None:
+        program = {'name': 'scaling', 'source': source, 'expected': None}
+        calls['run'] = lambda: run_once(program, EXECUTORS[executor])
+    return calls
+
+
+def best_seconds(call: Callable[[], object], repeat: int) -> float:
+    """Fastest of `repeat` calls"""
+    best = math.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def growth(previous: Optional[Dict], current: Dict, axis: str, key: str) -> Optional[float]:
+    """Exponent k in time ∝ value^k between two steps of a numeric axis"""
+    if previous is None or axis == 'langs':
+        return None
+    ratio = current['value'] / previous['value'] if previous['value'] else math.inf
+    if ratio <= 1 or math.isinf(ratio) or previous[key] < MIN_SECONDS or current[key] < MIN_SECONDS:
+        return None
+    return round(math.log(current[key] / previous[key]) / math.log(ratio), 2)
+
+
+def sweep(axis: str, values, executor: Optional[str] = None, repeat: int = 3, stream=sys.stdout) -> List[Dict]:
+    """Measure every stage at each value of one axis, the other axes at BASE"""
+    rows, previous = [], None
+    print(f"\n📈 {axis}: {', '.join(map(str, values))}", file=stream)
+    for value in values:
+        params = {**BASE, axis: value}
+        row = {'axis': axis, 'value': value, 'source_kb': round(len(generate(**params)) / 1024, 1)}
+        for name, call in stages(params, executor).items():
+            call()  # warm up regex and format caches
+            row[f'{name}_s'] = best_seconds(call, repeat)
+            row[f'{name}_peak_kb'] = allocations(call)['alloc_peak_kb']
+        flags = []
+        for key in [key for key in row if key.endswith('_s')]:
+            exponent = row[f'{key[:-2]}_growth'] = growth(previous, row, axis, key)
+            if exponent is not None and exponent > SUPERLINEAR:
+                flags.append(f"{key[:-2]} x^{exponent}")
+        rows.append(row)
+        previous = row
+        timings = '   '.join(f"{key[:-2]} {row[key] * 1000:>10,.2f} ms / {row[key[:-2] + '_peak_kb']:>10,.1f} KiB"
+                               for key in row if key.endswith('_s'))
+        print(f"  {str(value):<10} {row['source_kb']:>10,.1f} KiB   {timings}"
+              + (f"   ⚠️ superlinear: {', '.join(flags)}" if flags else ''), file=stream)
+    return rows
+
+
+def parse_values(specs: List[str]) -> Dict[str, tuple]:
+    """`axis=v1,v2,...` overrides of an axis' sweep values"""
+    values = {}
+    for spec in specs:
+        axis, _, listed = spec.partition('=')
+        if axis not in AXES or not listed:
+            raise ValueError(f"Expected axis=v1,v2 with an axis of {', '.join(AXES)}, got {spec!r}")
+        if axis == 'langs':
+            values[axis] = tuple(listed.split(';'))
+        else:
+            values[axis] = tuple(int(value) for value in listed.split(','))
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate scaling workloads and sweep them")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    emit = commands.add_parser('emit', help="print one generated program")
+    for axis, default in BASE.items():
+        emit.add_argument(f'--{axis}', type=type(default), default=default)
+
+    run = commands.add_parser('sweep', help="measure stages along each axis")
+    run.add_argument('--axes', default=','.join(AXES), help="comma-separated: " + ', '.join(AXES))
+    run.add_argument('--values', action='append', default=[],
+                     help="override an axis' values, e.g. state=10,1000 (langs separated by ';')")
+    run.add_argument('--executor', choices=sorted(EXECUTORS), help="also time the whole pipeline on this backend")
+    run.add_argument('--repeat', type=int, default=3, help="calls per measurement; the fastest counts")
+    run.add_argument('--json', help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.command == 'emit':
+        sys.stdout.write(generate(**{axis: getattr(args, axis) for axis in BASE}))
+        return
+
+    axes = [axis for axis in args.axes.split(',') if axis]
+    unknown = [axis for axis in axes if axis not in AXES]
+    if unknown:
+        parser.error(f"unknown axes {unknown} (choose from {', '.join(AXES)})")
+    try:
+        values = {**AXES, **parse_values(args.values)}
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"📈 Scaling sweep from {BASE}")
+    rows = [row for axis in axes for row in sweep(axis, values[axis], args.executor, args.repeat)]
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'base': BASE, 'executor': args.executor, 'created': time.time(), 'rows': rows}, f, indent=2)
+        print(f"💾 Results saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
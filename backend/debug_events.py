@@ -0,0 +1,117 @@
+import collections
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Deque, Dict, List, Optional
+
+# Structured debug events. Callers pass a template and its arguments instead
+# of an f-string, and a run's context drops events below its level with one
+# comparison, so nothing is formatted unless someone is listening: the
+# console when the run has debug output on, and the bounded event buffer
+# behind GET /debug/events. Console lines from the server go through
+# ConsoleLogger, which formats and writes them on its own thread and drops
+# what exceeds its rate instead of slowing pipelines down.
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING}
+
+# Lowest level kept in the event buffer for runs without debug output
+EVENT_LEVEL = LEVELS.get(os.environ.get('POLYGLOT_EVENT_LEVEL', 'warning').lower(), WARNING)
+EVENT_BUFFER_SIZE = int(os.environ.get('POLYGLOT_EVENT_BUFFER_SIZE', '2000'))
+
+# Server console lines per second; the rest are counted and reported as suppressed
+LOG_RATE = float(os.environ.get('POLYGLOT_LOG_RATE', '50'))
+LOG_QUEUE_SIZE = int(os.environ.get('POLYGLOT_LOG_QUEUE_SIZE', '1000'))
+
+
+def level_name(level: int) -> str:
+    return next((name for name, value in LEVELS.items() if value == level), str(level))
+
+
+class EventBuffer:
+    """Ring buffer of the most recent debug events across runs"""
+
+    def __init__(self, size: int = EVENT_BUFFER_SIZE):
+        self.events: Deque[Dict] = collections.deque(maxlen=size)
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def append(self, run_id: str, level: int, message: str):
+        with self.lock:
+            self.sequence += 1
+            self.events.append({'seq': self.sequence, 'time': time.time(), 'run_id': run_id,
+                                'level': level_name(level), 'message': message})
+
+    def query(self, run_id: Optional[str] = None, level: int = DEBUG, since: int = 0, limit: int = 200) -> List[Dict]:
+        """The latest events matching the filters, oldest first"""
+        with self.lock:
+            events = [event for event in self.events
+                      if event['seq'] > since and LEVELS[event['level']] >= level
+                      and (run_id is None or event['run_id'] == run_id)]
+        return events[-limit:] if limit > 0 else []
+
+
+# Shared by every run in the server process
+EVENTS = EventBuffer()
+
+
+class ConsoleLogger:
+    """Writes server console lines from a background thread, at most `rate` per second"""
+
+    def __init__(self, rate: float = LOG_RATE, queue_size: int = LOG_QUEUE_SIZE, stream=None):
+        self.rate = rate
+        self.stream = stream
+        self.lines: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.suppressed = 0
+        self.allowance = rate
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+    def log(self, template: str, *args):
+        """Queue a line; it is formatted on the logger thread, or dropped if over the rate"""
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            if self.allowance < 1:
+                self.suppressed += 1
+                return
+            self.allowance -= 1
+            # Lines dropped since the last one written are reported just before this one
+            suppressed, self.suppressed = self.suppressed, 0
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._write, name='poly-console', daemon=True)
+                self.thread.start()
+        try:
+            self.lines.put_nowait((template, args, suppressed))
+        except queue.Full:
+            with self.lock:
+                self.suppressed += suppressed + 1
+
+    def flush(self, timeout: float = 5.0):
+        """Wait until queued lines are written"""
+        deadline = time.monotonic() + timeout
+        while self.lines.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _write(self):
+        while True:
+            template, args, suppressed = self.lines.get()
+            try:
+                stream = self.stream or sys.stdout
+                if suppressed:
+                    print(f"… {suppressed} log lines suppressed", file=stream)
+                print(template.format(*args) if args else template, file=stream, flush=True)
+            except Exception:
+                pass
+            finally:
+                self.lines.task_done()
+
+
+# Console logger for the server's per-run and per-line messages
+SERVER_LOG = ConsoleLogger()
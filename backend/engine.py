@@ -1,61 +1,540 @@
-import subprocess
+import io
 import os
-import tempfile
-import shutil
+import re
+import socket
+import tarfile
 import textwrap
+import threading
+import time
+import queue
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
-def execute_in_docker(lang: str, code: str, state_json: str) -> str:
-    """
-    Builds and runs a Docker container, wrapping code in templates
-    and definitively fixing Python indentation.
-    """
-    c_template = "#include <stdio.h>\n#include <string.h>\nint main() {{ {code} return 0; }}"
-    java_template = "import java.util.Arrays; import java.util.regex.*; public class Main {{ public static void main(String[] args) {{ {code} }} }}"
+from admission import ADMISSION, Reservation
+from metrics import CONTAINER_STARTS, CONTAINERS_RUNNING, timed
+from runtime_profiles import profile_environment
+from state_codec import JAVA_STATE_CLASS, add_state_runtime
+from tracing import traced
+
+import docker
+from docker.utils.socket import frames_iter, STDOUT, STDERR
+
+LANG_MAP = {
+    'c': ('main.c', 'c.Dockerfile', 'polyglot-c-runner'),
+    'py': ('script.py', 'py.Dockerfile', 'polyglot-py-runner'),
+    'java': ('Main.java', 'java.Dockerfile', 'polyglot-java-runner'),
+}
+
+# Language label of each image in metrics; the combined sandbox image is 'sandbox'
+IMAGE_LANGS = dict({image_tag: lang for lang, (_, _, image_tag) in LANG_MAP.items()}, **{'polyglot-sandbox': 'sandbox'})
+
+# Connections kept open to the daemon socket and shared by every block
+DOCKER_POOL_SIZE = int(os.environ.get('POLYGLOT_DOCKER_POOL_SIZE', '10'))
 
-    lang_map = {
-        'c': ('main.c', 'c.Dockerfile', 'polyglot-c-runner', c_template),
-        'py': ('script.py', 'py.Dockerfile', 'polyglot-py-runner', None),
-        'java': ('Main.java', 'java.Dockerfile', 'polyglot-java-runner', java_template),
+# State travels in the run archive, so its size is bounded by configuration rather than ARG_MAX
+MAX_STATE_BYTES = int(os.environ.get('POLYGLOT_MAX_STATE_BYTES', str(16 * 1024 * 1024)))
+
+# Runner images hold only the toolchain; source and state are uploaded into each container
+WORK_DIR = '/usr/src/app'
+STATE_FILE = 'state.json'
+
+# Java images also carry a class data sharing archive built from this program: it loads
+# PolyState and the JDK classes typical blocks and their output capture use, so each
+# block's JVM maps them from the archive instead of loading them (see java.Dockerfile)
+JAVA_CDS_WARMUP = r'''import java.util.Arrays; import java.util.regex.*;
+public class CdsWarmup {
+    public static void main(String[] args) {
+        int n = (int) PolyState.getLong("n");
+        float f = (float) PolyState.getDouble("f");
+        boolean b = PolyState.getBoolean("b");
+        char c = PolyState.getString("c").charAt(0);
+        String s = PolyState.getString("s");
+        int[] a = PolyState.getIntArray("a");
+        Arrays.sort(a);
+        Matcher m = Pattern.compile("[a-z]+").matcher(s);
+        while (m.find()) s = s.replace(m.group(), m.group().toUpperCase());
+        StringBuilder sb = new StringBuilder();
+        for (int i = 0; i < a.length; i++) sb.append(a[i]).append(i < a.length - 1 ? "," : "");
+        System.out.println(Arrays.toString(a) + " " + sb + " " + String.format("%.2f", f) + " " + Math.sqrt(n));
+        System.out.print("{");
+        System.out.print("\"n\": " + n);
+        System.out.print(", ");
+        System.out.print("\"s\": " + s + c + b);
+        System.out.print("}");
+        System.out.println();
     }
+}
+'''
+JAVA_CDS_STATE = '{"n": 42, "f": 1.5, "b": true, "c": "x", "s": "hello \\u00e9 world", "a": [3, 1, 2]}'
 
-    if lang not in lang_map:
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> docker.DockerClient:
+    """
+    Returns the process-wide Docker Engine API client. Its HTTP
+    connection pool keeps daemon connections alive between blocks.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            try:
+                _client = docker.from_env(max_pool_size=DOCKER_POOL_SIZE)
+            except docker.errors.DockerException as e:
+                raise RuntimeError(f"Docker daemon not reachable. Is Docker running?\n{e}")
+        return _client
+
+def wrap_source(lang: str, code: str) -> str:
+    """
+    Wraps code in its language template and definitively fixes
+    Python indentation. Returns the complete source file.
+    """
+    if lang not in LANG_MAP:
         raise ValueError(f"Unsupported language: {lang}")
 
-    filename, dockerfile_name, image_tag, template = lang_map[lang]
-    
-    final_code = code
+    return add_state_runtime(lang, _apply_template(lang, code))
+
+def is_complete_c_program(code: str) -> bool:
+    """Natively compiled nested blocks and loop hosts arrive as complete C programs"""
+    return re.search(r'\bint\s+main\s*\(', code) is not None
+
+def wrap_shared_object(code: str) -> str:
+    """
+    Wraps a C block as a shared object exporting `int poly_block(poly_state *)`
+    for the sandbox's resident runner (poly_runner.c). The state loaders read
+    the JSON text the runner passes in instead of POLY_STATE_FILE.
+    """
+    template = ("#include <stdio.h>\n#include <string.h>\n"
+                "typedef struct poly_state {{ const char *json; }} poly_state;\n"
+                "int poly_block(poly_state *state) {{ poly_state_text = (char *)state->json; {code} return 0; }}")
+    return add_state_runtime('c', template.format(code=code))
+
+def _apply_template(lang: str, code: str) -> str:
+    c_template = "#include <stdio.h>\n#include <string.h>\nint main() {{ {code} return 0; }}"
+    java_template = "import java.util.Arrays; import java.util.regex.*; public class Main {{ public static void main(String[] args) {{ {code} }} }}"
+
     if lang == 'py':
-        final_code = textwrap.dedent(final_code)
-    
+        return textwrap.dedent(code)
+
     # Special handling for Java - don't wrap if it's already a complete class
-    if template and lang == 'java':
+    if lang == 'java':
         # Check if the code already contains a complete class definition
         if 'public class Main' in code and 'public static void main' in code:
-            final_code = code  # Use as-is, don't wrap in template
-        else:
-            final_code = template.format(code=final_code)
-    elif template:
-        final_code = template.format(code=final_code)
-
-    with tempfile.TemporaryDirectory() as temp_dir:
-        with open(os.path.join(temp_dir, filename), 'w') as f:
-            f.write(final_code)
-        
-        # Get the directory where this script is located
+            return code  # Use as-is, don't wrap in template
+        return java_template.format(code=code)
+
+    if is_complete_c_program(code):
+        return code
+    return c_template.format(code=code)
+
+def make_archive(files: Dict[str, bytes]) -> bytes:
+    """
+    Packs files into an in-memory tar archive, for put_archive uploads
+    and build contexts.
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = 0o644
+            info.mtime = int(time.time())
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+def check_state_size(state_json: str) -> bytes:
+    """
+    Encodes state for delivery, refusing state over POLYGLOT_MAX_STATE_BYTES.
+    """
+    state = state_json.encode()
+    if len(state) > MAX_STATE_BYTES:
+        raise RuntimeError(f"State is {len(state)} bytes, over the {MAX_STATE_BYTES} byte limit "
+                           f"(POLYGLOT_MAX_STATE_BYTES)")
+    return state
+
+_built_images = set()
+_build_lock = threading.Lock()
+
+def build_context(image_tag: str, dockerfile_name: str, files: Dict[str, bytes] = None) -> str:
+    """
+    Builds an image from an in-memory context (the Dockerfile plus files)
+    once per process and returns its tag.
+    """
+    with _build_lock:
+        if image_tag in _built_images:
+            return image_tag
+
         script_dir = os.path.dirname(os.path.abspath(__file__))
-        dockerfile_path = os.path.join(script_dir, dockerfile_name)
-        shutil.copyfile(dockerfile_path, os.path.join(temp_dir, dockerfile_name))
-
-        try:
-            build_command = ["docker", "build", "-t", image_tag, "-f", dockerfile_name, "."]
-            subprocess.run(build_command, check=True, cwd=temp_dir, capture_output=True, text=True)
-
-            run_command = ["docker", "run", "--rm", image_tag, state_json]
-            result = subprocess.run(run_command, check=True, capture_output=True, text=True)
-            
-            return result.stdout.strip()
-        except subprocess.CalledProcessError as e:
-            error_message = f"Docker command failed.\nStderr: {e.stderr}"
-            raise RuntimeError(error_message)
-        except FileNotFoundError:
-             raise RuntimeError("Docker command not found. Is Docker installed?")
\ No newline at end of file
+        with open(os.path.join(script_dir, dockerfile_name), 'rb') as f:
+            context = dict(files or {}, **{dockerfile_name: f.read()})
+
+        try:
+            lang = IMAGE_LANGS.get(image_tag, image_tag)
+            with timed('image_build', lang), traced('image_build', lang=lang):
+                get_client().images.build(fileobj=io.BytesIO(make_archive(context)), custom_context=True,
+                                          dockerfile=dockerfile_name, tag=image_tag, rm=True)
+        except docker.errors.BuildError as e:
+            build_log = ''.join(chunk.get('stream', '') + chunk.get('error', '') for chunk in e.build_log)
+            raise RuntimeError(f"Docker command failed.\nStderr: {build_log}")
+        except docker.errors.APIError as e:
+            raise RuntimeError(f"Docker command failed.\nStderr: {e.explanation}")
+
+        _built_images.add(image_tag)
+        return image_tag
+
+def java_runtime_files() -> Dict[str, bytes]:
+    """
+    Build context files for the Java class data sharing archive: PolyState as
+    a class of its own, the warm-up program and the state it reads.
+    """
+    return {
+        'PolyState.java': JAVA_STATE_CLASS.encode(),
+        'CdsWarmup.java': JAVA_CDS_WARMUP.encode(),
+        'cds-state.json': JAVA_CDS_STATE.encode(),
+    }
+
+def build_image(lang: str) -> str:
+    """
+    Builds the runner image for a language (toolchain, plus the class data
+    sharing archive for Java) and returns its tag.
+    """
+    if lang not in LANG_MAP:
+        raise ValueError(f"Unsupported language: {lang}")
+    _, dockerfile_name, image_tag = LANG_MAP[lang]
+    return build_context(image_tag, dockerfile_name, java_runtime_files() if lang == 'java' else None)
+
+def source_files(lang: str, code: str) -> Dict[str, bytes]:
+    """
+    The files a runner container needs before it starts: the wrapped source.
+    """
+    return {LANG_MAP[lang][0]: wrap_source(lang, code).encode()}
+
+def execute_in_docker(lang: str, code: str, state_json: str, profile: str = 'fast') -> str:
+    """
+    Runs code in its runner container, wrapping code in templates
+    and definitively fixing Python indentation. Source and state are
+    uploaded as an in-memory tar archive; nothing is written on the host.
+    """
+    return prepare_in_docker(lang, code, profile).execute(state_json)
+
+# Sample every block container's memory while it runs, for its peak in run reports. Off by
+# default: each sampled container costs a stats stream (admission still samples a few)
+MEASURE_BLOCK_MEMORY = os.environ.get('POLYGLOT_BLOCK_MEMORY', '0').lower() in ('1', 'true', 'yes')
+
+# The sandbox agent ends a block's stderr with this marker and the block's peak RSS in KiB (sandbox_agent.py)
+PEAK_RSS_MARKER = '\x1epoly-peak-rss-kb '
+
+class ContainerChannel:
+    """Line-oriented stdin/stdout channel over a Docker attach or exec socket"""
+
+    def __init__(self, sock, wait: Callable[[], int], kill: Callable[[], None] = None,
+                 cleanup: Callable[[], None] = None):
+        self.sock = sock
+        self._wait = wait
+        self._kill = kill
+        self._cleanup = cleanup
+        self.closed = False
+        self.exit_code: Optional[int] = None
+        self.stderr_chunks: List[bytes] = []
+        # Admission reservation the program holds until it exits, if any
+        self.reservation: Optional[Reservation] = None
+        # Peak memory of the container, when sampled while it ran
+        self.container_peak_mb: Optional[float] = None
+        self._lines: queue.Queue = queue.Queue()
+        # Demultiplex stdout/stderr frames in the background so a chatty program can't stall
+        self._reader = threading.Thread(target=self._read_frames, daemon=True)
+        self._reader.start()
+
+    @property
+    def raw_socket(self) -> socket.socket:
+        return getattr(self.sock, '_sock', self.sock)
+
+    def _read_frames(self):
+        pending = b''
+        try:
+            for stream, data in frames_iter(self.sock, tty=False):
+                if stream == STDERR:
+                    self.stderr_chunks.append(data)
+                elif stream == STDOUT:
+                    pending += data
+                    *lines, pending = pending.split(b'\n')
+                    for line in lines:
+                        self._lines.put(line.decode(errors='replace'))
+        except (OSError, ValueError):
+            pass
+        if pending:
+            self._lines.put(pending.decode(errors='replace'))
+        self._lines.put(None)
+
+    @property
+    def stderr(self) -> str:
+        return b''.join(self.stderr_chunks).decode(errors='replace').split(PEAK_RSS_MARKER, 1)[0]
+
+    @property
+    def peak_memory_mb(self) -> Optional[float]:
+        """Peak memory of the program: its container's, or the RSS the sandbox agent reported"""
+        if self.container_peak_mb is not None:
+            return self.container_peak_mb
+        _, marker, peak = b''.join(self.stderr_chunks).decode(errors='replace').partition(PEAK_RSS_MARKER)
+        if marker and peak.split() and peak.split()[0].isdigit():
+            return int(peak.split()[0]) / 1024
+        return None
+
+    def readline(self) -> Optional[str]:
+        """Next stdout line without its newline, or None once the program exits"""
+        line = self._lines.get()
+        if line is None:
+            # Keep answering None to later calls
+            self._lines.put(None)
+        return line
+
+    def read_all(self) -> str:
+        """Everything the program writes to stdout until it exits"""
+        lines = []
+        while (line := self.readline()) is not None:
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def send_bytes(self, data: bytes):
+        try:
+            self.raw_socket.sendall(data)
+        except OSError:
+            raise RuntimeError(f"Container exited while waiting for input.\nStderr: {self.stderr}")
+
+    def send_line(self, line: str):
+        self.send_bytes((line + '\n').encode())
+
+    def close_stdin(self):
+        try:
+            self.raw_socket.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    def close(self) -> int:
+        """Close stdin, wait for the program and return its exit code"""
+        if self.closed:
+            return self.exit_code
+        self.close_stdin()
+        self._reader.join()
+        try:
+            self.exit_code = self._wait()
+        finally:
+            self.release()
+        return self.exit_code
+
+    def abort(self):
+        """Stop the program without waiting for it to finish"""
+        if self.closed:
+            return
+        if self._kill is not None:
+            try:
+                self._kill()
+            except docker.errors.APIError:
+                pass
+        self.exit_code = -1
+        self.release()
+
+    def release(self):
+        self.closed = True
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        if self._cleanup is not None:
+            try:
+                self._cleanup()
+            except docker.errors.APIError:
+                pass
+
+class PreparedRun:
+    """
+    A program whose container is already started and compiling. It waits
+    for its state (bind) before running, so compilation can overlap with
+    upstream blocks that are still producing that state.
+    """
+
+    def __init__(self, channel: ContainerChannel, bind: Callable[[bytes], None]):
+        self.channel = channel
+        self._bind = bind
+
+    def start(self, state_json: str = "{}") -> ContainerChannel:
+        """Bind state and let the program run; returns its channel with stdin still open"""
+        try:
+            state = check_state_size(state_json)
+            try:
+                self._bind(state)
+            except RuntimeError:
+                # The program already exited (e.g. a compile error); close() reports it
+                pass
+        except BaseException:
+            # Otherwise the program waits for its state forever and keeps its reservation
+            self.channel.abort()
+            raise
+        return self.channel
+
+    def execute(self, state_json: str = "{}") -> str:
+        """Bind state, run to completion and return stdout"""
+        channel = self.start(state_json)
+        try:
+            channel.close_stdin()
+            output = channel.read_all()
+            exit_code = channel.close()
+        except BaseException:
+            channel.abort()
+            raise
+
+        if exit_code != 0:
+            raise RuntimeError(f"Docker command failed.\nStderr: {channel.stderr}")
+        return output.strip()
+
+    def discard(self):
+        """Drop a prepared run that will never be bound"""
+        self.channel.abort()
+
+def resource_limits(cpus: float, memory_mb: int) -> dict:
+    """
+    Host config for a container's --cpus and --memory limits (no swap on top).
+    """
+    return get_client().api.create_host_config(nano_cpus=int(cpus * 1e9), mem_limit=f"{memory_mb}m",
+                                               memswap_limit=f"{memory_mb}m")
+
+def memory_usage_mb(memory_stats: Dict) -> Optional[float]:
+    """
+    Memory use in one stats frame: cgroup v1's max_usage, else (cgroup v2) the
+    current usage. A stopped container's frame has neither.
+    """
+    usage = memory_stats.get('max_usage') or memory_stats.get('usage')
+    return usage / (1024 * 1024) if usage else None
+
+class MemorySampler:
+    """
+    Peak memory of a running container, from the daemon's stats stream (about
+    one frame a second). The daemon reports nothing once the container exited,
+    so the samples have to be taken while it runs; a container that exits
+    before its first frame stays unmeasured.
+    """
+
+    def __init__(self, container_id: str):
+        self.peak_mb: Optional[float] = None
+        self._thread = threading.Thread(target=self._sample, args=(container_id,), daemon=True)
+        self._thread.start()
+
+    def _sample(self, container_id: str):
+        try:
+            # The stream ends when the container stops or is removed
+            for stats in get_client().api.stats(container_id, decode=True, stream=True):
+                usage = memory_usage_mb(stats.get('memory_stats') or {})
+                if usage is not None and (self.peak_mb is None or usage > self.peak_mb):
+                    self.peak_mb = usage
+        except (docker.errors.APIError, OSError, ValueError):
+            pass
+
+def start_container(image_tag: str, files: Dict[str, bytes] = None, environment: Dict[str, str] = None,
+                    reservation: Optional[Reservation] = None) -> ContainerChannel:
+    """
+    Creates a container, uploads files into its working directory, attaches
+    to it and starts it (create/put_archive/attach/start; wait and remove
+    happen when the channel closes). A reservation sets the container's
+    CPU and memory limits and is released when the container goes away.
+    """
+    api = get_client().api
+    environment = dict(environment or {}, POLY_STATE_FILE=f"{WORK_DIR}/{STATE_FILE}")
+    host_config = resource_limits(reservation.cpus, reservation.memory_mb) if reservation else None
+    lang = IMAGE_LANGS.get(image_tag, image_tag)
+    with timed('container_start', lang), traced('container_start', lang=lang):
+        try:
+            container_id = api.create_container(image_tag, stdin_open=True, stdin_once=True,
+                                                environment=environment, host_config=host_config)['Id']
+        except docker.errors.APIError as e:
+            raise RuntimeError(f"Docker command failed.\nStderr: {e.explanation}")
+
+        try:
+            if files:
+                api.put_archive(container_id, WORK_DIR, make_archive(files))
+            # Attach before starting so no early output is lost
+            sock = api.attach_socket(container_id, params={'stdin': 1, 'stdout': 1, 'stderr': 1, 'stream': 1})
+            api.start(container_id)
+        except docker.errors.APIError as e:
+            api.remove_container(container_id, force=True)
+            raise RuntimeError(f"Docker command failed.\nStderr: {e.explanation}")
+    CONTAINER_STARTS.inc(lang=lang)
+    CONTAINERS_RUNNING.inc(lang=lang)
+    observe = reservation is not None and ADMISSION.wants_sample(reservation.key)
+    sampler = MemorySampler(container_id) if MEASURE_BLOCK_MEMORY or observe else None
+
+    def cleanup():
+        CONTAINERS_RUNNING.dec(lang=lang)
+        peak = sampler.peak_mb if sampler is not None else None
+        if MEASURE_BLOCK_MEMORY:
+            channel.container_peak_mb = peak
+        if reservation is not None:
+            reservation.release()
+            if observe and peak is not None:
+                ADMISSION.observe(reservation.key, peak)
+        api.remove_container(container_id, force=True)
+
+    channel = ContainerChannel(sock,
+                               wait=lambda: api.wait(container_id)['StatusCode'],
+                               kill=lambda: api.kill(container_id),
+                               cleanup=cleanup)
+    channel.container_id = container_id
+    channel.reservation = reservation
+    return channel
+
+def prepare_in_docker(lang: str, code: str, profile: str = 'fast',
+                      nested: Iterable[Tuple[str, str]] = ()) -> PreparedRun:
+    """
+    Starts code in its runner container, where it compiles with the runtime
+    profile's flags and then waits for state. Binding uploads state.json and
+    sends the go line the runner images wait for (see *.Dockerfile). Nested
+    (language, profile) runtimes the program starts are reserved with it.
+    """
+    image_tag = build_image(lang)
+    # Waits until the block's CPU and memory fit on the host
+    reservation = ADMISSION.reserve(lang, profile, nested)
+    try:
+        channel = start_container(image_tag, source_files(lang, code), profile_environment(profile), reservation)
+    except Exception:
+        reservation.release()
+        raise
+    api = get_client().api
+
+    def bind(state: bytes):
+        try:
+            api.put_archive(channel.container_id, WORK_DIR, make_archive({STATE_FILE: state}))
+        except docker.errors.APIError as e:
+            raise RuntimeError(f"Docker command failed.\nStderr: {e.explanation}")
+        channel.send_line("go")
+
+    return PreparedRun(channel, bind)
+
+def open_channel(lang: str, code: str, profile: str = 'fast', nested: Iterable[Tuple[str, str]] = ()) -> ContainerChannel:
+    """
+    Starts code in its runner container with stdin attached, for programs
+    that exchange lines with the orchestrator while running.
+    """
+    return prepare_in_docker(lang, code, profile, nested).start()
+
+def exec_in_container(container_id: str, command: List[str], environment: Dict[str, str] = None,
+                      cleanup: Callable[[], None] = None) -> ContainerChannel:
+    """
+    Runs a command inside an already running container with stdin
+    attached, over the same kind of channel as a fresh container.
+    """
+    api = get_client().api
+    try:
+        exec_id = api.exec_create(container_id, command, stdin=True, environment=environment)['Id']
+        sock = api.exec_start(exec_id, socket=True)
+    except docker.errors.APIError as e:
+        raise RuntimeError(f"Docker command failed.\nStderr: {e.explanation}")
+
+    def wait() -> int:
+        # close() has read the exec socket to EOF; the exit code lands a moment later
+        delay = 0.001
+        while True:
+            result = api.exec_inspect(exec_id)
+            if not result['Running'] and result['ExitCode'] is not None:
+                return result['ExitCode']
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    return ContainerChannel(sock, wait=wait, cleanup=cleanup)
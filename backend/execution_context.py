@@ -0,0 +1,127 @@
+import collections
+import os
+import threading
+import uuid
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional
+
+from debug_events import DEBUG, EVENT_LEVEL, EVENTS, SERVER_LOG, ConsoleLogger, EventBuffer
+from profiling import RunProfiler
+from run_report import RunReport
+from tracing import NO_SPAN, Tracer
+
+# Execution context: the settings and shared components one pipeline run uses.
+# The server builds a context per run from its defaults when the run is
+# submitted, so a debug or sandbox toggle only affects runs submitted after it
+# and concurrent pipelines in one process never read each other's settings.
+# Components that are safe to share (the preparation pool, the parse cache)
+# are shared by every context instead of being created per run.
+
+# Background pool that prepares (generates, stages and compiles) upcoming blocks
+PREPARE_POOL = ThreadPoolExecutor(max_workers=int(os.environ.get('POLYGLOT_PREPARE_WORKERS', '4')),
+                                  thread_name_prefix='poly-prepare')
+
+# Iterations a simulated nested loop may run, one container execution per nested block each
+MAX_SIMULATED_ITERATIONS = int(os.environ.get('POLYGLOT_MAX_SIMULATED_ITERATIONS', '1000'))
+
+PARSE_CACHE_SIZE = int(os.environ.get('POLYGLOT_PARSE_CACHE_SIZE', '1024'))
+
+
+class ParseCache:
+    """Bounded LRU cache for results that depend only on a block's code and language"""
+
+    def __init__(self, size: int = PARSE_CACHE_SIZE):
+        self.size = size
+        self.entries: Dict[Hashable, object] = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable, compute: Callable[[], object]):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        value = compute()
+        with self.lock:
+            self.entries[key] = value
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# Shared by every context in the server process
+PARSE_CACHE = ParseCache()
+
+
+class ExecutionContext:
+    """Debug level, limits, executor, caches and metrics sink of one pipeline run"""
+
+    def __init__(self, debug: bool = False, sandbox: bool = False, profile: Optional[str] = None,
+                 max_iterations: int = MAX_SIMULATED_ITERATIONS, executor: Executor = PREPARE_POOL,
+                 parse_cache: ParseCache = PARSE_CACHE,
+                 metrics: Optional[Callable[[str, float, Dict[str, str]], None]] = None,
+                 events: Optional[EventBuffer] = EVENTS, console: ConsoleLogger = SERVER_LOG,
+                 run_id: Optional[str] = None,
+                 report: Optional[RunReport] = None, tracer: Optional[Tracer] = None,
+                 cpu_profiler: Optional[RunProfiler] = None, backend=None):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.debug = debug
+        # Events below this level have no subscriber and are dropped unformatted
+        self.level = DEBUG if debug else EVENT_LEVEL
+        # Run every block in one combined-runtime container
+        self.sandbox = sandbox
+        # Runtime profile for blocks whose header names none (None: POLYGLOT_DEFAULT_PROFILE)
+        self.profile = profile
+        self.max_iterations = max_iterations
+        self.executor = executor
+        self.parse_cache = parse_cache
+        self.metrics = metrics
+        self.events = events
+        # Rate-limited console the run's debug output goes to
+        self.console = console
+        # Timing breakdown the orchestrator fills in, if anyone keeps one for this run
+        self.report = report
+        # Span recorder if this run is traced
+        self.tracer = tracer
+        # cProfile scope if this run is profiled
+        self.cpu_profiler = cpu_profiler
+        # Record/replay backend that runs block programs instead of the engine (replay_executor)
+        self.backend = backend
+
+    def enabled(self, level: int = DEBUG) -> bool:
+        """Whether events of this level are recorded, to skip building expensive arguments"""
+        return level >= self.level
+
+    def log(self, level: int, template: str, *args):
+        """Record an event, formatting template with args only if the run keeps events of this level"""
+        if level < self.level:
+            return
+        message = template.format(*args) if args else template
+        if self.debug:
+            self.console.log(message)
+        if self.events is not None:
+            self.events.append(self.run_id, level, message)
+
+    def span(self, name: str, category: str = 'pipeline', activate: bool = True, **args):
+        """Span of the run's trace around the enclosed code, or a no-op when the run is not traced"""
+        if self.tracer is None:
+            return NO_SPAN
+        return self.tracer.span(name, category, activate, **args)
+
+    def profiled(self):
+        """Profile the enclosed code on this thread if the run is profiled, else a no-op"""
+        if self.cpu_profiler is None:
+            return NO_SPAN
+        return self.cpu_profiler.scope()
+
+    def metric(self, name: str, value: float = 1.0, **labels: str):
+        """Report a measurement to the run's metrics sink, if it has one"""
+        if self.metrics is not None:
+            self.metrics(name, value, labels)
@@ -0,0 +1,194 @@
+import collections
+import os
+import threading
+import time
+from typing import Callable, Deque, Dict, Iterator, List, Optional
+
+# Pipeline runs submitted over WebSocket wait here for one of a fixed number of
+# workers. Waiting runs are dispatched round-robin across clients, so one
+# client's burst cannot hold everyone else back, and submissions beyond the
+# queue depth are rejected instead of oversubscribing Docker.
+#
+# Each run carries an estimated cost (advanced_orchestrator.estimate_pipeline_cost).
+# Short runs go first, and some workers form a fast lane that only takes short
+# runs, so small programs never wait behind long nested loops. A long run ages
+# into the short class the longer it waits, so it cannot starve.
+
+PIPELINE_WORKERS = int(os.environ.get('POLYGLOT_PIPELINE_WORKERS', '4'))
+MAX_QUEUE_DEPTH = int(os.environ.get('POLYGLOT_MAX_QUEUE_DEPTH', '32'))
+FAST_LANE_WORKERS = int(os.environ.get('POLYGLOT_FAST_LANE_WORKERS', '1'))
+SHORT_JOB_COST = float(os.environ.get('POLYGLOT_SHORT_JOB_COST', '3'))
+# Cost a waiting run sheds per second
+AGING_PER_SECOND = float(os.environ.get('POLYGLOT_QUEUE_AGING', '0.5'))
+
+
+class QueueFull(Exception):
+    """Raised when a run is submitted while the queue is at its maximum depth"""
+
+
+class Job:
+    """One submitted run: a line generator, where its lines go and where it waits"""
+
+    def __init__(self, client_id: str, run: Callable[[], Iterator[str]], emit: Callable[[Optional[str]], None],
+                 on_position: Callable[[int], None] = None, cost: float = 0.0):
+        self.client_id = client_id
+        self.run = run
+        self.emit = emit
+        self.on_position = on_position
+        self.cost = cost
+        self.submitted = time.monotonic()
+        self.position: Optional[int] = None
+        self.cancelled = False
+
+    def short(self, now: float) -> bool:
+        """Whether the run counts as short, once its waiting time is taken off its cost"""
+        return self.cost - AGING_PER_SECOND * (now - self.submitted) <= SHORT_JOB_COST
+
+    def cancel(self):
+        """Stop the run: drop it from the queue, or stop it after its current line"""
+        self.cancelled = True
+
+
+class JobQueue:
+    """Fixed worker pool fed from per-client queues, short runs first, round-robin within a class"""
+
+    def __init__(self, workers: int = PIPELINE_WORKERS, max_depth: int = MAX_QUEUE_DEPTH,
+                 fast_lane: int = FAST_LANE_WORKERS):
+        self.workers = workers
+        self.max_depth = max_depth
+        # At least one worker always takes long runs
+        self.fast_lane = max(0, min(fast_lane, workers - 1))
+        self.waiting: Dict[str, Deque[Job]] = collections.OrderedDict()
+        self.running = 0
+        self.running_fast = 0
+        self.completed = 0
+        self.rejected = 0
+        self.condition = threading.Condition()
+        self.threads: List[threading.Thread] = []
+
+    def depth(self) -> int:
+        return sum(len(jobs) for jobs in self.waiting.values())
+
+    @staticmethod
+    def pick(waiting: Dict[str, Deque[Job]], now: float, fast_lane: bool = False) -> Optional[str]:
+        """Client whose next run goes first: the first short one in round-robin order, else the first"""
+        for client_id, jobs in waiting.items():
+            if (jobs[0].cost <= SHORT_JOB_COST) if fast_lane else jobs[0].short(now):
+                return client_id
+        if fast_lane or not waiting:
+            return None
+        return next(iter(waiting))
+
+    def ordered(self) -> List[Job]:
+        """Waiting jobs in the order workers will take them (if none arrive or age meanwhile)"""
+        now = time.monotonic()
+        waiting = collections.OrderedDict((client_id, collections.deque(jobs))
+                                          for client_id, jobs in self.waiting.items())
+        order = []
+        while waiting:
+            client_id = self.pick(waiting, now)
+            jobs = waiting.pop(client_id)
+            order.append(jobs.popleft())
+            if jobs:
+                waiting[client_id] = jobs
+        return order
+
+    def submit(self, client_id: str, run: Callable[[], Iterator[str]], emit: Callable[[Optional[str]], None],
+               on_position: Callable[[int], None] = None, cost: float = 0.0) -> Job:
+        """Queue a run whose lines (then None) are passed to emit; raises QueueFull when overloaded"""
+        job = Job(client_id, run, emit, on_position, cost)
+        with self.condition:
+            if self.depth() >= self.max_depth:
+                self.rejected += 1
+                raise QueueFull(f"Server busy: {self.depth()} runs already queued, please try again shortly")
+            self.waiting.setdefault(client_id, collections.deque()).append(job)
+            self._start_workers()
+            self._notify_positions()
+            self.condition.notify_all()
+        return job
+
+    def cancel(self, job: Job):
+        with self.condition:
+            job.cancel()
+            jobs = self.waiting.get(job.client_id)
+            if jobs is not None and job in jobs:
+                jobs.remove(job)
+                if not jobs:
+                    del self.waiting[job.client_id]
+                self._notify_positions()
+
+    def stats(self) -> Dict[str, int]:
+        with self.condition:
+            return {'workers': self.workers, 'fast_lane': self.fast_lane, 'queued': self.depth(),
+                    'running': self.running, 'running_fast_lane': self.running_fast,
+                    'completed': self.completed, 'rejected': self.rejected, 'max_depth': self.max_depth}
+
+    def _start_workers(self):
+        while len(self.threads) < self.workers:
+            fast_lane = len(self.threads) < self.fast_lane
+            name = f"poly-pipeline-{'fast-' if fast_lane else ''}{len(self.threads)}"
+            thread = threading.Thread(target=self._work, args=(fast_lane,), name=name, daemon=True)
+            self.threads.append(thread)
+            thread.start()
+
+    def _notify_positions(self):
+        # Runs an idle worker is about to take are not waiting
+        idle_fast = self.fast_lane - self.running_fast
+        idle = self.workers - self.fast_lane - (self.running - self.running_fast)
+        position = 0
+        for job in self.ordered():
+            if idle_fast > 0 and job.cost <= SHORT_JOB_COST:
+                idle_fast -= 1
+                continue
+            if idle > 0:
+                idle -= 1
+                continue
+            position += 1
+            if job.position != position:
+                job.position = position
+                if job.on_position is not None:
+                    job.on_position(position)
+
+    def _next(self, fast_lane: bool) -> Job:
+        with self.condition:
+            while (client_id := self.pick(self.waiting, time.monotonic(), fast_lane)) is None:
+                self.condition.wait()
+            # Take the head of that client's queue, then move the client to the back
+            jobs = self.waiting.pop(client_id)
+            job = jobs.popleft()
+            if jobs:
+                self.waiting[client_id] = jobs
+            job.position = 0
+            self.running += 1
+            self.running_fast += fast_lane
+            self._notify_positions()
+            return job
+
+    def _work(self, fast_lane: bool = False):
+        while True:
+            job = self._next(fast_lane)
+            lines = None
+            try:
+                lines = job.run()
+                for line in lines:
+                    if job.cancelled:
+                        break
+                    job.emit(line)
+            except Exception as e:
+                # A failing run or a client that went away must not take the worker down
+                if not job.cancelled:
+                    try:
+                        job.emit(f"❌ Error: {e}")
+                    except Exception:
+                        pass
+            finally:
+                if hasattr(lines, 'close'):
+                    lines.close()
+                try:
+                    job.emit(None)
+                except Exception:
+                    pass
+                with self.condition:
+                    self.running -= 1
+                    self.running_fast -= fast_lane
+                    self.completed += 1
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+🌊 WebSocket Load Test
+Opens a pool of concurrent /ws connections and submits corpus programs
+(benchmark_corpus/) at a target arrival rate, Poisson or evenly spaced.
+Measures time to the first line and to "--- Pipeline Finished ---" from each
+run's scheduled arrival, so a saturated client pool shows up as latency
+instead of hiding it. It also records the error rate, output correctness and
+the server's RSS, CPU use, queue depth and runs in flight from /metrics.
+Start the server with POLYGLOT_EXECUTOR=replay to measure server scaling
+apart from container cost, or on Docker to measure capacity.
+
+    python load_test.py [--url ws://localhost:8000/ws?debug=0] [--clients 100] [--rate 20]
+                        [--runs 500] [--mix simple_python=3,nested_python_java=1]
+                        [--json summary.json]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import websockets
+
+from benchmark_corpus import ERROR_LINE, check_output, load_corpus, normalize, percentile
+
+FINISHED = "--- Pipeline Finished ---"
+# Lines the server sends about a run rather than from its programs
+STATUS_LINE = re.compile(r'^(🚀 Starting pipeline\.\.\.|⏳ Queued, position \d+|⚠️ .*)$')
+# Server gauges sampled while the test runs, summed over their labels
+SERVER_GAUGES = {
+    'polyglot_process_resident_memory_mb': 'rss_mb',
+    'polyglot_process_cpu_seconds': 'cpu_seconds',
+    'polyglot_queue_depth': 'queue_depth',
+    'polyglot_runs_in_flight': 'runs_in_flight',
+}
+
+
+def parse_mix(spec: str, programs: List[Dict]) -> List[Tuple[Dict, float]]:
+    """Programs with their relative weights from `name=weight,...`; empty: every program, equally"""
+    if not spec:
+        return [(program, 1.0) for program in programs]
+    by_name = {program['name']: program for program in programs}
+    mix = []
+    for entry in spec.split(','):
+        name, _, weight = entry.partition('=')
+        if name not in by_name:
+            raise ValueError(f"Unknown corpus program {name!r}")
+        mix.append((by_name[name], float(weight or 1)))
+    return mix
+
+
+def schedule(mix: List[Tuple[Dict, float]], rate: float, runs: int, poisson: bool = True,
+             seed: int = 0) -> List[Tuple[float, Dict]]:
+    """Arrival offsets in seconds with the program submitted at each"""
+    rng = random.Random(seed)
+    programs, weights = zip(*mix)
+    offset, arrivals = 0.0, []
+    for _ in range(runs):
+        arrivals.append((offset, rng.choices(programs, weights)[0]))
+        offset += rng.expovariate(rate) if poisson else 1 / rate
+    return arrivals
+
+
+def parse_metrics(text: str) -> Dict[str, float]:
+    """The sampled gauges from a Prometheus text exposition"""
+    values = dict.fromkeys(SERVER_GAUGES.values(), 0.0)
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        name, _, value = line.rpartition(' ')
+        name = name.split('{', 1)[0]
+        if name in SERVER_GAUGES:
+            values[SERVER_GAUGES[name]] += float(value)
+    return values
+
+
+def fetch(url: str, timeout: float = 5.0) -> str:
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read().decode()
+
+
+async def sample_server(base_url: str, interval: float, samples: List[Dict], stop: asyncio.Event):
+    """Scrape /metrics every `interval` seconds until stopped; an unreachable server leaves gaps"""
+    while True:
+        try:
+            text = await asyncio.to_thread(fetch, f"{base_url}/metrics")
+            samples.append({'time': time.perf_counter(), **parse_metrics(text)})
+        except OSError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+            return
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_program(websocket, program: Dict, scheduled: float, timeout: float) -> Dict:
+    """Submit one program on a connection and read its lines until the run is finished"""
+    sent = time.perf_counter()
+    await websocket.send(program['source'])
+    first_line, lines = None, []
+    while True:
+        message = await asyncio.wait_for(websocket.recv(), timeout=max(sent + timeout - time.perf_counter(), 0.001))
+        if first_line is None:
+            first_line = time.perf_counter() - scheduled
+        if message == FINISHED:
+            break
+        lines.append(message)
+    finished = time.perf_counter() - scheduled
+    output = [line for line in normalize(lines) if not STATUS_LINE.match(line)]
+    error = next((line for line in output if ERROR_LINE.match(line)), None)
+    return {'program': program['name'], 'client_wait': sent - scheduled, 'first_line': first_line,
+            'finished': finished, 'lines': len(lines), 'error': error,
+            'queued': any(line.startswith('⏳') for line in lines),
+            'correct': error is None and check_output(program, output)}
+
+
+class Clients:
+    """Open /ws connections, each running one program at a time"""
+
+    def __init__(self, url: str):
+        self.url = url
+        # An idle connection, or None for a slot whose connection failed and is opened again on use
+        self.idle: asyncio.Queue = asyncio.Queue()
+        self.connect_errors = 0
+
+    async def connect(self):
+        try:
+            return await websockets.connect(self.url, max_size=None, open_timeout=30)
+        except (OSError, asyncio.TimeoutError, websockets.WebSocketException):
+            self.connect_errors += 1
+            return None
+
+    async def open(self, count: int):
+        for websocket in await asyncio.gather(*(self.connect() for _ in range(count))):
+            self.idle.put_nowait(websocket)
+
+    async def run(self, program: Dict, scheduled: float, timeout: float) -> Dict:
+        websocket = await self.idle.get()
+        try:
+            if websocket is None:
+                websocket = await self.connect()
+                if websocket is None:
+                    raise ConnectionError(f"could not connect to {self.url}")
+            return await run_program(websocket, program, scheduled, timeout)
+        except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+            # The connection may still carry the rest of this run; start over with a fresh one
+            if websocket is not None:
+                await websocket.close()
+            websocket = None
+            if isinstance(e, asyncio.TimeoutError):
+                reason = f"timeout after {timeout:.0f}s"
+            else:
+                reason = f"{type(e).__name__}: {e}"
+            return {'program': program['name'], 'client_wait': None, 'first_line': None, 'finished': None,
+                    'lines': 0, 'error': reason, 'queued': False, 'correct': False}
+        finally:
+            self.idle.put_nowait(websocket)
+
+    async def close(self):
+        while not self.idle.empty():
+            websocket = self.idle.get_nowait()
+            if websocket is not None:
+                await websocket.close()
+
+
+def distribution(values: List[float]) -> Optional[Dict[str, float]]:
+    """p50/p95/p99/max of seconds, in ms"""
+    if not values:
+        return None
+    summary = {f'p{percent}': round(percentile(values, percent) * 1000, 1) for percent in (50, 95, 99)}
+    summary['max'] = round(max(values) * 1000, 1)
+    return summary
+
+
+def server_usage(samples: List[Dict]) -> Optional[Dict[str, float]]:
+    """RSS, average CPU cores, and the peak queue depth and runs in flight over the test"""
+    if len(samples) < 2:
+        return None
+    first, last = samples[0], samples[-1]
+    return {'rss_start_mb': round(first['rss_mb'], 1), 'rss_peak_mb': round(max(s['rss_mb'] for s in samples), 1),
+            'rss_end_mb': round(last['rss_mb'], 1),
+            'cpu_cores': round((last['cpu_seconds'] - first['cpu_seconds']) / (last['time'] - first['time']), 2),
+            'queue_depth_max': max(s['queue_depth'] for s in samples),
+            'runs_in_flight_max': max(s['runs_in_flight'] for s in samples)}
+
+
+def summarize(results: List[Dict], wall_seconds: float, samples: List[Dict]) -> Dict:
+    """Latency distributions, error rate, correctness and server usage of a finished test"""
+    done = [result for result in results if result['finished'] is not None]
+    errors = [result for result in results if result['error']]
+    programs = {}
+    for name in sorted({result['program'] for result in results}):
+        runs = [result for result in results if result['program'] == name]
+        programs[name] = {'runs': len(runs), 'errors': sum(bool(result['error']) for result in runs),
+                          'correct': sum(result['correct'] for result in runs),
+                          'finished_ms': distribution([r['finished'] for r in runs if r['finished'] is not None])}
+    return {
+        'runs': len(results),
+        'completed': len(done),
+        'duration_s': round(wall_seconds, 2),
+        'throughput_rps': round(len(done) / wall_seconds, 2) if wall_seconds else 0.0,
+        'error_rate': round(len(errors) / len(results), 4) if results else 0.0,
+        'incorrect': sum(not result['correct'] and not result['error'] for result in results),
+        'queued': sum(result['queued'] for result in results),
+        'first_line_ms': distribution([result['first_line'] for result in done]),
+        'finished_ms': distribution([result['finished'] for result in done]),
+        'client_wait_ms': distribution([result['client_wait'] for result in done]),
+        'errors': sorted({result['error'] for result in errors})[:10],
+        'programs': programs,
+        'server': server_usage(samples),
+    }
+
+
+async def load_test(url: str, mix: List[Tuple[Dict, float]], clients: int = 100, rate: float = 20.0,
+                    runs: int = 500, timeout: float = 120.0, poisson: bool = True, seed: int = 0,
+                    sample_interval: float = 1.0, stream=sys.stdout) -> Dict:
+    """Submit `runs` programs at `rate` per second over `clients` connections and summarize"""
+    parts = urlsplit(url)
+    base_url = f"{'https' if parts.scheme == 'wss' else 'http'}://{parts.netloc}"
+    pool = Clients(url)
+    await pool.open(clients)
+    print(f"  {clients - pool.connect_errors}/{clients} connections open", file=stream)
+
+    samples, stop = [], asyncio.Event()
+    sampler = asyncio.create_task(sample_server(base_url, sample_interval, samples, stop))
+    started = time.perf_counter()
+    tasks = []
+    for offset, program in schedule(mix, rate, runs, poisson, seed):
+        await asyncio.sleep(max(started + offset - time.perf_counter(), 0))
+        tasks.append(asyncio.create_task(pool.run(program, started + offset, timeout)))
+    results = await asyncio.gather(*tasks)
+    wall_seconds = time.perf_counter() - started
+    stop.set()
+    await sampler
+    await pool.close()
+
+    summary = summarize(results, wall_seconds, samples)
+    summary.update(url=url, clients=clients, target_rate=rate, connect_errors=pool.connect_errors)
+    return summary
+
+
+def print_summary(summary: Dict, stream=sys.stdout):
+    def line(label: str, values: Optional[Dict]) -> str:
+        if values is None:
+            return f"  {label:<16} -"
+        return f"  {label:<16} " + '   '.join(f"{key} {value:>9,.1f} ms" for key, value in values.items())
+
+    print(f"\n📊 {summary['completed']}/{summary['runs']} runs in {summary['duration_s']}s "
+          f"({summary['throughput_rps']} runs/s, target {summary['target_rate']}/s), "
+          f"error rate {summary['error_rate']:.1%}, {summary['incorrect']} with wrong output, "
+          f"{summary['queued']} queued", file=stream)
+    print(line('first line', summary['first_line_ms']), file=stream)
+    print(line('finished', summary['finished_ms']), file=stream)
+    print(line('client wait', summary['client_wait_ms']), file=stream)
+    server = summary['server']
+    if server is not None:
+        print(f"  server           RSS {server['rss_start_mb']} → {server['rss_end_mb']} MiB "
+              f"(peak {server['rss_peak_mb']})   CPU {server['cpu_cores']} cores   "
+              f"queue ≤ {server['queue_depth_max']:.0f}   in flight ≤ {server['runs_in_flight_max']:.0f}",
+              file=stream)
+    for error in summary['errors']:
+        print(f"  ❌ {error}", file=stream)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the /ws endpoint with concurrent clients")
+    parser.add_argument('--url', default='ws://localhost:8000/ws?debug=0', help="WebSocket endpoint (debug off)")
+    parser.add_argument('--clients', type=int, default=100, help="concurrent connections")
+    parser.add_argument('--rate', type=float, default=20.0, help="target arrivals per second")
+    parser.add_argument('--runs', type=int, default=500, help="programs submitted in total")
+    parser.add_argument('--mix', default='', help="corpus programs and weights, e.g. simple_python=3,counting=1")
+    parser.add_argument('--fixed-interval', action='store_true', help="space arrivals evenly instead of Poisson")
+    parser.add_argument('--timeout', type=float, default=120.0, help="seconds a run may take")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the arrival schedule and program choice")
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help="exit with 1 above this error rate")
+    parser.add_argument('--json', help="write the summary to this JSON file")
+    args = parser.parse_args()
+    if args.clients < 1 or args.runs < 1 or args.rate <= 0:
+        parser.error("--clients, --runs and --rate must be positive")
+    try:
+        mix = parse_mix(args.mix, load_corpus())
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"🌊 {args.runs} runs at {args.rate}/s over {args.clients} connections to {args.url}")
+    summary = asyncio.run(load_test(args.url, mix, args.clients, args.rate, args.runs, args.timeout,
+                                    not args.fixed_interval, args.seed))
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(dict(summary, created=time.time()), f, indent=2, ensure_ascii=False)
+        print(f"💾 Summary saved to {args.json}")
+    if summary['error_rate'] > args.max_error_rate:
+        print(f"❌ Error rate {summary['error_rate']:.1%} above {args.max_error_rate:.1%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,575 @@
+import json
+import math
+import re
+import textwrap
+from typing import Dict, List, Any, Tuple, Iterator
+
+from admission import hosting
+from runtime_profiles import select_profile
+from state_codec import encode_state, signature_compatible, state_signature
+from transpiler import (C_RUNTIME, C_SCALAR_TYPES, CBackend, Symbol, TranspileError, blank_c_literals,
+                        c_string_literal, declaration_scope, find_c_declarations,
+                        normalize_python_block, parse_nested_block, scan_c_declarations,
+                        type_of_value)
+
+# Loop host: the outer block runs as a real program in its own language (any
+# loop shape, nested loops, any number of arrays). Every nested block site is
+# replaced by a callback that prints a marker line with the visible variables
+# and blocks on stdin; the orchestrator runs the nested block and replies with
+# the updated values.
+
+CALL_MARKER = '\x1ePOLY_CALL'
+
+
+class LoopHostError(Exception):
+    """Raised when an outer block cannot be hosted"""
+
+
+PY_HOST_PRELUDE = '''import json as _poly_json
+import sys as _poly_sys
+
+def _poly_call(_site):
+    _vars = {}
+    for _name, _value in list(globals().items()):
+        if _name.startswith('_'):
+            continue
+        try:
+            _poly_json.dumps(_value)
+        except (TypeError, ValueError):
+            continue
+        _vars[_name] = _value
+    _poly_sys.stdout.flush()
+    print("\\x1ePOLY_CALL", _site, _poly_json.dumps(_vars), flush=True)
+    globals().update(_poly_json.loads(_poly_sys.stdin.readline()))
+
+'''
+
+JAVA_HOST_CLASS = '''import java.util.*;
+import java.util.regex.*;
+
+public class Main {
+    static Scanner __polyIn = new Scanner(System.in);
+
+    static void __polyJson(StringBuilder sb, Object v, boolean allowNan) {
+        if (v instanceof String) {
+            sb.append('"');
+            for (char ch : ((String) v).toCharArray()) {
+                if (ch == '"' || ch == '\\\\') sb.append('\\\\').append(ch);
+                else if (ch == '\\n') sb.append("\\\\n");
+                else if (ch < 0x20) sb.append(String.format("\\\\u%04x", (int) ch));
+                else sb.append(ch);
+            }
+            sb.append('"');
+        } else if (v instanceof int[]) {
+            sb.append(Arrays.toString((int[]) v));
+        } else if (v instanceof long[]) {
+            sb.append(Arrays.toString((long[]) v));
+        } else if (v instanceof Double || v instanceof Float) {
+            // JSON has no NaN or Infinity: the state gets null, callbacks (read by Python's json) the tokens
+            double d = ((Number) v).doubleValue();
+            sb.append(!allowNan && (Double.isNaN(d) || Double.isInfinite(d)) ? "null" : String.valueOf(v));
+        } else if (v instanceof double[]) {
+            double[] items = (double[]) v;
+            sb.append('[');
+            for (int k = 0; k < items.length; k++) {
+                if (k > 0) sb.append(", ");
+                __polyJson(sb, items[k], allowNan);
+            }
+            sb.append(']');
+        } else if (v instanceof float[]) {
+            float[] items = (float[]) v;
+            sb.append('[');
+            for (int k = 0; k < items.length; k++) {
+                if (k > 0) sb.append(", ");
+                __polyJson(sb, items[k], allowNan);
+            }
+            sb.append(']');
+        } else if (v instanceof boolean[]) {
+            sb.append(Arrays.toString((boolean[]) v));
+        } else if (v instanceof String[]) {
+            sb.append('[');
+            String[] items = (String[]) v;
+            for (int k = 0; k < items.length; k++) {
+                if (k > 0) sb.append(", ");
+                __polyJson(sb, items[k], allowNan);
+            }
+            sb.append(']');
+        } else {
+            sb.append(String.valueOf(v));
+        }
+    }
+
+    static String __polyObject(Object... pairs) {
+        return __polyObject(false, pairs);
+    }
+
+    static String __polyObject(boolean allowNan, Object[] pairs) {
+        StringBuilder sb = new StringBuilder("{");
+        for (int k = 0; k < pairs.length; k += 2) {
+            if (k > 0) sb.append(", ");
+            __polyJson(sb, pairs[k], allowNan);
+            sb.append(": ");
+            __polyJson(sb, pairs[k + 1], allowNan);
+        }
+        return sb.append("}").toString();
+    }
+
+    static void __polyCall(int site, Object... pairs) {
+        System.out.flush();
+        System.out.println("\\u001ePOLY_CALL " + site + " " + __polyObject(true, pairs));
+        System.out.flush();
+    }
+
+    public static void main(String[] args) {
+%s
+    }
+}
+'''
+
+# Resident Python runtime for nested py blocks: one container per hosted run
+# instead of one per iteration
+PY_NESTED_AGENT = '''import contextlib
+import io
+import json
+import sys
+
+for line in sys.stdin:
+    request = json.loads(line)
+    namespace = dict(request['state'])
+    buffer = io.StringIO()
+    error = None
+    try:
+        with contextlib.redirect_stdout(buffer):
+            exec(compile(request['code'], '<nested>', 'exec'), namespace)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    state = {}
+    for name, value in namespace.items():
+        if name.startswith('_'):
+            continue
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            continue
+        state[name] = value
+    print(json.dumps({'stdout': buffer.getvalue(), 'state': state, 'error': error}), flush=True)
+'''
+
+# Resident Java and C runtimes for nested blocks in those languages: the block
+# is generated and compiled once per state shape and then runs once per
+# request line (the state as JSON), ending each run with a marker line
+NESTED_DONE_MARKER = '\x1ePOLY_DONE'
+
+C_NESTED_AGENT = '''int main() {
+    char *poly_request = NULL;
+    size_t poly_request_size = 0;
+    while (getline(&poly_request, &poly_request_size, stdin) > 0) {
+        poly_state_text = poly_request;
+        {
+%s
+        }
+        printf("\\n\\036POLY_DONE\\n");
+        fflush(stdout);
+    }
+    return 0;
+}
+'''
+
+JAVA_NESTED_AGENT = '''import java.util.*;
+import java.util.regex.*;
+
+public class Main {
+    public static void main(String[] args) throws Exception {
+        java.io.BufferedReader __polyRequests = new java.io.BufferedReader(new java.io.InputStreamReader(System.in, "UTF-8"));
+        for (String __polyRequest; (__polyRequest = __polyRequests.readLine()) != null; ) {
+            PolyState.load(__polyRequest);
+            {
+%s
+            }
+            System.out.println();
+            System.out.println("\\u001ePOLY_DONE");
+            System.out.flush();
+        }
+    }
+}
+'''
+
+NESTED_AGENTS = {'c': C_NESTED_AGENT, 'java': JAVA_NESTED_AGENT}
+
+JAVA_DECL_TYPES = {'int': 'int', 'long': 'int', 'short': 'int', 'byte': 'int',
+                   'double': 'float', 'float': 'float', 'boolean': 'bool', 'String': 'str'}
+
+
+def find_java_declarations(code: str) -> List[Dict[str, Any]]:
+    """Find Java local variable declarations with their IR type and scope"""
+    clean = blank_c_literals(code)
+    declarations = []
+    pattern = r'\b(int|long|short|byte|double|float|boolean|String)\s*(\[\s*\])?\s+([A-Za-z_]\w*)\s*(?=[=;,:)])'
+    for match in re.finditer(pattern, clean):
+        java_type, array, name = match.group(1), match.group(2), match.group(3)
+        before = clean[:match.start()]
+        in_header = re.search(r'\bfor\s*\([^;)]*$', before) is not None
+        declarations.append({
+            'name': name,
+            'type': JAVA_DECL_TYPES[java_type] + ('[]' if array else ''),
+            'java_type': java_type,
+            'top_level': before.count('{') == before.count('}') and not in_header,
+            'scope': declaration_scope(clean, match.start(), in_header),
+        })
+    return declarations
+
+
+class PythonNestedRuntime:
+    """A resident Python container that executes nested py blocks on request"""
+
+    def __init__(self, open_channel):
+        self.open_channel = open_channel
+        self.channel = None
+
+    def execute(self, code: str, state: Dict[str, Any]) -> Tuple[List[str], Dict[str, Any]]:
+        if self.channel is None:
+            self.channel = self.open_channel('py', PY_NESTED_AGENT)
+        public_state = {k: v for k, v in state.items() if not k.startswith('_')}
+        self.channel.send_line(json.dumps({'code': normalize_python_block(code), 'state': public_state}))
+        reply = self.channel.readline()
+        if reply is None:
+            raise RuntimeError(f"Nested Python runtime exited.\nStderr: {self.channel.stderr}")
+        result = json.loads(reply)
+        lines = [line for line in result['stdout'].split('\n') if line.strip()]
+        if result['error']:
+            lines.append(f"Error executing nested py: {result['error']}")
+        return lines, result['state']
+
+    def close(self):
+        if self.channel is not None:
+            self.channel.close()
+            self.channel = None
+
+
+class CompiledNestedRuntime:
+    """A resident Java or C program that executes one nested site on request"""
+
+    def __init__(self, orchestrator, site: Dict, profile: str):
+        self.orchestrator = orchestrator
+        self.block = {'lang': site['lang'], 'code': site['code']}
+        self.profile = profile
+        self.channel = None
+        self.signature = None
+
+    def execute(self, state: Dict[str, Any]) -> str:
+        """Run the site with the given state and return its output, state line included"""
+        lang = self.block['lang']
+        referenced = self.orchestrator.extract_variable_references(self.block['code'], lang)
+        # What the block declares itself (e.g. on an earlier call) is not loaded again
+        declared = self.orchestrator.extract_modified_variables(self.block['code'], lang)
+        variables = {k: v for k, v in state.items()
+                     if k in referenced and k not in declared and not k.startswith('_')}
+        signature = state_signature(lang, variables)
+        if self.channel is not None and not signature_compatible(lang, self.signature, signature):
+            # Declarations (and C array sizes) are compiled in; a new shape needs a new program
+            self.close()
+        if self.channel is None:
+            code = self.orchestrator.generate_block_code(self.block, signature)
+            program = NESTED_AGENTS[lang].replace('%s', textwrap.indent(code, ' ' * 12))
+            self.channel = self.orchestrator.open_channel(lang, program, self.profile)
+            self.signature = signature
+        self.channel.send_line(encode_state(variables))
+        lines = []
+        while True:
+            line = self.channel.readline()
+            if line is None:
+                stderr = self.channel.stderr
+                self.close()
+                raise RuntimeError(f"Nested {lang} runtime exited.\nStderr: {stderr}")
+            if line == NESTED_DONE_MARKER:
+                return '\n'.join(lines).strip()
+            lines.append(line)
+
+    def close(self):
+        if self.channel is not None:
+            self.channel.close()
+            self.channel = None
+
+
+class LoopHost:
+    """Run an outer block as a real program and serve its nested blocks through callbacks"""
+
+    def __init__(self, orchestrator, block: Dict):
+        nested_info = block['nested_info']
+        self.orchestrator = orchestrator
+        self.outer_lang = nested_info['outer_lang']
+        self.outer_code = nested_info['outer_content']
+        self.profile = block.get('profile')
+        self.sites = sorted(nested_info['nested_blocks'], key=lambda b: b['start'])
+        self.writeback: Dict[int, List[Tuple[str, str]]] = {}
+        # Nested block executions served so far
+        self.calls = 0
+        self.python_runtime = PythonNestedRuntime(orchestrator.open_channel)
+
+        skeleton = self.outer_code
+        for site in self.sites:
+            skeleton = skeleton[:site['start']] + ' ' * (site['end'] - site['start']) + skeleton[site['end']:]
+        self.skeleton = skeleton
+        # One resident runtime per Java or C site, started on its first call
+        self.compiled_runtimes = {index: CompiledNestedRuntime(orchestrator, site, profile)
+                                  for index, (site, (_, profile)) in enumerate(zip(self.sites, self.nested_runtimes()))
+                                  if site['lang'] in NESTED_AGENTS}
+
+        builders = {'c': self.build_c_program, 'py': self.build_python_program, 'java': self.build_java_program}
+        if self.outer_lang not in builders:
+            raise LoopHostError(f"cannot host nested blocks inside {self.outer_lang}")
+        self.program = builders[self.outer_lang]()
+
+    # Analysis shared by all outer languages
+    def state_variables(self, declared: set) -> Dict[str, Any]:
+        """Shared-state variables the outer code reads but does not declare itself"""
+        referenced = self.orchestrator.extract_variable_references(self.skeleton, self.outer_lang)
+        return {k: v for k, v in self.orchestrator.global_state.items()
+                if k in referenced and k not in declared and not k.startswith('_')}
+
+    def created_variables(self, declared: set) -> Dict[str, str]:
+        """Variables nested blocks create that the outer code uses afterwards, with their IR types"""
+        referenced = self.orchestrator.extract_variable_references(self.skeleton, self.outer_lang)
+        created = {}
+        for site in self.sites:
+            for name in self.orchestrator.extract_modified_variables(site['code'], site['lang']):
+                if name in referenced and name not in declared and name not in self.orchestrator.global_state:
+                    created[name] = self.infer_type(site, name)
+        return created
+
+    def infer_type(self, site: Dict, name: str) -> str:
+        """Best-effort type of a variable assigned by a nested block (int if unknown)"""
+        try:
+            backend = CBackend({}, self.orchestrator.global_state, assume_int=True)
+            backend.statements(parse_nested_block(site['code'], site['lang']))
+            symbol = backend.symbols.get(name)
+            if symbol is not None and symbol.type in ('int', 'float', 'bool', 'str'):
+                return symbol.type
+        except TranspileError:
+            pass
+        return 'int'
+
+    def visible(self, declarations: List[Dict], site: Dict) -> List[Dict]:
+        """Declarations in scope at a nested site (innermost wins)"""
+        visible = {}
+        for declaration in declarations:
+            start, end = declaration['scope']
+            if start < site['start'] and site['end'] <= end:
+                visible[declaration['name']] = declaration
+        return list(visible.values())
+
+    def replace_sites(self, calls: List[str]) -> str:
+        program = self.outer_code
+        for site, call in reversed(list(zip(self.sites, calls))):
+            program = program[:site['start']] + call + program[site['end']:]
+        return program
+
+    # C outer programs
+    def build_c_program(self) -> str:
+        if re.search(r'#\s*include|\bmain\s*\(', self.outer_code):
+            raise LoopHostError("outer C code must be statements only")
+        declarations = find_c_declarations(self.skeleton)
+        declared = {d['name'] for d in declarations}
+        # inject_variable_declarations emits int arrays, int/float scalars and char arrays
+        state_vars = {name: value for name, value in self.state_variables(declared).items()
+                      if type_of_value(value) in ('int', 'float', 'int[]')
+                      or (isinstance(value, str) and len(value) != 1)}
+        created = self.created_variables(declared | set(state_vars))
+
+        # Everything declared at the top of main is visible at every site
+        whole = (0, len(self.outer_code))
+        injected = [{'name': name, 'type': type_of_value(value), 'top_level': True,
+                     'single': isinstance(value, float), 'scope': whole}
+                    for name, value in state_vars.items()]
+        injected += [{'name': name, 'type': type_, 'top_level': True, 'single': False, 'scope': whole}
+                     for name, type_ in created.items()]
+
+        calls = [self.c_callback(index, injected + self.visible(declarations, site))
+                 for index, site in enumerate(self.sites)]
+
+        prelude = self.orchestrator.inject_variable_declarations('c', state_vars)
+        defaults = {'int': '0', 'float': '0.0', 'bool': '0', 'str': '""'}
+        for name, type_ in created.items():
+            prelude += f"{C_SCALAR_TYPES[type_]} {name} = {defaults[type_]};\n"
+
+        captured = {d['name']: d for d in injected}
+        for name, declaration in scan_c_declarations(self.skeleton).items():
+            captured.setdefault(name, declaration)
+        capture = CBackend(captured, {}).capture(captured)
+
+        return (C_RUNTIME + "\nint main() {\n" + textwrap.indent(prelude, '    ')
+                + self.replace_sites(calls) + "\n"
+                + "".join(f"    {line}\n" for line in capture)
+                + "    return 0;\n}\n")
+
+    def c_callback(self, index: int, visible: List[Dict]) -> str:
+        """Statement replacing a nested site: report variables, then read numeric values back"""
+        lines = ["fflush(stdout);", f"fputs({c_string_literal(f'{CALL_MARKER} {index} {{')}, stdout);"]
+        writeback = []
+        emitted = 0
+        for declaration in visible:
+            name, type_ = declaration['name'], declaration['type']
+            if type_ in ('char', 'pointer', 'bool', 'str[]'):
+                continue
+            prefix = ', ' if emitted else ''
+            emitted += 1
+            lines.append(f"fputs({c_string_literal(prefix + json.dumps(name) + ': ')}, stdout);")
+            lines.extend(CBackend().json_value(Symbol(name, type_, 'outer'), allow_nan=True))
+            if type_ != 'str':
+                writeback.append((name, type_))
+        lines += ['fputs("}\\n", stdout);', "fflush(stdout);"]
+        for name, type_ in writeback:
+            scanned = ('{ long long _v; if (scanf("%lld", &_v) == 1) TARGET = _v; }' if type_.startswith('int')
+                       else '{ double _v; if (scanf("%lf", &_v) == 1) TARGET = _v; }')
+            if type_.endswith('[]'):
+                lines.append(f"for (long long _k = 0; _k < (long long)(sizeof({name}) / sizeof({name}[0])); _k++) "
+                             + scanned.replace('TARGET', f"{name}[_k]"))
+            else:
+                lines.append(scanned.replace('TARGET', name))
+        self.writeback[index] = writeback
+        return "{ " + " ".join(lines) + " }"
+
+    # Python outer programs
+    def build_python_program(self) -> str:
+        calls = [f"_poly_call({index})" for index in range(len(self.sites))]
+        body = normalize_python_block(self.replace_sites(calls))
+        modified = self.orchestrator.extract_modified_variables(self.skeleton, 'py')
+        for site in self.sites:
+            modified |= self.orchestrator.extract_modified_variables(site['code'], site['lang'])
+        state_vars = self.state_variables(set())
+        return (PY_HOST_PRELUDE
+                + self.orchestrator.inject_variable_declarations('py', state_vars)
+                + body
+                + self.orchestrator.inject_output_capture('py', modified, body))
+
+    # Java outer programs
+    def build_java_program(self) -> str:
+        if 'class ' in self.outer_code:
+            raise LoopHostError("outer Java code must be statements only")
+        declarations = find_java_declarations(self.skeleton)
+        declared = {d['name'] for d in declarations}
+        state_vars = self.state_variables(declared)
+        calls = [self.java_callback(index, self.visible(declarations, site))
+                 for index, site in enumerate(self.sites)]
+        # Report the final values of top-level and injected variables as one JSON line
+        captured = list(state_vars) + [d['name'] for d in declarations if d['top_level']]
+        pairs = ''.join(f', "{name}", {name}' for name in dict.fromkeys(captured))
+        body = (self.orchestrator.inject_variable_declarations('java', state_vars)
+                + self.replace_sites(calls)
+                + f"\nSystem.out.println(__polyObject({pairs[2:]}));\n")
+        return JAVA_HOST_CLASS.replace('%s', textwrap.indent(body, '        '))
+
+    def java_callback(self, index: int, visible: List[Dict]) -> str:
+        pairs, writeback, lines = [], [], []
+        for declaration in visible:
+            name, java_type, type_ = declaration['name'], declaration['java_type'], declaration['type']
+            pairs.append(f'"{name}", {name}')
+            if type_ == 'str' or type_ == 'str[]':
+                continue
+            parse = {'int': '(int) Long.parseLong(__polyIn.next())', 'long': 'Long.parseLong(__polyIn.next())',
+                     'short': '(short) Long.parseLong(__polyIn.next())', 'byte': '(byte) Long.parseLong(__polyIn.next())',
+                     'double': 'Double.parseDouble(__polyIn.next())', 'float': '(float) Double.parseDouble(__polyIn.next())',
+                     'boolean': 'Boolean.parseBoolean(__polyIn.next())'}[java_type]
+            if type_.endswith('[]'):
+                lines.append(f"for (int _k = 0; _k < {name}.length; _k++) {name}[_k] = {parse};")
+            else:
+                lines.append(f"{name} = {parse};")
+            writeback.append((name, type_))
+        self.writeback[index] = writeback
+        args = ''.join(', ' + pair for pair in pairs)
+        return f"__polyCall({index}{args}); " + " ".join(lines)
+
+    # Running
+    def encode_reply(self, index: int, variables: Dict[str, Any]) -> str:
+        """Reply line carrying the values the outer program reads back after a callback"""
+        state = self.orchestrator.global_state
+        if self.outer_lang == 'py':
+            return json.dumps({k: v for k, v in state.items() if not k.startswith('_')})
+        values = []
+        for name, type_ in self.writeback[index]:
+            original = variables.get(name)
+            value = state.get(name, original)
+            if type_.endswith('[]'):
+                # Arrays keep their outer length; a value that no longer fits leaves the slot unchanged
+                items = value if isinstance(value, list) else []
+                pairs = zip(list(items)[:len(original)] + original[len(items):], original)
+            else:
+                pairs = [(value, original)]
+            for item, fallback in pairs:
+                values.append(self.encode_value(item, fallback, type_[:-2] if type_.endswith('[]') else type_))
+        return ' '.join(values)
+
+    @staticmethod
+    def encode_value(value: Any, fallback: Any, type_: str) -> str:
+        for candidate in (value, fallback):
+            try:
+                if type_ == 'bool':
+                    return 'true' if candidate else 'false'
+                if type_ == 'int':
+                    return str(int(candidate))
+                number = float(candidate)
+            except (TypeError, ValueError, OverflowError):
+                continue
+            # Spelled so both Java's parseDouble and C's scanf read them
+            if math.isnan(number):
+                return 'NaN'
+            if math.isinf(number):
+                return 'Infinity' if number > 0 else '-Infinity'
+            return repr(number)
+        # A non-finite float arrives as null and nothing replaced it
+        return 'NaN' if type_ == 'float' else '0'
+
+    def dispatch(self, index: int, variables: Dict[str, Any]) -> List[str]:
+        """Execute one nested block with the outer program's current variables"""
+        site = self.sites[index]
+        self.calls += 1
+        self.orchestrator.global_state.update(variables)
+        with self.orchestrator.context.span('iteration', index=self.calls - 1, site=index, lang=site['lang']):
+            if site['lang'] == 'py':
+                lines, state = self.python_runtime.execute(site['code'], self.orchestrator.global_state)
+                self.orchestrator.global_state.update(state)
+                return lines
+            if index not in self.compiled_runtimes:
+                return [f"Error executing {site['lang']}: unsupported nested language"]
+            try:
+                output = self.compiled_runtimes[index].execute(self.orchestrator.global_state)
+            except Exception as e:
+                return [f"Error executing {site['lang']}: {e}"]
+            program_lines, _ = self.orchestrator.process_execution_output_and_return(output)
+            return program_lines
+
+    def nested_runtimes(self) -> List[Tuple[str, str]]:
+        """(language, profile) of the runtimes nested blocks start, reserved with the outer program"""
+        default = self.orchestrator.context.profile
+        return [('py', select_profile('py', PY_NESTED_AGENT, default)) if site['lang'] == 'py' else
+                (site['lang'], select_profile(site['lang'], site['code'], site.get('profile') or default))
+                for site in self.sites]
+
+    def run(self) -> Iterator[str]:
+        """Run the outer program, yielding program output lines as they arrive"""
+        channel = self.orchestrator.open_channel(self.outer_lang, self.program, self.profile,
+                                                 self.nested_runtimes())
+        try:
+            while True:
+                line = channel.readline()
+                if line is None:
+                    break
+                if line.startswith(CALL_MARKER):
+                    _, index, payload = line.split(' ', 2)
+                    # Nested runtimes draw from the outer program's reservation instead of waiting on the host
+                    with hosting(getattr(channel, 'reservation', None)):
+                        lines = self.dispatch(int(index), json.loads(payload))
+                    for nested_line in lines:
+                        yield nested_line
+                    channel.send_line(self.encode_reply(int(index), json.loads(payload)))
+                else:
+                    program_lines, _ = self.orchestrator.process_execution_output_and_return(line)
+                    for program_line in program_lines:
+                        yield program_line
+            if channel.close() != 0:
+                yield f"Error executing {self.outer_lang}: {channel.stderr.strip()}"
+        finally:
+            channel.abort()
+            self.python_runtime.close()
+            for runtime in self.compiled_runtimes.values():
+                runtime.close()
@@ -0,0 +1,126 @@
+import collections
+import itertools
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+# Memory of the server process. tracemalloc is off until started through
+# POST /memory/tracemalloc/start, because it slows every allocation down;
+# while it runs, snapshots can be taken, listed by the source line that
+# allocated the most, and diffed against each other to find what grows
+# between two points in time (global_state copies, block output strings,
+# split line lists). The peak memory of each block's own program is measured
+# by the engine and kept in the run report instead.
+
+# Stack frames recorded per allocation; 1 groups by the allocating line only
+TRACEMALLOC_FRAMES = int(os.environ.get('POLYGLOT_TRACEMALLOC_FRAMES', '1'))
+SNAPSHOT_HISTORY = int(os.environ.get('POLYGLOT_MEMORY_SNAPSHOTS', '10'))
+GROUP_BY = ('lineno', 'filename', 'traceback')
+
+# Allocations made by tracemalloc and the import machinery are not the server's
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def resident_memory_mb() -> Optional[float]:
+    """Current resident set size of this process (Linux), in MiB"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def process_memory() -> Dict:
+    """Current and peak RSS of the server process, plus tracemalloc's totals while it runs"""
+    memory = {'rss_mb': resident_memory_mb(),
+              'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+              'tracemalloc': tracemalloc.is_tracing()}
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        memory.update(traced_mb=current / (1024 * 1024), traced_peak_mb=peak / (1024 * 1024))
+    return memory
+
+
+def stat_dict(stat, group_by: str) -> Dict:
+    frame = stat.traceback[0]
+    entry = {'file': frame.filename, 'line': frame.lineno if group_by != 'filename' else None,
+             'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+    if hasattr(stat, 'size_diff'):
+        entry.update(size_diff_kb=round(stat.size_diff / 1024, 1), count_diff=stat.count_diff)
+    if group_by == 'traceback':
+        entry['traceback'] = stat.traceback.format()
+    return entry
+
+
+class SnapshotStore:
+    """The latest tracemalloc snapshots of the server process, by ID"""
+
+    def __init__(self, size: int = SNAPSHOT_HISTORY):
+        self.size = size
+        self.snapshots: Dict[int, Dict] = collections.OrderedDict()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def start(self, frames: int = TRACEMALLOC_FRAMES):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(frames, 1))
+
+    def stop(self):
+        """Stop tracing; snapshots taken so far stay available"""
+        tracemalloc.stop()
+
+    def take(self) -> Dict:
+        """Snapshot the allocations traced so far"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running (POST /memory/tracemalloc/start)")
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        traces = snapshot.traces
+        size_mb = round(sum(trace.size for trace in traces) / (1024 * 1024), 3)
+        with self.lock:
+            snapshot_id = next(self.ids)
+            self.snapshots[snapshot_id] = {'id': snapshot_id, 'taken': time.time(), 'blocks': len(traces),
+                                           'size_mb': size_mb, 'snapshot': snapshot}
+            while len(self.snapshots) > self.size:
+                self.snapshots.popitem(last=False)
+        return self.summary(snapshot_id)
+
+    def get(self, snapshot_id: int) -> tracemalloc.Snapshot:
+        with self.lock:
+            entry = self.snapshots.get(snapshot_id)
+        if entry is None:
+            raise KeyError(f"No snapshot {snapshot_id} (only the latest {self.size} are kept)")
+        return entry['snapshot']
+
+    def summary(self, snapshot_id: int) -> Dict:
+        with self.lock:
+            entry = self.snapshots.get(snapshot_id)
+        if entry is None:
+            raise KeyError(f"No snapshot {snapshot_id} (only the latest {self.size} are kept)")
+        return {key: value for key, value in entry.items() if key != 'snapshot'}
+
+    def recent(self) -> List[Dict]:
+        with self.lock:
+            entries = list(self.snapshots.values())
+        return [{key: value for key, value in entry.items() if key != 'snapshot'} for entry in entries]
+
+    def top(self, snapshot_id: int, group_by: str = 'lineno', limit: int = 20) -> List[Dict]:
+        """Where a snapshot's memory was allocated, largest first"""
+        stats = self.get(snapshot_id).statistics(group_by)
+        return [stat_dict(stat, group_by) for stat in stats[:limit]]
+
+    def diff(self, first_id: int, second_id: int, group_by: str = 'lineno', limit: int = 20) -> List[Dict]:
+        """What grew or shrank from the first snapshot to the second, largest change first"""
+        stats = self.get(second_id).compare_to(self.get(first_id), group_by)
+        return [stat_dict(stat, group_by) for stat in stats[:limit]]
+
+
+# Shared by every run in the server process
+SNAPSHOTS = SnapshotStore()
@@ -0,0 +1,198 @@
+import bisect
+import contextlib
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+# In-process metrics in the Prometheus text format, served by GET /metrics.
+# Counters and histograms are updated under one short per-metric lock;
+# gauges whose value lives elsewhere (queue depth, admission, caches) are read
+# from callbacks only when the endpoint is scraped.
+
+# Seconds; pipeline phases range from sub-millisecond parsing to image builds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+def format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Monotonic count per label combination"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[LabelValues, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self.values.get(tuple(labels[name] for name in self.labelnames), 0.0)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        with self.lock:
+            values = list(self.values.items())
+        for key, value in values:
+            yield self.name + '_total', format_labels(self.labelnames, key), value
+
+
+class Gauge:
+    """Current value per label combination, set directly or read from a callback at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 callback: Callable[[], Dict[LabelValues, float]] = None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.values: Dict[LabelValues, float] = {}
+        self.lock = threading.Lock()
+
+    def set(self, value: float, **labels: str):
+        with self.lock:
+            self.values[tuple(labels[name] for name in self.labelnames)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        if self.callback is not None:
+            values = list(self.callback().items())
+        else:
+            with self.lock:
+                values = list(self.values.items())
+        for key, value in values:
+            yield self.name, format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """Distribution of observed values per label combination in cumulative buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label combination: a count per bucket (plus +Inf), then the sum of observations
+        self.values: Dict[LabelValues, List[float]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0.0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def count(self, **labels: str) -> int:
+        counts = self.values.get(tuple(labels[name] for name in self.labelnames))
+        return int(sum(counts[:-1])) if counts else 0
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        with self.lock:
+            values = [(key, list(counts)) for key, counts in self.values.items()]
+        names = self.labelnames + ('le',)
+        for key, counts in values:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else format_value(bound)
+                yield self.name + '_bucket', format_labels(names, key + (le,)), cumulative
+            yield self.name + '_sum', format_labels(self.labelnames, key), counts[-1]
+            yield self.name + '_count', format_labels(self.labelnames, key), cumulative
+
+
+class Registry:
+    """The metrics a process exposes, rendered in registration order"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+              callback: Callable[[], Dict[LabelValues, float]] = None) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames, callback))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception:
+                # A failing callback must not break the scrape
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {format_value(value)}" for name, labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+# Shared by every run in the server process
+REGISTRY = Registry()
+
+PHASE_SECONDS = REGISTRY.histogram(
+    'polyglot_phase_seconds', 'Time spent in each pipeline phase, by block language', ('phase', 'lang'))
+PHASE_ERRORS = REGISTRY.counter(
+    'polyglot_phase_errors', 'Pipeline phases that raised, by block language', ('phase', 'lang'))
+BLOCKS = REGISTRY.counter('polyglot_blocks', 'Blocks executed, by language', ('lang',))
+CONTAINER_STARTS = REGISTRY.counter('polyglot_container_starts', 'Containers started, by image language', ('lang',))
+CONTAINERS_RUNNING = REGISTRY.gauge('polyglot_containers_running', 'Containers currently alive, by image language',
+                                    ('lang',))
+PREPARED_AHEAD = REGISTRY.counter(
+    'polyglot_prepared_ahead', 'Blocks prepared ahead that were used (hit) or regenerated (miss)', ('lang', 'result'))
+RUNS = REGISTRY.counter('polyglot_runs', 'Pipeline runs finished, by outcome', ('outcome',))
+WEBSOCKET_MESSAGES = REGISTRY.counter('polyglot_websocket_messages', 'Lines sent to WebSocket clients')
+
+
+@contextlib.contextmanager
+def timed(phase: str, lang: str = 'all'):
+    """Observe how long the enclosed code takes as one phase; failures are also counted"""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        PHASE_ERRORS.inc(phase=phase, lang=lang)
+        raise
+    finally:
+        PHASE_SECONDS.observe(time.perf_counter() - started, phase=phase, lang=lang)
@@ -0,0 +1,140 @@
+/*
+ * Resident runner for C blocks compiled as shared objects (pipeline sandbox).
+ *
+ * Each request is one line on stdin: "<block.so>\t<state.json>\n". The runner
+ * forks a child per request, like the Python zygote: the child drops to
+ * POLY_BLOCK_UID with the sandbox agent's block rlimits, dlopens the block and
+ * calls poly_block(&state) with stdout and stderr redirected into
+ * per-invocation memory files. A block that calls exit() or crashes only ends
+ * its own child. The runner answers on stdout with a header line
+ * "<exit code> <stdout bytes> <stderr bytes> <peak RSS KiB>\n" followed by
+ * both buffers; a block killed by a signal reports 128 + the signal number.
+ */
+#define _GNU_SOURCE
+#include <dlfcn.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <grp.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/mman.h>
+#include <sys/resource.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+typedef struct poly_state { const char *json; } poly_state;
+typedef int (*poly_block_fn)(poly_state *);
+
+/* Exit code of a child that could not load the block or drop privileges */
+#define SETUP_FAILED 127
+
+static char *read_file(const char *path) {
+    FILE *f = fopen(path, "rb");
+    long size = 0;
+    if (f) { fseek(f, 0, SEEK_END); size = ftell(f); fseek(f, 0, SEEK_SET); }
+    char *text = calloc(size + 1, 1);
+    if (f) { size = (long)fread(text, 1, size, f); fclose(f); }
+    return text;
+}
+
+static void copy_out(int fd, FILE *to) {
+    char buffer[65536];
+    ssize_t n;
+    lseek(fd, 0, SEEK_SET);
+    while ((n = read(fd, buffer, sizeof buffer)) > 0) fwrite(buffer, 1, (size_t)n, to);
+}
+
+/* The limits and user of sandbox_agent.py's BLOCK_RLIMITS and BLOCK_UID */
+static int drop_privileges(void) {
+    const char *cpu = getenv("POLY_BLOCK_CPU_SECONDS");
+    struct { int resource; rlim_t value; } limits[] = {
+        { RLIMIT_CPU, cpu ? strtoull(cpu, NULL, 10) : 300 },
+        { RLIMIT_NOFILE, 1024 },
+        { RLIMIT_CORE, 0 },
+    };
+    for (size_t i = 0; i < sizeof limits / sizeof limits[0]; i++) {
+        struct rlimit limit;
+        getrlimit(limits[i].resource, &limit);
+        rlim_t value = limits[i].value;
+        if (limit.rlim_max != RLIM_INFINITY && value > limit.rlim_max) value = limit.rlim_max;
+        limit.rlim_cur = limit.rlim_max = value;
+        if (setrlimit(limits[i].resource, &limit) != 0) return -1;
+    }
+    const char *uid = getenv("POLY_BLOCK_UID");
+    if (uid && *uid) {
+        uid_t id = (uid_t)strtoul(uid, NULL, 10);
+        if (setgroups(0, NULL) != 0 || setgid(id) != 0 || setuid(id) != 0) return -1;
+    }
+    return 0;
+}
+
+/* In the forked child: only stdio stays open, pointing at /dev/null and this invocation's buffers */
+static void run_block(const char *path, poly_state *state, int out_fd, int err_fd) {
+    int null_fd = open("/dev/null", O_RDONLY);
+    dup2(null_fd, STDIN_FILENO);
+    dup2(out_fd, STDOUT_FILENO);
+    dup2(err_fd, STDERR_FILENO);
+    closefrom(STDERR_FILENO + 1);
+    setsid();
+    if (drop_privileges() != 0) {
+        perror("poly_runner: dropping privileges");
+        _exit(SETUP_FAILED);
+    }
+    void *handle = dlopen(path, RTLD_NOW | RTLD_LOCAL);
+    poly_block_fn fn = handle ? (poly_block_fn)dlsym(handle, "poly_block") : NULL;
+    if (!fn) {
+        const char *error = dlerror();
+        fprintf(stderr, "%s\n", error ? error : "poly_block not found");
+        _exit(SETUP_FAILED);
+    }
+    exit(fn(state));
+}
+
+int main(void) {
+    char line[8192];
+    int reply_fd = dup(STDOUT_FILENO);
+    FILE *reply = fdopen(reply_fd, "w");
+
+    while (fgets(line, sizeof line, stdin)) {
+        line[strcspn(line, "\n")] = 0;
+        char *tab = strchr(line, '\t');
+        if (!tab) continue;
+        *tab = 0;
+
+        poly_state state = { read_file(tab + 1) };
+        int out_fd = memfd_create("poly_stdout", 0);
+        int err_fd = memfd_create("poly_stderr", 0);
+
+        int exit_code;
+        struct rusage usage = { 0 };
+        pid_t pid = fork();
+        if (pid == 0) run_block(line, &state, out_fd, err_fd);
+        if (pid < 0) {
+            exit_code = SETUP_FAILED;
+            dprintf(err_fd, "poly_runner: fork failed: %s\n", strerror(errno));
+        } else {
+            int status = 0;
+            while (wait4(pid, &status, 0, &usage) < 0 && errno == EINTR) {}
+            if (WIFSIGNALED(status)) {
+                exit_code = 128 + WTERMSIG(status);
+                dprintf(err_fd, "C block crashed: %s\n", strsignal(WTERMSIG(status)));
+            } else {
+                exit_code = WEXITSTATUS(status);
+            }
+        }
+
+        off_t out_size = lseek(out_fd, 0, SEEK_END);
+        off_t err_size = lseek(err_fd, 0, SEEK_END);
+        fprintf(reply, "%d %lld %lld %ld\n", exit_code, (long long)out_size, (long long)err_size, usage.ru_maxrss);
+        copy_out(out_fd, reply);
+        copy_out(err_fd, reply);
+        fflush(reply);
+
+        close(out_fd);
+        close(err_fd);
+        free((void *)state.json);
+    }
+    return 0;
+}
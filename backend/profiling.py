@@ -0,0 +1,254 @@
+import collections
+import contextlib
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# On-demand CPU profiling of the server process. The sampling profiler walks
+# every thread's stack from a background thread at a fixed interval for at
+# most POLYGLOT_PROFILE_MAX_SECONDS and aggregates collapsed stacks (the input
+# of flamegraph.pl, speedscope and Perfetto). A run profiler scopes cProfile
+# to one run: the worker thread executing it and the preparation threads
+# generating its blocks, until the same cap. Neither costs anything while
+# nothing is being profiled: no thread runs and no profile hook is set.
+#
+# Supported on CPython 3.9 to 3.13. Up to 3.11 cProfile hooks one thread, so a
+# run keeps one profile per thread that takes part in it and several runs are
+# profiled at once. From 3.12 cProfile sits on sys.monitoring: one profiler
+# for the whole process, seeing every thread, and enabling a second raises
+# ValueError. There a run shares one profile between its threads, only one
+# run is profiled at a time, and the profile also counts other runs' threads.
+
+PROFILE_MAX_SECONDS = float(os.environ.get('POLYGLOT_PROFILE_MAX_SECONDS', '30'))
+# Shortest sampling interval; sampling walks every thread's stack while holding the GIL
+PROFILE_MIN_INTERVAL = 0.001
+# Runs profiled with cProfile at once, and profiles kept for GET /profile/runs/{run_id}
+PROFILE_MAX_RUNS = int(os.environ.get('POLYGLOT_PROFILE_MAX_RUNS', '2'))
+PROFILE_HISTORY = int(os.environ.get('POLYGLOT_PROFILE_HISTORY', '20'))
+
+# cProfile is one process-wide profiler (sys.monitoring) rather than a per-thread hook
+PROCESS_WIDE_CPROFILE = sys.version_info >= (3, 12)
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples the stacks of all other threads until stopped or out of time"""
+
+    def __init__(self):
+        self.stacks: collections.Counter = collections.Counter()
+        self.samples = 0
+        self.interval = 0.0
+        self.started: Optional[float] = None
+        self.stopped: Optional[float] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds: float = PROFILE_MAX_SECONDS, interval: float = 0.005):
+        """Start sampling for at most PROFILE_MAX_SECONDS; results of a previous session are discarded"""
+        with self.lock:
+            if self.running():
+                raise RuntimeError("A profiling session is already running")
+            seconds = min(max(seconds, 0.0), PROFILE_MAX_SECONDS)
+            self.interval = max(interval, PROFILE_MIN_INTERVAL)
+            self.stacks = collections.Counter()
+            self.samples = 0
+            self.started, self.stopped = time.time(), None
+            self.stop_event = threading.Event()
+            self.thread = threading.Thread(target=self._sample, args=(time.monotonic() + seconds,),
+                                           name='poly-profiler', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _sample(self, deadline: float):
+        own = threading.get_ident()
+        while time.monotonic() < deadline and not self.stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            sampled = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                sampled.append(';'.join(reversed(stack)))
+            with self.lock:
+                self.stacks.update(sampled)
+                self.samples += 1
+        self.stopped = time.time()
+
+    def collapsed(self) -> str:
+        """One line per distinct stack, root first: `thread;outer;...;inner count`"""
+        with self.lock:
+            stacks = list(self.stacks.items())
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(stacks))
+
+    def status(self) -> Dict:
+        with self.lock:
+            samples, stacks = self.samples, len(self.stacks)
+        return {'running': self.running(), 'started': self.started, 'stopped': self.stopped,
+                'interval': self.interval, 'samples': samples, 'stacks': stacks, 'max_seconds': PROFILE_MAX_SECONDS}
+
+
+# Tells whether this thread is already inside a run profiler's scope
+_scoped = threading.local()
+
+
+class RunProfiler:
+    """
+    cProfile scoped to one run: one profile per thread that takes part in it,
+    or one shared by all of them where cProfile is process-wide
+    """
+
+    def __init__(self, run_id: str, max_seconds: float = PROFILE_MAX_SECONDS):
+        self.run_id = run_id
+        self.ended = False
+        self.deadline = time.monotonic() + max_seconds
+        self.profiles: List[cProfile.Profile] = []
+        # The process-wide profile while any of the run's threads is in scope, and how many are
+        self.shared: Optional[cProfile.Profile] = None
+        self.scopes = 0
+        self.lock = threading.Lock()
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.deadline
+
+    def enter(self) -> Optional[cProfile.Profile]:
+        """Start profiling this thread; None if another profiler holds the process"""
+        if not PROCESS_WIDE_CPROFILE:
+            profile = cProfile.Profile()
+            profile.enable()
+            return profile
+        with self.lock:
+            if self.shared is None:
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError:
+                    return None
+                self.shared = profile
+            self.scopes += 1
+            return self.shared
+
+    def exit(self, profile: cProfile.Profile):
+        """Stop profiling this thread; a shared profile stops with the last of the run's threads"""
+        if not PROCESS_WIDE_CPROFILE:
+            profile.disable()
+            with self.lock:
+                self.profiles.append(profile)
+            return
+        with self.lock:
+            self.scopes -= 1
+            if self.scopes == 0:
+                profile.disable()
+                self.profiles.append(profile)
+                self.shared = None
+
+    @contextlib.contextmanager
+    def scope(self):
+        """Profile the enclosed code on this thread, unless the run is past its cap or already profiled here"""
+        if self.expired() or getattr(_scoped, 'active', False):
+            yield None
+            return
+        profile = self.enter()
+        if profile is None:
+            yield None
+            return
+        _scoped.active = True
+        try:
+            yield profile
+        finally:
+            _scoped.active = False
+            self.exit(profile)
+
+    def lines(self, lines: Iterable[str]) -> Iterator[str]:
+        """Profile a run's line generator on the thread consuming it, stopping at the cap"""
+        with self.scope() as profile:
+            for line in lines:
+                if profile is not None and self.expired():
+                    profile.disable()
+                    profile = None
+                yield line
+
+    def stats(self) -> Optional[pstats.Stats]:
+        with self.lock:
+            profiles = [profile for profile in self.profiles if profile.getstats()]
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def report(self, sort: str = 'cumulative', limit: int = 50) -> str:
+        """The run's merged profile as a pstats text table"""
+        stats = self.stats()
+        if stats is None:
+            return "No samples recorded\n"
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def dump(self) -> bytes:
+        """The run's merged profile in the binary pstats format (`pstats.Stats(path)`, snakeviz)"""
+        stats = self.stats()
+        return marshal.dumps(stats.stats if stats is not None else {})
+
+
+class RunProfiles:
+    """Run profilers by run ID, at most PROFILE_MAX_RUNS of them active at a time"""
+
+    def __init__(self, max_runs: int = PROFILE_MAX_RUNS, size: int = PROFILE_HISTORY):
+        # A process-wide cProfile can only profile one run at a time
+        self.max_runs = 1 if PROCESS_WIDE_CPROFILE else max_runs
+        self.size = size
+        self.profilers: Dict[str, RunProfiler] = collections.OrderedDict()
+        self.active = 0
+        self.lock = threading.Lock()
+
+    def begin(self, run_id: str, max_seconds: float = PROFILE_MAX_SECONDS) -> Optional[RunProfiler]:
+        """A profiler for a run, or None if too many runs are being profiled already"""
+        with self.lock:
+            if self.active >= self.max_runs:
+                return None
+            self.active += 1
+            profiler = self.profilers[run_id] = RunProfiler(run_id, min(max_seconds, PROFILE_MAX_SECONDS))
+            while len(self.profilers) > self.size:
+                self.profilers.popitem(last=False)
+            return profiler
+
+    def end(self, profiler: RunProfiler):
+        """Free a profiled run's slot; safe to call more than once"""
+        with self.lock:
+            if not profiler.ended:
+                profiler.ended = True
+                self.active -= 1
+
+    def get(self, run_id: str) -> Optional[RunProfiler]:
+        with self.lock:
+            return self.profilers.get(run_id)
+
+
+# Shared by every run in the server process
+SAMPLER = SamplingProfiler()
+RUN_PROFILES = RunProfiles()
@@ -0,0 +1,302 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from engine import open_channel, prepare_in_docker
+
+# Record/replay executor backends. Recording runs every block in its real
+# container and appends what it did to a JSON lines file: the program's
+# stdout, stderr and exit code for its (lang, code, state), with the time its
+# container took to start and to run. Interactive programs (loop hosts, the
+# nested Python runtime) are recorded as their transcript of lines sent and
+# received. Replaying serves those results back without Docker, identical
+# for identical input, so the orchestrator and server can be benchmarked and
+# load-tested apart from runtime cost; latency can be the recorded one, none,
+# or a fixed synthetic delay per program.
+
+REPLAY_FILE = os.environ.get('POLYGLOT_REPLAY_FILE', os.path.join('tmp', 'polyglot-replay.jsonl'))
+# 'recorded', 'none', or seconds each replayed program takes
+REPLAY_LATENCY = os.environ.get('POLYGLOT_REPLAY_LATENCY', 'recorded')
+# Executor backend of server runs: docker (none of these), record or replay
+EXECUTOR_MODE = os.environ.get('POLYGLOT_EXECUTOR', 'docker').lower()
+
+
+def run_key(lang: str, code: str, state_json: Optional[str] = None) -> str:
+    """Identity of a program run; interactive programs have no state and are keyed by their code"""
+    digest = hashlib.sha256(f"{lang}\0{code}".encode())
+    if state_json is not None:
+        digest.update(b"\0" + state_json.encode())
+    return digest.hexdigest()
+
+
+def failure(stderr: str) -> RuntimeError:
+    # Same message the engine raises for a program that exits non-zero
+    return RuntimeError(f"Docker command failed.\nStderr: {stderr}")
+
+
+class Recording:
+    """Recorded program runs by key, appended to a JSON lines file as they complete"""
+
+    def __init__(self, path: str = REPLAY_FILE):
+        self.path = path
+        self.runs: Dict[str, Dict] = {}
+        # Container start time by program, whatever state it later ran with
+        self.prepare_seconds: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def load(self) -> 'Recording':
+        """Read the file; a run recorded more than once is served as recorded last"""
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    self.remember(json.loads(line))
+        return self
+
+    def remember(self, entry: Dict):
+        with self.lock:
+            self.runs[entry['key']] = entry
+            self.prepare_seconds[entry['program']] = entry['prepare_seconds']
+
+    def add(self, entry: Dict):
+        self.remember(entry)
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def get(self, key: str) -> Dict:
+        with self.lock:
+            entry = self.runs.get(key)
+        if entry is None:
+            raise RuntimeError(f"No recorded run {key[:12]} in {self.path}; record it with POLYGLOT_EXECUTOR=record")
+        return entry
+
+
+class RecordingRun:
+    """A prepared run that records its result once executed"""
+
+    def __init__(self, run, recording: Recording, lang: str, code: str, prepare_seconds: float):
+        self.run = run
+        self.channel = getattr(run, 'channel', None)
+        self.recording = recording
+        self.lang = lang
+        self.code = code
+        self.prepare_seconds = prepare_seconds
+
+    def execute(self, state_json: str = "{}") -> str:
+        started = time.perf_counter()
+        try:
+            stdout = self.run.execute(state_json)
+        except RuntimeError as e:
+            self.record(state_json, '', str(e).split('Stderr: ', 1)[-1], 1, time.perf_counter() - started)
+            raise
+        self.record(state_json, stdout, '', 0, time.perf_counter() - started)
+        return stdout
+
+    def record(self, state_json: str, stdout: str, stderr: str, exit_code: int, run_seconds: float):
+        self.recording.add({'key': run_key(self.lang, self.code, state_json),
+                            'program': run_key(self.lang, self.code), 'lang': self.lang,
+                            'stdout': stdout, 'stderr': stderr, 'exit_code': exit_code,
+                            'prepare_seconds': round(self.prepare_seconds, 6), 'run_seconds': round(run_seconds, 6),
+                            'peak_memory_mb': getattr(self.channel, 'peak_memory_mb', None)})
+
+    def discard(self):
+        self.run.discard()
+
+
+class RecordingChannel:
+    """An interactive program's channel that records the lines exchanged over it"""
+
+    def __init__(self, channel, recording: Recording, lang: str, code: str, prepare_seconds: float):
+        self.channel = channel
+        self.recording = recording
+        self.lang = lang
+        self.code = code
+        self.prepare_seconds = prepare_seconds
+        self.started = time.perf_counter()
+        self.transcript: List[Dict[str, str]] = []
+        self.recorded = False
+
+    @property
+    def stderr(self) -> str:
+        return self.channel.stderr
+
+    @property
+    def peak_memory_mb(self) -> Optional[float]:
+        return self.channel.peak_memory_mb
+
+    def readline(self) -> Optional[str]:
+        line = self.channel.readline()
+        if line is not None:
+            self.transcript.append({'out': line})
+        return line
+
+    def send_bytes(self, data: bytes):
+        self.transcript.append({'in': data.decode(errors='replace')})
+        self.channel.send_bytes(data)
+
+    def send_line(self, line: str):
+        self.send_bytes((line + '\n').encode())
+
+    def close_stdin(self):
+        self.channel.close_stdin()
+
+    def close(self) -> int:
+        exit_code = self.channel.close()
+        # Lines the caller never read are part of the transcript too
+        while (line := self.channel.readline()) is not None:
+            self.transcript.append({'out': line})
+        self.record(exit_code)
+        return exit_code
+
+    def abort(self):
+        self.channel.abort()
+        self.record(-1)
+
+    def record(self, exit_code: int):
+        # Callers abort in a finally block after closing
+        if self.recorded:
+            return
+        self.recorded = True
+        program = run_key(self.lang, self.code)
+        self.recording.add({'key': program, 'program': program, 'lang': self.lang,
+                            'transcript': self.transcript, 'stderr': self.channel.stderr,
+                            'exit_code': exit_code, 'prepare_seconds': round(self.prepare_seconds, 6),
+                            'run_seconds': round(time.perf_counter() - self.started, 6),
+                            'peak_memory_mb': self.channel.peak_memory_mb})
+
+
+class RecordingExecutor:
+    """Runs blocks in their real containers and records every run"""
+
+    def __init__(self, recording: Recording, prepare: Callable = prepare_in_docker,
+                 open_interactive: Callable = open_channel):
+        self.recording = recording
+        self._prepare = prepare
+        self._open_channel = open_interactive
+
+    def prepare(self, lang: str, code: str, profile: str = 'fast') -> RecordingRun:
+        started = time.perf_counter()
+        run = self._prepare(lang, code, profile)
+        return RecordingRun(run, self.recording, lang, code, time.perf_counter() - started)
+
+    def open_channel(self, lang: str, code: str, profile: str = 'fast',
+                     nested: Iterable[Tuple[str, str]] = ()) -> RecordingChannel:
+        started = time.perf_counter()
+        # The real program reserves its nested runtimes as it would without recording
+        channel = self._open_channel(lang, code, profile, nested)
+        return RecordingChannel(channel, self.recording, lang, code, time.perf_counter() - started)
+
+
+class ReplayChannel:
+    """Plays an interactive program's transcript back, as long as the caller sends the recorded lines"""
+
+    def __init__(self, entry: Dict, delay: float = 0.0):
+        self.transcript = entry['transcript']
+        self.exit_code_recorded = entry['exit_code']
+        self.stderr = entry['stderr']
+        self.peak_memory_mb = entry.get('peak_memory_mb')
+        self.delay = delay
+        self.position = 0
+        self.closed = False
+        self.exit_code: Optional[int] = None
+
+    def readline(self) -> Optional[str]:
+        if self.position >= len(self.transcript):
+            return None
+        event = self.transcript[self.position]
+        if 'out' not in event:
+            raise RuntimeError("Replay diverged: the program waits for input the caller has not sent")
+        self.position += 1
+        return event['out']
+
+    def read_all(self) -> str:
+        lines = []
+        while (line := self.readline()) is not None:
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def send_bytes(self, data: bytes):
+        event = self.transcript[self.position] if self.position < len(self.transcript) else {}
+        if event.get('in') != data.decode(errors='replace'):
+            raise RuntimeError(f"Replay diverged: sent {data[:80]!r}, recorded {event.get('in', '')[:80]!r}")
+        self.position += 1
+
+    def send_line(self, line: str):
+        self.send_bytes((line + '\n').encode())
+
+    def close_stdin(self):
+        pass
+
+    def close(self) -> int:
+        if not self.closed:
+            time.sleep(self.delay)
+            self.closed, self.exit_code = True, self.exit_code_recorded
+        return self.exit_code
+
+    def abort(self):
+        self.closed, self.exit_code = True, -1
+
+
+class ReplayRun:
+    """A recorded program waiting for its state"""
+
+    def __init__(self, executor: 'ReplayExecutor', lang: str, code: str):
+        self.executor = executor
+        self.lang = lang
+        self.code = code
+        self.channel: Optional[ReplayChannel] = None
+
+    def execute(self, state_json: str = "{}") -> str:
+        entry = self.executor.recording.get(run_key(self.lang, self.code, state_json))
+        time.sleep(self.executor.delay(entry['run_seconds']))
+        self.channel = ReplayChannel({'transcript': [], **entry})
+        if entry['exit_code'] != 0:
+            raise failure(entry['stderr'])
+        return entry['stdout']
+
+    def discard(self):
+        pass
+
+
+class ReplayExecutor:
+    """Serves recorded runs back without Docker, with recorded, no or synthetic latency"""
+
+    def __init__(self, recording: Recording, latency: str = REPLAY_LATENCY):
+        self.recording = recording
+        self.latency = latency
+
+    def delay(self, recorded: float) -> float:
+        """Seconds a replayed step takes: as recorded, none, or the fixed latency spread over the run"""
+        if self.latency == 'recorded':
+            return recorded
+        if self.latency == 'none':
+            return 0.0
+        return float(self.latency) / 2
+
+    def prepare(self, lang: str, code: str, profile: str = 'fast') -> ReplayRun:
+        # The container start happens while upstream blocks run, as with real containers
+        time.sleep(self.delay(self.recording.prepare_seconds.get(run_key(lang, code), 0.0)))
+        return ReplayRun(self, lang, code)
+
+    def open_channel(self, lang: str, code: str, profile: str = 'fast',
+                     nested: Iterable[Tuple[str, str]] = ()) -> ReplayChannel:
+        entry = self.recording.get(run_key(lang, code))
+        time.sleep(self.delay(entry['prepare_seconds']))
+        return ReplayChannel(entry, self.delay(entry['run_seconds']))
+
+
+def executor_backend(mode: str = EXECUTOR_MODE, path: str = REPLAY_FILE, latency: str = REPLAY_LATENCY):
+    """The record or replay backend for a mode, or None to run blocks on the engine directly"""
+    if mode == 'record':
+        return RecordingExecutor(Recording(path))
+    if mode == 'replay':
+        if latency not in ('recorded', 'none') and not latency.replace('.', '', 1).isdigit():
+            raise ValueError(f"Unknown replay latency {latency!r} (recorded, none or seconds)")
+        return ReplayExecutor(Recording(path).load(), latency)
+    if mode != 'docker':
+        raise ValueError(f"Unknown executor {mode!r} (choose from docker, record, replay)")
+    return None
@@ -0,0 +1,153 @@
+import collections
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Run reports: where the time of one pipeline run went, block by block. The
+# orchestrator fills a report through the run's ExecutionContext from
+# measurements it takes anyway, the server keeps the latest reports for
+# GET /runs/{run_id}/report, and clients that connect with `/ws?report=1` get
+# theirs as a final JSON message of type "run_report".
+
+REPORT_HISTORY = int(os.environ.get('POLYGLOT_REPORT_HISTORY', '200'))
+
+
+def output_sizes(output: str):
+    """Bytes of program output and of state JSON lines in a block's raw output"""
+    stdout_bytes = state_bytes = 0
+    for line in output.split('\n') if output else ():
+        size = len(line.encode()) + 1
+        stripped = line.strip()
+        if stripped.startswith('{') and stripped.endswith('}') and '"' in stripped:
+            state_bytes += size
+        else:
+            stdout_bytes += size
+    return stdout_bytes, state_bytes
+
+
+class BlockReport:
+    """Measurements of one block; nested blocks also count the iterations they ran"""
+
+    def __init__(self, index: int, lang: str, kind: str = 'block'):
+        self.index = index
+        self.lang = lang
+        self.kind = kind
+        self.prepared_ahead: Optional[bool] = None
+        self.codegen_seconds = 0.0
+        self.container_start_seconds = 0.0
+        self.run_seconds = 0.0
+        self.iterations: Optional[int] = 0
+        self.state_in_bytes = 0
+        self.state_out_bytes = 0
+        self.stdout_bytes = 0
+        # Highest peak memory of the block's programs, where the engine could measure it
+        self.peak_memory_mb: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def add_run(self, container_start_seconds: float, run_seconds: float, state_json: str, output: str,
+                peak_memory_mb: Optional[float] = None):
+        """Add one program execution: its container start, its run, the data it moved and its peak memory"""
+        stdout_bytes, state_bytes = output_sizes(output)
+        if peak_memory_mb is not None:
+            self.peak_memory_mb = max(self.peak_memory_mb or 0.0, peak_memory_mb)
+        self.container_start_seconds += container_start_seconds
+        self.run_seconds += run_seconds
+        self.state_in_bytes += len(state_json.encode())
+        self.stdout_bytes += stdout_bytes
+        self.state_out_bytes += state_bytes
+
+    def to_dict(self) -> Dict:
+        report = dict(vars(self))
+        for key, value in report.items():
+            if isinstance(value, float):
+                report[key] = round(value, 6)
+        return report
+
+
+class RunReport:
+    """Timing breakdown of one pipeline run"""
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.started = time.time()
+        self.started_perf = time.perf_counter()
+        self.total_seconds: Optional[float] = None
+        self.queued_seconds: Optional[float] = None
+        self.blocks: List[BlockReport] = []
+        self.sandbox = False
+        self.container_launches = 0
+        self.sandbox_execs = 0
+        # Why the run stopped before its blocks finished, if it did
+        self.error: Optional[str] = None
+        self.lock = threading.Lock()
+
+    def block(self, lang: str, kind: str = 'block') -> BlockReport:
+        """Start the report of the next block"""
+        with self.lock:
+            block = BlockReport(len(self.blocks), lang, kind)
+            self.blocks.append(block)
+            return block
+
+    def launched(self, in_sandbox: bool = False):
+        """Count a program started in a container of its own, or inside the run's sandbox"""
+        with self.lock:
+            if in_sandbox:
+                self.sandbox_execs += 1
+            else:
+                self.container_launches += 1
+
+    def begin(self):
+        """Mark the end of the run's wait in the job queue"""
+        self.queued_seconds = time.perf_counter() - self.started_perf
+
+    def finish(self):
+        if self.total_seconds is None:
+            self.total_seconds = time.perf_counter() - self.started_perf
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            blocks = [block.to_dict() for block in self.blocks]
+        return {
+            'run_id': self.run_id,
+            'started': self.started,
+            'finished': self.total_seconds is not None,
+            'total_seconds': round(self.total_seconds if self.total_seconds is not None
+                                   else time.perf_counter() - self.started_perf, 6),
+            'queued_seconds': round(self.queued_seconds, 6) if self.queued_seconds is not None else None,
+            'sandbox': self.sandbox,
+            'container_launches': self.container_launches + self.sandbox,
+            'sandbox_execs': self.sandbox_execs,
+            'error': self.error,
+            'blocks': blocks,
+        }
+
+
+class ReportStore:
+    """The latest run reports by run ID"""
+
+    def __init__(self, size: int = REPORT_HISTORY):
+        self.size = size
+        self.reports: Dict[str, RunReport] = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, report: RunReport) -> RunReport:
+        with self.lock:
+            self.reports[report.run_id] = report
+            while len(self.reports) > self.size:
+                self.reports.popitem(last=False)
+        return report
+
+    def get(self, run_id: str) -> Optional[RunReport]:
+        with self.lock:
+            return self.reports.get(run_id)
+
+    def recent(self, limit: int = 20) -> List[Dict]:
+        with self.lock:
+            reports = list(self.reports.values())[-limit:]
+        return [{'run_id': r.run_id, 'started': r.started, 'total_seconds': r.total_seconds,
+                 'blocks': len(r.blocks)} for r in reversed(reports)]
+
+
+# Shared by every run in the server process
+REPORTS = ReportStore()
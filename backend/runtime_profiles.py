@@ -0,0 +1,78 @@
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Runtime profiles: compiler and VM flags a block is built and run with.
+# `fast` keeps turnaround low for small blocks; `optimized` pays for a slower
+# compile to run heavy loops faster. A block picks one with a header option
+# (`::c profile=optimized`), otherwise select_profile guesses from its size
+# and loop trip counts. Flags reach the runners as environment variables
+# (see *.Dockerfile and sandbox_agent.py) and are part of every compile cache key.
+
+PROFILES: Dict[str, Dict[str, List[str]]] = {
+    'fast': {
+        'cflags': ['-O0', '-pipe'],
+        'javacflags': ['-g:none', '-J-XX:TieredStopAtLevel=1', '-J-XX:+UseSerialGC'],
+        'jvmflags': ['-XX:TieredStopAtLevel=1', '-XX:+UseSerialGC'],
+        'pyflags': [],
+    },
+    'optimized': {
+        'cflags': ['-O2', '-march=native', '-pipe'],
+        'javacflags': ['-g:none'],
+        'jvmflags': ['-XX:+UseParallelGC', '-XX:+AlwaysPreTouch', '-Xms256m'],
+        'pyflags': [],
+    },
+}
+
+# Profile used when a block names none; 'auto' applies the heuristic
+DEFAULT_PROFILE = os.environ.get('POLYGLOT_DEFAULT_PROFILE', 'auto')
+
+# A block is heavy when its loops may run this many iterations or it has this many lines
+HEAVY_LOOP_TRIPS = int(os.environ.get('POLYGLOT_OPTIMIZE_TRIPS', '100000'))
+HEAVY_BLOCK_LINES = int(os.environ.get('POLYGLOT_OPTIMIZE_LINES', '200'))
+
+# Options written after a block marker on the marker's line, e.g. `::c profile=optimized`
+BLOCK_HEADER = re.compile(r'[ \t]+((?:\w+=[\w.-]+[ \t]*)+)(?=\r?\n)')
+
+
+def parse_block_header(source: str, marker_end: int) -> Tuple[Dict[str, str], int]:
+    """Options following the `::lang` marker ending at marker_end, and where the block's code starts"""
+    match = BLOCK_HEADER.match(source, marker_end)
+    if not match:
+        return {}, marker_end
+    options = dict(option.split('=', 1) for option in match.group(1).split())
+    return options, match.end()
+
+
+def estimate_loop_trips(code: str) -> int:
+    """Upper bound on loop iterations from literal loop bounds (nested loops multiply)"""
+    trips = 1
+    for header in re.findall(r'\b(?:for|while)\b[^{:\n]*', code):
+        bounds = [int(n) for n in re.findall(r'(?:<=?|range\s*\(\s*)\s*(\d+)', header)]
+        if bounds:
+            trips *= max(bounds)
+    return trips
+
+
+def select_profile(lang: str, code: str, requested: Optional[str] = None) -> str:
+    """The profile a block runs with: the requested one, else the default, else the heuristic"""
+    name = requested or DEFAULT_PROFILE
+    if name != 'auto':
+        if name not in PROFILES:
+            raise ValueError(f"Unknown runtime profile '{name}' (choose from {', '.join(PROFILES)})")
+        return name
+    if lang in ('c', 'java') and (estimate_loop_trips(code) >= HEAVY_LOOP_TRIPS
+                                  or code.count('\n') + 1 >= HEAVY_BLOCK_LINES):
+        return 'optimized'
+    return 'fast'
+
+
+def profile_environment(profile: str) -> Dict[str, str]:
+    """Flags of a profile as the environment variables the runners read"""
+    flags = PROFILES[profile]
+    return {
+        'POLY_CFLAGS': ' '.join(flags['cflags']),
+        'POLY_JAVACFLAGS': ' '.join(flags['javacflags']),
+        'POLY_JVMFLAGS': ' '.join(flags['jvmflags']),
+        'POLY_PYFLAGS': ' '.join(flags['pyflags']),
+    }
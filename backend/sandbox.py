@@ -0,0 +1,113 @@
+import os
+from typing import Iterable, Optional, Tuple
+
+import docker
+
+from admission import ADMISSION
+from metrics import CONTAINER_STARTS, CONTAINERS_RUNNING, timed
+from engine import (ContainerChannel, PreparedRun, build_context, exec_in_container, get_client,
+                    is_complete_c_program, java_runtime_files, resource_limits, wrap_shared_object, wrap_source)
+from runtime_profiles import profile_environment
+from tracing import traced
+
+SANDBOX_IMAGE = 'polyglot-sandbox'
+
+# C blocks run as shared objects called by the sandbox's resident runner instead of one process each
+C_SHARED_OBJECTS = os.environ.get('POLYGLOT_C_SHARED_OBJECTS', '1') != '0'
+
+# Limits for the whole sandbox container; its blocks still reserve host capacity one by one
+SANDBOX_CPUS = float(os.environ.get('POLYGLOT_SANDBOX_CPUS', '2'))
+SANDBOX_MEMORY_MB = int(os.environ.get('POLYGLOT_SANDBOX_MEMORY_MB', '2048'))
+
+
+def build_sandbox_image() -> str:
+    """Build the combined runtime image once per server process"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    files = java_runtime_files()
+    for name in ('sandbox_agent.py', 'poly_runner.c'):
+        with open(os.path.join(script_dir, name), 'rb') as f:
+            files[name] = f.read()
+    return build_context(SANDBOX_IMAGE, 'polyglot.Dockerfile', files)
+
+
+def frame(data: bytes) -> bytes:
+    """Frame bytes for `agent.py run`: a byte-count header line, then the data"""
+    return f"{len(data)}\n".encode() + data
+
+
+def frame_program(lang: str, code: str, shared_object: bool = False) -> bytes:
+    """The source frame `agent.py run` compiles before waiting for state (see sandbox_agent.py)"""
+    source = wrap_shared_object(code) if shared_object else wrap_source(lang, code)
+    return frame(source.encode())
+
+
+def runs_as_shared_object(lang: str, code: str, interactive: bool = False) -> bool:
+    """
+    Plain C blocks go to the resident runner. Interactive programs need their
+    own stdin and complete programs their own main(), so they keep `run`.
+    """
+    return lang == 'c' and C_SHARED_OBJECTS and not interactive and not is_complete_c_program(code)
+
+
+class PipelineSandbox:
+    """One container with every runtime, shared by all blocks of a pipeline run"""
+
+    def __init__(self):
+        self.container_id: Optional[str] = None
+
+    def start(self) -> str:
+        if self.container_id is None:
+            image = build_sandbox_image()
+            api = get_client().api
+            try:
+                with timed('container_start', 'sandbox'), traced('container_start', lang='sandbox'):
+                    container_id = api.create_container(image, host_config=resource_limits(SANDBOX_CPUS,
+                                                                                           SANDBOX_MEMORY_MB))['Id']
+                    api.start(container_id)
+            except docker.errors.APIError as e:
+                raise RuntimeError(f"Docker command failed.\nStderr: {e.explanation}")
+            CONTAINER_STARTS.inc(lang='sandbox')
+            CONTAINERS_RUNNING.inc(lang='sandbox')
+            self.container_id = container_id
+        return self.container_id
+
+    def prepare(self, lang: str, code: str, interactive: bool = False, profile: str = 'fast',
+                nested: Iterable[Tuple[str, str]] = ()) -> PreparedRun:
+        """Send a block to the agent so it compiles while upstream blocks still run"""
+        shared_object = runs_as_shared_object(lang, code, interactive)
+        command = "run-so" if shared_object else "run"
+        container_id = self.start()
+        reservation = ADMISSION.reserve(lang, profile, nested)
+        try:
+            channel = exec_in_container(container_id, ["python3", "/sandbox/agent.py", command, lang],
+                                        profile_environment(profile), cleanup=reservation.release)
+        except Exception:
+            reservation.release()
+            raise
+        channel.reservation = reservation
+        channel.send_bytes(frame_program(lang, code, shared_object))
+        return PreparedRun(channel, lambda state: channel.send_bytes(frame(state)))
+
+    def execute(self, lang: str, code: str, state_json: str, profile: str = 'fast') -> str:
+        """Run one block inside the sandbox; same contract as engine.execute_in_docker"""
+        return self.prepare(lang, code, profile=profile).execute(state_json)
+
+    def open_channel(self, lang: str, code: str, profile: str = 'fast',
+                     nested: Iterable[Tuple[str, str]] = ()) -> ContainerChannel:
+        """Start a block inside the sandbox with stdin attached; same contract as engine.open_channel"""
+        return self.prepare(lang, code, interactive=True, profile=profile, nested=nested).start()
+
+    def close(self):
+        if self.container_id is not None:
+            try:
+                get_client().api.remove_container(self.container_id, force=True)
+            except (docker.errors.APIError, RuntimeError):
+                pass
+            CONTAINERS_RUNNING.dec(lang='sandbox')
+            self.container_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,363 @@
+"""
+In-container agent for the pipeline sandbox (polyglot.Dockerfile).
+
+  agent.py idle           keep the sandbox container alive between blocks,
+                          serve the resident C runner on RUNNER_SOCKET and
+                          start the Python zygote
+  agent.py zygote         preload Python modules, then fork a fresh child
+                          per Python block requested on ZYGOTE_SOCKET
+  agent.py run <lang>     read a framed program from stdin and compile it if
+                          needed, then read its framed state and run it,
+                          forwarding output line by line
+  agent.py run-so c       like run, but compile the C block as a shared object
+                          and have the resident runner (poly_runner.c) call
+                          its poly_block() in a forked child, with the same
+                          user and limits as forked Python blocks, instead
+                          of starting a new program
+
+A frame is a header line with a byte count, then that many bytes. The
+source frame comes first so compilation can start before upstream blocks
+have produced the state; the state frame follows when the orchestrator
+binds it. Whatever follows on stdin belongs to the program. State is
+handed from block to block through STATE_FILE on the container's
+filesystem: the frame's state is merged in before the run and every JSON
+state line the program prints is merged in after it. Compiler and VM flags
+of the block's runtime profile arrive as POLY_*FLAGS environment variables
+and are part of the compile cache key. A run ends its stderr with the block
+process's peak RSS after PEAK_RSS_MARKER, which the orchestrator strips off
+and records in the run report.
+"""
+
+import hashlib
+import importlib
+import json
+import os
+import resource
+import runpy
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import traceback
+
+SANDBOX_DIR = os.environ.get('POLY_SANDBOX_DIR', '/sandbox')
+WORK_DIR = os.path.join(SANDBOX_DIR, 'work')
+STATE_FILE = os.path.join(SANDBOX_DIR, 'state.json')
+RUNNER = os.path.join(SANDBOX_DIR, 'poly_runner')
+RUNNER_SOCKET = os.path.join(SANDBOX_DIR, 'runner.sock')
+ZYGOTE_SOCKET = os.path.join(SANDBOX_DIR, 'zygote.sock')
+
+# Imported once by the zygote so forked Python blocks start with them loaded
+# (json and os are what the state loader and output capture use)
+ZYGOTE_PRELOAD = ['json', 'os', 're', 'math', 'random', 'collections', 'itertools', 'functools',
+                  'statistics', 'datetime', 'textwrap', 'string', 'decimal', 'fractions', 'heapq', 'bisect']
+
+# Forked Python blocks run as this user (unset: keep the agent's) with these limits
+BLOCK_UID = os.environ.get('POLY_BLOCK_UID')
+BLOCK_RLIMITS = {
+    resource.RLIMIT_CPU: int(os.environ.get('POLY_BLOCK_CPU_SECONDS', '300')),
+    resource.RLIMIT_NOFILE: 1024,
+    resource.RLIMIT_CORE: 0,
+}
+
+# Class data sharing archive and the PolyState jar it was dumped with (polyglot.Dockerfile)
+JAVA_RUNTIME_JAR = '/opt/polyglot/polyglot-runtime.jar'
+JAVA_CDS_ARCHIVE = '/opt/polyglot/polyglot.jsa'
+
+SOURCES = {'c': 'main.c', 'so': 'main.c', 'py': 'script.py', 'java': 'Main.java'}
+
+# Last stderr line of a run: the block process's peak RSS in KiB (engine.PEAK_RSS_MARKER)
+PEAK_RSS_MARKER = '\x1epoly-peak-rss-kb '
+
+
+def read_exact(size):
+    """Read size bytes from fd 0 without buffering past them"""
+    chunks = []
+    while size > 0:
+        chunk = os.read(0, size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_frame():
+    header = b''
+    while not header.endswith(b'\n'):
+        byte = os.read(0, 1)
+        if not byte:
+            break
+        header += byte
+    return read_exact(int(header or 0))
+
+
+def load_state():
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    with open(STATE_FILE + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(STATE_FILE + '.tmp', STATE_FILE)
+
+
+def profile_flags():
+    return {name: os.environ.get(name, '').split()
+            for name in ('POLY_CFLAGS', 'POLY_JAVACFLAGS', 'POLY_JVMFLAGS', 'POLY_PYFLAGS')}
+
+
+def prepare(lang, source):
+    """Write and compile the program once per distinct source and flags; return its command"""
+    flags = profile_flags()
+    key = hashlib.sha1(json.dumps(flags, sort_keys=True).encode() + source)
+    directory = os.path.join(WORK_DIR, key.hexdigest())
+    cflags, javacflags = flags['POLY_CFLAGS'], flags['POLY_JAVACFLAGS']
+    java_runtime = ['-cp', directory]
+    if os.path.exists(JAVA_CDS_ARCHIVE):
+        java_runtime = [f'-XX:SharedArchiveFile={JAVA_CDS_ARCHIVE}', '-Xshare:auto', '-XX:-UsePerfData',
+                        '-cp', f'{JAVA_RUNTIME_JAR}:{directory}']
+    commands = {
+        'c': (['gcc', *cflags, '-o', 'myapp', 'main.c'], [os.path.join(directory, 'myapp')]),
+        'so': (['gcc', *cflags, '-shared', '-fPIC', '-o', 'block.so', 'main.c'], [os.path.join(directory, 'block.so')]),
+        'py': (None, [sys.executable, *flags['POLY_PYFLAGS'], os.path.join(directory, 'script.py')]),
+        'java': (['javac', *javacflags, 'Main.java'], ['java', *java_runtime, *flags['POLY_JVMFLAGS'], 'Main']),
+    }
+    compile_command, run_command = commands[lang]
+    marker = os.path.join(directory, '.ready')
+    if not os.path.exists(marker):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, SOURCES[lang]), 'wb') as f:
+            f.write(source)
+        if compile_command:
+            result = subprocess.run(compile_command, cwd=directory, capture_output=True, text=True)
+            if result.returncode != 0:
+                sys.stderr.write(result.stderr)
+                sys.exit(result.returncode)
+        open(marker, 'w').close()
+    return run_command
+
+
+def merge_state_line(state, line):
+    """Merge a JSON state line printed by a block into the sandbox state"""
+    text = line.strip()
+    if text.startswith(b'{') and text.endswith(b'}') and b'"' in text:
+        try:
+            state.update(json.loads(text))
+        except ValueError:
+            pass
+
+
+def bind_state():
+    """Read the state frame and merge it into STATE_FILE before a run"""
+    incoming = read_frame()
+    state = load_state()
+    if incoming.strip():
+        state.update(json.loads(incoming))
+        save_state(state)
+    return state
+
+
+def forward_output(stream, state):
+    for line in stream:
+        sys.stdout.buffer.write(line)
+        sys.stdout.buffer.flush()
+        merge_state_line(state, line)
+
+
+def run(lang):
+    command = prepare(lang, read_frame())
+    state = bind_state()
+
+    env = dict(os.environ, POLY_STATE_FILE=STATE_FILE)
+    if lang == 'py' and os.path.exists(ZYGOTE_SOCKET) and not profile_flags()['POLY_PYFLAGS']:
+        exit_code, peak_rss_kb = run_in_zygote(command[-1], env, state)
+    else:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, env=env)
+        forward_output(process.stdout, state)
+        # wait4 gives the block's own resource usage, without the compiler's
+        _, status, usage = os.wait4(process.pid, 0)
+        exit_code = process.returncode = os.waitstatus_to_exitcode(status)
+        peak_rss_kb = usage.ru_maxrss
+    save_state(state)
+    sys.stderr.write(f"{PEAK_RSS_MARKER}{peak_rss_kb}\n")
+    sys.stderr.flush()
+    sys.exit(exit_code)
+
+
+def run_in_zygote(script, env, state):
+    """Have the zygote fork a child for the script; return its exit code and peak RSS in KiB"""
+    read_end, write_end = os.pipe()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(ZYGOTE_SOCKET)
+        request = json.dumps({'script': script, 'env': env, 'cwd': os.getcwd()}).encode()
+        socket.send_fds(connection, [request], [0, write_end, 2])
+        os.close(write_end)
+        with os.fdopen(read_end, 'rb') as stdout:
+            forward_output(stdout, state)
+        status = connection.makefile('rb').readline().split()
+    # No status means the zygote's child died without reporting (a block killed by a signal still reports)
+    if not status:
+        return 1, 0
+    return int(status[0]), int(status[1]) if len(status) > 1 else 0
+
+
+def run_shared_object():
+    library = prepare('so', read_frame())[0]
+    state = bind_state()
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(RUNNER_SOCKET)
+        connection.sendall(f"{library}\t{STATE_FILE}\n".encode())
+        reply = connection.makefile('rb')
+        exit_code, out_size, err_size, peak_rss_kb = (int(n) for n in reply.readline().split())
+        out, err = reply.read(out_size), reply.read(err_size)
+
+    for line in out.splitlines(keepends=True):
+        merge_state_line(state, line)
+    sys.stdout.buffer.write(out)
+    sys.stdout.buffer.flush()
+    sys.stderr.buffer.write(err)
+    save_state(state)
+    sys.stderr.write(f"{PEAK_RSS_MARKER}{peak_rss_kb}\n")
+    sys.stderr.flush()
+    sys.exit(exit_code)
+
+
+class ResidentRunner:
+    """The poly_runner process; started on first use and again if it dies (blocks run in its forked children)"""
+
+    def __init__(self):
+        self.process = None
+        self.lock = threading.Lock()
+
+    def call(self, request):
+        with self.lock:
+            try:
+                if self.process is None or self.process.poll() is not None:
+                    self.process = subprocess.Popen([RUNNER], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+                self.process.stdin.write(request)
+                self.process.stdin.flush()
+                header = self.process.stdout.readline()
+                exit_code, out_size, err_size, peak_rss_kb = (int(n) for n in header.split())
+                return header + self.process.stdout.read(out_size + err_size)
+            except (OSError, ValueError) as e:
+                if self.process is not None:
+                    self.process.kill()
+                    self.process = None
+                error = f"C block crashed the shared-object runner ({e or 'no reply'})".encode()
+                return f"139 0 {len(error)} 0\n".encode() + error
+
+
+class RunnerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.wfile.write(self.server.runner.call(self.rfile.readline()))
+
+
+def serve_runner():
+    if os.path.exists(RUNNER_SOCKET):
+        os.unlink(RUNNER_SOCKET)
+    server = socketserver.ThreadingUnixStreamServer(RUNNER_SOCKET, RunnerHandler)
+    server.runner = ResidentRunner()
+    server.serve_forever()
+
+
+def serve_zygote():
+    for name in ZYGOTE_PRELOAD:
+        importlib.import_module(name)
+    # Children are never waited for; they report their block's exit status and peak RSS on their connection
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    if os.path.exists(ZYGOTE_SOCKET):
+        os.unlink(ZYGOTE_SOCKET)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(ZYGOTE_SOCKET + '.tmp')
+    server.listen(64)
+    os.replace(ZYGOTE_SOCKET + '.tmp', ZYGOTE_SOCKET)
+    while True:
+        connection, _ = server.accept()
+        if os.fork() == 0:
+            server.close()
+            run_forked_block(connection)
+        connection.close()
+
+
+def run_forked_block(connection):
+    """
+    In a fresh fork of the zygote: fork once more for the block and report its
+    exit status and peak RSS on the connection, which the block never sees
+    """
+    try:
+        message, fds, _, _ = socket.recv_fds(connection, 1 << 20, 3)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        pid = os.fork()
+        if pid == 0:
+            run_block(json.loads(message), fds, connection)
+        for fd in fds:
+            os.close(fd)
+        _, status, usage = os.wait4(pid, 0)
+        connection.sendall(f"{os.waitstatus_to_exitcode(status)} {usage.ru_maxrss}\n".encode())
+    finally:
+        os._exit(0)
+
+
+def close_inherited_fds():
+    """Close every fd but stdio, like subprocess's close_fds"""
+    os.closerange(3, max(int(fd) for fd in os.listdir('/proc/self/fd')) + 1)
+
+
+def run_block(request, fds, connection):
+    """Take over the client's streams, close everything else, drop privileges and run the script"""
+    exit_code = 1
+    try:
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+        connection.close()
+        close_inherited_fds()
+        os.setsid()
+        for limit, value in BLOCK_RLIMITS.items():
+            hard = resource.getrlimit(limit)[1]
+            value = value if hard == resource.RLIM_INFINITY else min(value, hard)
+            resource.setrlimit(limit, (value, value))
+        if BLOCK_UID is not None:
+            os.setgroups([])
+            os.setgid(int(BLOCK_UID))
+            os.setuid(int(BLOCK_UID))
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        sys.argv = [request['script']]
+        sys.path[0] = os.path.dirname(request['script'])
+        try:
+            runpy.run_path(request['script'], run_name='__main__')
+            exit_code = 0
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                exit_code = e.code or 0
+            else:
+                sys.stderr.write(f"{e.code}\n")
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(exit_code & 0xFF)
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == 'idle':
+        os.makedirs(WORK_DIR, exist_ok=True)
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), 'zygote'])
+        serve_runner()
+    elif sys.argv[1] == 'zygote':
+        serve_zygote()
+    elif sys.argv[1] == 'run-so':
+        run_shared_object()
+    run(sys.argv[2])
@@ -1,15 +1,73 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.websockets import WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, Response
 from pydantic import BaseModel
+import asyncio
+import json
+import os
+import time
+import uuid
 import uvicorn
-from advanced_orchestrator import parse_code_to_tree, execute_tree_generator, set_debug_mode, get_debug_mode
+from typing import Optional
+from advanced_orchestrator import (parse_code_to_tree, execute_tree_generator, set_debug_mode, get_debug_mode,
+                                   set_sandbox_mode, get_sandbox_mode, estimate_pipeline_cost, default_context)
+from execution_context import PARSE_CACHE, ExecutionContext
+from replay_executor import EXECUTOR_MODE
+from admission import ADMISSION
+from debug_events import EVENTS, LEVELS, SERVER_LOG
+from job_queue import JobQueue, QueueFull
+from memory import GROUP_BY, SNAPSHOTS, TRACEMALLOC_FRAMES, process_memory, resident_memory_mb
+from profiling import RUN_PROFILES, SAMPLER
+from metrics import REGISTRY, RUNS, WEBSOCKET_MESSAGES, timed
+from run_report import REPORTS, RunReport
+from tracing import TRACE_ALL, Tracer, trace_path
 
 class DebugToggle(BaseModel):
     enabled: bool
 
+class SandboxToggle(BaseModel):
+    enabled: bool
+
+class ProfileStart(BaseModel):
+    seconds: float = 10.0
+    interval_ms: float = 5.0
+
 app = FastAPI()
 
+# Every WebSocket run goes through this queue and its fixed worker pool
+job_queue = JobQueue()
+
+# Gauges read from the queue, admission control and the parse cache when /metrics is scraped
+def runs_in_flight() -> dict:
+    stats = job_queue.stats()
+    return {('fast',): stats['running_fast_lane'], ('general',): stats['running'] - stats['running_fast_lane']}
+
+def admission_occupancy() -> dict:
+    stats = ADMISSION.stats()
+    return {('cpus',): stats['reserved_cpus'] / stats['cpus'],
+            ('memory',): stats['reserved_memory_mb'] / stats['memory_mb']}
+
+def parse_cache_hit_ratio() -> dict:
+    stats = PARSE_CACHE.stats()
+    lookups = stats['hits'] + stats['misses']
+    return {(): stats['hits'] / lookups if lookups else 0.0}
+
+REGISTRY.gauge('polyglot_queue_depth', 'Runs waiting for a pipeline worker',
+               callback=lambda: {(): job_queue.stats()['queued']})
+REGISTRY.gauge('polyglot_runs_in_flight', 'Runs being executed by pipeline workers, by lane', ('lane',),
+               callback=runs_in_flight)
+REGISTRY.gauge('polyglot_blocks_admitted', 'Blocks holding a CPU and memory reservation',
+               callback=lambda: {(): ADMISSION.stats()['in_flight']})
+REGISTRY.gauge('polyglot_admission_occupancy', 'Share of host capacity reserved by running blocks', ('resource',),
+               callback=admission_occupancy)
+REGISTRY.gauge('polyglot_process_resident_memory_mb', 'Resident set size of the server process',
+               callback=lambda: {(): resident_memory_mb() or 0.0})
+REGISTRY.gauge('polyglot_process_cpu_seconds', 'CPU time the server process used so far, all threads',
+               callback=lambda: {(): time.process_time()})
+REGISTRY.gauge('polyglot_parse_cache_hit_ratio', 'Share of variable scans answered from the parse cache',
+               callback=parse_cache_hit_ratio)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -24,7 +82,7 @@ app.add_middleware(
 
 @app.post("/debug/toggle")
 async def toggle_debug(debug_toggle: DebugToggle):
-    """Toggle debug mode on/off"""
+    """Toggle debug mode on/off for runs submitted from now on"""
     set_debug_mode(debug_toggle.enabled)
     print(f"Debug mode toggled to: {debug_toggle.enabled}")
     return {"debug_mode": get_debug_mode(), "message": f"Debug mode {'enabled' if debug_toggle.enabled else 'disabled'}"}
@@ -34,6 +92,148 @@ async def get_debug_status():
     """Get current debug mode status"""
     return {"debug_mode": get_debug_mode()}
 
+@app.get("/debug/events")
+async def get_debug_events(run_id: Optional[str] = None, level: str = 'debug', since: int = 0, limit: int = 200):
+    """Get recent debug events, optionally of one run, at or above a level, after sequence number `since`"""
+    if level not in LEVELS:
+        raise HTTPException(status_code=400, detail=f"Unknown level '{level}' (choose from {', '.join(LEVELS)})")
+    return {"events": EVENTS.query(run_id, LEVELS[level], since, limit)}
+
+@app.post("/sandbox/toggle")
+async def toggle_sandbox(sandbox_toggle: SandboxToggle):
+    """Toggle pipeline sandbox mode (one combined container per run) on/off"""
+    set_sandbox_mode(sandbox_toggle.enabled)
+    print(f"Pipeline sandbox toggled to: {sandbox_toggle.enabled}")
+    return {"sandbox_mode": get_sandbox_mode(), "message": f"Pipeline sandbox {'enabled' if sandbox_toggle.enabled else 'disabled'}"}
+
+@app.get("/sandbox/status")
+async def get_sandbox_status():
+    """Get current pipeline sandbox mode status"""
+    return {"sandbox_mode": get_sandbox_mode()}
+
+@app.get("/queue/status")
+async def get_queue_status():
+    """Get pipeline queue depth, running and completed runs and rejections"""
+    return job_queue.stats()
+
+@app.get("/admission/status")
+async def get_admission_status():
+    """Get host CPU/memory reserved by in-flight blocks and the per-language estimates"""
+    return ADMISSION.stats()
+
+@app.get("/runs")
+async def get_recent_runs(limit: int = 20):
+    """Get the latest runs with their IDs, newest first"""
+    return {"runs": REPORTS.recent(limit)}
+
+@app.get("/runs/{run_id}/report")
+async def get_run_report(run_id: str):
+    """Get the timing breakdown of one run, per block"""
+    report = REPORTS.get(run_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"No report for run '{run_id}' (only recent runs are kept)")
+    return report.to_dict()
+
+@app.get("/runs/{run_id}/trace")
+async def get_run_trace(run_id: str):
+    """Get the Chrome Trace Event JSON of a traced run, to open in Perfetto or chrome://tracing"""
+    path = trace_path(run_id)
+    if not run_id.isalnum() or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"No trace for run '{run_id}' (trace runs with /ws?trace=1)")
+    return FileResponse(path, media_type="application/json", filename=f"{run_id}.trace.json")
+
+@app.post("/profile/start")
+async def start_profile(profile_start: ProfileStart):
+    """Start sampling every thread's stack for at most POLYGLOT_PROFILE_MAX_SECONDS"""
+    try:
+        SAMPLER.start(profile_start.seconds, profile_start.interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return SAMPLER.status()
+
+@app.post("/profile/stop")
+async def stop_profile():
+    """Stop the sampling profiler before its time is up"""
+    await asyncio.to_thread(SAMPLER.stop)
+    return SAMPLER.status()
+
+@app.get("/profile/status")
+async def get_profile_status():
+    """Get whether the sampling profiler runs and how much it has sampled"""
+    return SAMPLER.status()
+
+@app.get("/profile/collapsed", response_class=PlainTextResponse)
+async def get_profile_collapsed():
+    """Get the sampled stacks in the collapsed format of flamegraph.pl and speedscope"""
+    return PlainTextResponse(SAMPLER.collapsed())
+
+@app.get("/profile/runs/{run_id}")
+async def get_run_profile(run_id: str, format: str = 'text', sort: str = 'cumulative', limit: int = 50):
+    """Get the cProfile results of a run started with /ws?cpu_profile=1, as a pstats table or binary dump"""
+    profiler = RUN_PROFILES.get(run_id)
+    if profiler is None:
+        raise HTTPException(status_code=404, detail=f"No profile for run '{run_id}' (profile runs with /ws?cpu_profile=1)")
+    if format == 'pstats':
+        return Response(profiler.dump(), media_type="application/octet-stream",
+                        headers={"Content-Disposition": f'attachment; filename="{run_id}.pstats"'})
+    if format != 'text':
+        raise HTTPException(status_code=400, detail="Unknown format (choose from text, pstats)")
+    try:
+        return PlainTextResponse(profiler.report(sort, limit))
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Unknown sort key '{sort}'")
+
+@app.get("/memory/status")
+async def get_memory_status():
+    """Get the server process's RSS, tracemalloc totals and the snapshots kept"""
+    return dict(process_memory(), snapshots=SNAPSHOTS.recent())
+
+@app.post("/memory/tracemalloc/start")
+async def start_tracemalloc(frames: int = TRACEMALLOC_FRAMES):
+    """Start tracing allocations of the server process (slows it down until stopped)"""
+    SNAPSHOTS.start(frames)
+    return process_memory()
+
+@app.post("/memory/tracemalloc/stop")
+async def stop_tracemalloc():
+    """Stop tracing allocations; snapshots taken so far stay available"""
+    SNAPSHOTS.stop()
+    return process_memory()
+
+@app.post("/memory/snapshots")
+async def take_memory_snapshot():
+    """Snapshot the traced allocations of the server process"""
+    try:
+        return await asyncio.to_thread(SNAPSHOTS.take)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/memory/snapshots/{snapshot_id}")
+async def get_memory_snapshot(snapshot_id: int, group_by: str = 'lineno', limit: int = 20):
+    """Get the source lines (or files, or tracebacks) that allocated the most memory in a snapshot"""
+    if group_by not in GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"Unknown group_by '{group_by}' (choose from {', '.join(GROUP_BY)})")
+    try:
+        return {"snapshot": SNAPSHOTS.summary(snapshot_id),
+                "top": await asyncio.to_thread(SNAPSHOTS.top, snapshot_id, group_by, limit)}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+@app.get("/memory/diff")
+async def get_memory_diff(first: int, second: int, group_by: str = 'lineno', limit: int = 20):
+    """Get what grew between two snapshots, by source line (or file, or traceback), largest change first"""
+    if group_by not in GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"Unknown group_by '{group_by}' (choose from {', '.join(GROUP_BY)})")
+    try:
+        return {"diff": await asyncio.to_thread(SNAPSHOTS.diff, first, second, group_by, limit)}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Get phase latency histograms, counters and gauges in the Prometheus text format"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/version")
 async def get_version():
     """Get backend version and features"""
@@ -56,43 +256,108 @@ async def get_version():
             "cross_language_variables": True,
             "debug_mode": True,
             "single_language_execution": True,
-            "docker_containerized": True
+            "docker_containerized": True,
+            "pipeline_sandbox": get_sandbox_mode(),
+            "executor": EXECUTOR_MODE
         },
         "orchestrator": "SharedStateOrchestrator" if nested_available else "Legacy",
         "status": "ready"
     }
 
+def run_pipeline(blocks: list, context: ExecutionContext, cpu_profile: bool = False):
+    """Lines of one pipeline run, as executed by a job queue worker"""
+    try:
+        # Profiled from when a worker takes the run, so waiting runs hold no profiling slot
+        if cpu_profile:
+            context.cpu_profiler = RUN_PROFILES.begin(context.run_id)
+            if context.cpu_profiler is None:
+                yield "⚠️ CPU profiling skipped: too many runs are being profiled"
+        yield "🚀 Starting pipeline..."
+        
+        # Use the existing generator-based execution for proper WebSocket streaming
+        if blocks:
+            SERVER_LOG.log("Run {}: {} blocks, debug mode {}", context.run_id, len(blocks), context.debug)
+            # Execute using the generator that respects the run's debug mode
+            for log_entry in execute_tree_generator(blocks, context=context):
+                SERVER_LOG.log("Yielding: {}", log_entry)
+                yield log_entry
+        else:
+            if context.report is not None:
+                context.report.error = "Could not parse any code blocks."
+            yield "❌ Error: Could not parse any code blocks."
+        
+    except Exception as e:
+        # Counted as a failed run once its lines are sent
+        if context.report is not None:
+            context.report.error = str(e)
+        yield f"❌ Error: {e}"
+        SERVER_LOG.log("Execution error in run {}: {}", context.run_id, e)
+    finally:
+        if context.cpu_profiler is not None:
+            RUN_PROFILES.end(context.cpu_profiler)
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     print("INFO:     connection open")
+    client_id = str(uuid.uuid4())
+    # `/ws?debug=0|1` fixes debug output for this connection's runs, else the server default applies
+    debug = websocket.query_params.get('debug')
+    # `/ws?report=1` adds the run report as a final {"type": "run_report"} message after each run
+    send_report = websocket.query_params.get('report') in ('1', 'true')
+    # `/ws?trace=1` (or POLYGLOT_TRACE) records each run's spans to GET /runs/{run_id}/trace
+    trace = TRACE_ALL or websocket.query_params.get('trace') in ('1', 'true')
+    # `/ws?cpu_profile=1` runs each run under cProfile, results at GET /profile/runs/{run_id}
+    cpu_profile = websocket.query_params.get('cpu_profile') in ('1', 'true')
+    job = None
     try:
         while True:
             polyglot_code = await websocket.receive_text()
-            print(f"Received code for execution (DEBUG_MODE={get_debug_mode()}):\n{polyglot_code}")
-            
-            await websocket.send_text("🚀 Starting pipeline...")
+            # Settings are read once per run, so later toggles never change a run in flight
+            context = default_context() if debug is None else default_context(debug=debug not in ('0', 'false'))
+            context.report = REPORTS.add(RunReport(context.run_id))
+            if trace:
+                context.tracer = Tracer(context.run_id)
+            SERVER_LOG.log("Received code for execution (debug={}):\n{}", context.debug, polyglot_code)
             
+            # Worker threads hand lines (then None) and queue positions back to this event loop
+            loop = asyncio.get_running_loop()
+            messages = asyncio.Queue()
+            emit = lambda line: loop.call_soon_threadsafe(messages.put_nowait, line)
+            on_position = lambda position: emit(f"⏳ Queued, position {position}")
             try:
-                # Use the existing generator-based execution for proper WebSocket streaming
-                blocks = parse_code_to_tree(polyglot_code)
-                if blocks:
-                    print(f"Generated {len(blocks)} blocks, executing with debug mode: {get_debug_mode()}")
-                    # Execute using the generator that respects debug mode
-                    for log_entry in execute_tree_generator(blocks):
-                        print(f"Yielding: {log_entry}")
-                        await websocket.send_text(log_entry)
-                else:
-                    await websocket.send_text("❌ Error: Could not parse any code blocks.")
-                
+                with timed('parse'):
+                    blocks = parse_code_to_tree(polyglot_code)
+                job = job_queue.submit(client_id, lambda: run_pipeline(blocks, context, cpu_profile), emit,
+                                       on_position, cost=estimate_pipeline_cost(blocks))
             except Exception as e:
+                RUNS.inc(outcome='rejected' if isinstance(e, QueueFull) else 'failed')
+                context.report.finish()
                 await websocket.send_text(f"❌ Error: {e}")
-                print(f"Execution error: {e}")
+                await websocket.send_text("--- Pipeline Finished ---")
+                continue
+            
+            while (line := await messages.get()) is not None:
+                with timed('websocket_send'), context.span('socket_send', 'server', activate=False):
+                    await websocket.send_text(line)
+                WEBSOCKET_MESSAGES.inc()
+            job = None
+            RUNS.inc(outcome='failed' if context.report.error is not None else 'completed')
             
             await websocket.send_text("--- Pipeline Finished ---")
+            if context.tracer is not None:
+                path = await asyncio.to_thread(context.tracer.write)
+                SERVER_LOG.log("Trace of run {} written to {}", context.run_id, path)
+            if send_report:
+                await websocket.send_text(json.dumps({"type": "run_report", "report": context.report.to_dict()}))
 
     except WebSocketDisconnect:
         print("Client disconnected.")
+    finally:
+        # Drop a queued run, or stop a running one, when its client goes away
+        if job is not None:
+            job_queue.cancel(job)
+            RUNS.inc(outcome='cancelled')
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,343 @@
+import json
+from typing import Dict, Any, Optional, Tuple
+
+# State codec: blocks are generated from the *shape* of the shared state
+# (a signature: types, plus array/string lengths where C needs them) and
+# read the values from POLY_STATE_FILE when they start. The generated code
+# therefore only changes when the signature changes, so it can be compiled
+# before upstream blocks have produced the values.
+
+C_STATE_RUNTIME = r'''#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+static char *poly_state_text = NULL;
+
+/* Position of a top-level key's value in the state file, or NULL */
+static const char *poly_state_find(const char *name) {
+    if (!poly_state_text) {
+        const char *path = getenv("POLY_STATE_FILE");
+        FILE *f = path ? fopen(path, "rb") : NULL;
+        long size = 0;
+        if (f) { fseek(f, 0, SEEK_END); size = ftell(f); fseek(f, 0, SEEK_SET); }
+        poly_state_text = calloc(size + 1, 1);
+        if (f) { size = (long)fread(poly_state_text, 1, size, f); fclose(f); }
+    }
+    size_t len = strlen(name);
+    int depth = 0;
+    for (const char *p = poly_state_text; *p; p++) {
+        if (*p == '"') {
+            const char *start = ++p;
+            while (*p && *p != '"') { if (*p == '\\' && p[1]) p++; p++; }
+            if (!*p) break;
+            if (depth == 1 && (size_t)(p - start) == len && strncmp(start, name, len) == 0) {
+                const char *q = p + 1;
+                while (*q == ' ' || *q == '\t' || *q == '\n' || *q == '\r') q++;
+                if (*q == ':') {
+                    q++;
+                    while (*q == ' ' || *q == '\t' || *q == '\n' || *q == '\r') q++;
+                    return q;
+                }
+            }
+        } else if (*p == '{' || *p == '[') {
+            depth++;
+        } else if (*p == '}' || *p == ']') {
+            depth--;
+        }
+    }
+    return NULL;
+}
+
+static inline long long poly_state_int(const char *name) {
+    const char *v = poly_state_find(name);
+    if (!v) return 0;
+    if (*v == 't') return 1;
+    return strtoll(v, NULL, 10);
+}
+
+static inline double poly_state_double(const char *name) {
+    const char *v = poly_state_find(name);
+    return v ? strtod(v, NULL) : 0.0;
+}
+
+static inline void poly_state_int_array(const char *name, int *out, int n) {
+    const char *v = poly_state_find(name);
+    if (!v || *v != '[') return;
+    v++;
+    for (int i = 0; i < n; i++) {
+        char *end;
+        while (*v == ' ' || *v == ',' || *v == '\n' || *v == '\t' || *v == '\r') v++;
+        if (*v == 't' || *v == 'f') { out[i] = *v == 't'; v += *v == 't' ? 4 : 5; continue; }
+        out[i] = (int)strtoll(v, &end, 10);
+        if (end == v) break;
+        v = end;
+    }
+}
+
+/* Decode a JSON string value into out (UTF-8, NUL-terminated) */
+static inline void poly_state_str(const char *name, char *out, size_t size) {
+    const char *v = poly_state_find(name);
+    size_t n = 0;
+    if (size == 0) return;
+    if (v && *v == '"') {
+        for (v++; *v && *v != '"'; v++) {
+            char bytes[3];
+            size_t count = 1;
+            bytes[0] = *v;
+            if (*v == '\\' && v[1]) {
+                v++;
+                switch (*v) {
+                    case 'n': bytes[0] = '\n'; break;
+                    case 't': bytes[0] = '\t'; break;
+                    case 'r': bytes[0] = '\r'; break;
+                    case 'b': bytes[0] = '\b'; break;
+                    case 'f': bytes[0] = '\f'; break;
+                    case 'u': {
+                        char hex[5] = {0};
+                        unsigned long c;
+                        strncpy(hex, v + 1, 4);
+                        c = strtoul(hex, NULL, 16);
+                        v += strlen(hex);
+                        if (c < 0x80) {
+                            bytes[0] = (char)c;
+                        } else if (c < 0x800) {
+                            bytes[0] = (char)(0xC0 | (c >> 6)); bytes[1] = (char)(0x80 | (c & 0x3F)); count = 2;
+                        } else {
+                            bytes[0] = (char)(0xE0 | (c >> 12)); bytes[1] = (char)(0x80 | ((c >> 6) & 0x3F));
+                            bytes[2] = (char)(0x80 | (c & 0x3F)); count = 3;
+                        }
+                        break;
+                    }
+                    default: bytes[0] = *v;
+                }
+            }
+            if (n + count >= size) break;
+            memcpy(out + n, bytes, count);
+            n += count;
+        }
+    }
+    out[n] = 0;
+}
+
+static inline char poly_state_char(const char *name) {
+    char buffer[8];
+    poly_state_str(name, buffer, sizeof buffer);
+    return buffer[0];
+}
+'''
+
+JAVA_STATE_CLASS = r'''
+class PolyState {
+    private static java.util.Map<String, Object> values;
+    private static String text;
+    private static int pos;
+
+    static Object get(String name) {
+        if (values == null) {
+            try {
+                load(new String(java.nio.file.Files.readAllBytes(java.nio.file.Paths.get(System.getenv("POLY_STATE_FILE"))), "UTF-8"));
+            } catch (Exception e) {
+                values = new java.util.HashMap<>();
+            }
+        }
+        return values.get(name);
+    }
+
+    /* Replace the state, e.g. with one a resident program read from stdin */
+    static void load(String json) {
+        try {
+            text = json;
+            pos = 0;
+            Object parsed = parse();
+            values = parsed instanceof java.util.Map ? (java.util.Map<String, Object>) parsed : new java.util.HashMap<>();
+        } catch (Exception e) {
+            values = new java.util.HashMap<>();
+        }
+    }
+
+    private static void skip() {
+        while (pos < text.length() && Character.isWhitespace(text.charAt(pos))) pos++;
+    }
+
+    private static Object parse() {
+        skip();
+        char c = text.charAt(pos);
+        if (c == '{') {
+            java.util.Map<String, Object> map = new java.util.HashMap<>();
+            pos++;
+            skip();
+            if (text.charAt(pos) == '}') { pos++; return map; }
+            while (true) {
+                skip();
+                String key = (String) parse();
+                skip();
+                pos++;
+                map.put(key, parse());
+                skip();
+                if (text.charAt(pos++) == '}') return map;
+            }
+        }
+        if (c == '[') {
+            java.util.List<Object> list = new java.util.ArrayList<>();
+            pos++;
+            skip();
+            if (text.charAt(pos) == ']') { pos++; return list; }
+            while (true) {
+                list.add(parse());
+                skip();
+                if (text.charAt(pos++) == ']') return list;
+            }
+        }
+        if (c == '"') {
+            StringBuilder sb = new StringBuilder();
+            pos++;
+            while (text.charAt(pos) != '"') {
+                char ch = text.charAt(pos++);
+                if (ch == '\\') {
+                    char esc = text.charAt(pos++);
+                    if (esc == 'n') ch = '\n';
+                    else if (esc == 't') ch = '\t';
+                    else if (esc == 'r') ch = '\r';
+                    else if (esc == 'b') ch = '\b';
+                    else if (esc == 'f') ch = '\f';
+                    else if (esc == 'u') { ch = (char) Integer.parseInt(text.substring(pos, pos + 4), 16); pos += 4; }
+                    else ch = esc;
+                }
+                sb.append(ch);
+            }
+            pos++;
+            return sb.toString();
+        }
+        if (text.startsWith("true", pos)) { pos += 4; return Boolean.TRUE; }
+        if (text.startsWith("false", pos)) { pos += 5; return Boolean.FALSE; }
+        if (text.startsWith("null", pos)) { pos += 4; return null; }
+        int start = pos;
+        while (pos < text.length() && "+-0123456789.eE".indexOf(text.charAt(pos)) >= 0) pos++;
+        String number = text.substring(start, pos);
+        if (number.contains(".") || number.contains("e") || number.contains("E")) return Double.parseDouble(number);
+        return Long.parseLong(number);
+    }
+
+    private static double number(Object v) {
+        if (v instanceof Boolean) return ((Boolean) v) ? 1 : 0;
+        return v instanceof Number ? ((Number) v).doubleValue() : 0;
+    }
+
+    static long getLong(String name) { Object v = get(name); return v instanceof Long ? (Long) v : (long) number(v); }
+    static double getDouble(String name) { return number(get(name)); }
+    static boolean getBoolean(String name) { return Boolean.TRUE.equals(get(name)); }
+    static String getString(String name) { Object v = get(name); return v == null ? "" : v.toString(); }
+
+    static int[] getIntArray(String name) {
+        Object v = get(name);
+        if (!(v instanceof java.util.List)) return new int[0];
+        java.util.List<?> list = (java.util.List<?>) v;
+        int[] out = new int[list.size()];
+        for (int i = 0; i < out.length; i++) out[i] = (int) number(list.get(i));
+        return out;
+    }
+}
+'''
+
+PY_STATE_LOADER = '''import json as _poly_json, os as _poly_os
+with open(_poly_os.environ.get('POLY_STATE_FILE', 'state.json')) as _poly_file:
+    _poly_state = _poly_json.load(_poly_file)
+for _poly_name in {names!r}:
+    if _poly_name in _poly_state:
+        globals()[_poly_name] = _poly_state[_poly_name]
+'''
+
+
+def encode_state(variables: Dict[str, Any]) -> str:
+    """Serialize state for POLY_STATE_FILE (raw UTF-8, which the C loader decodes directly)"""
+    return json.dumps(variables, ensure_ascii=False)
+
+
+def value_signature(lang: str, value: Any) -> Optional[Tuple]:
+    """Shape of one value as the generated code needs it, or None if it cannot be bound"""
+    if isinstance(value, list):
+        if all(isinstance(x, int) for x in value):
+            # C arrays are sized at compile time; Java and Python arrays are not
+            return ('int[]', len(value)) if lang == 'c' else ('int[]',)
+        return None
+    if isinstance(value, bool):
+        # C has always treated booleans as ints
+        return ('int',) if lang == 'c' else ('bool',)
+    if isinstance(value, int):
+        return ('int',)
+    if isinstance(value, float):
+        return ('float',)
+    if isinstance(value, str):
+        if len(value) == 1:
+            return ('char',)
+        return ('str', len(value.encode())) if lang == 'c' else ('str',)
+    return None
+
+
+def state_signature(lang: str, variables: Dict[str, Any]) -> Dict[str, Tuple]:
+    """Signature of the variables a block reads; Python only needs their names"""
+    if lang == 'py':
+        return {name: () for name in variables}
+    signature = {}
+    for name, value in variables.items():
+        shape = value_signature(lang, value)
+        if shape is not None:
+            signature[name] = shape
+    return signature
+
+
+def signature_compatible(lang: str, prepared: Dict[str, Tuple], actual: Dict[str, Tuple]) -> bool:
+    """Whether code generated for the prepared signature can run with the actual state"""
+    if lang == 'py':
+        # The Python loader skips names that are missing from the state
+        return set(actual) <= set(prepared)
+    return prepared == actual
+
+
+def state_loaders(lang: str, signature: Dict[str, Tuple]) -> str:
+    """Declarations that load each variable from POLY_STATE_FILE at startup"""
+    if not signature:
+        return ""
+
+    if lang == 'py':
+        return PY_STATE_LOADER.format(names=sorted(signature))
+
+    declarations = []
+    for name, shape in signature.items():
+        type_ = shape[0]
+        if lang == 'c':
+            if type_ == 'int[]':
+                declarations.append(f"int {name}[{shape[1]}]; poly_state_int_array(\"{name}\", {name}, {shape[1]});")
+                declarations.append(f"int {name}_size = {shape[1]};")
+            elif type_ == 'int':
+                declarations.append(f"int {name} = (int)poly_state_int(\"{name}\");")
+            elif type_ == 'float':
+                declarations.append(f"float {name} = (float)poly_state_double(\"{name}\");")
+            elif type_ == 'char':
+                declarations.append(f"char {name} = poly_state_char(\"{name}\");")
+            elif type_ == 'str':
+                declarations.append(f"char {name}[{shape[1] + 1}]; poly_state_str(\"{name}\", {name}, sizeof {name});")
+        elif lang == 'java':
+            if type_ == 'int[]':
+                declarations.append(f"int[] {name} = PolyState.getIntArray(\"{name}\");")
+            elif type_ == 'int':
+                declarations.append(f"int {name} = (int) PolyState.getLong(\"{name}\");")
+            elif type_ == 'float':
+                declarations.append(f"float {name} = (float) PolyState.getDouble(\"{name}\");")
+            elif type_ == 'bool':
+                declarations.append(f"boolean {name} = PolyState.getBoolean(\"{name}\");")
+            elif type_ == 'char':
+                declarations.append(f"char {name} = PolyState.getString(\"{name}\").charAt(0);")
+            elif type_ == 'str':
+                declarations.append(f"String {name} = PolyState.getString(\"{name}\");")
+
+    return "\n".join(declarations) + "\n" if declarations else ""
+
+
+def add_state_runtime(lang: str, source: str) -> str:
+    """Add the state loader runtime to a complete source file that uses it"""
+    if lang == 'c' and 'poly_state_' in source and 'poly_state_find(' not in source:
+        return C_STATE_RUNTIME + source
+    if lang == 'java' and 'PolyState.' in source and 'class PolyState' not in source:
+        return source + JAVA_STATE_CLASS
+    return source
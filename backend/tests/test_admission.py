@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test resource-aware admission control: packing by CPU/memory, waiting, rejection, nested shares and peak refinement
+"""
+
+import threading
+import time
+
+from admission import AdmissionController, AdmissionTimeout, hosting
+
+
+def test_blocks_wait_until_they_fit():
+    controller = AdmissionController(cpus=2, memory_mb=1024, timeout=5)
+    java = controller.reserve('java', 'fast')
+    c_blocks = [controller.reserve('c', 'fast') for _ in range(2)]
+    assert controller.stats()['reserved_memory_mb'] == 512 + 2 * 64
+
+    admitted = threading.Event()
+    def second_java():
+        controller.reserve('java', 'fast')
+        admitted.set()
+    threading.Thread(target=second_java, daemon=True).start()
+    assert not admitted.wait(0.2), "java block admitted beyond the host's CPUs"
+    java.release()
+    java.release()
+    assert admitted.wait(2)
+    assert controller.stats()['in_flight'] == 3
+    for reservation in c_blocks:
+        reservation.release()
+    print("✅ Blocks admitted only while their CPU and memory fit")
+
+
+def test_rejected_after_timeout_and_oversized_blocks():
+    controller = AdmissionController(cpus=1, memory_mb=256, timeout=0.1)
+    assert controller.estimate('java', 'optimized') == (1, 256)
+    first = controller.reserve('java', 'optimized')
+    start = time.monotonic()
+    try:
+        controller.reserve('java', 'optimized')
+        assert False, "a block that never fits must not be admitted"
+    except AdmissionTimeout as e:
+        assert 'POLYGLOT_ADMISSION_TIMEOUT' in str(e)
+    assert time.monotonic() - start >= 0.1
+    stats = controller.stats()
+    assert stats['rejected'] == 1 and stats['in_flight'] == 1 and stats['reserved_memory_mb'] == 256
+    first.release()
+    assert controller.stats()['in_flight'] == 0
+    print("✅ Oversized blocks clamped to the host and blocks that never fit rejected after the timeout")
+
+
+def test_nested_runtimes_draw_from_their_host():
+    controller = AdmissionController(cpus=2, memory_mb=1024, timeout=0.1)
+    host = controller.reserve('c', 'fast', nested=[('py', 'fast'), ('c', 'fast'), ('c', 'optimized')])
+    # The host's own share, one Python runtime and the larger of the two C estimates
+    assert (host.cpus, host.memory_mb) == (0.5, 64) and host.held == (2.0, 64 + 128 + 128)
+    stats = controller.stats()
+    assert stats['in_flight'] == 1 and stats['reserved_cpus'] == 2.0
+    try:
+        controller.reserve('py', 'fast')
+        assert False, "the host's CPUs are all reserved"
+    except AdmissionTimeout:
+        pass
+
+    with hosting(host):
+        python = controller.reserve('py', 'fast')
+        nested_c = controller.reserve('c', 'optimized')
+        assert (python.memory_mb, nested_c.memory_mb) == (128, 128) and controller.stats()['in_flight'] == 1
+        nested_c.release()
+        # Released shares are drawn again; a runtime without a free share waits on the host
+        controller.reserve('c', 'fast').release()
+        try:
+            controller.reserve('java', 'fast')
+            assert False, "no share for java"
+        except AdmissionTimeout:
+            pass
+    python.release()
+    assert controller.stats()['reserved_cpus'] == 2.0
+    host.release()
+    assert controller.stats()['in_flight'] == 0 and controller.stats()['reserved_memory_mb'] == 0
+    print("✅ Loop hosts reserve their nested runtimes up front and those draw from the host's reservation")
+
+
+def test_observed_peaks_refine_estimates():
+    controller = AdmissionController(cpus=4, memory_mb=8192)
+    assert controller.estimate('java', 'fast') == (1.0, 512)
+    # Small samples never lower the limit below the language default
+    controller.observe(('java', 'fast'), 100)
+    assert controller.estimate('java', 'fast') == (1.0, 512)
+    controller.observe(('java', 'fast'), 1000)
+    assert controller.estimate('java', 'fast') == (1.0, 740)
+    controller.observe(('java', 'fast'), 10000)
+    assert controller.estimate('java', 'fast') == (1.0, 2048)
+    controller.observe(('c', 'fast'), 1)
+    assert controller.estimate('c', 'fast')[1] == 64
+    assert [controller.wants_sample(('c', 'fast')) for _ in range(12)].count(True) == 6
+    print("✅ Estimates follow observed peak memory")
+
+
+if __name__ == "__main__":
+    test_blocks_wait_until_they_fit()
+    test_rejected_after_timeout_and_oversized_blocks()
+    test_nested_runtimes_draw_from_their_host()
+    test_observed_peaks_refine_estimates()
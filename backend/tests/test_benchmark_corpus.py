@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test the end-to-end benchmark corpus: the manifest, output checks, percentiles and the container executor
+"""
+
+import io
+
+import advanced_orchestrator
+import benchmark_corpus
+from advanced_orchestrator import parse_code_to_tree
+from benchmark_corpus import check_output, load_corpus, percentile, run_corpus
+
+
+class FakeRun:
+    def __init__(self, code: str):
+        self.code = code
+
+    def execute(self, state_json: str) -> str:
+        # Single-language programs print no state line
+        return 'Hello from Java!\n' if 'Hello from Java!' in self.code else 'unexpected\n'
+
+    def discard(self):
+        pass
+
+
+def test_corpus_manifest():
+    programs = load_corpus()
+    names = [program['name'] for program in programs]
+    assert len(names) == len(set(names)) >= 15
+    for program in programs:
+        assert program['compare'] in ('exact', 'regex'), program['name']
+        assert parse_code_to_tree(program['source']), program['name']
+    assert sum(program['expected'] is None for program in programs) == 1
+    print("✅ Every corpus program exists, parses and has an output check")
+
+
+def test_output_checks_and_percentiles():
+    exact = {'expected': ['Count: 3', '2 4 6'], 'compare': 'exact'}
+    assert check_output(exact, ['', '  Count: 3', '2 4 6  ', ''])
+    assert not check_output(exact, ['Count: 3'])
+    assert not check_output(exact, ['Count: 3', '2 4 7'])
+    regex = {'expected': [r'Pi doubled: 6\.28\d*'], 'compare': 'regex'}
+    assert check_output(regex, ['Pi doubled: 6.28318'])
+    assert not check_output(regex, ['Pi doubled: 6.3'])
+    assert check_output({'expected': None}, ['anything'])
+
+    values = list(range(1, 101))
+    assert [percentile(values, p) for p in (50, 95, 99, 100)] == [50, 95, 99, 100]
+    assert percentile([7.0], 99) == 7.0 and percentile([], 50) is None
+    print("✅ Output is checked exactly or by pattern, and percentiles use the nearest rank")
+
+
+def test_run_on_container_executor():
+    launched = []
+    original = advanced_orchestrator.prepare_in_docker
+    advanced_orchestrator.prepare_in_docker = lambda lang, code, profile: launched.append(lang) or FakeRun(code)
+    try:
+        stream = io.StringIO()
+        results = run_corpus('docker', runs=3, only='single_java', stream=stream)
+        assert launched == ['java'] * 4, "three measured runs after one warmup"
+        wrong = benchmark_corpus.benchmark_program(
+            {'name': 'wrong', 'source': "::py\nprint('hi')\n::/py", 'expected': ['hi']},
+            benchmark_corpus.EXECUTORS['docker'], runs=2)
+    finally:
+        advanced_orchestrator.prepare_in_docker = original
+
+    [result] = results
+    assert result['correct'] == 3 and result['containers_per_run'] == 1 and not result['errors']
+    assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms']
+    assert '✅ single_java' in stream.getvalue()
+    assert wrong['correct'] == 0 and wrong['output'] == ['unexpected']
+    print("✅ Corpus runs report latency, containers per run and correctness")
+
+
+if __name__ == "__main__":
+    test_corpus_manifest()
+    test_output_checks_and_percentiles()
+    test_run_on_container_executor()
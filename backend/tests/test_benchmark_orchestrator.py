@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Test the orchestrator hot path benchmark: synthetic inputs, measurements and baseline comparison
+"""
+
+import io
+
+from benchmark_orchestrator import SIZES, block_output, compare, program, run_benchmarks
+from advanced_orchestrator import SharedStateOrchestrator
+
+
+def test_synthetic_inputs_scale():
+    orchestrator = SharedStateOrchestrator()
+    for size, statements in SIZES.items():
+        blocks = orchestrator.parse_all_blocks(program(statements))
+        assert [block['lang'] for block in blocks] == ['py', 'c', 'java', 'c'] and blocks[-1]['nested']
+        lines, state = orchestrator.process_execution_output_and_return(block_output(statements))
+        assert len(lines) == statements and len(state) >= statements // 2
+    print("✅ Synthetic programs, state and output parse at every size")
+
+
+def test_run_and_compare():
+    stream = io.StringIO()
+    results = run_benchmarks(['small'], only='inject_output_capture', min_time=0.01, repeat=1, stream=stream)
+    assert sorted(results) == [f'inject_output_capture[{lang}]/small' for lang in ('c', 'java', 'py')]
+    assert all(result['ops_per_sec'] > 0 and result['alloc_peak_kb'] >= 0 for result in results.values())
+    assert len(stream.getvalue().splitlines()) == 3
+
+    baseline = {key: dict(result) for key, result in results.items()}
+    assert compare(baseline, results) == []
+    key = 'inject_output_capture[py]/small'
+    baseline[key]['ops_per_sec'] = results[key]['ops_per_sec'] * 2
+    baseline[key]['alloc_peak_kb'] = results[key]['alloc_peak_kb'] / 4 - 1
+    regressions = compare(baseline, results)
+    assert len(regressions) == 2 and all(line.startswith(key) for line in regressions)
+    print("✅ Benchmarks report ops/s and allocations, and regressions against a baseline")
+
+
+if __name__ == "__main__":
+    test_synthetic_inputs_scale()
+    test_run_and_compare()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Test the scaling workloads: generated programs along each axis, sweeps and growth exponents
+"""
+
+import io
+
+from advanced_orchestrator import SharedStateOrchestrator, parse_code_to_tree
+from benchmark_scaling import generate, growth, parse_values, sweep
+
+
+def test_generated_programs():
+    orchestrator = SharedStateOrchestrator()
+    blocks = orchestrator.parse_all_blocks(generate(blocks=7, langs='py,c,java', depth=0))
+    assert [block['lang'] for block in blocks] == ['py', 'c', 'java', 'py', 'c', 'java', 'py']
+    assert not any(block['nested'] for block in blocks)
+
+    source = generate(blocks=2, langs='java,py', depth=3, trips=4, state=6, stdout=5)
+    assert 'int[] data = {0, 1, 2, 3, 4, 5};' in source and 'range(5)' in source
+    assert 'int items[] = {0, 1, 2, 3};' in source and source.count('::/') == 2 + 1 + 3
+    [tree] = parse_code_to_tree(source)
+    assert tree['is_nested']
+    *_, nested = orchestrator.parse_all_blocks(source)
+    assert nested['lang'] == 'c' and nested['nested_info']['nested_blocks'][0]['lang'] == 'py'
+
+    try:
+        generate(langs='py,rust')
+        assert False, "unknown languages must be refused"
+    except ValueError:
+        pass
+    print("✅ Generated programs follow block count, language mix, nesting, trips, state and stdout")
+
+
+def test_sweep_and_growth():
+    stream = io.StringIO()
+    rows = sweep('state', (10, 100), repeat=1, stream=stream)
+    assert [row['value'] for row in rows] == [10, 100]
+    assert all(row['parse_s'] > 0 and row['state_peak_kb'] > 0 for row in rows)
+    assert rows[1]['state_peak_kb'] > rows[0]['state_peak_kb']
+    assert len(stream.getvalue().strip().splitlines()) == 3
+
+    previous = {'value': 10, 'parse_s': 0.01}
+    assert growth(previous, {'value': 100, 'parse_s': 0.1}, 'state', 'parse_s') == 1.0
+    assert growth(previous, {'value': 100, 'parse_s': 1.0}, 'state', 'parse_s') == 2.0
+    assert growth(previous, {'value': 100, 'parse_s': 0.0001}, 'state', 'parse_s') is None
+    assert parse_values(['state=1,5', 'langs=py;c,java']) == {'state': (1, 5), 'langs': ('py', 'c,java')}
+    print("✅ Sweeps measure every stage and report growth exponents")
+
+
+if __name__ == "__main__":
+    test_generated_programs()
+    test_sweep_and_growth()
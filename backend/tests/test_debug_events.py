@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test structured debug events: lazy formatting, the bounded event buffer and the rate-limited console logger
+"""
+
+import contextlib
+import io
+import time
+
+from debug_events import DEBUG, WARNING, ConsoleLogger, EventBuffer
+from execution_context import ExecutionContext
+
+
+class Expensive:
+    """Counts how often it is turned into text"""
+
+    def __init__(self):
+        self.formatted = 0
+
+    def __format__(self, spec):
+        self.formatted += 1
+        return "expensive"
+
+
+def test_events_formatted_only_when_kept():
+    events = EventBuffer(size=10)
+    value = Expensive()
+    output = io.StringIO()
+    console = ConsoleLogger(stream=output)
+    quiet = ExecutionContext(debug=False, events=events, console=console, run_id='quiet')
+    with contextlib.redirect_stdout(output):
+        quiet.log(DEBUG, "state: {}", value)
+        assert value.formatted == 0 and not quiet.enabled(DEBUG)
+        quiet.log(WARNING, "warning: {}", value)
+        loud = ExecutionContext(debug=True, events=events, console=console, run_id='loud')
+        loud.log(DEBUG, "state: {}", value)
+        # Written by the console's thread, not by the run
+        assert output.getvalue() == ""
+        console.flush()
+    assert value.formatted == 2
+    assert output.getvalue() == "state: expensive\n"
+    assert [(e['run_id'], e['level'], e['message']) for e in events.query()] == [
+        ('quiet', 'warning', 'warning: expensive'), ('loud', 'debug', 'state: expensive')]
+    print("✅ Debug events are only formatted when the run keeps them")
+
+
+def test_event_buffer_bounded_and_filtered():
+    events = EventBuffer(size=3)
+    for i in range(5):
+        events.append('a' if i % 2 else 'b', WARNING if i == 4 else DEBUG, f"event {i}")
+    assert [e['message'] for e in events.query()] == ['event 2', 'event 3', 'event 4']
+    assert [e['message'] for e in events.query(run_id='b')] == ['event 2', 'event 4']
+    assert [e['message'] for e in events.query(level=WARNING)] == ['event 4']
+    assert [e['message'] for e in events.query(since=3, limit=1)] == ['event 4']
+    print("✅ Event buffer keeps the latest events and filters by run, level and sequence")
+
+
+def test_console_logger_rate_limited():
+    stream = io.StringIO()
+    logger = ConsoleLogger(rate=5, stream=stream)
+    for i in range(20):
+        logger.log("line {}", i)
+    logger.flush()
+    assert stream.getvalue().splitlines() == [f"line {i}" for i in range(5)]
+    time.sleep(0.3)
+    logger.log("after {}", "pause")
+    logger.flush()
+    assert stream.getvalue().splitlines()[5:] == ["… 15 log lines suppressed", "after pause"]
+    print("✅ Console logger writes in the background and suppresses lines over its rate")
+
+
+if __name__ == "__main__":
+    test_events_formatted_only_when_kept()
+    test_event_buffer_bounded_and_filtered()
+    test_console_logger_rate_limited()
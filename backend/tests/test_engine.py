@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Test the Docker API channel: frame demultiplexing, stdin and lifecycle callbacks
+"""
+
+import io
+import json
+import os
+import shutil
+import socket
+import subprocess
+import struct
+import tarfile
+import tempfile
+import threading
+
+import engine
+from admission import AdmissionController
+from engine import PEAK_RSS_MARKER, ContainerChannel, PreparedRun, check_state_size, java_runtime_files, make_archive, source_files
+
+
+def frame(stream: int, data: bytes) -> bytes:
+    """A Docker attach/exec frame: stream type, 3 padding bytes, big-endian length"""
+    return struct.pack('>BxxxL', stream, len(data)) + data
+
+
+def test_channel_demultiplexes_frames():
+    container_end, channel_end = socket.socketpair()
+    calls = []
+    channel = ContainerChannel(channel_end, wait=lambda: calls.append('wait') or 3,
+                               cleanup=lambda: calls.append('remove'))
+
+    # Lines split across frames and interleaved with stderr
+    container_end.sendall(frame(1, b'hello wo') + frame(2, b'warning\n') + frame(1, b'rld\nsecond\npart'))
+    assert channel.readline() == 'hello world'
+    assert channel.readline() == 'second'
+
+    channel.send_line('reply 1 2')
+    assert container_end.recv(64) == b'reply 1 2\n'
+
+    container_end.sendall(frame(1, b'ial\n'))
+    container_end.close()
+    assert channel.readline() == 'partial'
+    assert channel.readline() is None and channel.readline() is None
+    assert channel.stderr == 'warning\n'
+
+    assert channel.close() == 3 and channel.close() == 3
+    assert calls == ['wait', 'remove']
+    print("✅ Channel demultiplexes stdout/stderr frames and runs lifecycle callbacks once")
+
+
+def test_read_all_and_abort():
+    container_end, channel_end = socket.socketpair()
+    container_end.sendall(frame(1, b'a\nb\n'))
+    container_end.close()
+    channel = ContainerChannel(channel_end, wait=lambda: 0)
+    assert channel.read_all() == 'a\nb'
+
+    container_end, channel_end = socket.socketpair()
+    killed = []
+    channel = ContainerChannel(channel_end, wait=lambda: 0, kill=lambda: killed.append(True))
+    channel.abort()
+    channel.abort()
+    assert killed == [True] and channel.closed
+    container_end.close()
+    print("✅ read_all collects output and abort kills once")
+
+
+def test_peak_memory_from_sandbox_agent():
+    container_end, channel_end = socket.socketpair()
+    container_end.sendall(frame(1, b'out\n') + frame(2, f'oops\n{PEAK_RSS_MARKER}20480\n'.encode()))
+    container_end.close()
+    channel = ContainerChannel(channel_end, wait=lambda: 1)
+    assert channel.read_all() == 'out' and channel.close() == 1
+    assert channel.stderr == 'oops\n' and channel.peak_memory_mb == 20.0
+    channel.container_peak_mb = 64.0
+    assert channel.peak_memory_mb == 64.0
+    print("✅ Channel strips the agent's peak RSS line from stderr and reports it")
+
+
+def test_exec_wait_backs_off():
+    container_end, channel_end = socket.socketpair()
+    inspections = [{'Running': True, 'ExitCode': None}] * 3 + [{'Running': False, 'ExitCode': 7}]
+
+    class FakeApi:
+        def exec_create(self, container_id, command, stdin, environment):
+            return {'Id': 'exec-1'}
+
+        def exec_start(self, exec_id, socket):
+            return channel_end
+
+        def exec_inspect(self, exec_id):
+            return inspections.pop(0)
+
+    sleeps = []
+    original_client, original_sleep = engine.get_client, engine.time.sleep
+    engine.get_client = lambda: type('Client', (), {'api': FakeApi()})()
+    engine.time.sleep = sleeps.append
+    try:
+        channel = engine.exec_in_container('container-1', ['true'])
+        container_end.close()
+        assert channel.close() == 7
+    finally:
+        engine.get_client, engine.time.sleep = original_client, original_sleep
+    assert sleeps == [0.001, 0.002, 0.004]
+    print("✅ Exec exit codes are polled with backoff once the socket reaches EOF")
+
+
+# Stats frames as the daemon streams them (trimmed to the fields the sampler reads and their neighbours)
+CGROUP_V2_FRAME = {
+    'read': '2026-10-19T10:00:01.000000000Z', 'pids_stats': {'current': 3},
+    'memory_stats': {'usage': 52428800, 'limit': 134217728,
+                     'stats': {'anon': 41943040, 'file': 8388608, 'inactive_file': 4194304}},
+}
+CGROUP_V1_FRAME = {
+    'read': '2026-10-19T10:00:02.000000000Z', 'pids_stats': {'current': 3},
+    'memory_stats': {'usage': 62914560, 'max_usage': 83886080, 'limit': 134217728,
+                     'stats': {'cache': 8388608, 'rss': 41943040, 'total_inactive_file': 4194304}},
+}
+# A stopped container's frame: zero read time and no memory figures
+STOPPED_FRAME = {'read': '0001-01-01T00:00:00Z', 'pids_stats': {}, 'memory_stats': {}}
+
+
+def test_container_memory_sampled_while_running():
+    container_end, channel_end = socket.socketpair()
+    streamed = threading.Event()
+    calls = []
+
+    class FakeApi:
+        def create_host_config(self, **limits):
+            return limits
+
+        def create_container(self, image, **options):
+            return {'Id': 'container-1'}
+
+        def attach_socket(self, container_id, params):
+            return channel_end
+
+        def start(self, container_id):
+            calls.append('start')
+
+        def stats(self, container_id, decode, stream):
+            assert decode and stream
+            yield CGROUP_V2_FRAME
+            yield CGROUP_V1_FRAME
+            yield STOPPED_FRAME
+            streamed.set()
+
+        def wait(self, container_id):
+            # The container runs until the daemon has streamed its frames
+            assert streamed.wait(5)
+            return {'StatusCode': 0}
+
+        def remove_container(self, container_id, force):
+            calls.append('remove')
+
+    controller = AdmissionController(cpus=4, memory_mb=4096)
+    original_client, original_admission, original_measure = engine.get_client, engine.ADMISSION, \
+        engine.MEASURE_BLOCK_MEMORY
+    engine.get_client = lambda: type('Client', (), {'api': FakeApi()})()
+    engine.ADMISSION = controller
+    engine.MEASURE_BLOCK_MEMORY = True
+    try:
+        channel = engine.start_container('polyglot-py', reservation=controller.reserve('py', 'fast'))
+        container_end.close()
+        assert channel.read_all() == '' and channel.close() == 0
+    finally:
+        engine.get_client, engine.ADMISSION, engine.MEASURE_BLOCK_MEMORY = \
+            original_client, original_admission, original_measure
+    assert calls == ['start', 'remove']
+    assert engine.memory_usage_mb(CGROUP_V2_FRAME['memory_stats']) == 50.0
+    assert engine.memory_usage_mb(STOPPED_FRAME['memory_stats']) is None
+    assert channel.peak_memory_mb == 80.0
+    assert controller.peaks[('py', 'fast')] == 80.0 and controller.stats()['in_flight'] == 0
+    print("✅ Container memory sampled from the stats stream while it runs, on cgroup v1 and v2")
+
+
+def test_run_files_archive():
+    files = dict(source_files('c', 'printf("hi\\n");'), **{'state.json': check_state_size('{"a": [1, 2]}')})
+    assert set(files) == {'main.c', 'state.json'} and b'int main()' in files['main.c']
+
+    with tarfile.open(fileobj=io.BytesIO(make_archive(files))) as archive:
+        assert archive.getnames() == ['main.c', 'state.json']
+        assert archive.extractfile('state.json').read() == b'{"a": [1, 2]}'
+    print("✅ Source and state packed into an in-memory archive")
+
+
+def test_state_size_limit():
+    original = engine.MAX_STATE_BYTES
+    engine.MAX_STATE_BYTES = 10
+    try:
+        assert check_state_size('{"a": 1}') == b'{"a": 1}'
+        try:
+            check_state_size('{"a": [1, 2, 3]}')
+        except RuntimeError as e:
+            assert 'POLYGLOT_MAX_STATE_BYTES' in str(e)
+            print(f"✅ Oversized state rejected: {e}")
+        else:
+            raise AssertionError("oversized state should be rejected")
+
+        # The prepared container is killed rather than left waiting for its state
+        container_end, channel_end = socket.socketpair()
+        calls = []
+        channel = ContainerChannel(channel_end, wait=lambda: 0, kill=lambda: calls.append('kill'),
+                                   cleanup=lambda: calls.append('release'))
+        run = PreparedRun(channel, bind=lambda state: calls.append('bind'))
+        try:
+            run.execute('{"a": [1, 2, 3]}')
+        except RuntimeError:
+            pass
+        assert calls == ['kill', 'release'] and channel.closed, calls
+        container_end.close()
+        print("✅ A run whose state is rejected releases its container")
+    finally:
+        engine.MAX_STATE_BYTES = original
+
+
+def test_java_cds_warmup_files():
+    files = java_runtime_files()
+    assert b'class PolyState' in files['PolyState.java']
+    state = json.loads(files['cds-state.json'])
+    assert {'n', 'f', 'b', 'c', 's', 'a'} <= set(state)
+    if not shutil.which('javac'):
+        print("⚠️ javac not available, skipping warm-up run")
+        return
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, data in files.items():
+            with open(os.path.join(temp_dir, name), 'wb') as f:
+                f.write(data)
+        subprocess.run(['javac', 'PolyState.java', 'CdsWarmup.java'], cwd=temp_dir, check=True)
+        result = subprocess.run(['java', '-cp', '.', 'CdsWarmup'], cwd=temp_dir, capture_output=True, text=True,
+                                env=dict(os.environ, POLY_STATE_FILE='cds-state.json'))
+        assert result.returncode == 0 and result.stdout.startswith('[1, 2, 3]'), result.stderr
+    print("✅ Class data sharing warm-up program runs against PolyState")
+
+
+if __name__ == "__main__":
+    test_channel_demultiplexes_frames()
+    test_read_all_and_abort()
+    test_peak_memory_from_sandbox_agent()
+    test_exec_wait_backs_off()
+    test_container_memory_sampled_while_running()
+    test_run_files_archive()
+    test_state_size_limit()
+    test_java_cds_warmup_files()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test per-run execution contexts: debug output, profiles, executor, parse cache and metrics of concurrent runs
+"""
+
+import contextlib
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import advanced_orchestrator
+from advanced_orchestrator import SharedStateOrchestrator, default_context, set_debug_mode
+from debug_events import ConsoleLogger
+from execution_context import ExecutionContext, ParseCache
+
+
+class FakeRun:
+    def __init__(self, output: str):
+        self.output = output
+
+    def execute(self, state_json: str) -> str:
+        return self.output
+
+    def discard(self):
+        pass
+
+
+def test_defaults_read_once_per_run():
+    original = advanced_orchestrator.DEBUG_MODE
+    try:
+        set_debug_mode(True)
+        context = default_context()
+        set_debug_mode(False)
+        assert context.debug and not default_context().debug
+        assert default_context(debug=True).debug
+        print("✅ A debug toggle only affects runs whose context is created after it")
+    finally:
+        advanced_orchestrator.DEBUG_MODE = original
+
+
+def test_debug_output_per_run():
+    output = io.StringIO()
+    console = ConsoleLogger(rate=1000, stream=output)
+    quiet = SharedStateOrchestrator(context=ExecutionContext(debug=False, console=console))
+    loud = SharedStateOrchestrator(context=ExecutionContext(debug=True, console=console))
+    with contextlib.redirect_stdout(output):
+        threads = [threading.Thread(target=o.execute_sequential_blocks, args=("",)) for o in (quiet, loud) * 3]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    console.flush()
+    assert output.getvalue().count("SEQUENTIAL BLOCK EXECUTION") == 3
+    print("✅ Concurrent runs print debug output only when their own context asks for it")
+
+
+def test_profile_executor_and_metrics():
+    executor = ThreadPoolExecutor(max_workers=1)
+    metrics = []
+    context = ExecutionContext(profile='optimized', executor=executor,
+                               metrics=lambda name, value, labels: metrics.append((name, labels)))
+    orchestrator = SharedStateOrchestrator(context=context)
+    profiles = []
+    orchestrator.prepare_code = lambda lang, code, profile=None: profiles.append(profile) or FakeRun('{"y": 2}')
+    blocks = orchestrator.parse_sequential_blocks("::py\nx = 1\n::/py\n::py profile=fast\ny = 2\n::/py")
+
+    prepared = orchestrator.prepare_ahead(blocks, 0)
+    assert prepared.result().run.output == '{"y": 2}'
+    orchestrator.run_block(blocks[1])
+    assert profiles == ['optimized', 'fast']
+    assert metrics == [('block_seconds', {'lang': 'py'})]
+    executor.shutdown()
+    print("✅ Runs use their context's default profile, executor and metrics sink")
+
+
+def test_parse_cache_shared_between_runs():
+    cache = ParseCache(size=2)
+    first = SharedStateOrchestrator(context=ExecutionContext(parse_cache=cache))
+    second = SharedStateOrchestrator(context=ExecutionContext(parse_cache=cache))
+    modified = first.extract_modified_variables("x = 1\ny = 2", 'py')
+    modified.discard('x')
+    assert second.extract_modified_variables("x = 1\ny = 2", 'py') == {'x', 'y'}
+    assert cache.stats() == {'entries': 1, 'hits': 1, 'misses': 1}
+    for code in ("a = 1", "b = 2"):
+        first.extract_variable_references(code, 'py')
+    assert cache.stats()['entries'] == 2
+    assert advanced_orchestrator.extract_variable_references("a + b", 'py') == {'a', 'b'}
+    print("✅ Parse results are cached across runs and bounded")
+
+
+if __name__ == "__main__":
+    test_defaults_read_once_per_run()
+    test_debug_output_per_run()
+    test_profile_executor_and_metrics()
+    test_parse_cache_shared_between_runs()
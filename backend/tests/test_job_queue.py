@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Test the pipeline job queue: round-robin fairness, short-run priority, positions, rejection and cancellation
+"""
+
+import threading
+import time
+
+import job_queue
+from job_queue import JobQueue, QueueFull
+
+
+class Recorder:
+    """Collects what a job queue reports for each submitted run"""
+
+    def __init__(self):
+        self.started = []
+        self.lines = {}
+        self.positions = {}
+        self.finished = threading.Semaphore(0)
+
+    def submit(self, queue: JobQueue, client_id: str, name: str, gate: threading.Event = None, cost: float = 0.0):
+        def run():
+            self.started.append(name)
+            if gate is not None:
+                gate.wait(5)
+            yield f"{name} line"
+
+        def emit(line):
+            if line is None:
+                self.finished.release()
+            else:
+                self.lines.setdefault(name, []).append(line)
+
+        return queue.submit(client_id, run, emit, lambda position: self.positions.setdefault(name, []).append(position),
+                            cost)
+
+
+def test_round_robin_across_clients():
+    queue = JobQueue(workers=1, max_depth=10)
+    recorder = Recorder()
+    gate = threading.Event()
+    recorder.submit(queue, 'a', 'a0', gate)
+    while not recorder.started:
+        pass
+    for name in ('a1', 'a2', 'a3'):
+        recorder.submit(queue, 'a', name)
+    recorder.submit(queue, 'b', 'b1')
+    recorder.submit(queue, 'c', 'c1')
+    assert [job.client_id for job in queue.ordered()] == ['a', 'b', 'c', 'a', 'a']
+    assert recorder.positions['c1'] == [3]
+    gate.set()
+    for _ in range(6):
+        assert recorder.finished.acquire(timeout=5)
+    assert recorder.started == ['a0', 'a1', 'b1', 'c1', 'a2', 'a3']
+    assert recorder.lines['b1'] == ['b1 line']
+    assert recorder.positions['a3'][-1] == 1
+    assert queue.stats()['completed'] == 6
+    print("✅ Waiting runs dispatched round-robin across clients with positions reported")
+
+
+def test_rejection_and_cancellation():
+    queue = JobQueue(workers=1, max_depth=2)
+    recorder = Recorder()
+    gate = threading.Event()
+    recorder.submit(queue, 'a', 'running', gate)
+    while not recorder.started:
+        pass
+    waiting = recorder.submit(queue, 'b', 'cancelled')
+    recorder.submit(queue, 'c', 'kept')
+    try:
+        recorder.submit(queue, 'd', 'rejected')
+        assert False, "queue accepted a run beyond its depth"
+    except QueueFull as e:
+        assert 'busy' in str(e)
+    queue.cancel(waiting)
+    assert recorder.positions['kept'] == [2, 1]
+    gate.set()
+    for _ in range(2):
+        assert recorder.finished.acquire(timeout=5)
+    assert recorder.started == ['running', 'kept']
+    assert queue.stats()['rejected'] == 1
+    print("✅ Overload rejected and cancelled runs dropped from the queue")
+
+
+def test_short_runs_first_and_fast_lane():
+    queue = JobQueue(workers=2, max_depth=10, fast_lane=1)
+    recorder = Recorder()
+    heavy_gate = threading.Event()
+    recorder.submit(queue, 'a', 'heavy0', heavy_gate, cost=50)
+    while not recorder.started:
+        pass
+    # The general worker is busy; the fast lane still takes short runs but never heavy ones
+    recorder.submit(queue, 'b', 'heavy1', cost=50)
+    recorder.submit(queue, 'c', 'short1', cost=1)
+    assert recorder.finished.acquire(timeout=5)
+    assert recorder.started == ['heavy0', 'short1']
+    assert recorder.positions['heavy1'] == [1]
+
+    # Behind the busy worker, a short run overtakes an earlier long one
+    gate = threading.Event()
+    recorder.submit(queue, 'c', 'short2', gate, cost=1)
+    while len(recorder.started) < 3:
+        pass
+    recorder.submit(queue, 'd', 'short3', cost=1)
+    assert [job.client_id for job in queue.ordered()] == ['d', 'b']
+    heavy_gate.set()
+    gate.set()
+    for _ in range(4):
+        assert recorder.finished.acquire(timeout=5)
+    assert recorder.started.index('short3') < recorder.started.index('heavy1')
+    print("✅ Short runs go first and the fast lane skips long ones")
+
+
+def test_aging_promotes_long_runs():
+    original = job_queue.AGING_PER_SECOND
+    job_queue.AGING_PER_SECOND = 1000.0
+    try:
+        queue = JobQueue(workers=1, max_depth=10)
+        recorder = Recorder()
+        gate = threading.Event()
+        recorder.submit(queue, 'a', 'running', gate)
+        while not recorder.started:
+            pass
+        recorder.submit(queue, 'b', 'old heavy', cost=50)
+        time.sleep(0.1)
+        recorder.submit(queue, 'c', 'new short', cost=1)
+        assert [job.client_id for job in queue.ordered()] == ['b', 'c']
+        gate.set()
+        for _ in range(3):
+            assert recorder.finished.acquire(timeout=5)
+        assert recorder.started == ['running', 'old heavy', 'new short']
+        print("✅ Long runs age into the short class instead of starving")
+    finally:
+        job_queue.AGING_PER_SECOND = original
+
+
+if __name__ == "__main__":
+    test_round_robin_across_clients()
+    test_rejection_and_cancellation()
+    test_short_runs_first_and_fast_lane()
+    test_aging_promotes_long_runs()
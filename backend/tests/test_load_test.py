@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test the WebSocket load test: arrival schedules, metric scraping and a short run against a live server
+"""
+
+import asyncio
+import io
+import socket
+import threading
+import time
+
+import uvicorn
+
+import advanced_orchestrator
+import server
+from load_test import load_test, parse_metrics, parse_mix, schedule
+
+PROGRAMS = [
+    {'name': 'hello', 'source': "print('hello')", 'expected': ['hello']},
+    {'name': 'broken', 'source': "print('broken')", 'expected': ['fixed']},
+]
+
+
+class FakeRun:
+    def __init__(self, code: str):
+        self.code = code
+
+    def execute(self, state_json: str) -> str:
+        time.sleep(0.02)
+        return 'broken' if 'broken' in self.code else 'hello'
+
+    def discard(self):
+        pass
+
+
+def test_schedule_and_metrics():
+    mix = parse_mix('hello=3,broken', PROGRAMS)
+    assert [(program['name'], weight) for program, weight in mix] == [('hello', 3.0), ('broken', 1.0)]
+    arrivals = schedule(mix, rate=100, runs=2000, seed=1)
+    assert arrivals == schedule(mix, rate=100, runs=2000, seed=1)
+    # Poisson arrivals average the target rate
+    assert 18 < arrivals[-1][0] < 22
+    assert 1300 < sum(program['name'] == 'hello' for _, program in arrivals) < 1700
+    assert [offset for offset, _ in schedule(mix, rate=4, runs=3, poisson=False)] == [0.0, 0.25, 0.5]
+
+    text = ('# HELP polyglot_process_resident_memory_mb RSS\npolyglot_process_resident_memory_mb 120.5\n'
+            'polyglot_runs_in_flight{lane="fast"} 2\npolyglot_runs_in_flight{lane="any"} 3\n'
+            'polyglot_process_cpu_seconds 4.25\npolyglot_blocks_admitted 7\n')
+    assert parse_metrics(text) == {'rss_mb': 120.5, 'cpu_seconds': 4.25, 'queue_depth': 0.0, 'runs_in_flight': 5.0}
+    print("✅ Arrival schedules follow the mix and rate, and server gauges are scraped")
+
+
+def test_load_against_server():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    uvicorn_server = uvicorn.Server(uvicorn.Config(server.app, log_level='warning'))
+    thread = threading.Thread(target=uvicorn_server.run, kwargs={'sockets': [sock]}, daemon=True)
+    original = advanced_orchestrator.prepare_in_docker
+    advanced_orchestrator.prepare_in_docker = lambda lang, code, profile: FakeRun(code)
+    thread.start()
+    try:
+        while not uvicorn_server.started:
+            time.sleep(0.01)
+        stream = io.StringIO()
+        summary = asyncio.run(load_test(f"ws://127.0.0.1:{port}/ws?debug=0", parse_mix('', PROGRAMS), clients=5,
+                                        rate=50, runs=20, timeout=30, sample_interval=0.05, stream=stream))
+    finally:
+        uvicorn_server.should_exit = True
+        thread.join(timeout=10)
+        advanced_orchestrator.prepare_in_docker = original
+        sock.close()
+
+    assert summary['runs'] == summary['completed'] == 20 and summary['error_rate'] == 0
+    programs = summary['programs']
+    assert programs['hello']['correct'] == programs['hello']['runs'] > 0
+    assert programs['broken']['correct'] == 0 and summary['incorrect'] == programs['broken']['runs']
+    assert summary['first_line_ms']['p50'] <= summary['finished_ms']['p50']
+    assert summary['server'] is not None and summary['server']['rss_peak_mb'] > 0
+    assert '5/5 connections open' in stream.getvalue()
+    print("✅ Concurrent clients measure first line, finish time, correctness and server usage")
+
+
+if __name__ == "__main__":
+    test_schedule_and_metrics()
+    test_load_against_server()
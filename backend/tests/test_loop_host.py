@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Test the loop host: outer programs with arbitrary loops serving nested blocks via callbacks
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from advanced_orchestrator import SharedStateOrchestrator, set_debug_mode
+from engine import wrap_source
+from loop_host import CALL_MARKER, LoopHost
+
+# 'import math' keeps the nested block out of the native transpiler
+WHILE_LOOP = """::c
+int a[] = {3, 1, 2};
+double scale = 1.5;
+int n = 0;
+while (n < 3) {
+    for (int j = 0; j < 2; j++) {
+        ::py
+        import math
+        a[n] = a[n] + j
+        scale = scale * 2
+        hits = n
+        print("py", n, j, math.floor(scale))
+        ::/py
+    }
+    n++;
+}
+printf("done %d %d %d hits=%lld\\n", a[0], a[1], a[2], hits);
+::/c"""
+
+PY_OUTER = """::py
+count = 0
+while count < 3:
+    count += 1
+    ::java
+    System.out.println("java sees " + count);
+    ::/java
+::/py"""
+
+JAVA_OUTER = """::java
+int[] xs = {1, 2, 3};
+for (int i = 0; i < xs.length; i++) {
+    ::py
+    xs[i] = xs[i] * 10
+    ::/py
+}
+::/java"""
+
+
+def host_for(code: str, state: dict = None) -> LoopHost:
+    set_debug_mode(False)
+    orchestrator = SharedStateOrchestrator()
+    orchestrator.global_state.update(state or {})
+    return LoopHost(orchestrator, orchestrator.parse_all_blocks(code)[0])
+
+
+class LocalChannel:
+    """Same interface as engine.ContainerChannel, over a local process"""
+
+    def __init__(self, command):
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE, text=True, bufsize=1)
+        self.stderr = ''
+
+    def readline(self):
+        line = self.process.stdout.readline()
+        return line.rstrip('\n') if line else None
+
+    def send_line(self, line):
+        self.process.stdin.write(line + '\n')
+        self.process.stdin.flush()
+
+    def close(self):
+        self.process.stdin.close()
+        self.stderr = self.process.stderr.read()
+        return self.process.wait()
+
+    def abort(self):
+        if self.process.poll() is None:
+            self.process.kill()
+
+
+def open_local_channel(temp_dir: str):
+    """Stand-in for engine.open_channel that runs C and Python on this machine"""
+    def open_channel(lang, code, profile=None, nested=()):
+        if lang == 'c':
+            source = os.path.join(temp_dir, 'main.c')
+            with open(source, 'w') as f:
+                f.write(wrap_source('c', code))
+            command = [os.path.join(temp_dir, 'myapp')]
+            subprocess.run(['gcc', '-o', command[0], source], check=True, capture_output=True, text=True)
+        else:
+            command = [sys.executable, '-c', code]
+        return LocalChannel(command)
+    return open_channel
+
+
+def test_program_generation():
+    c_host = host_for(WHILE_LOOP)
+    assert c_host.program.count(CALL_MARKER.replace('\x1e', '\\036')) == 1
+    assert 'long long hits = 0;' in c_host.program
+    assert c_host.writeback[0] == [('hits', 'int'), ('a', 'int[]'), ('scale', 'float'), ('n', 'int'), ('j', 'int')]
+
+    py_host = host_for(PY_OUTER)
+    assert '_poly_call(0)' in py_host.program and 'while count < 3:' in py_host.program
+    compile(py_host.program, '<host>', 'exec')
+
+    java_host = host_for(JAVA_OUTER)
+    assert '__polyCall(0, "xs", xs, "i", i);' in java_host.program
+    assert java_host.writeback[0] == [('xs', 'int[]'), ('i', 'int')]
+    assert "System.out.println(__polyObject(\"xs\", xs));" in java_host.program
+    print("✅ Host programs generated for C, Python and Java outer blocks")
+
+
+def test_reply_encoding():
+    host = host_for(WHILE_LOOP)
+    host.orchestrator.global_state.update({'hits': 2, 'a': [7, 8], 'scale': 'oops', 'n': 1, 'j': 0})
+    reply = host.encode_reply(0, {'hits': 0, 'a': [3, 1, 2], 'scale': 1.5, 'n': 1, 'j': 0})
+    assert reply == '2 7 8 2 1.5 1 0'
+    # Non-finite floats (or a None Python left behind) go back in a form Java and C both parse
+    host.orchestrator.global_state.update({'scale': float('-inf')})
+    assert host.encode_reply(0, {'hits': 0, 'a': [3, 1, 2], 'scale': None, 'n': 1, 'j': 0}) == '2 7 8 2 -Infinity 1 0'
+    host.orchestrator.global_state.update({'scale': None})
+    assert host.encode_reply(0, {'hits': 0, 'a': [3, 1, 2], 'scale': None, 'n': 1, 'j': 0}) == '2 7 8 2 NaN 1 0'
+    print(f"✅ Reply keeps array lengths and falls back on bad values: {reply!r}")
+
+
+def test_hosted_c_while_loop():
+    if not shutil.which('gcc'):
+        print("⚠️ gcc not available, skipping hosted run")
+        return
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        set_debug_mode(False)
+        orchestrator = SharedStateOrchestrator()
+        orchestrator.open_channel = open_local_channel(temp_dir)
+        host = LoopHost(orchestrator, orchestrator.parse_all_blocks(WHILE_LOOP)[0])
+        output = list(host.run())
+
+    assert output == ['py 0 0 3', 'py 0 1 6', 'py 1 0 12', 'py 1 1 24', 'py 2 0 48', 'py 2 1 96',
+                      'done 4 2 3 hits=2'], output
+    assert host.orchestrator.global_state['a'] == [4, 2, 3]
+    assert host.orchestrator.global_state['scale'] == 96.0
+    print("✅ Hosted C while/for loop drove the nested Python runtime")
+
+
+def test_hosted_non_finite_floats():
+    if not shutil.which('gcc'):
+        print("⚠️ gcc not available, skipping hosted run")
+        return
+
+    program = ("::c\ndouble zero = 0.0;\ndouble r = 1.0 / zero;\ndouble q = zero / zero;\n"
+               "for (int k = 0; k < 2; k++) {\n::py\nimport math\nprint(r, q)\nr = -math.inf\n::/py\n}\n"
+               "printf(\"%f\\n\", r);\n::/c")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        set_debug_mode(False)
+        orchestrator = SharedStateOrchestrator()
+        orchestrator.open_channel = open_local_channel(temp_dir)
+        host = LoopHost(orchestrator, orchestrator.parse_all_blocks(program)[0])
+        output = list(host.run())
+
+    # Sent as the NaN/Infinity tokens Python's json reads, not as null or C's 'inf'
+    assert output == ['inf nan', '-inf nan', '-inf'], output
+    print("✅ Non-finite floats cross the callback channel as floats")
+
+
+def test_hosted_nested_c_runtime():
+    if not shutil.which('gcc'):
+        print("⚠️ gcc not available, skipping hosted run")
+        return
+
+    program = ("::py\ntotal = 0\nfor i in range(3):\n    ::c\n    printf(\"c sees %d\\n\", i);\n"
+               "    int twice = i * 2;\n    ::/c\n    total = total + twice\nprint(\"total\", total)\n::/py")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        set_debug_mode(False)
+        orchestrator = SharedStateOrchestrator()
+        opened = []
+        open_channel = open_local_channel(temp_dir)
+        orchestrator.open_channel = lambda lang, *args: opened.append(lang) or open_channel(lang, *args)
+        host = LoopHost(orchestrator, orchestrator.parse_all_blocks(program)[0])
+        output = list(host.run())
+
+    assert output == ['c sees 0', 'c sees 1', 'c sees 2', 'total 6'], output
+    # The outer program and one resident C program, not one container per iteration
+    assert opened == ['py', 'c'], opened
+    print("✅ Nested C blocks ran in one resident program compiled once")
+
+
+if __name__ == "__main__":
+    test_program_generation()
+    test_reply_encoding()
+    test_hosted_c_while_loop()
+    test_hosted_non_finite_floats()
+    test_hosted_nested_c_runtime()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Test memory instrumentation: tracemalloc snapshots and diffs by source line, process RSS and block peaks in reports
+"""
+
+import tracemalloc
+
+from memory import SnapshotStore, process_memory
+from run_report import BlockReport
+
+retained = []
+
+
+def grow():
+    retained.extend('x' * 1000 + str(i) for i in range(2000))
+
+
+def test_snapshot_diff_by_line():
+    store = SnapshotStore(size=2)
+    try:
+        store.take()
+        assert False, "snapshots need tracemalloc running"
+    except RuntimeError:
+        pass
+    store.start()
+    try:
+        first = store.take()['id']
+        grow()
+        second = store.take()['id']
+        diff = store.diff(first, second, limit=5)
+        assert diff[0]['file'].endswith('test_memory.py') and diff[0]['size_diff_kb'] >= 1900
+        assert diff[0]['line'] == grow.__code__.co_firstlineno + 1
+        assert store.top(second, 'filename', limit=50)[0]['line'] is None
+        assert process_memory()['traced_mb'] > 0
+
+        store.take()
+        assert [snapshot['id'] for snapshot in store.recent()] == [second, second + 1]
+        try:
+            store.top(first)
+            assert False, "only the latest snapshots are kept"
+        except KeyError:
+            pass
+    finally:
+        store.stop()
+        retained.clear()
+    assert not tracemalloc.is_tracing() and process_memory()['rss_mb'] > 0
+    print("✅ Snapshot diffs point at the source line that grew")
+
+
+def test_block_peak_memory_in_report():
+    block = BlockReport(0, 'py')
+    block.add_run(0.1, 0.2, '{}', 'a', peak_memory_mb=30.0)
+    block.add_run(0.1, 0.2, '{}', 'b', peak_memory_mb=12.5)
+    block.add_run(0.1, 0.2, '{}', 'c')
+    assert block.to_dict()['peak_memory_mb'] == 30.0
+    assert BlockReport(1, 'c').to_dict()['peak_memory_mb'] is None
+    print("✅ Block reports keep the highest peak memory of their programs")
+
+
+if __name__ == "__main__":
+    test_snapshot_diff_by_line()
+    test_block_peak_memory_in_report()
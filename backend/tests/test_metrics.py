@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Test the in-process metrics: counters, histograms, scrape-time gauges and the Prometheus text format
+"""
+
+import threading
+
+import metrics
+from metrics import Registry
+
+
+def test_render_prometheus_text():
+    registry = Registry()
+    runs = registry.counter('demo_runs', 'Runs by outcome', ('outcome',))
+    latency = registry.histogram('demo_seconds', 'Latency', ('phase',), buckets=(0.1, 1.0))
+    registry.gauge('demo_depth', 'Queue depth', callback=lambda: {(): 3})
+    runs.inc(outcome='completed')
+    runs.inc(2, outcome='say "hi"')
+    for value in (0.05, 0.1, 0.5, 4.0):
+        latency.observe(value, phase='execute')
+
+    lines = registry.render().splitlines()
+    assert '# TYPE demo_runs counter' in lines
+    assert 'demo_runs_total{outcome="completed"} 1' in lines
+    assert 'demo_runs_total{outcome="say \\"hi\\""} 2' in lines
+    assert [line for line in lines if line.startswith('demo_seconds_bucket')] == [
+        'demo_seconds_bucket{phase="execute",le="0.1"} 2',
+        'demo_seconds_bucket{phase="execute",le="1"} 3',
+        'demo_seconds_bucket{phase="execute",le="+Inf"} 4',
+    ]
+    assert 'demo_seconds_sum{phase="execute"} 4.65' in lines
+    assert 'demo_seconds_count{phase="execute"} 4' in lines
+    assert 'demo_depth 3' in lines
+    print("✅ Metrics render in the Prometheus text format")
+
+
+def test_concurrent_updates_and_timed_phases():
+    registry = Registry()
+    counter = registry.counter('demo_blocks', 'Blocks', ('lang',))
+
+    def work():
+        for _ in range(10000):
+            counter.inc(lang='py')
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.value(lang='py') == 40000
+
+    before = metrics.PHASE_SECONDS.count(phase='codegen', lang='test')
+    try:
+        with metrics.timed('codegen', 'test'):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    assert metrics.PHASE_SECONDS.count(phase='codegen', lang='test') == before + 1
+    assert metrics.PHASE_ERRORS.value(phase='codegen', lang='test') >= 1
+    print("✅ Concurrent increments are not lost and failed phases are timed and counted")
+
+
+if __name__ == "__main__":
+    test_render_prometheus_text()
+    test_concurrent_updates_and_timed_phases()
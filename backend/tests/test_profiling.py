@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test on-demand CPU profiling: the sampling profiler's collapsed stacks and caps, and cProfile scoped to one run
+"""
+
+import marshal
+import sys
+import threading
+import time
+
+import advanced_orchestrator
+import profiling
+import server
+from advanced_orchestrator import execute_tree_generator, parse_code_to_tree
+from execution_context import ExecutionContext
+from profiling import RunProfiles, SamplingProfiler
+
+
+class FakeRun:
+    def execute(self, state_json: str) -> str:
+        return 'hello\n{"n": 1}'
+
+    def discard(self):
+        pass
+
+
+def busy_loop(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampling_profiler():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,), name='busy-worker')
+    worker.start()
+    sampler = SamplingProfiler()
+    try:
+        sampler.start(seconds=5, interval=0.001)
+        try:
+            sampler.start()
+            assert False, "a second session must be refused"
+        except RuntimeError:
+            pass
+        time.sleep(0.1)
+        sampler.stop()
+    finally:
+        stop.set()
+        worker.join()
+
+    status = sampler.status()
+    assert not status['running'] and status['samples'] > 0
+    lines = sampler.collapsed().splitlines()
+    busy = [line for line in lines if line.startswith('busy-worker;') and 'busy_loop (test_profiling.py' in line]
+    assert busy and all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+    print("✅ Sampling profiler aggregates collapsed stacks of other threads")
+
+
+def test_sampling_duration_cap():
+    original = profiling.PROFILE_MAX_SECONDS
+    profiling.PROFILE_MAX_SECONDS = 0.05
+    try:
+        sampler = SamplingProfiler()
+        sampler.start(seconds=3600)
+        sampler.thread.join(timeout=2)
+        assert not sampler.running()
+    finally:
+        profiling.PROFILE_MAX_SECONDS = original
+    print("✅ Sampling stops on its own at the duration cap")
+
+
+def test_run_profile():
+    profiles = RunProfiles(max_runs=1)
+    profiler = profiles.begin('run-1')
+    assert profiles.begin('run-2') is None
+    original = advanced_orchestrator.prepare_in_docker
+    advanced_orchestrator.prepare_in_docker = lambda lang, code, profile: FakeRun()
+    try:
+        context = ExecutionContext(cpu_profiler=profiler)
+        blocks = parse_code_to_tree("::py\nn = 1\nprint('hello')\n::/py\n::py\nprint(n)\n::/py")
+        list(execute_tree_generator(blocks, context=context))
+    finally:
+        advanced_orchestrator.prepare_in_docker = original
+    profiles.end(profiler)
+    profiles.end(profiler)
+    assert profiles.active == 0 and profiles.get('run-1') is profiler
+    # No profile hook is left behind on this thread
+    assert sys.getprofile() is None
+
+    report = profiler.report(limit=200)
+    assert 'execute_blocks_generator' in report and 'generate_block_code' in report
+    stats = marshal.loads(profiler.dump())
+    assert any(name == 'inject_output_capture' for (_, _, name) in stats)
+    print("✅ cProfile covers a run's own thread and its preparation threads")
+
+
+def test_run_profile_threads_share_the_process_profiler():
+    profiles = RunProfiles(max_runs=2)
+    profiler = profiles.begin('run-1')
+    if profiling.PROCESS_WIDE_CPROFILE:
+        assert profiles.begin('run-2') is None, "a second run cannot enable a second process-wide profiler"
+    inside, release = threading.Barrier(2), threading.Event()
+
+    def prepare_thread():
+        with profiler.scope() as profile:
+            assert profile is not None
+            inside.wait(5)
+            busy_loop(release)
+
+    thread = threading.Thread(target=prepare_thread)
+    thread.start()
+    # Both threads of the run are profiled at once, even where a second cProfile would raise
+    with profiler.scope() as profile:
+        assert profile is not None
+        inside.wait(5)
+        release.set()
+        sum(range(1000))
+    thread.join()
+    profiles.end(profiler)
+    assert sys.getprofile() is None and profiler.shared is None
+    assert 'busy_loop' in profiler.report(limit=200)
+    print(f"✅ A run's threads are profiled together on Python {sys.version_info[0]}.{sys.version_info[1]}")
+
+
+def test_run_pipeline_frees_its_profiling_slot():
+    original = server.RUN_PROFILES
+    server.RUN_PROFILES = profiles = RunProfiles(max_runs=1)
+    try:
+        blocks = parse_code_to_tree("::py\nx = 1\n::/py")
+        # A run closed early (its client went away) and one that stopped on an error
+        lines = server.run_pipeline(blocks, ExecutionContext(events=None), cpu_profile=True)
+        assert next(lines) == "🚀 Starting pipeline..." and profiles.active == 1
+        lines.close()
+        assert profiles.active == 0
+        context = ExecutionContext(events=None)
+        list(server.run_pipeline([], context, cpu_profile=True))
+        assert profiles.active == 0 and context.cpu_profiler.ended
+    finally:
+        server.RUN_PROFILES = original
+    print("✅ A profiled pipeline run frees its profiling slot however it ends")
+
+
+if __name__ == "__main__":
+    test_sampling_profiler()
+    test_sampling_duration_cap()
+    test_run_profile()
+    test_run_profile_threads_share_the_process_profiler()
+    test_run_pipeline_frees_its_profiling_slot()
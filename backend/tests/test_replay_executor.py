@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Test the record/replay executor: recorded runs and transcripts, deterministic replay and synthetic latency
+"""
+
+import json
+import os
+import tempfile
+import time
+
+from advanced_orchestrator import execute_tree_generator, parse_code_to_tree
+from execution_context import ExecutionContext
+from replay_executor import Recording, RecordingExecutor, ReplayExecutor, executor_backend
+
+PROGRAM = "::py\nn = 21\nprint('start')\n::/py\n::py\nprint(n * 2)\n::/py"
+
+
+class FakeRun:
+    """Stands in for a container: doubles `n` from the state, fails on `fail`"""
+
+    def __init__(self, code: str):
+        self.code = code
+
+    def execute(self, state_json: str) -> str:
+        time.sleep(0.05)
+        if 'fail' in self.code:
+            raise RuntimeError("Docker command failed.\nStderr: boom")
+        if 'n * 2' in self.code:
+            return f"{json.loads(state_json)['n'] * 2}\n{state_json}"
+        return 'start\n{"n": 21}'
+
+    def discard(self):
+        pass
+
+
+class FakeChannel:
+    """An interactive program that answers each line with it in upper case"""
+
+    def __init__(self):
+        self.replies = []
+        self.stderr = ''
+        self.peak_memory_mb = 12.5
+
+    def send_bytes(self, data: bytes):
+        self.replies.append(data.decode().strip().upper())
+
+    def readline(self):
+        return self.replies.pop(0) if self.replies else None
+
+    def close(self) -> int:
+        return 0
+
+    def abort(self):
+        pass
+
+
+def run(backend) -> list:
+    context = ExecutionContext(backend=backend, events=None)
+    return list(execute_tree_generator(parse_code_to_tree(PROGRAM), context=context))
+
+
+def test_record_and_replay_runs():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'replay.jsonl')
+        recorder = RecordingExecutor(Recording(path), prepare=lambda lang, code, profile: FakeRun(code))
+        recorded = run(recorder)
+        assert recorded == ['start', '42']
+        try:
+            recorder.prepare('py', 'fail', 'fast').execute('{}')
+            assert False, "a failing program must still fail while recorded"
+        except RuntimeError:
+            pass
+
+        replay = executor_backend('replay', path, 'none')
+        started = time.perf_counter()
+        assert run(replay) == recorded == run(replay)
+        assert time.perf_counter() - started < 0.05, "no latency: nothing sleeps"
+        try:
+            replay.prepare('py', 'fail', 'fast').execute('{}')
+            assert False, "a recorded failure is replayed as a failure"
+        except RuntimeError as e:
+            assert str(e) == "Docker command failed.\nStderr: boom"
+        try:
+            replay.prepare('py', 'never recorded', 'fast').execute('{}')
+            assert False, "an unrecorded run must be refused"
+        except RuntimeError as e:
+            assert 'No recorded run' in str(e)
+
+        synthetic = ReplayExecutor(Recording(path).load(), latency='0.1')
+        started = time.perf_counter()
+        assert run(synthetic) == recorded
+        # Two programs, each half the latency to start and half to run; the second starts while the first runs
+        assert time.perf_counter() - started >= 0.15
+    print("✅ Recorded runs replay identically without Docker, with no or synthetic latency")
+
+
+def test_record_and_replay_channels():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'replay.jsonl')
+        opened = []
+        recorder = RecordingExecutor(Recording(path), open_interactive=lambda lang, code, profile, nested:
+                                     opened.append(list(nested)) or FakeChannel())
+        # A loop host's nested runtimes are still reserved with it while recording
+        recorder.open_channel('c', 'host', 'fast', [('py', 'fast')]).abort()
+        assert opened == [[('py', 'fast')]]
+        channel = recorder.open_channel('py', 'agent', 'fast')
+        channel.send_line('hello')
+        assert channel.readline() == 'HELLO'
+        channel.send_line('world')
+        assert channel.close() == 0
+        channel.abort()
+
+        replay = executor_backend('replay', path, 'none')
+        channel = replay.open_channel('py', 'agent', 'fast')
+        channel.send_line('hello')
+        assert channel.readline() == 'HELLO' and channel.peak_memory_mb == 12.5
+        channel.send_line('world')
+        assert channel.readline() == 'WORLD' and channel.readline() is None
+        assert channel.close() == 0
+
+        channel = replay.open_channel('py', 'agent', 'fast')
+        try:
+            channel.send_line('something else')
+            assert False, "input other than the recorded one must be refused"
+        except RuntimeError as e:
+            assert 'diverged' in str(e)
+    print("✅ Interactive programs replay their transcript and detect diverging input")
+
+
+if __name__ == "__main__":
+    test_record_and_replay_runs()
+    test_record_and_replay_channels()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test per-run timing reports: block entries, data volumes, container launches and the report store
+"""
+
+import json
+
+import advanced_orchestrator
+import server
+from advanced_orchestrator import execute_tree_generator, parse_code_to_tree
+from execution_context import ExecutionContext
+from run_report import ReportStore, RunReport, output_sizes
+
+
+class FakeRun:
+    def __init__(self, code: str):
+        self.code = code
+
+    def execute(self, state_json: str) -> str:
+        if 'total = n * 2' in self.code:
+            return 'double\n' + json.dumps({'total': json.loads(state_json)['n'] * 2})
+        return 'hello\n{"n": 21}'
+
+    def discard(self):
+        pass
+
+
+def test_report_of_sequential_run():
+    original = advanced_orchestrator.prepare_in_docker
+    advanced_orchestrator.prepare_in_docker = lambda lang, code, profile: FakeRun(code)
+    try:
+        report = RunReport('run-1')
+        context = ExecutionContext(report=report)
+        blocks = parse_code_to_tree("::py\nn = 21\nprint('hello')\n::/py\n::py\ntotal = n * 2\nprint('double')\n::/py")
+        lines = list(execute_tree_generator(blocks, context=context))
+    finally:
+        advanced_orchestrator.prepare_in_docker = original
+
+    assert lines == ['hello', 'double']
+    result = report.to_dict()
+    assert result['finished'] and result['queued_seconds'] is not None and result['error'] is None
+    assert result['container_launches'] == 2 and result['sandbox_execs'] == 0
+    first, second = result['blocks']
+    assert (first['lang'], first['kind'], first['prepared_ahead']) == ('py', 'block', True)
+    assert first['stdout_bytes'] == len('hello\n') and first['state_out_bytes'] == len('{"n": 21}\n')
+    assert second['state_in_bytes'] == len('{"n": 21}')
+    assert all(block['run_seconds'] >= 0 and block['error'] is None for block in result['blocks'])
+    print("✅ Run report records every block's timings and data volumes")
+
+
+def test_report_store_and_sizes():
+    store = ReportStore(size=2)
+    for run_id in ('a', 'b', 'c'):
+        store.add(RunReport(run_id))
+    assert store.get('a') is None and store.get('c').run_id == 'c'
+    assert [run['run_id'] for run in store.recent()] == ['c', 'b']
+    assert output_sizes('') == (0, 0)
+    assert output_sizes('x\n{"a": 1}') == (2, 9)
+    print("✅ Report store keeps only the latest reports")
+
+
+def test_failed_run_recorded():
+    report = RunReport('run-2')
+    context = ExecutionContext(report=report, events=None)
+    original = server.execute_tree_generator
+    server.execute_tree_generator = lambda blocks, context: (_ for _ in ()).throw(RuntimeError("daemon gone"))
+    try:
+        lines = list(server.run_pipeline(parse_code_to_tree("::py\nx = 1\n::/py"), context))
+    finally:
+        server.execute_tree_generator = original
+    # The server counts the run as failed, not completed
+    assert lines[-1] == "❌ Error: daemon gone" and report.to_dict()['error'] == "daemon gone"
+    print("✅ A run that stopped on an error is reported as failed")
+
+
+if __name__ == "__main__":
+    test_report_of_sequential_run()
+    test_report_store_and_sizes()
+    test_failed_run_recorded()
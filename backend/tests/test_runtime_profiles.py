@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Test runtime profiles: block header options, the size/loop heuristic and flags in compile cache keys
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from advanced_orchestrator import SharedStateOrchestrator
+from runtime_profiles import estimate_loop_trips, profile_environment, select_profile
+from sandbox import frame, frame_program
+
+AGENT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sandbox_agent.py')
+
+
+def test_block_header_selects_profile():
+    orchestrator = SharedStateOrchestrator()
+    blocks = orchestrator.parse_sequential_blocks('::c profile=optimized\nint x = 5;\n::/c\n::py\nprofile = 1\n::/py')
+    assert blocks[0] == {'lang': 'c', 'code': 'int x = 5;', 'profile': 'optimized'}
+    assert blocks[1] == {'lang': 'py', 'code': 'profile = 1', 'profile': None}
+
+    nested = orchestrator.parse_all_blocks('::c profile=fast\nfor (int i = 0; i < 3; i++) {\n'
+                                           '    ::py profile=optimized\n    print(i)\n    ::/py\n}\n::/c')
+    assert nested[0]['profile'] == 'fast' and nested[0]['code'].startswith('for')
+    assert nested[0]['nested_info']['nested_blocks'][0]['code'] == 'print(i)'
+    assert nested[0]['nested_info']['nested_blocks'][0]['profile'] == 'optimized'
+    print("✅ Header options parsed and stripped from block code")
+
+
+def test_heuristic_and_validation():
+    assert estimate_loop_trips('for (int i = 0; i < 1000; i++) { for (int j = 0; j <= 500; j++) {} }') == 500000
+    assert estimate_loop_trips('for i in range(10):\n    pass') == 10
+    assert select_profile('c', 'for (int i = 0; i < 1000000; i++) sum += i;') == 'optimized'
+    assert select_profile('c', 'printf("hi\\n");') == 'fast'
+    assert select_profile('py', 'for i in range(1000000): pass') == 'fast'
+    assert select_profile('c', 'printf("hi\\n");', 'optimized') == 'optimized'
+    try:
+        select_profile('c', '', 'turbo')
+        assert False, "unknown profile accepted"
+    except ValueError as e:
+        assert 'turbo' in str(e)
+    assert '-O2' in profile_environment('optimized')['POLY_CFLAGS']
+    print("✅ Profiles chosen from headers, block size and loop trip counts")
+
+
+def test_flags_in_compile_cache_key():
+    if not shutil.which('gcc'):
+        return
+    with tempfile.TemporaryDirectory() as sandbox_dir:
+        for profile in ('fast', 'optimized', 'fast'):
+            env = dict(os.environ, POLY_SANDBOX_DIR=sandbox_dir, **profile_environment(profile))
+            result = subprocess.run([sys.executable, AGENT, 'run', 'c'],
+                                    input=frame_program('c', 'printf("ok\\n");') + frame(b''),
+                                    capture_output=True, env=env)
+            assert result.returncode == 0 and result.stdout == b'ok\n', result.stderr
+        assert len(os.listdir(os.path.join(sandbox_dir, 'work'))) == 2
+        print("✅ Same source compiled once per profile")
+
+
+if __name__ == "__main__":
+    test_block_header_selects_profile()
+    test_heuristic_and_validation()
+    test_flags_in_compile_cache_key()
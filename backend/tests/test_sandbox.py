@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Test the pipeline sandbox agent: framed programs, compile cache and state on the filesystem
+"""
+
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from engine import PEAK_RSS_MARKER
+from sandbox import frame, frame_program, runs_as_shared_object
+from state_codec import state_loaders, state_signature
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AGENT = os.path.join(BACKEND, 'sandbox_agent.py')
+
+
+def run_agent(sandbox_dir: str, lang: str, code: str, state_json: str = "",
+              shared_object: bool = False) -> subprocess.CompletedProcess:
+    env = dict(os.environ, POLY_SANDBOX_DIR=sandbox_dir)
+    command = 'run-so' if shared_object else 'run'
+    program = frame_program(lang, code, shared_object)
+    return subprocess.run([sys.executable, AGENT, command, lang], input=program + frame(state_json.encode()),
+                          capture_output=True, env=env)
+
+
+def test_frame_program():
+    source = 'print("é")'
+    header, rest = frame_program('py', source).split(b'\n', 1)
+    assert header == str(len(source.encode())).encode() and rest == source.encode()
+    assert frame(b'') == b'0\n'
+    print("✅ Frame header counts bytes")
+
+
+def test_state_handover_between_blocks():
+    with tempfile.TemporaryDirectory() as sandbox_dir:
+        code = 'import json, os\nstate = json.load(open(os.environ["POLY_STATE_FILE"]))\nprint(state["x"] + 1)\nprint(json.dumps({"y": state["x"] * 2}))'
+        result = run_agent(sandbox_dir, 'py', code, '{"x": 20}')
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.decode().split('\n')[0] == '21'
+
+        with open(os.path.join(sandbox_dir, 'state.json')) as f:
+            assert json.load(f) == {'x': 20, 'y': 40}
+        print("✅ State handed over through the sandbox filesystem")
+
+        if not shutil.which('gcc'):
+            print("⚠️ gcc not available, skipping C block")
+            return
+        for _ in range(2):
+            result = run_agent(sandbox_dir, 'c', 'printf("from c\\n");')
+            assert result.returncode == 0 and result.stdout.decode().strip() == 'from c', result.stderr
+        assert len(os.listdir(os.path.join(sandbox_dir, 'work'))) == 2
+        print("✅ C block compiled once and reused")
+
+
+def peak_rss_kb(stderr: bytes) -> int:
+    _, marker, peak = stderr.decode().partition(PEAK_RSS_MARKER)
+    assert marker, stderr
+    return int(peak.split()[0])
+
+
+def test_block_peak_rss_is_reported():
+    with tempfile.TemporaryDirectory() as sandbox_dir:
+        small = run_agent(sandbox_dir, 'py', 'print("small")')
+        large = run_agent(sandbox_dir, 'py', 'data = bytearray(64 * 1024 * 1024)\nprint(len(data))')
+        assert small.returncode == 0 and large.returncode == 0, large.stderr
+        assert peak_rss_kb(large.stderr) - peak_rss_kb(small.stderr) >= 48 * 1024
+        assert small.stderr.decode().endswith('\n') and small.stdout == b'small\n'
+        print("✅ Runs end stderr with the block's own peak RSS")
+
+
+def test_compile_error_is_reported():
+    if not shutil.which('gcc'):
+        return
+    with tempfile.TemporaryDirectory() as sandbox_dir:
+        result = run_agent(sandbox_dir, 'c', 'this is not c;')
+        assert result.returncode != 0 and b'error' in result.stderr
+        print("✅ Compile errors surface as a failed run")
+
+
+def test_shared_object_runner():
+    if not shutil.which('gcc'):
+        return
+    assert runs_as_shared_object('c', 'printf("x");')
+    assert not runs_as_shared_object('c', 'printf("x");', interactive=True)
+    assert not runs_as_shared_object('c', 'int main() { return 0; }')
+    assert not runs_as_shared_object('py', 'print(1)')
+
+    with tempfile.TemporaryDirectory() as sandbox_dir:
+        subprocess.run(['gcc', '-o', os.path.join(sandbox_dir, 'poly_runner'),
+                        os.path.join(BACKEND, 'poly_runner.c'), '-ldl'], check=True)
+        idle = subprocess.Popen([sys.executable, AGENT, 'idle'], env=dict(os.environ, POLY_SANDBOX_DIR=sandbox_dir),
+                                start_new_session=True)
+        try:
+            while not os.path.exists(os.path.join(sandbox_dir, 'runner.sock')):
+                time.sleep(0.05)
+            code = state_loaders('c', state_signature('c', {'n': 0})) + \
+                'printf("n=%d\\n", n); fprintf(stderr, "warn\\n"); printf("{\\"m\\": %d}\\n", n * 2);'
+            for n in (3, 5):
+                result = run_agent(sandbox_dir, 'c', code, json.dumps({'n': n}), shared_object=True)
+                assert result.returncode == 0, result.stderr
+                assert result.stdout.decode().split('\n')[0] == f'n={n}'
+                assert result.stderr.startswith(b'warn\n' + PEAK_RSS_MARKER.encode())
+            with open(os.path.join(sandbox_dir, 'state.json')) as f:
+                assert json.load(f) == {'n': 5, 'm': 10}
+            assert len(os.listdir(os.path.join(sandbox_dir, 'work'))) == 1
+            print("✅ C block loaded once as a shared object and called with fresh state and buffers")
+
+            pids = 'printf("%d %d\\n", getpid(), getppid());'
+            before = run_agent(sandbox_dir, 'c', pids, shared_object=True).stdout.split()
+            result = run_agent(sandbox_dir, 'c', 'return 3;', shared_object=True)
+            assert result.returncode == 3 and result.stdout == b''
+            result = run_agent(sandbox_dir, 'c', 'printf("bye\\n"); exit(4);', shared_object=True)
+            assert result.returncode == 4 and result.stdout == b'bye\n', result.stderr
+            result = run_agent(sandbox_dir, 'c', 'int *p = 0; *p = 1;', shared_object=True)
+            assert result.returncode == 128 + signal.SIGSEGV and b'crashed' in result.stderr
+            result = run_agent(sandbox_dir, 'c', pids, shared_object=True)
+            assert result.returncode == 0 and peak_rss_kb(result.stderr) > 0, result.stderr
+            after = result.stdout.split()
+            # A fresh child of the same runner: exit() and the crash did not take the runner down
+            assert before[0] != after[0] and before[1] == after[1]
+            print("✅ Blocks run in forked children: exit() and crashes end only their own block")
+        finally:
+            # The idle agent also started a zygote
+            os.killpg(idle.pid, signal.SIGKILL)
+            idle.wait()
+
+
+def test_python_zygote():
+    with tempfile.TemporaryDirectory() as sandbox_dir:
+        zygote = subprocess.Popen([sys.executable, AGENT, 'zygote'], env=dict(os.environ, POLY_SANDBOX_DIR=sandbox_dir))
+        try:
+            while not os.path.exists(os.path.join(sandbox_dir, 'zygote.sock')):
+                time.sleep(0.05)
+            code = ('import json, os, sys\nstate = json.load(open(os.environ["POLY_STATE_FILE"]))\n'
+                    'zygote = open(f"/proc/{os.getppid()}/stat").read().split()[3]\n'
+                    'print(zygote, "json" in sys.modules)\nprint(json.dumps({"y": state["x"] + 1}))')
+            for x in (1, 2):
+                result = run_agent(sandbox_dir, 'py', code, json.dumps({'x': x}))
+                assert result.returncode == 0, result.stderr
+                grandparent, preloaded = result.stdout.decode().split('\n')[0].split()
+                assert int(grandparent) == zygote.pid and preloaded == 'True'
+            with open(os.path.join(sandbox_dir, 'state.json')) as f:
+                assert json.load(f) == {'x': 2, 'y': 3}
+            print("✅ Python blocks forked from the zygote with modules preloaded")
+
+            assert peak_rss_kb(result.stderr) > 0
+            assert run_agent(sandbox_dir, 'py', 'import sys\nsys.exit(3)').returncode == 3
+            result = run_agent(sandbox_dir, 'py', 'raise ValueError("boom")')
+            assert result.returncode == 1 and b'ValueError: boom' in result.stderr
+            env = dict(os.environ, POLY_SANDBOX_DIR=sandbox_dir)
+            result = subprocess.run([sys.executable, AGENT, 'run', 'py'],
+                                    input=frame_program('py', 'print(input()[::-1])') + frame(b'') + b'olleh\n',
+                                    capture_output=True, env=env)
+            assert result.returncode == 0 and result.stdout == b'hello\n', result.stderr
+            result = run_agent(sandbox_dir, 'py', 'import ctypes\nctypes.string_at(0)')
+            assert result.returncode == 256 - signal.SIGSEGV and peak_rss_kb(result.stderr) > 0
+            # Only stdio and the listing's own directory fd: the zygote's connection is not inherited
+            result = run_agent(sandbox_dir, 'py', 'import os\nprint(sorted(int(fd) for fd in os.listdir("/proc/self/fd")))')
+            assert result.stdout.decode().startswith('[0, 1, 2, 3]'), result.stdout
+            print("✅ Zygote children report exit codes, signals and tracebacks, read the block's stdin "
+                  "and inherit no other fds")
+        finally:
+            zygote.kill()
+            zygote.wait()
+
+
+if __name__ == "__main__":
+    test_frame_program()
+    test_state_handover_between_blocks()
+    test_block_peak_rss_is_reported()
+    test_compile_error_is_reported()
+    test_shared_object_runner()
+    test_python_zygote()
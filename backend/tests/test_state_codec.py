@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Test state binding at run time and compile/run pipelining of sequential blocks
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from advanced_orchestrator import SharedStateOrchestrator, execute_blocks_generator, set_debug_mode
+from engine import wrap_source
+from state_codec import encode_state, signature_compatible, state_loaders, state_signature
+
+STATE = {'a': [3, True, 5], 'n': 7, 'f': 2.5, 'c': 'x', 's': 'héllo "q"\n€'}
+
+
+def run_local(lang: str, code: str, state: dict) -> str:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        state_file = os.path.join(temp_dir, 'state.json')
+        with open(state_file, 'w') as f:
+            f.write(encode_state(state))
+        env = dict(os.environ, POLY_STATE_FILE=state_file)
+        source = os.path.join(temp_dir, 'main.c' if lang == 'c' else 'script.py')
+        with open(source, 'w') as f:
+            f.write(wrap_source(lang, code))
+        if lang == 'c':
+            binary = os.path.join(temp_dir, 'myapp')
+            subprocess.run(['gcc', '-Wall', '-o', binary, source], check=True, capture_output=True, text=True)
+            command = [binary]
+        else:
+            command = [sys.executable, source]
+        return subprocess.run(command, check=True, capture_output=True, text=True, env=env).stdout
+
+
+def test_signatures():
+    assert state_signature('c', STATE) == {'a': ('int[]', 3), 'n': ('int',), 'f': ('float',),
+                                           'c': ('char',), 's': ('str', 14)}
+    assert state_signature('java', {'a': [1, 2], 'b': True}) == {'a': ('int[]',), 'b': ('bool',)}
+    assert signature_compatible('py', {'x': (), 'y': ()}, {'x': ()})
+    assert not signature_compatible('c', {'a': ('int[]', 3)}, {'a': ('int[]', 4)})
+    print("✅ Signatures capture the shape, not the values")
+
+
+def test_c_loader():
+    if not shutil.which('gcc'):
+        print("⚠️ gcc not available, skipping C loader")
+        return
+    code = (state_loaders('c', state_signature('c', STATE))
+            + 'printf("%d %d %d %d %d %.2f %c [%s]\\n", a[0], a[1], a[2], a_size, n, f, c, s);')
+    assert run_local('c', code, STATE) == '3 1 5 3 7 2.50 x [héllo "q"\n€]\n'
+    # Same program, new values: no recompilation needed in a real run
+    assert run_local('c', code, dict(STATE, n=42, a=[9, 8, 7])).startswith('9 8 7 3 42')
+    print("✅ C program reads its state at startup")
+
+
+def test_py_loader():
+    code = state_loaders('py', state_signature('py', {'n': 1, 'missing': 2})) + 'print(n, "missing" in globals())'
+    assert run_local('py', code, {'n': 5}) == '5 False\n'
+    print("✅ Python loader binds the names present in the state")
+
+
+class FakeRun:
+    def __init__(self, log, code):
+        self.log, self.code = log, code
+
+    def execute(self, state_json):
+        self.log.append(('execute', json.loads(state_json)))
+        return 'ok'
+
+    def discard(self):
+        self.log.append(('discard', self.code))
+
+
+def test_prepare_ahead_and_rebind():
+    set_debug_mode(False)
+    orchestrator = SharedStateOrchestrator()
+    log = []
+    orchestrator.prepare_code = lambda lang, code, profile=None: log.append(('prepare', lang)) or FakeRun(log, code)
+    orchestrator.global_state.update({'nums': [1, 2]})
+
+    blocks = orchestrator.parse_sequential_blocks(
+        "::py\nnums.append(3)\ntotal = 6\n::/py\n::c\nprintf(\"%d\", nums[0]);\n::/c\n::java\nint x = total;\n::/java")
+
+    # nums exists, so the C block can be generated from its current shape
+    c_ahead = orchestrator.prepare_ahead(blocks, 1)
+    assert c_ahead.result().signature == {'nums': ('int[]', 2)}
+    # total only appears once the Python block has run: Java right after it would have to wait
+    assert orchestrator.prepare_ahead([blocks[0], blocks[2]], 1) is None
+
+    # The Python block grew the list, so the prepared C program no longer fits
+    orchestrator.global_state['nums'] = [1, 2, 3]
+    log.clear()
+    orchestrator.run_block(blocks[1], c_ahead)
+    assert [entry[0] for entry in log] == ['discard', 'prepare', 'execute']
+    assert log[-1] == ('execute', {'nums': [1, 2, 3]})
+
+    # Unchanged shape: the prepared program is bound to the new values as-is
+    c_ahead = orchestrator.prepare_ahead(blocks, 1)
+    c_ahead.result()
+    orchestrator.global_state['nums'] = [4, 5, 6]
+    log.clear()
+    orchestrator.run_block(blocks[1], c_ahead)
+    assert log == [('execute', {'nums': [4, 5, 6]})]
+    print("✅ Blocks prepared ahead are reused when the state shape matches")
+
+
+def test_prepare_ahead_after_current_block():
+    """A block prepared ahead holds a reservation the block before it must never wait for"""
+    set_debug_mode(False)
+    orchestrator = SharedStateOrchestrator()
+    log = []
+    orchestrator.prepare_code = lambda lang, code, profile=None: log.append(('prepare', lang)) or FakeRun(log, code)
+    orchestrator.execute_nested_block_with_loop_and_return_output = lambda block: log.append(('host', 'c')) or []
+    orchestrator.global_state.update({'nums': [1, 2]})
+    blocks = orchestrator.parse_sequential_blocks("::py\nnums.append(3)\n::/py\n::c\nprintf(\"%d\", nums[0]);\n::/c")
+
+    # A stale block is prepared again before the next one is prepared ahead
+    c_ahead = orchestrator.prepare_ahead(blocks, 1)
+    c_ahead.result()
+    orchestrator.global_state['nums'] = [1, 2, 3]
+    log.clear()
+    orchestrator.run_block(blocks[1], c_ahead, lambda: log.append(('ready', 'c')))
+    assert [entry[0] for entry in log] == ['discard', 'prepare', 'ready', 'execute']
+
+    # A block that fails before it runs releases what it prepared
+    def fail():
+        raise RuntimeError("state rejected")
+    c_ahead = orchestrator.prepare_ahead(blocks, 1)
+    c_ahead.result()
+    log.clear()
+    try:
+        orchestrator.run_block(blocks[1], c_ahead, fail)
+    except RuntimeError:
+        pass
+    assert [entry[0] for entry in log] == ['discard'], log
+
+    # Nothing of the same run is prepared while a loop host runs
+    code = "::py\nx = 1\n::/py\n::c\nfor (int i = 0; i < 2; i++) {\n::py\nprint(i)\n::/py\n}\n::/c\n::java\nint y = 2;\n::/java"
+    log.clear()
+    list(execute_blocks_generator(orchestrator, [{'lang': 'nested', 'code': code, 'is_nested': True}]))
+    assert [entry[0] for entry in log] == ['prepare', 'execute', 'host', 'prepare', 'execute'], log
+    print("✅ The next block is prepared only once the current block holds its runtime")
+
+
+if __name__ == "__main__":
+    test_signatures()
+    test_c_loader()
+    test_py_loader()
+    test_prepare_ahead_and_rebind()
+    test_prepare_ahead_after_current_block()
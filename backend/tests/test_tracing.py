@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Test span tracing: spans of a pipeline run, their threads, the Chrome Trace Event output and the bounded buffer
+"""
+
+import json
+import os
+import tempfile
+
+import advanced_orchestrator
+from advanced_orchestrator import execute_tree_generator, parse_code_to_tree
+from execution_context import ExecutionContext
+from tracing import NO_SPAN, Tracer, traced
+
+
+class FakeRun:
+    def execute(self, state_json: str) -> str:
+        return 'hello\n{"n": 1}'
+
+    def discard(self):
+        pass
+
+
+def fake_prepare(lang, code, profile):
+    # Stands in for the engine, which records its own spans on the active tracer
+    with traced('container_start', lang=lang):
+        return FakeRun()
+
+
+def test_spans_of_a_run():
+    original = advanced_orchestrator.prepare_in_docker
+    advanced_orchestrator.prepare_in_docker = fake_prepare
+    try:
+        context = ExecutionContext(tracer=Tracer('trace-1'))
+        blocks = parse_code_to_tree("::py\nn = 1\nprint('hello')\n::/py\n::py\nprint(n)\n::/py")
+        list(execute_tree_generator(blocks, context=context))
+    finally:
+        advanced_orchestrator.prepare_in_docker = original
+
+    trace = context.tracer.to_chrome()
+    spans = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+    names = [span['name'] for span in spans]
+    assert names.count('run') == 1 and names.count('block') == 2
+    for name in ('prepare', 'container_start', 'codegen', 'execute', 'state_decode'):
+        assert name in names, name
+    run = next(span for span in spans if span['name'] == 'run')
+    for span in spans:
+        assert run['ts'] <= span['ts'] and span['ts'] + span['dur'] <= run['ts'] + run['dur'] + 1
+    # Blocks are prepared ahead on the preparation pool while the run goes on in this thread
+    thread_names = {event['tid']: event['args']['name'] for event in trace['traceEvents'] if event['ph'] == 'M'}
+    assert any(thread_names[span['tid']].startswith('poly-prepare') for span in spans if span['name'] == 'codegen')
+    assert [span['args'] for span in spans if span['name'] == 'block'] == [{'index': 0, 'lang': 'py'},
+                                                                           {'index': 1, 'lang': 'py'}]
+    assert trace['otherData'] == {'run_id': 'trace-1', 'dropped_spans': 0}
+    print("✅ Traced run records nested spans with their threads")
+
+
+def test_buffer_and_output_file():
+    tracer = Tracer('trace-2', size=3)
+    for index in range(5):
+        with tracer.span('iteration', index=index):
+            pass
+    trace = tracer.to_chrome()
+    assert [event['args'] for event in trace['traceEvents'] if event['ph'] == 'X'] == [
+        {'index': 0}, {'index': 1}, {'index': 2}]
+    assert trace['otherData']['dropped_spans'] == 2
+
+    # Code outside a traced span records nothing
+    assert traced('container_start') is NO_SPAN
+    assert ExecutionContext().span('block') is NO_SPAN
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = tracer.write(directory)
+        assert os.path.basename(path) == 'trace-2.trace.json'
+        with open(path) as f:
+            assert json.load(f)['displayTimeUnit'] == 'ms'
+    print("✅ Spans beyond the buffer are dropped and traces are written as Chrome Trace Event JSON")
+
+
+if __name__ == "__main__":
+    test_spans_of_a_run()
+    test_buffer_and_output_file()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Test the nested-block transpiler (Python/Java front-ends -> C back-end)
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+from advanced_orchestrator import SharedStateOrchestrator
+from execution_context import ExecutionContext
+from transpiler import (NATIVE_FALLBACK, TranspileError, compile_nested_c_program, parse_nested_block,
+                        transpile_statements, Print, Append, If)
+
+NESTED_LOOP = """::c
+int a[] = {1, 2, 3, 4, 5};
+printf("start\\n");
+for(int i = 0; i < 5; i++) {
+    ::py
+    print("Print in python - ", a[i])
+    l.append(a[i] ** 2)
+    if a[i] % 2 == 0:
+        print(f"{a[i]} is even, half={a[i] / 2:.2f}")
+    total = total + a[i]
+    ::/py
+
+    ::java
+    System.out.println("Sout from Java - " + a[i] + " squared " + (a[i] * a[i]));
+    ::/java
+}
+printf("total %d\\n", (int) total);
+::/c"""
+
+EXPECTED_OUTPUT = """start
+Print in python -  1
+Sout from Java - 1 squared 1
+Print in python -  2
+2 is even, half=1.00
+Sout from Java - 2 squared 4
+Print in python -  3
+Sout from Java - 3 squared 9
+Print in python -  4
+4 is even, half=2.00
+Sout from Java - 4 squared 16
+Print in python -  5
+Sout from Java - 5 squared 25
+total 15"""
+
+
+def compile_block(code: str, state: dict) -> str:
+    block = SharedStateOrchestrator().parse_all_blocks(code)[0]
+    nested_info = block['nested_info']
+    return compile_nested_c_program(nested_info['outer_content'], nested_info['nested_blocks'], state)
+
+
+def run_with_local_gcc(program: str, check: bool = True):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'main.c')
+        with open(source, 'w') as f:
+            f.write(program)
+        binary = os.path.join(temp_dir, 'myapp')
+        subprocess.run(['gcc', '-o', binary, source], check=True, capture_output=True, text=True)
+        result = subprocess.run([binary], check=check, capture_output=True, text=True)
+        return result.stdout if check else result
+
+
+def test_frontends():
+    py_ir = parse_nested_block('print("x", a[i])\n    l.append(a[i] ** 2)', 'py')
+    assert isinstance(py_ir[0], Print) and isinstance(py_ir[1], Append)
+
+    java_ir = parse_nested_block('if (a[i] > 2) { System.out.println("big " + a[i]); }', 'java')
+    assert isinstance(java_ir[0], If) and isinstance(java_ir[0].body[0], Print)
+    print("✅ Front-ends produce IR")
+
+
+def test_unsupported_code_falls_back():
+    for code, lang in [('import math', 'py'), ('d = {"k": 1}', 'py'),
+                       ('List<Integer> x = new ArrayList<>();', 'java')]:
+        try:
+            compile_block(f"::c\nint x = 1;\n::{lang} {code} ::/{lang}\n::/c", {})
+        except TranspileError as e:
+            print(f"✅ Rejected {lang}: {code!r} ({e})")
+        else:
+            raise AssertionError(f"{code!r} should not transpile")
+
+
+def test_legacy_conversion():
+    converted = transpile_statements('print("Value:", x)', 'py')
+    assert 'fputs("Value:", stdout);' in converted and '(long long)(x)' in converted
+    print(f"✅ convert_nested_to_outer-style conversion: {converted}")
+
+
+def test_native_program():
+    program = compile_block(NESTED_LOOP, {'l': [], 'total': 0})
+    assert 'int main()' in program and 'poly_ilist l' in program
+
+    if not shutil.which('gcc'):
+        print("⚠️ gcc not available, skipping native run")
+        return
+
+    output = run_with_local_gcc(program).strip().split('\n')
+    state = json.loads(output[-1])
+    assert '\n'.join(line for line in output[:-1] if line) == EXPECTED_OUTPUT
+    assert state == {'a': [1, 2, 3, 4, 5], 'l': [1, 4, 9, 16, 25], 'total': 15}
+    print("✅ Native nested program output and state match")
+
+
+def test_unassigned_reads_fall_back():
+    rejected = [
+        "::c\nint x = 1;\n::py\nprint(y)\ny = 1\n::/py\n::/c",
+        "::c\nint x = 1;\n::py\nif x > 0:\n    y = 1\nprint(y)\n::/py\n::/c",
+        "::c\nint x = 1;\n::py\nfor k in range(x):\n    y = k\nprint(y)\n::/py\n::/c",
+        # Only runs when the condition holds, so the later block may read y unassigned
+        "::c\nint x = 1;\nif (x > 2) {\n::py\ny = 1\n::/py\n}\n::py\nprint(y)\n::/py\n::/c",
+        # A later loop iteration would see y, the first one would not
+        "::c\nfor (int i = 0; i < 2; i++) {\n::py\nprint(y)\n::/py\n::py\ny = i\n::/py\n}\n::/c",
+    ]
+    for code in rejected:
+        try:
+            compile_block(code, {})
+        except TranspileError as e:
+            assert 'before it is assigned' in str(e) or 'unknown variable' in str(e), e
+        else:
+            raise AssertionError(f"{code!r} reads a variable before it is assigned")
+    # Assigned by an earlier block in the same braces, or on both branches
+    compile_block("::c\nfor (int i = 0; i < 2; i++) {\n::py\ny = i\n::/py\n::py\nprint(y)\n::/py\n}\n::/c", {})
+    compile_block("::c\nint x = 1;\n::py\nif x:\n    y = 1\nelse:\n    y = 2\nprint(y)\n::/py\n::/c", {})
+    print("✅ Reads of variables that may be unassigned are rejected at transpile time")
+
+
+def test_native_semantics():
+    if not shutil.which('gcc'):
+        print("⚠️ gcc not available, skipping native semantics")
+        return
+
+    def run(code: str, state: dict = None):
+        return run_with_local_gcc(compile_block(code, state or {}), check=False)
+
+    # Python ints outgrowing 64 bits and errors Python raises stop the native program
+    for nested in ["print(2 ** 70)", "print(1 / 0)", "print(7 // 0)", "print(7 % 0)", "print(2.5 // 0.0)",
+                   "big = 9223372036854775807\nprint(big + 1)", "print(-big)", "print(int(1e30))",
+                   "print(l[3])"]:
+        result = run(f"::c\nint x = 1;\n::py\n{nested}\n::/py\n::/c", {'big': -2 ** 63, 'l': [1]})
+        assert result.returncode == 86 and NATIVE_FALLBACK in result.stderr, (nested, result)
+    result = run("::c\nfor (int i = 0; i < 30; i++) {\n::py\ntotal = total * 10\n::/py\n}\n::/c", {'total': 1})
+    assert result.returncode == 86 and 'integer overflow' in result.stderr
+    result = run("::c\nint a[] = {1, 2};\n::py\nprint(a[-1], a[-2])\nprint(a[2])\n::/py\n::/c")
+    assert result.returncode == 86 and result.stdout.startswith('2 1\n')
+
+    # Java ints wrap at 32 bits, longs at 64, and division by zero is an exception
+    java = run("::c\nint x = 1;\n::java\nint big = 2147483647;\nbig = big + 1;\nSystem.out.println(big);\n"
+               "System.out.println(2147483647 * 2);\nSystem.out.println(n * 3);\n"
+               "long wide = 9223372036854775807L;\nwide = wide + 1;\nSystem.out.println(wide);\n"
+               "System.out.println((long) 2147483647 + 1);\nSystem.out.println((int) 3.9e10);\n"
+               "System.out.println(-2147483648 / -1);\nSystem.out.println(Math.abs(-2147483648));\n"
+               "::/java\n::/c", {'n': 3000000000})
+    assert java.returncode == 0, java.stderr
+    assert java.stdout.split('\n')[:8] == ['-2147483648', '-2', '410065408', '-9223372036854775808',
+                                           '2147483648', '2147483647', '-2147483648', '-2147483648']
+    result = run("::c\nint x = 0;\n::java\nSystem.out.println(7 / x);\n::/java\n::/c")
+    assert result.returncode == 86 and 'division by zero' in result.stderr
+    result = run("::c\nint a[] = {1, 2};\n::java\nSystem.out.println(a[-1]);\n::/java\n::/c")
+    assert result.returncode == 86 and 'out of bounds' in result.stderr
+
+    # A Java loop variable is its own variable, not the outer C one
+    result = run("::c\nfor (int i = 0; i < 2; i++) {\n::java\nfor (int i = 0; i < 3; i++) { }\n"
+                 "::/java\nprintf(\"%d\\n\", i);\n}\n::/c")
+    assert result.stdout.split('\n')[:2] == ['0', '1'], result
+
+    # A variable assigned only when a branch ran does not flow back
+    output = run("::c\nint x = 1;\n::py\nif x > 5:\n    y = 1\nz = 2\n::/py\n::/c").stdout
+    assert json.loads(output.strip().split('\n')[-1]) == {'x': 1, 'z': 2}
+    print("✅ Native programs wrap Java ints and stop where Python would overflow or raise")
+
+
+def test_native_float_formatting():
+    if not shutil.which('gcc'):
+        print("⚠️ gcc not available, skipping native float formatting")
+        return
+    values = [100.0, 50.0, 1e15, 1e16, 1.5e16, 1e-4, 1e-5, 1e8, 0.1, 1 / 3, -0.0, 2.5e-10, 123456789.125, 1e22,
+              1.7976931348623157e308]
+    state = {f'v{i}': value for i, value in enumerate(values)}
+    prints = '\n'.join(f"print(v{i})" for i in range(len(values)))
+    output = run_with_local_gcc(compile_block(f"::c\nint x = 1;\n::py\n{prints}\ny = 200.0\n::/py\n::/c",
+                                              state)).strip().split('\n')
+    # What CPython prints for the same values
+    assert output[:len(values)] == [repr(value) for value in values]
+    exported = json.loads(output[-1])
+    assert exported['y'] == 200.0 and isinstance(exported['y'], float)
+
+    # Double.toString: fixed from 1e-3 up to 1e7, else computerized scientific notation
+    prints = '\n'.join(f"System.out.println(v{i});" for i in range(len(values)))
+    output = run_with_local_gcc(compile_block(f"::c\nint x = 1;\n::java\n{prints}\n::/java\n::/c",
+                                              state)).strip().split('\n')
+    assert output[:len(values)] == ['100.0', '50.0', '1.0E15', '1.0E16', '1.5E16', '1.0E-4', '1.0E-5', '1.0E8',
+                                    '0.1', '0.3333333333333333', '-0.0', '2.5E-10', '1.23456789125E8', '1.0E22',
+                                    '1.7976931348623157E308']
+    print("✅ Native floats print like Python's repr and Java's Double.toString, and export as floats")
+
+
+def test_native_fallback():
+    """A native program that stops with the marker runs again through the general path"""
+    orchestrator = SharedStateOrchestrator(ExecutionContext(events=None))
+    block = orchestrator.parse_all_blocks("::c\nint x = 1;\n::py\nprint(2 ** 70)\n::/py\n::/c")[0]
+    hosted = []
+    orchestrator.execute_code = lambda *args: (_ for _ in ()).throw(
+        RuntimeError(f"Docker command failed.\nStderr: {NATIVE_FALLBACK}: integer overflow"))
+    orchestrator.execute_hosted_nested_block = lambda loop_host: hosted.append(loop_host) or ['1180591620717411303424']
+    assert orchestrator.execute_nested_block_with_loop_and_return_output(block) == ['1180591620717411303424']
+    assert len(hosted) == 1
+    print("✅ Native programs that stop with the fallback marker run per iteration instead")
+
+
+if __name__ == "__main__":
+    test_frontends()
+    test_unsupported_code_falls_back()
+    test_legacy_conversion()
+    test_native_program()
+    test_unassigned_reads_fall_back()
+    test_native_semantics()
+    test_native_float_formatting()
+    test_native_fallback()
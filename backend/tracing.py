@@ -0,0 +1,128 @@
+import contextlib
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+# Span tracing: an opt-in timeline of one pipeline run (the run, its blocks,
+# nested iterations, image builds, container starts, executions, state
+# decoding and socket sends) with the thread each span ran on, written as a
+# Chrome Trace Event JSON file that opens in Perfetto or chrome://tracing.
+# A run's tracer claims one slot per finished span from a buffer allocated
+# up front, so recording a span is a counter step and a few stores: no
+# allocation, lock or formatting while the run is being measured. Spans
+# beyond the buffer are counted as dropped.
+
+TRACE_DIR = os.environ.get('POLYGLOT_TRACE_DIR', os.path.join(tempfile.gettempdir(), 'polyglot-traces'))
+TRACE_BUFFER_SIZE = int(os.environ.get('POLYGLOT_TRACE_BUFFER_SIZE', '65536'))
+
+# Trace every run, not only those asking for it with `/ws?trace=1`
+TRACE_ALL = os.environ.get('POLYGLOT_TRACE', '').lower() in ('1', 'true', 'yes')
+
+# Tracer of the span open on each thread, for code that has no context to ask (engine, sandbox)
+_active = threading.local()
+
+NO_SPAN = contextlib.nullcontext()
+
+
+class Span:
+    """Times the enclosed code into a tracer slot; optionally the thread's active tracer meanwhile"""
+
+    __slots__ = ('tracer', 'name', 'category', 'args', 'activate', 'start', 'previous')
+
+    def __init__(self, tracer: 'Tracer', name: str, category: str, args: Dict, activate: bool = True):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.activate = activate
+
+    def __enter__(self):
+        if self.activate:
+            self.previous = getattr(_active, 'tracer', None)
+            _active.tracer = self.tracer
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        if self.activate:
+            _active.tracer = self.previous
+        self.tracer.record(self.name, self.category, self.start, end, self.args)
+        return False
+
+
+class Tracer:
+    """Spans of one run in preallocated parallel arrays"""
+
+    def __init__(self, run_id: str, size: int = TRACE_BUFFER_SIZE):
+        self.run_id = run_id
+        self.size = size
+        self.origin = time.perf_counter_ns()
+        self.names: List[Optional[str]] = [None] * size
+        self.categories: List[Optional[str]] = [None] * size
+        self.args: List[Optional[Dict]] = [None] * size
+        self.starts = array('q', bytes(8 * size))
+        self.ends = array('q', bytes(8 * size))
+        self.threads = array('Q', bytes(8 * size))
+        self.thread_names: Dict[int, str] = {}
+        # Claiming a slot is atomic, so threads never write the same one
+        self.slots = itertools.count()
+
+    def span(self, name: str, category: str = 'pipeline', activate: bool = True, **args) -> Span:
+        return Span(self, name, category, args, activate)
+
+    def record(self, name: str, category: str, start: int, end: int, args: Dict):
+        slot = next(self.slots)
+        if slot >= self.size:
+            return
+        thread = threading.get_ident()
+        if thread not in self.thread_names:
+            self.thread_names[thread] = threading.current_thread().name
+        self.names[slot] = name
+        self.categories[slot] = category
+        self.args[slot] = args
+        self.starts[slot] = start
+        self.ends[slot] = end
+        self.threads[slot] = thread
+
+    def to_chrome(self) -> Dict:
+        """The recorded spans as a Chrome Trace Event document, earliest first"""
+        claimed = next(self.slots)
+        pid = os.getpid()
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                   'args': {'name': f'polyglot run {self.run_id}'}}]
+        events.extend({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread, 'args': {'name': name}}
+                      for thread, name in list(self.thread_names.items()))
+        spans = [{'name': self.names[slot], 'cat': self.categories[slot], 'ph': 'X', 'pid': pid,
+                  'tid': self.threads[slot], 'ts': (self.starts[slot] - self.origin) / 1000,
+                  'dur': (self.ends[slot] - self.starts[slot]) / 1000, 'args': self.args[slot]}
+                 for slot in range(min(claimed, self.size)) if self.names[slot] is not None]
+        spans.sort(key=lambda event: event['ts'])
+        events.extend(spans)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'run_id': self.run_id, 'dropped_spans': max(0, claimed - self.size)}}
+
+    def write(self, directory: str = TRACE_DIR) -> str:
+        """Write the trace to <directory>/<run_id>.trace.json and return its path"""
+        os.makedirs(directory, exist_ok=True)
+        path = trace_path(self.run_id, directory)
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome(), f)
+        return path
+
+
+def trace_path(run_id: str, directory: str = TRACE_DIR) -> str:
+    return os.path.join(directory, f'{run_id}.trace.json')
+
+
+def traced(name: str, category: str = 'engine', **args):
+    """Span on the tracer active on this thread, or a no-op when the current run is not traced"""
+    tracer = getattr(_active, 'tracer', None)
+    if tracer is None:
+        return NO_SPAN
+    return Span(tracer, name, category, args)
@@ -0,0 +1,1544 @@
+import ast
+import json
+import re
+import textwrap
+from typing import Dict, List, Any, Tuple, Optional
+
+# Nested-block transpiler: a small typed IR, Python and Java front-ends for a
+# practical subset (arithmetic, conditionals, prints, list append, indexing)
+# and a C back-end that compiles nested blocks straight into the outer C code.
+
+
+class TranspileError(Exception):
+    """Raised when a nested block uses something outside the supported subset"""
+
+
+# ---------------------------------------------------------------------------
+# Typed IR
+# ---------------------------------------------------------------------------
+# Scalar types are 'int', 'float', 'bool' and 'str', plus 'long' for Java's
+# 64-bit integers (a Java 'int' is 32 bits). Lists and C arrays use the
+# element type with a '[]' suffix ('int[]', 'float[]', 'str[]'); '?[]' is an
+# empty list whose element type is fixed by its first append.
+
+class Node:
+    """Base class for IR nodes"""
+    fields: Tuple[str, ...] = ()
+
+    def __init__(self, *args):
+        for field, value in zip(self.fields, args):
+            setattr(self, field, value)
+
+    def __repr__(self):
+        args = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.fields)
+        return f"{type(self).__name__}({args})"
+
+
+# Expressions
+class Const(Node):
+    fields = ('value', 'type')
+
+class Name(Node):
+    fields = ('name',)
+
+class ListLit(Node):
+    fields = ('elements',)
+
+class Index(Node):
+    fields = ('base', 'index')
+
+class Length(Node):
+    fields = ('value',)
+
+class BinOp(Node):
+    # '+', '-', '*', '/' (true division), '//' and '%' (Python floor semantics),
+    # 'tdiv' and 'tmod' (C/Java truncating semantics), '**'
+    fields = ('op', 'left', 'right')
+
+class UnaryOp(Node):
+    fields = ('op', 'operand')
+
+class Compare(Node):
+    fields = ('op', 'left', 'right')
+
+class BoolOp(Node):
+    fields = ('op', 'values')
+
+class Call(Node):
+    # Builtins only: abs, min, max, int, float, and Java's long casts
+    fields = ('func', 'args')
+
+class Ternary(Node):
+    fields = ('cond', 'then', 'orelse')
+
+class FString(Node):
+    # parts are literal strings or (expr, format_spec) tuples
+    fields = ('parts',)
+
+
+# Statements
+class Print(Node):
+    # style is 'py' or 'java' and affects how booleans and floats are spelled
+    fields = ('args', 'sep', 'end', 'style')
+
+class Assign(Node):
+    # declared is the IR type of a Java declaration, export marks variables
+    # that should flow back into the shared state
+    fields = ('target', 'value', 'declared', 'export')
+
+class Append(Node):
+    fields = ('target', 'value')
+
+class If(Node):
+    fields = ('cond', 'body', 'orelse')
+
+class ForRange(Node):
+    fields = ('var', 'start', 'stop', 'step', 'body')
+
+
+# ---------------------------------------------------------------------------
+# Python front-end
+# ---------------------------------------------------------------------------
+
+def normalize_python_block(code: str) -> str:
+    """Re-indent block text whose first line lost its indentation to the block marker"""
+    lines = code.strip('\n').split('\n')
+    first, rest = lines[0].strip(), textwrap.dedent('\n'.join(lines[1:]))
+    candidates = [textwrap.dedent(code), first + '\n' + rest,
+                  first + '\n' + textwrap.indent(rest, '    ')]
+    for candidate in candidates:
+        try:
+            ast.parse(candidate)
+            return candidate
+        except SyntaxError:
+            continue
+    return candidates[0]
+
+
+class PythonFrontend:
+    """Lower a nested Python block to IR using the standard ast module"""
+
+    BINOPS = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/',
+              ast.FloorDiv: '//', ast.Mod: '%', ast.Pow: '**'}
+    CMPOPS = {ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=',
+              ast.Gt: '>', ast.GtE: '>='}
+    BUILTINS = {'abs', 'min', 'max', 'int', 'float'}
+
+    def parse(self, code: str) -> List[Node]:
+        """Parse nested Python code into a list of IR statements"""
+        return self.statements(self.parse_source(code).body)
+
+    def parse_source(self, code: str) -> ast.Module:
+        try:
+            return ast.parse(normalize_python_block(code))
+        except SyntaxError:
+            raise TranspileError("Python block does not parse")
+
+    def statements(self, nodes: list) -> List[Node]:
+        result = []
+        for node in nodes:
+            stmt = self.statement(node)
+            if stmt is not None:
+                result.append(stmt)
+        return result
+
+    def statement(self, node) -> Optional[Node]:
+        if isinstance(node, ast.Pass):
+            return None
+        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Call):
+            call = node.value
+            if isinstance(call.func, ast.Name) and call.func.id == 'print':
+                return self.print_call(call)
+            if (isinstance(call.func, ast.Attribute) and call.func.attr == 'append'
+                    and isinstance(call.func.value, ast.Name) and len(call.args) == 1):
+                return Append(Name(call.func.value.id), self.expr(call.args[0]))
+        elif isinstance(node, ast.Assign) and len(node.targets) == 1:
+            return Assign(self.target(node.targets[0]), self.expr(node.value), None, True)
+        elif isinstance(node, ast.AugAssign) and type(node.op) in self.BINOPS:
+            target = self.target(node.target)
+            value = BinOp(self.BINOPS[type(node.op)], target, self.expr(node.value))
+            return Assign(target, value, None, True)
+        elif isinstance(node, ast.If):
+            return If(self.expr(node.test), self.statements(node.body), self.statements(node.orelse))
+        elif isinstance(node, ast.For):
+            return self.for_range(node)
+        raise TranspileError(f"unsupported Python statement: {type(node).__name__}")
+
+    def print_call(self, call: ast.Call) -> Print:
+        options = {'sep': ' ', 'end': '\n'}
+        for keyword in call.keywords:
+            if keyword.arg not in options or not self.is_str_constant(keyword.value):
+                raise TranspileError("unsupported print() keyword")
+            options[keyword.arg] = keyword.value.value
+        return Print([self.expr(arg) for arg in call.args], options['sep'], options['end'], 'py')
+
+    def for_range(self, node: ast.For) -> ForRange:
+        iterator = node.iter
+        if (not isinstance(node.target, ast.Name) or node.orelse
+                or not isinstance(iterator, ast.Call) or not isinstance(iterator.func, ast.Name)
+                or iterator.func.id != 'range' or not 1 <= len(iterator.args) <= 3):
+            raise TranspileError("only 'for name in range(...)' loops are supported")
+        args = [self.expr(arg) for arg in iterator.args]
+        start, stop, step = Const(0, 'int'), args[0], Const(1, 'int')
+        if len(args) >= 2:
+            start, stop = args[0], args[1]
+        if len(args) == 3:
+            step = args[2]
+        return ForRange(node.target.id, start, stop, step, self.statements(node.body))
+
+    def target(self, node) -> Node:
+        if isinstance(node, (ast.Name, ast.Subscript)):
+            return self.expr(node)
+        raise TranspileError("unsupported assignment target")
+
+    @staticmethod
+    def is_str_constant(node) -> bool:
+        return isinstance(node, ast.Constant) and isinstance(node.value, str)
+
+    def expr(self, node) -> Node:
+        if isinstance(node, ast.Constant):
+            value = node.value
+            if isinstance(value, bool):
+                return Const(value, 'bool')
+            if isinstance(value, int):
+                return Const(value, 'int')
+            if isinstance(value, float):
+                return Const(value, 'float')
+            if isinstance(value, str):
+                return Const(value, 'str')
+        elif isinstance(node, ast.Name):
+            return Name(node.id)
+        elif isinstance(node, ast.List):
+            return ListLit([self.expr(element) for element in node.elts])
+        elif isinstance(node, ast.BinOp) and type(node.op) in self.BINOPS:
+            return BinOp(self.BINOPS[type(node.op)], self.expr(node.left), self.expr(node.right))
+        elif isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.USub):
+                return UnaryOp('-', self.expr(node.operand))
+            if isinstance(node.op, ast.UAdd):
+                return self.expr(node.operand)
+            if isinstance(node.op, ast.Not):
+                return UnaryOp('not', self.expr(node.operand))
+        elif isinstance(node, ast.BoolOp):
+            op = 'and' if isinstance(node.op, ast.And) else 'or'
+            return BoolOp(op, [self.expr(value) for value in node.values])
+        elif isinstance(node, ast.Compare) and all(type(op) in self.CMPOPS for op in node.ops):
+            operands = [node.left] + node.comparators
+            comparisons = [Compare(self.CMPOPS[type(op)], self.expr(left), self.expr(right))
+                           for op, left, right in zip(node.ops, operands, operands[1:])]
+            return comparisons[0] if len(comparisons) == 1 else BoolOp('and', comparisons)
+        elif isinstance(node, ast.Subscript):
+            index = node.slice.value if type(node.slice).__name__ == 'Index' else node.slice
+            if not isinstance(index, ast.Slice):
+                return Index(self.expr(node.value), self.expr(index))
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            args = [self.expr(arg) for arg in node.args]
+            if node.func.id == 'len' and len(args) == 1:
+                return Length(args[0])
+            if node.func.id in self.BUILTINS:
+                return Call(node.func.id, args)
+        elif isinstance(node, ast.IfExp):
+            return Ternary(self.expr(node.test), self.expr(node.body), self.expr(node.orelse))
+        elif isinstance(node, ast.JoinedStr):
+            return self.fstring(node)
+        raise TranspileError(f"unsupported Python expression: {type(node).__name__}")
+
+    def fstring(self, node: ast.JoinedStr) -> FString:
+        parts = []
+        for value in node.values:
+            if self.is_str_constant(value):
+                parts.append(value.value)
+            elif isinstance(value, ast.FormattedValue) and value.conversion == -1:
+                spec = ''
+                if value.format_spec is not None:
+                    if not all(self.is_str_constant(v) for v in value.format_spec.values):
+                        raise TranspileError("nested f-string format specs are not supported")
+                    spec = ''.join(v.value for v in value.format_spec.values)
+                parts.append((self.expr(value.value), spec))
+            else:
+                raise TranspileError("unsupported f-string part")
+        return FString(parts)
+
+
+# ---------------------------------------------------------------------------
+# Java front-end
+# ---------------------------------------------------------------------------
+
+JAVA_TOKEN_RE = re.compile(r'''
+    (?P<ws>\s+|//[^\n]*|/\*.*?\*/)
+  | (?P<float>\d+\.\d*(?:[eE][-+]?\d+)?[fFdD]?|\d+[fFdD])
+  | (?P<int>\d+[lL]?)
+  | (?P<string>"(?:[^"\\\n]|\\.)*")
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<op>\+\+|--|\+=|-=|\*=|/=|%=|==|!=|<=|>=|&&|\|\||[-+*/%<>=!?:;,.(){}\[\]])
+''', re.VERBOSE | re.DOTALL)
+
+# short, byte, float and char have no exact C counterpart here and fall back
+JAVA_TYPES = {'int': 'int', 'long': 'long', 'double': 'float', 'boolean': 'bool', 'String': 'str'}
+
+
+class JavaFrontend:
+    """Lower a nested Java block to IR with a small recursive-descent parser"""
+
+    COMPOUND = {'+=': '+', '-=': '-', '*=': '*', '/=': 'tdiv', '%=': 'tmod'}
+
+    def parse(self, code: str) -> List[Node]:
+        """Parse nested Java statements into a list of IR statements"""
+        self.tokens = self.tokenize(code)
+        self.pos = 0
+        statements = []
+        while self.peek()[0] != 'eof':
+            statements.extend(self.statement())
+        return statements
+
+    @staticmethod
+    def tokenize(code: str) -> List[Tuple[str, str]]:
+        tokens, pos = [], 0
+        while pos < len(code):
+            match = JAVA_TOKEN_RE.match(code, pos)
+            if not match:
+                raise TranspileError(f"unexpected Java input near {code[pos:pos + 20]!r}")
+            if match.lastgroup != 'ws':
+                tokens.append((match.lastgroup, match.group()))
+            pos = match.end()
+        tokens.append(('eof', ''))
+        return tokens
+
+    def peek(self, offset: int = 0) -> Tuple[str, str]:
+        return self.tokens[min(self.pos + offset, len(self.tokens) - 1)]
+
+    def next(self) -> Tuple[str, str]:
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def accept(self, text: str) -> bool:
+        if self.peek()[1] == text and self.peek()[0] in ('op', 'name'):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, text: str):
+        if not self.accept(text):
+            raise TranspileError(f"expected {text!r} in Java block, found {self.peek()[1]!r}")
+
+    def name(self) -> str:
+        kind, text = self.next()
+        if kind != 'name':
+            raise TranspileError(f"expected identifier in Java block, found {text!r}")
+        return text
+
+    def body(self) -> List[Node]:
+        if self.accept('{'):
+            statements = []
+            while not self.accept('}'):
+                if self.peek()[0] == 'eof':
+                    raise TranspileError("unterminated Java block")
+                statements.extend(self.statement())
+            return statements
+        return self.statement()
+
+    def statement(self) -> List[Node]:
+        kind, text = self.peek()
+        if text == '{' and kind == 'op':
+            return self.body()
+        if self.accept(';'):
+            return []
+        if kind == 'name' and text in JAVA_TYPES and self.peek(1)[0] == 'name':
+            return self.declaration()
+        if self.accept('if'):
+            self.expect('(')
+            cond = self.expr()
+            self.expect(')')
+            then = self.body()
+            orelse = self.body() if self.accept('else') else []
+            return [If(cond, then, orelse)]
+        if self.accept('for'):
+            return [self.for_loop()]
+        if text == 'System':
+            return [self.println()]
+        if kind == 'name':
+            statement = self.simple_statement()
+            self.expect(';')
+            return [statement]
+        raise TranspileError(f"unsupported Java statement starting with {text!r}")
+
+    def declaration(self) -> List[Node]:
+        declared = JAVA_TYPES[self.next()[1]]
+        statements = []
+        while True:
+            name = self.name()
+            if self.peek()[1] == '[':
+                raise TranspileError("Java array declarations are not supported")
+            default = {'int': Const(0, 'int'), 'long': Const(0, 'long'), 'float': Const(0.0, 'float'),
+                       'bool': Const(False, 'bool'), 'str': Const('', 'str')}[declared]
+            value = self.expr() if self.accept('=') else default
+            statements.append(Assign(Name(name), value, declared, False))
+            if not self.accept(','):
+                break
+        self.expect(';')
+        return statements
+
+    def simple_statement(self) -> Node:
+        target = self.postfix(Name(self.name()))
+        if self.accept('++'):
+            return Assign(target, BinOp('+', target, Const(1, 'int')), None, False)
+        if self.accept('--'):
+            return Assign(target, BinOp('-', target, Const(1, 'int')), None, False)
+        if self.accept('='):
+            return Assign(target, self.expr(), None, False)
+        op = self.peek()[1]
+        if op in self.COMPOUND:
+            self.next()
+            return Assign(target, BinOp(self.COMPOUND[op], target, self.expr()), None, False)
+        raise TranspileError(f"unsupported Java statement near {op!r}")
+
+    def for_loop(self) -> ForRange:
+        self.expect('(')
+        if not self.accept('int'):
+            raise TranspileError("only counting 'for (int i = ...; ...; ...)' loops are supported")
+        var = self.name()
+        self.expect('=')
+        start = self.expr()
+        self.expect(';')
+        if self.name() != var:
+            raise TranspileError("for loop condition must test the loop variable")
+        op = self.next()[1]
+        bound = self.expr()
+        self.expect(';')
+        if self.name() != var:
+            raise TranspileError("for loop update must change the loop variable")
+        update = self.next()[1]
+        if update == '++':
+            step = Const(1, 'int')
+        elif update == '--':
+            step = Const(-1, 'int')
+        elif update in ('+=', '-=') and self.peek()[0] == 'int':
+            amount = int(self.next()[1].rstrip('lL'))
+            step = Const(amount if update == '+=' else -amount, 'int')
+        else:
+            raise TranspileError("unsupported for loop update")
+        self.expect(')')
+        ascending = step.value > 0
+        if (op in ('<', '<=')) != ascending or op not in ('<', '<=', '>', '>='):
+            raise TranspileError("for loop condition does not match its direction")
+        stop = BinOp('+' if op == '<=' else '-', bound, Const(1, 'int')) if op in ('<=', '>=') else bound
+        return ForRange(var, start, stop, step, self.body())
+
+    def println(self) -> Print:
+        for part in ('System', '.', 'out', '.'):
+            self.expect(part)
+        method = self.name()
+        if method not in ('println', 'print'):
+            raise TranspileError(f"unsupported System.out.{method}")
+        self.expect('(')
+        args = [] if self.peek()[1] == ')' else [self.expr()]
+        self.expect(')')
+        self.expect(';')
+        return Print(args, '', '\n' if method == 'println' else '', 'java')
+
+    # Expressions, lowest precedence first
+    def expr(self) -> Node:
+        cond = self.binary(0)
+        if self.accept('?'):
+            then = self.expr()
+            self.expect(':')
+            return Ternary(cond, then, self.expr())
+        return cond
+
+    LEVELS = [('||',), ('&&',), ('==', '!='), ('<', '<=', '>', '>='), ('+', '-'), ('*', '/', '%')]
+
+    def binary(self, level: int) -> Node:
+        if level == len(self.LEVELS):
+            return self.unary()
+        left = self.binary(level + 1)
+        while self.peek()[0] == 'op' and self.peek()[1] in self.LEVELS[level]:
+            op = self.next()[1]
+            right = self.binary(level + 1)
+            if op in ('||', '&&'):
+                left = BoolOp('or' if op == '||' else 'and', [left, right])
+            elif level in (2, 3):
+                left = Compare(op, left, right)
+            else:
+                left = BinOp({'/': 'tdiv', '%': 'tmod'}.get(op, op), left, right)
+        return left
+
+    def unary(self) -> Node:
+        if self.accept('-'):
+            return UnaryOp('-', self.unary())
+        if self.accept('+'):
+            return self.unary()
+        if self.accept('!'):
+            return UnaryOp('not', self.unary())
+        if (self.peek()[1] == '(' and self.peek(1)[1] in JAVA_TYPES
+                and self.peek(2)[1] == ')' and JAVA_TYPES[self.peek(1)[1]] in ('int', 'long', 'float')):
+            self.next()
+            func = JAVA_TYPES[self.next()[1]]
+            self.next()
+            return Call(func, [self.unary()])
+        return self.postfix(self.primary())
+
+    def postfix(self, node: Node) -> Node:
+        while True:
+            if self.accept('['):
+                node = Index(node, self.expr())
+                self.expect(']')
+            elif self.peek()[1] == '.' and self.peek(1)[1] == 'length':
+                self.pos += 2
+                if self.accept('('):
+                    self.expect(')')
+                node = Length(node)
+            else:
+                return node
+
+    def primary(self) -> Node:
+        kind, text = self.next()
+        if kind == 'int':
+            if text[-1] in 'lL':
+                return Const(int(text[:-1]), 'long')
+            if int(text) > 2 ** 31:
+                raise TranspileError(f"integer literal {text} is out of range for a Java int")
+            return Const(int(text), 'int')
+        if kind == 'float':
+            return Const(float(text.rstrip('fFdD')), 'float')
+        if kind == 'string':
+            return Const(json.loads(text), 'str')
+        if kind == 'name':
+            if text in ('true', 'false'):
+                return Const(text == 'true', 'bool')
+            if text == 'Math' and self.accept('.'):
+                func = self.name()
+                if func not in ('abs', 'min', 'max'):
+                    raise TranspileError(f"unsupported Math.{func}")
+                self.expect('(')
+                args = [self.expr()]
+                while self.accept(','):
+                    args.append(self.expr())
+                self.expect(')')
+                return Call(func, args)
+            return Name(text)
+        if text == '(':
+            node = self.expr()
+            self.expect(')')
+            return node
+        raise TranspileError(f"unsupported Java expression near {text!r}")
+
+
+FRONTENDS = {'py': PythonFrontend, 'java': JavaFrontend}
+
+
+def parse_nested_block(code: str, lang: str) -> List[Node]:
+    """Run the front-end for a nested block's language"""
+    if lang not in FRONTENDS:
+        raise TranspileError(f"no front-end for nested {lang} blocks")
+    return FRONTENDS[lang]().parse(code)
+
+
+# ---------------------------------------------------------------------------
+# C back-end
+# ---------------------------------------------------------------------------
+
+# Marker and exit status of a native program that hit something only the
+# interpreted path reproduces faithfully
+NATIVE_FALLBACK = 'poly-native-fallback'
+
+C_RUNTIME = r'''#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <stdint.h>
+#include <limits.h>
+#include <math.h>
+
+#define POLY_LIST(name, T) \
+typedef struct { T *data; long long len, cap; } name; \
+static inline void name##_push(name *l, T v) { \
+    if (l->len == l->cap) { \
+        l->cap = l->cap ? l->cap * 2 : 8; \
+        l->data = realloc(l->data, l->cap * sizeof(T)); \
+    } \
+    l->data[l->len++] = v; \
+} \
+static inline name name##_from(const T *values, long long n) { \
+    name l = {0}; \
+    for (long long k = 0; k < n; k++) name##_push(&l, values[k]); \
+    return l; \
+}
+POLY_LIST(poly_ilist, long long)
+POLY_LIST(poly_flist, double)
+POLY_LIST(poly_slist, const char *)
+
+/* What the program cannot reproduce (Python's big ints, errors the interpreted
+   runtimes raise) ends it with this marker; the block then runs per iteration */
+static inline void poly_fallback(const char *reason) {
+    fprintf(stderr, "poly-native-fallback: %s\n", reason);
+    exit(86);
+}
+static inline long long poly_index(long long i, long long len) {
+    if (i < 0) i += len;
+    if (i < 0 || i >= len) poly_fallback("list index out of range");
+    return i;
+}
+static inline long long poly_jindex(long long i, long long len) {
+    if (i < 0 || i >= len) poly_fallback("array index out of bounds");
+    return i;
+}
+static inline long long poly_add(long long a, long long b) {
+    long long r;
+    if (__builtin_add_overflow(a, b, &r)) poly_fallback("integer overflow");
+    return r;
+}
+static inline long long poly_sub(long long a, long long b) {
+    long long r;
+    if (__builtin_sub_overflow(a, b, &r)) poly_fallback("integer overflow");
+    return r;
+}
+static inline long long poly_mul(long long a, long long b) {
+    long long r;
+    if (__builtin_mul_overflow(a, b, &r)) poly_fallback("integer overflow");
+    return r;
+}
+static inline long long poly_neg(long long a) {
+    if (a == LLONG_MIN) poly_fallback("integer overflow");
+    return -a;
+}
+static inline long long poly_abs(long long a) { return a < 0 ? poly_neg(a) : a; }
+static inline double poly_div(double a, double b) {
+    if (b == 0) poly_fallback("division by zero");
+    return a / b;
+}
+static inline long long poly_floordiv(long long a, long long b) {
+    if (b == 0) poly_fallback("integer division by zero");
+    if (b == -1) return poly_neg(a);
+    long long q = a / b;
+    return (a % b != 0 && ((a < 0) != (b < 0))) ? q - 1 : q;
+}
+static inline long long poly_mod(long long a, long long b) {
+    if (b == 0) poly_fallback("integer modulo by zero");
+    if (b == -1) return 0;
+    long long r = a % b;
+    return (r != 0 && ((r < 0) != (b < 0))) ? r + b : r;
+}
+static inline double poly_ffloordiv(double a, double b) {
+    if (b == 0) poly_fallback("float floor division by zero");
+    double q = a / b;
+    long long t = (long long)q;
+    return (double)(t > q ? t - 1 : t);
+}
+static inline long long poly_ipow(long long base, long long exp) {
+    if (exp < 0) poly_fallback("negative integer exponent");
+    long long result = 1;
+    while (exp) {
+        if ((exp & 1) && __builtin_mul_overflow(result, base, &result)) poly_fallback("integer overflow");
+        exp >>= 1;
+        if (exp && __builtin_mul_overflow(base, base, &base)) poly_fallback("integer overflow");
+    }
+    return result;
+}
+static inline long long poly_float_to_int(double v) {
+    if (v != v || v >= 9223372036854775808.0 || v < -9223372036854775808.0) poly_fallback("float out of integer range");
+    return (long long)v;
+}
+/* Java semantics: int wraps at 32 bits and long at 64, casts from double saturate */
+static inline int32_t poly_i32(long long v) { return (int32_t)(uint32_t)(unsigned long long)v; }
+static inline long long poly_lwrap(unsigned long long v) { return (long long)v; }
+static inline long long poly_jdiv(long long a, long long b) {
+    if (b == 0) poly_fallback("division by zero");
+    return b == -1 ? poly_lwrap(0ULL - (unsigned long long)a) : a / b;
+}
+static inline long long poly_jmod(long long a, long long b) {
+    if (b == 0) poly_fallback("division by zero");
+    return b == -1 ? 0 : a % b;
+}
+static inline int32_t poly_d2i(double v) {
+    if (v != v) return 0;
+    if (v >= 2147483647.0) return INT32_MAX;
+    if (v <= -2147483648.0) return INT32_MIN;
+    return (int32_t)v;
+}
+static inline long long poly_d2l(double v) {
+    if (v != v) return 0;
+    if (v >= 9223372036854775807.0) return LLONG_MAX;
+    if (v <= -9223372036854775808.0) return LLONG_MIN;
+    return (long long)v;
+}
+/* Shortest digits that read back as v (as a C float when single), and the decimal exponent of the first */
+static inline int poly_float_digits(double v, int single, char *digits, int *exp10) {
+    char buf[40];
+    for (int p = 0; p <= 16; p++) {
+        snprintf(buf, sizeof buf, "%.*e", p, v);
+        double back = strtod(buf, NULL);
+        if (single ? (float)back == (float)v : back == v) break;
+    }
+    int n = 0;
+    char *s = buf;
+    for (; *s && *s != 'e'; s++) if (*s >= '0' && *s <= '9') digits[n++] = *s;
+    *exp10 = atoi(s + 1);
+    while (n > 1 && digits[n - 1] == '0') n--;
+    digits[n] = 0;
+    return n;
+}
+/* Python's repr(float), or Java's Double.toString (shortest digits, as JDK 19+ prints them) */
+static inline void poly_fmt_double(char *buf, double v, int single, int java) {
+    if (v != v) { strcpy(buf, java ? "NaN" : "nan"); return; }
+    char *out = buf;
+    if (signbit(v)) { *out++ = '-'; v = -v; }
+    if (isinf(v)) { strcpy(out, java ? "Infinity" : "inf"); return; }
+    char digits[24];
+    int exp10;
+    int n = poly_float_digits(v, single, digits, &exp10);
+    int fixed = java ? (v == 0 || (v >= 1e-3 && v < 1e7)) : (exp10 >= -4 && exp10 < 16);
+    if (fixed && exp10 < 0) {
+        *out++ = '0';
+        *out++ = '.';
+        for (int k = -1; k > exp10; k--) *out++ = '0';
+        strcpy(out, digits);
+    } else if (fixed) {
+        for (int k = 0; k <= exp10; k++) *out++ = k < n ? digits[k] : '0';
+        *out++ = '.';
+        strcpy(out, n > exp10 + 1 ? digits + exp10 + 1 : "0");
+    } else {
+        *out++ = digits[0];
+        if (n > 1 || java) {
+            *out++ = '.';
+            strcpy(out, n > 1 ? digits + 1 : "0");
+            out += strlen(out);
+        }
+        sprintf(out, java ? "E%d" : "e%+03d", exp10);
+    }
+}
+static inline void poly_fmt_float(char *buf, double v) { poly_fmt_double(buf, v, 0, 0); }
+static inline void poly_fmt_float32(char *buf, float v) { poly_fmt_double(buf, v, 1, 0); }
+static inline void poly_print_float(double v) { char buf[32]; poly_fmt_float(buf, v); fputs(buf, stdout); }
+static inline void poly_print_float32(float v) { char buf[32]; poly_fmt_float32(buf, v); fputs(buf, stdout); }
+static inline void poly_print_jfloat(double v) { char buf[32]; poly_fmt_double(buf, v, 0, 1); fputs(buf, stdout); }
+static inline void poly_print_jfloat32(float v) { char buf[32]; poly_fmt_double(buf, v, 1, 1); fputs(buf, stdout); }
+static inline void poly_print_str_repr(const char *s) {
+    char quote = (strchr(s, '\'') && !strchr(s, '"')) ? '"' : '\'';
+    putchar(quote);
+    for (; *s; s++) { if (*s == quote || *s == '\\') putchar('\\'); putchar(*s); }
+    putchar(quote);
+}
+static inline void poly_print_json_str(const char *s) {
+    putchar('"');
+    for (; *s; s++) {
+        if (*s == '"' || *s == '\\') { putchar('\\'); putchar(*s); }
+        else if (*s == '\n') fputs("\\n", stdout);
+        else if (*s == '\t') fputs("\\t", stdout);
+        else if ((unsigned char)*s < 0x20) printf("\\u%04x", *s);
+        else putchar(*s);
+    }
+    putchar('"');
+}
+static inline void poly_print_ilist(const poly_ilist *l) {
+    putchar('[');
+    for (long long k = 0; k < l->len; k++) printf(k ? ", %lld" : "%lld", l->data[k]);
+    putchar(']');
+}
+static inline void poly_print_flist(const poly_flist *l) {
+    putchar('[');
+    for (long long k = 0; k < l->len; k++) { if (k) fputs(", ", stdout); poly_print_float(l->data[k]); }
+    putchar(']');
+}
+static inline void poly_print_slist(const poly_slist *l, int json) {
+    putchar('[');
+    for (long long k = 0; k < l->len; k++) {
+        if (k) fputs(", ", stdout);
+        if (json) poly_print_json_str(l->data[k]); else poly_print_str_repr(l->data[k]);
+    }
+    putchar(']');
+}
+/* JSON has no NaN or Infinity; they reach the state as null. Finite floats keep
+   their decimal point or exponent so they come back as floats, not ints */
+static inline void poly_print_json_float(double v) {
+    if (!isfinite(v)) fputs("null", stdout);
+    else poly_print_float(v);
+}
+static inline void poly_print_json_float32(float v) {
+    if (!isfinite(v)) fputs("null", stdout);
+    else poly_print_float32(v);
+}
+/* Python's json (but not the state loaders) also reads NaN and Infinity */
+static inline void poly_print_json_float_nan(double v) {
+    if (isnan(v)) fputs("NaN", stdout);
+    else if (isinf(v)) fputs(v > 0 ? "Infinity" : "-Infinity", stdout);
+    else poly_print_float(v);
+}
+static inline void poly_print_json_float32_nan(float v) {
+    if (!isfinite(v)) poly_print_json_float_nan(v);
+    else poly_print_float32(v);
+}
+'''
+
+C_SCALAR_TYPES = {'int': 'long long', 'long': 'long long', 'float': 'double', 'bool': 'int', 'str': 'const char *'}
+INTEGER_TYPES = ('int', 'long')
+C_LIST_TYPES = {'int[]': 'poly_ilist', 'float[]': 'poly_flist', 'str[]': 'poly_slist'}
+C_DECL_TYPES = {'int': 'int', 'long': 'int', 'short': 'int', 'unsigned': 'int',
+                'float': 'float', 'double': 'float'}
+
+
+def c_string_literal(value: str) -> str:
+    """Quote a Python string as a C string literal"""
+    escapes = {'\\': '\\\\', '"': '\\"', '\n': '\\n', '\t': '\\t', '\r': '\\r', '?': '\\?'}
+    parts = []
+    for ch in value:
+        if ch in escapes:
+            parts.append(escapes[ch])
+        elif ord(ch) < 0x20:
+            parts.append(f"\\{ord(ch):03o}")
+        else:
+            parts.append(ch)
+    return '"' + ''.join(parts) + '"'
+
+
+def c_literal(value: Any, type_: str) -> str:
+    if type_ == 'bool':
+        return '1' if value else '0'
+    if type_ in INTEGER_TYPES:
+        value = int(value)
+        if not -2 ** 63 <= value < 2 ** 63:
+            raise TranspileError(f"integer {value} does not fit in 64 bits")
+        if value == -2 ** 63:
+            return "LLONG_MIN"
+        return f"{value}LL" if abs(value) > 2 ** 31 - 1 else str(value)
+    if type_ == 'float':
+        text = repr(float(value))
+        if text in ('inf', '-inf', 'nan'):
+            raise TranspileError("non-finite float constants are not supported")
+        return text
+    return c_string_literal(value)
+
+
+def type_of_value(value: Any) -> Optional[str]:
+    """IR type of a shared-state value, or None if it cannot be represented"""
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int' if -2 ** 63 <= value < 2 ** 63 else None
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, str):
+        return 'str'
+    if isinstance(value, list):
+        if not value:
+            return '?[]'
+        element_types = {type_of_value(element) for element in value}
+        if element_types <= {'int', 'bool'}:
+            return 'int[]'
+        if element_types <= {'int', 'float'}:
+            return 'float[]'
+        if element_types == {'str'}:
+            return 'str[]'
+    return None
+
+
+def blank_c_literals(code: str) -> str:
+    """Replace C comments and string/char literals with spaces, keeping offsets"""
+    pattern = r'//[^\n]*|/\*.*?\*/|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\''
+    return re.sub(pattern, lambda m: re.sub(r'[^\n]', ' ', m.group()), code, flags=re.DOTALL)
+
+
+def declaration_scope(clean: str, position: int, in_header: bool) -> Tuple[int, int]:
+    """Offsets of the region where a declaration at position is visible.
+
+    clean must already have literals blanked. Declarations in a for header
+    are scoped to the loop body; everything else to the enclosing braces.
+    """
+    if in_header:
+        depth, k = 0, clean.index('(', clean.rindex('for', 0, position))
+        for k in range(k, len(clean)):
+            depth += {'(': 1, ')': -1}.get(clean[k], 0)
+            if depth == 0:
+                break
+        rest = clean[k + 1:]
+        if rest.lstrip().startswith('{'):
+            start = k + 1 + (len(rest) - len(rest.lstrip()))
+        else:
+            end = clean.find(';', k)
+            return position, len(clean) if end < 0 else end + 1
+    else:
+        depth, start = 0, -1
+        for k in range(position - 1, -1, -1):
+            if clean[k] == '}':
+                depth += 1
+            elif clean[k] == '{':
+                if depth == 0:
+                    start = k
+                    break
+                depth -= 1
+        if start < 0:
+            return position, len(clean)
+    depth = 0
+    for k in range(start, len(clean)):
+        depth += {'{': 1, '}': -1}.get(clean[k], 0)
+        if depth == 0:
+            return position, k + 1
+    return position, len(clean)
+
+
+def find_c_declarations(code: str) -> List[Dict[str, Any]]:
+    """Find every variable declaration in C code with its IR type, position and scope"""
+    clean = blank_c_literals(code)
+    declarations = []
+    pattern = (r'\b(?:const\s+)?(int|long|short|unsigned|float|double|char)\b'
+               r'((?:\s+(?:int|long))*)\s*(\*?)\s*([A-Za-z_]\w*)\s*(\[[^\]]*\])?\s*(?=[=;,)])')
+    for match in re.finditer(pattern, clean):
+        base, pointer, name, array = match.group(1), match.group(3), match.group(4), match.group(5)
+        if base == 'char':
+            if pointer and array:
+                type_ = 'str[]'
+            elif pointer or array:
+                type_ = 'str'
+            else:
+                type_ = 'char'
+        else:
+            type_ = C_DECL_TYPES[base] + ('[]' if array else '')
+            if pointer:
+                type_ = 'pointer'
+        before = clean[:match.start()]
+        depth = before.count('{') - before.count('}')
+        in_header = re.search(r'\bfor\s*\([^;)]*$', before) is not None
+        declarations.append({
+            'name': name,
+            'type': type_,
+            'top_level': depth == 0 and not in_header,
+            'array': bool(array),
+            'single': base == 'float' and not pointer,
+            'scope': declaration_scope(clean, match.start(), in_header),
+        })
+    return declarations
+
+
+def scan_c_declarations(code: str) -> Dict[str, Dict[str, Any]]:
+    """Map each variable declared in outer C code to its first declaration"""
+    declarations = {}
+    for declaration in find_c_declarations(code):
+        declarations.setdefault(declaration['name'], declaration)
+    return declarations
+
+
+def enclosing_brace(clean: str, position: int) -> int:
+    """Offset of the innermost unmatched '{' before position, or -1 at top level"""
+    depth = 0
+    for k in range(position - 1, -1, -1):
+        if clean[k] == '}':
+            depth += 1
+        elif clean[k] == '{':
+            if depth == 0:
+                return k
+            depth -= 1
+    return -1
+
+
+def always_runs_before(clean: str, earlier: Dict, later: Dict) -> bool:
+    """Whether nested site `earlier` has run whenever site `later` runs.
+
+    clean is the outer code with literals and sites blanked. It holds when
+    `earlier` is a statement of its own in a compound statement that also
+    contains `later`, after it.
+    """
+    if re.search(r'\b(goto|switch)\b', clean):
+        return False
+    start = enclosing_brace(clean, earlier['start'])
+    end = len(clean)
+    if start >= 0:
+        _, end = declaration_scope(clean, start + 1, False)
+    if not earlier['end'] <= later['start'] < end:
+        return False
+    preceding = clean[:earlier['start']].rstrip()
+    return not preceding or preceding[-1] in ';{}'
+
+
+class Symbol:
+    """A variable visible to nested code: declared by the outer C code, taken
+    from the shared state, or created by a nested block"""
+
+    def __init__(self, name: str, type_: str, origin: str, value: Any = None, export: bool = False):
+        self.name = name
+        self.type = type_
+        self.origin = origin
+        self.value = value
+        self.export = export
+        self.modified = False
+        self.single = False  # C 'float' rather than 'double'
+        self.java_int = False  # Java 'int' local, held as int32_t
+
+    @property
+    def c_array(self) -> bool:
+        return self.origin == 'outer' and self.type.endswith('[]')
+
+
+class CBackend:
+    """Emit C statements for IR, tracking symbol types across nested sites"""
+
+    def __init__(self, outer_declarations: Dict[str, Dict[str, Any]] = None,
+                 state: Dict[str, Any] = None, assume_int: bool = False):
+        self.symbols: Dict[str, Symbol] = {}
+        for name, info in (outer_declarations or {}).items():
+            self.symbols[name] = Symbol(name, info['type'], 'outer')
+            self.symbols[name].single = info.get('single', False)
+        self.state = state or {}
+        self.assume_int = assume_int
+        self.temp_counter = 0
+        # Java semantics for the block being emitted, and the variables it created
+        # that are certainly assigned at this point of it
+        self.java = False
+        self.assigned = set()
+
+    def site(self, statements: List[Node], lang: str, assigned: set) -> Tuple[List[str], set]:
+        """C statements for one nested block, given the variables certainly assigned
+        before it runs; also returns the shared ones certainly assigned after it"""
+        self.java, self.assigned = lang == 'java', set(assigned)
+        lines = self.statements(statements, '    ')
+        return lines, {name for name in self.assigned if self.symbols[name].export}
+
+    # Symbols
+    def lookup(self, name: str) -> Symbol:
+        if name in self.symbols:
+            symbol = self.symbols[name]
+            # The interpreted path raises NameError; falling back lets it
+            if symbol.origin == 'local' and name not in self.assigned:
+                raise TranspileError(f"'{name}' may be read before it is assigned")
+            return symbol
+        if name in self.state and not name.startswith('_'):
+            type_ = type_of_value(self.state[name])
+            if type_ is None:
+                raise TranspileError(f"state variable '{name}' has an unsupported type")
+            symbol = self.symbols[name] = Symbol(name, type_, 'state', self.state[name], export=True)
+            return symbol
+        if self.assume_int:
+            symbol = self.symbols[name] = Symbol(name, 'int', 'outer')
+            return symbol
+        raise TranspileError(f"unknown variable '{name}'")
+
+    def declare(self, name: str, type_: str, export: bool) -> Symbol:
+        symbol = self.symbols[name] = Symbol(name, type_, 'local', export=export)
+        symbol.java_int = self.java and type_ == 'int'
+        return symbol
+
+    def resolve_list(self, symbol: Symbol, element_type: str = 'int'):
+        """Fix the element type of an empty list on its first real use"""
+        if symbol.type == '?[]':
+            symbol.type = element_type + '[]'
+
+    def temp(self) -> str:
+        self.temp_counter += 1
+        return f"_poly_t{self.temp_counter}"
+
+    # Expressions
+    def expr(self, node: Node) -> Tuple[str, str]:
+        """Return (C expression, IR type) for an IR expression"""
+        if isinstance(node, Const):
+            return c_literal(node.value, node.type), node.type
+        if isinstance(node, Name):
+            symbol = self.lookup(node.name)
+            if symbol.type in ('char', 'pointer'):
+                raise TranspileError(f"variable '{node.name}' has an unsupported C type")
+            if self.java and symbol.type == 'int' and not symbol.java_int:
+                # Java reads shared integers as 'int'
+                return f"poly_i32({node.name})", 'int'
+            return node.name, symbol.type
+        if isinstance(node, Index):
+            return self.index(node)
+        if isinstance(node, Length):
+            code, type_ = self.expr(node.value)
+            if type_ == 'str':
+                return f"(long long)strlen({code})", 'int'
+            if not type_.endswith('[]'):
+                raise TranspileError("len() of a non-sequence")
+            if isinstance(node.value, Name) and self.lookup(node.value.name).c_array:
+                return f"(long long)(sizeof({code}) / sizeof({code}[0]))", 'int'
+            return f"{code}.len", 'int'
+        if isinstance(node, BinOp):
+            return self.binop(node)
+        if isinstance(node, UnaryOp):
+            if node.op == 'not':
+                return f"(!{self.cond(node.operand)})", 'bool'
+            code, type_ = self.numeric(node.operand)
+            if type_ == 'float':
+                return f"(-{code})", type_
+            if not self.java:
+                return f"poly_neg({code})", type_
+            if type_ == 'long':
+                return f"poly_lwrap(0ULL - (unsigned long long)({code}))", type_
+            return f"poly_i32(-(long long)({code}))", type_
+        if isinstance(node, Compare):
+            return self.compare(node)
+        if isinstance(node, BoolOp):
+            joiner = ' && ' if node.op == 'and' else ' || '
+            return '(' + joiner.join(self.cond(value) for value in node.values) + ')', 'bool'
+        if isinstance(node, Call):
+            return self.call(node)
+        if isinstance(node, Ternary):
+            cond = self.cond(node.cond)
+            then, then_type = self.expr(node.then)
+            orelse, else_type = self.expr(node.orelse)
+            type_ = self.unify(then_type, else_type)
+            return f"({cond} ? {then} : {orelse})", type_
+        if isinstance(node, (FString, ListLit)):
+            raise TranspileError(f"{type(node).__name__} is only supported in print/assignment")
+        raise TranspileError(f"unsupported expression {node!r}")
+
+    def numeric(self, node: Node) -> Tuple[str, str]:
+        code, type_ = self.expr(node)
+        if type_ == 'bool':
+            return code, 'int'
+        if type_ not in ('int', 'long', 'float'):
+            raise TranspileError(f"expected a number, got {type_}")
+        return code, type_
+
+    @staticmethod
+    def unify(left: str, right: str) -> str:
+        if left == right:
+            return left
+        if {left, right} <= {'int', 'long', 'float', 'bool'}:
+            for type_ in ('float', 'long'):
+                if type_ in (left, right):
+                    return type_
+            return 'int'
+        raise TranspileError(f"incompatible types {left} and {right}")
+
+    def index(self, node: Index, read: bool = True) -> Tuple[str, str]:
+        if not isinstance(node.base, Name):
+            raise TranspileError("only variables can be indexed")
+        symbol = self.lookup(node.base.name)
+        self.resolve_list(symbol)
+        if not symbol.type.endswith('[]'):
+            raise TranspileError(f"'{symbol.name}' is not indexable")
+        index, index_type = self.numeric(node.index)
+        if index_type != 'int':
+            raise TranspileError("list indices must be integers")
+        element_type = symbol.type[:-2]
+        checked = 'poly_jindex' if self.java else 'poly_index'
+        if symbol.c_array:
+            length = f"(long long)(sizeof({symbol.name}) / sizeof({symbol.name}[0]))"
+            element = f"{symbol.name}[{checked}({index}, {length})]"
+        else:
+            element = f"{symbol.name}.data[{checked}({index}, {symbol.name}.len)]"
+        if read and self.java and element_type == 'int':
+            return f"poly_i32({element})", element_type
+        return element, element_type
+
+    # Python integers are unbounded: leaving 64 bits ends the native program
+    PYTHON_INT_OPS = {'+': 'poly_add', '-': 'poly_sub', '*': 'poly_mul',
+                      '//': 'poly_floordiv', '%': 'poly_mod', '**': 'poly_ipow'}
+
+    def binop(self, node: BinOp) -> Tuple[str, str]:
+        if node.op == '+' and self.is_str(node):
+            return '', 'str+'
+        left, left_type = self.numeric(node.left)
+        right, right_type = self.numeric(node.right)
+        type_ = self.unify(left_type, right_type)
+        if node.op == '/':
+            return f"poly_div({left}, {right})", 'float'
+        if type_ == 'float':
+            if node.op in ('+', '-', '*'):
+                return f"({left} {node.op} {right})", type_
+            if node.op == 'tdiv':
+                return f"((double)({left}) / ({right}))", type_
+            if node.op == '//':
+                return f"poly_ffloordiv({left}, {right})", type_
+        elif not self.java and node.op in self.PYTHON_INT_OPS:
+            return f"{self.PYTHON_INT_OPS[node.op]}({left}, {right})", type_
+        elif self.java and node.op in ('+', '-', '*', 'tdiv', 'tmod'):
+            if node.op in ('+', '-', '*'):
+                if type_ == 'long':
+                    return (f"poly_lwrap((unsigned long long)({left}) {node.op} "
+                            f"(unsigned long long)({right}))", type_)
+                return f"poly_i32((long long)({left}) {node.op} ({right}))", type_
+            code = f"poly_j{node.op[1:]}({left}, {right})"
+            return (code if type_ == 'long' else f"poly_i32({code})"), type_
+        raise TranspileError(f"operator {node.op} is not supported for {type_}")
+
+    def is_str(self, node: Node) -> bool:
+        """Whether an expression evaluates to a string (or string concatenation)"""
+        if isinstance(node, BinOp) and node.op == '+':
+            return self.is_str(node.left) or self.is_str(node.right)
+        if isinstance(node, FString):
+            return True
+        if isinstance(node, (BinOp, Compare, BoolOp, UnaryOp, Length, Call, ListLit)):
+            return False
+        return self.expr(node)[1] == 'str'
+
+    def compare(self, node: Compare) -> Tuple[str, str]:
+        left, left_type = self.expr(node.left)
+        right, right_type = self.expr(node.right)
+        if left_type == 'str' and right_type == 'str' and node.op in ('==', '!='):
+            return f"(strcmp({left}, {right}) {node.op} 0)", 'bool'
+        self.unify(left_type, right_type)
+        if left_type not in ('int', 'long', 'float', 'bool'):
+            raise TranspileError(f"cannot compare values of type {left_type}")
+        return f"({left} {node.op} {right})", 'bool'
+
+    def call(self, node: Call) -> Tuple[str, str]:
+        args = [self.numeric(arg) for arg in node.args]
+        if node.func in ('int', 'long', 'float') and len(args) == 1:
+            code, type_ = args[0]
+            if node.func == 'float':
+                return f"((double)({code}))", 'float'
+            if not self.java:
+                return (f"poly_float_to_int({code})" if type_ == 'float' else code), 'int'
+            if type_ == 'float':
+                return f"poly_d2{node.func[0]}({code})", node.func
+            return (f"poly_i32({code})" if node.func == 'int' else f"((long long)({code}))"), node.func
+        if node.func == 'abs' and len(args) == 1:
+            code, type_ = args[0]
+            if type_ == 'float':
+                return f"({code} < 0 ? -({code}) : ({code}))", type_
+            if not self.java:
+                return f"poly_abs({code})", type_
+            if type_ == 'long':
+                return f"({code} < 0 ? poly_lwrap(0ULL - (unsigned long long)({code})) : ({code}))", type_
+            return f"poly_i32({code} < 0 ? -(long long)({code}) : ({code}))", type_
+        if node.func in ('min', 'max') and len(args) == 2:
+            (left, left_type), (right, right_type) = args
+            op = '<' if node.func == 'min' else '>'
+            return f"({left} {op} {right} ? ({left}) : ({right}))", self.unify(left_type, right_type)
+        raise TranspileError(f"unsupported call to {node.func}()")
+
+    def cond(self, node: Node) -> str:
+        """C truth value of an expression using Python/Java truthiness"""
+        code, type_ = self.expr(node)
+        if type_ in ('int', 'long', 'float', 'bool'):
+            return code
+        if type_ == 'str':
+            return f"({code}[0] != '\\0')"
+        if type_.endswith('[]') and isinstance(node, Name) and not self.lookup(node.name).c_array:
+            return f"({code}.len != 0)"
+        raise TranspileError(f"cannot use {type_} as a condition")
+
+    # Printing
+    def print_value(self, node: Node, style: str) -> List[str]:
+        if isinstance(node, Const) and node.type == 'str':
+            return [f"fputs({c_string_literal(node.value)}, stdout);"] if node.value else []
+        if isinstance(node, FString):
+            lines = []
+            for part in node.parts:
+                if isinstance(part, str):
+                    lines.extend(self.print_value(Const(part, 'str'), style))
+                else:
+                    lines.extend(self.print_formatted(part[0], part[1], style))
+            return lines
+        if isinstance(node, BinOp) and node.op == '+' and self.is_str(node):
+            return self.print_value(node.left, style) + self.print_value(node.right, style)
+        code, type_ = self.expr(node)
+        if type_ in INTEGER_TYPES:
+            return [f'printf("%lld", (long long)({code}));']
+        if type_ == 'float':
+            printer = 'poly_print_float' if style == 'py' else 'poly_print_jfloat'
+            if self.is_single(node):
+                return [f"{printer}32({code});"]
+            return [f"{printer}({code});"]
+        if type_ == 'bool':
+            true, false = ('True', 'False') if style == 'py' else ('true', 'false')
+            return [f'fputs(({code}) ? "{true}" : "{false}", stdout);']
+        if type_ == 'str':
+            return [f"fputs({code}, stdout);"]
+        if (type_.endswith('[]') and style == 'py' and isinstance(node, Name)
+                and not self.lookup(node.name).c_array):
+            symbol = self.lookup(node.name)
+            self.resolve_list(symbol)
+            kind = C_LIST_TYPES[symbol.type][5]
+            if kind == 's':
+                return [f"poly_print_slist(&{code}, 0);"]
+            return [f"poly_print_{kind}list(&{code});"]
+        raise TranspileError(f"cannot print a value of type {type_}")
+
+    def is_single(self, node: Node) -> bool:
+        """Whether an expression reads a C 'float' directly (printed with float precision)"""
+        if isinstance(node, Index):
+            node = node.base
+        return isinstance(node, Name) and self.lookup(node.name).single
+
+    def print_formatted(self, node: Node, spec: str, style: str) -> List[str]:
+        if not spec:
+            return self.print_value(node, style)
+        match = re.fullmatch(r'(\d*)(?:\.(\d+))?([dfe]?)', spec)
+        if not match or (match.group(2) and not match.group(3)):
+            raise TranspileError(f"unsupported format spec {spec!r}")
+        width, precision, conversion = match.groups()
+        code, type_ = self.numeric(node)
+        conversion = conversion or ('d' if type_ in INTEGER_TYPES else '')
+        if not conversion or (conversion == 'd' and type_ not in INTEGER_TYPES):
+            raise TranspileError(f"unsupported format spec {spec!r} for {type_}")
+        fmt = '%' + width + (f".{precision}" if precision else '')
+        if conversion == 'd':
+            return [f'printf("{fmt}lld", (long long)({code}));']
+        return [f'printf("{fmt}{conversion}", (double)({code}));']
+
+    # Statements
+    def statements(self, nodes: List[Node], indent: str = '') -> List[str]:
+        lines = []
+        for node in nodes:
+            lines.extend(indent + line for line in self.statement(node))
+        return lines
+
+    def statement(self, node: Node) -> List[str]:
+        if isinstance(node, Print):
+            lines = []
+            for i, arg in enumerate(node.args):
+                if i and node.sep:
+                    lines.append(f"fputs({c_string_literal(node.sep)}, stdout);")
+                lines.extend(self.print_value(arg, node.style))
+            if node.end:
+                lines.append(f"fputs({c_string_literal(node.end)}, stdout);")
+            return lines
+        if isinstance(node, Assign):
+            return self.assign(node)
+        if isinstance(node, Append):
+            symbol = self.lookup(node.target.name)
+            if not symbol.type.endswith('[]') or symbol.c_array:
+                raise TranspileError(f"cannot append to '{symbol.name}'")
+            code, type_ = self.expr(node.value)
+            self.resolve_list(symbol, 'int' if type_ == 'bool' else type_)
+            self.check_assignable(symbol.type[:-2], type_)
+            symbol.modified = True
+            return [f"{C_LIST_TYPES[symbol.type]}_push(&{symbol.name}, {code});"]
+        if isinstance(node, If):
+            before = set(self.assigned)
+            lines = [f"if ({self.cond(node.cond)}) {{"] + self.statements(node.body, '    ')
+            after_body, self.assigned = self.assigned, before
+            if node.orelse:
+                lines += ["} else {"] + self.statements(node.orelse, '    ')
+            # Certainly assigned only if both branches assign it
+            self.assigned &= after_body
+            return lines + ["}"]
+        if isinstance(node, ForRange):
+            return self.for_range(node)
+        raise TranspileError(f"unsupported statement {node!r}")
+
+    @staticmethod
+    def check_assignable(target_type: str, value_type: str):
+        widening = (('float', 'int'), ('float', 'long'), ('long', 'int'), ('int', 'bool'))
+        if target_type == value_type or (target_type, value_type) in widening:
+            return
+        raise TranspileError(f"cannot assign {value_type} to {target_type}")
+
+    def assign(self, node: Assign) -> List[str]:
+        if isinstance(node.target, Index):
+            target, target_type = self.index(node.target, read=False)
+            code, type_ = self.expr(node.value)
+            self.check_assignable(target_type, type_)
+            self.lookup(node.target.base.name).modified = True
+            return [f"{target} = {code};"]
+        name = node.target.name
+        symbol = self.symbols.get(name) or (self.lookup(name) if name in self.state else None)
+        if isinstance(node.value, ListLit):
+            return self.assign_list(name, symbol, node)
+        code, type_ = self.expr(node.value)
+        if type_ == 'str+':
+            raise TranspileError("string concatenation is only supported inside print")
+        if symbol is None:
+            symbol = self.declare(name, node.declared or type_, node.export)
+        elif symbol.type.endswith('[]') or symbol.type in ('char', 'pointer'):
+            raise TranspileError(f"cannot assign to '{name}'")
+        elif symbol.java_int and not self.java:
+            raise TranspileError(f"'{name}' is a Java int and cannot hold a Python value")
+        self.check_assignable(node.declared or symbol.type, type_)
+        self.check_assignable(symbol.type, node.declared or type_)
+        return [f"{name} = {code};"] + self.assigned_to(symbol)
+
+    def assigned_to(self, symbol: Symbol) -> List[str]:
+        """Record an assignment; shared variables created by nested code flag it for the capture"""
+        symbol.modified = True
+        self.assigned.add(symbol.name)
+        if symbol.origin == 'local' and symbol.export:
+            return [f"_poly_set_{symbol.name} = 1;"]
+        return []
+
+    def assign_list(self, name: str, symbol: Optional[Symbol], node: Assign) -> List[str]:
+        values = [self.expr(element) for element in node.value.elements]
+        element_type = 'int'
+        for _, type_ in values:
+            element_type = self.unify(element_type, 'int' if type_ == 'bool' else type_) \
+                if type_ != 'str' else 'str'
+        if symbol is None:
+            if not values:
+                raise TranspileError(f"cannot infer the element type of empty list '{name}'")
+            symbol = self.declare(name, element_type + '[]', node.export)
+        elif symbol.c_array or not symbol.type.endswith('[]'):
+            raise TranspileError(f"cannot assign a list to '{name}'")
+        self.resolve_list(symbol, element_type)
+        list_type = C_LIST_TYPES[symbol.type]
+        lines = [f"{name}.len = 0;"]
+        for code, type_ in values:
+            self.check_assignable(symbol.type[:-2], type_)
+            lines.append(f"{list_type}_push(&{name}, {code});")
+        return lines + self.assigned_to(symbol)
+
+    def for_range(self, node: ForRange) -> List[str]:
+        step = node.step
+        if isinstance(step, UnaryOp) and step.op == '-' and isinstance(step.operand, Const):
+            step = Const(-step.operand.value, 'int')
+        if not isinstance(step, Const) or step.type != 'int' or step.value == 0:
+            raise TranspileError("range() step must be a non-zero integer constant")
+        op = '<' if step.value > 0 else '>'
+        start, start_type = self.numeric(node.start)
+        before = set(self.assigned)
+        if self.java:
+            return self.java_for(node, start, start_type, op, step.value, before)
+        symbol = self.symbols.get(node.var) or self.declare(node.var, 'int', False)
+        if symbol.type != 'int' or symbol.java_int:
+            raise TranspileError(f"loop variable '{node.var}' must be a Python int")
+        stop, stop_type = self.numeric(node.stop)
+        if (start_type, stop_type) != ('int', 'int'):
+            raise TranspileError("range() bounds must be integers")
+        bound = self.temp()
+        self.assigned_to(symbol)
+        lines = ([f"{{ long long {bound} = {stop};",
+                  f"for ({node.var} = {start}; {node.var} {op} {bound}; {node.var} += {step.value}) {{"]
+                 + self.statements(node.body, '    ') + ["} }"])
+        # The loop may not run at all
+        self.assigned = before
+        return lines
+
+    def java_for(self, node: ForRange, start: str, start_type: str, op: str, step: int, before: set) -> List[str]:
+        """A Java counting loop: its int variable is scoped to the loop and its condition re-evaluated"""
+        if start_type != 'int':
+            raise TranspileError("for loop variable must be initialized with an int")
+        outer = self.symbols.get(node.var)
+        symbol = self.symbols[node.var] = Symbol(node.var, 'int', 'loop')
+        symbol.java_int = True
+        try:
+            stop, stop_type = self.numeric(node.stop)
+            if stop_type != 'int':
+                raise TranspileError("for loop bound must be an int")
+            return ([f"for (int32_t {node.var} = {start}; {node.var} {op} {stop}; "
+                     f"{node.var} = poly_i32((long long){node.var} + {step})) {{"]
+                    + self.statements(node.body, '    ') + ["}"])
+        finally:
+            if outer is None:
+                del self.symbols[node.var]
+            else:
+                self.symbols[node.var] = outer
+            self.assigned = before
+
+    # Declarations and state capture
+    def prelude(self) -> List[str]:
+        """Declarations for state variables and variables created by nested code"""
+        lines = []
+        for symbol in self.symbols.values():
+            if symbol.origin not in ('state', 'local'):
+                continue
+            self.resolve_list(symbol)
+            if symbol.type in C_LIST_TYPES:
+                list_type = C_LIST_TYPES[symbol.type]
+                values = symbol.value or []
+                if values:
+                    element_type = symbol.type[:-2]
+                    literals = ", ".join(c_literal(v, element_type) for v in values)
+                    c_element = C_SCALAR_TYPES[element_type]
+                    lines.append(f"static {c_element} {symbol.name}_init[] = {{{literals}}};")
+                    lines.append(f"{list_type} {symbol.name} = {list_type}_from({symbol.name}_init, {len(values)});")
+                else:
+                    lines.append(f"{list_type} {symbol.name} = {{0}};")
+            else:
+                value = symbol.value if symbol.origin == 'state' else \
+                    {'int': 0, 'long': 0, 'float': 0.0, 'bool': False, 'str': ''}[symbol.type]
+                c_type = 'int32_t' if symbol.java_int else C_SCALAR_TYPES[symbol.type]
+                lines.append(f"{c_type} {symbol.name} = {c_literal(value, symbol.type)};")
+            if symbol.origin == 'local' and symbol.export:
+                lines.append(f"int _poly_set_{symbol.name} = 0;")
+        return lines
+
+    def capture(self, outer_declarations: Dict[str, Dict[str, Any]]) -> List[str]:
+        """Print a JSON state line with every variable that should flow back"""
+        entries = []
+        for name, info in outer_declarations.items():
+            if info['top_level'] and info['type'] not in ('char', 'pointer'):
+                symbol = self.symbols.get(name) or Symbol(name, info['type'], 'outer')
+                symbol.single = info.get('single', False)
+                entries.append(symbol)
+        for symbol in self.symbols.values():
+            if symbol.origin != 'outer' and symbol.export and (symbol.modified or symbol.origin == 'local'):
+                entries.append(symbol)
+        if not entries:
+            return []
+        lines = ['fputs("\\n{", stdout);', 'const char *_poly_sep = "";']
+        for symbol in entries:
+            entry = (['fputs(_poly_sep, stdout);',
+                      f'fputs({c_string_literal(json.dumps(symbol.name) + ": ")}, stdout);']
+                     + self.json_value(symbol) + ['_poly_sep = ", ";'])
+            if symbol.origin == 'local':
+                # Variables nested code creates flow back only once it has assigned them
+                entry = [f"if (_poly_set_{symbol.name}) {{ " + " ".join(entry) + " }"]
+            lines.extend(entry)
+        lines.append('fputs("}\\n", stdout);')
+        return lines
+
+    def json_value(self, symbol: Symbol, allow_nan: bool = False) -> List[str]:
+        name, type_ = symbol.name, symbol.type
+        suffix = '_nan' if allow_nan else ''
+        json_float = ('poly_print_json_float32' if symbol.single else 'poly_print_json_float') + suffix
+        if type_ == 'int':
+            return [f'printf("%lld", (long long){name});']
+        if type_ == 'float':
+            return [f"{json_float}({name});"]
+        if type_ == 'bool':
+            return [f'fputs({name} ? "true" : "false", stdout);']
+        if type_ == 'str':
+            return [f"poly_print_json_str({name});"]
+        element = type_[:-2]
+        if symbol.c_array:
+            item = {'int': f'printf("%lld", (long long){name}[_k]);',
+                    'float': f"{json_float}({name}[_k]);",
+                    'str': f"poly_print_json_str({name}[_k]);"}[element]
+            return ['putchar(\'[\');',
+                    f"for (long long _k = 0; _k < (long long)(sizeof({name}) / sizeof({name}[0])); _k++) "
+                    f"{{ if (_k) fputs(\", \", stdout); {item} }}",
+                    'putchar(\']\');']
+        if element == 'int':
+            return [f"poly_print_ilist(&{name});"]
+        if element == 'float':
+            return ['putchar(\'[\');',
+                    f"for (long long _k = 0; _k < {name}.len; _k++) "
+                    f"{{ if (_k) fputs(\", \", stdout); poly_print_json_float{suffix}({name}.data[_k]); }}",
+                    'putchar(\']\');']
+        return [f"poly_print_slist(&{name}, 1);"]
+
+
+def compile_nested_c_program(outer_code: str, nested_blocks: List[Dict], state: Dict[str, Any]) -> str:
+    """Compile an outer C block and its nested blocks into one native C program.
+
+    nested_blocks carry 'lang', 'code', 'start' and 'end' offsets into
+    outer_code, as produced by SharedStateOrchestrator.parse_all_blocks.
+    Raises TranspileError if anything falls outside the supported subset.
+    """
+    if re.search(r'#\s*include|\bmain\s*\(', outer_code):
+        raise TranspileError("outer C code must be statements only")
+
+    # Offsets point into the outer code; blank the sites before scanning it
+    skeleton = outer_code
+    for block in nested_blocks:
+        skeleton = skeleton[:block['start']] + ' ' * (block['end'] - block['start']) + skeleton[block['end']:]
+    outer_declarations = scan_c_declarations(skeleton)
+
+    backend = CBackend(outer_declarations, state)
+    clean = blank_c_literals(skeleton)
+    ordered = sorted(nested_blocks, key=lambda b: b['start'])
+    sites, assigned_by = [], []
+    for k, block in enumerate(ordered):
+        # Variables a block reads must have been assigned by a block that has always run first
+        assigned = set().union(*(assigned_by[j] for j in range(k) if always_runs_before(clean, ordered[j], block)))
+        body, assigned = backend.site(parse_nested_block(block['code'], block['lang']), block['lang'], assigned)
+        assigned_by.append(assigned)
+        sites.append((block['start'], block['end'],
+                      f"{{ /* nested {block['lang']} */\n" + "\n".join(body) + "\n}"))
+
+    program = outer_code
+    for start, end, code in reversed(sites):
+        program = program[:start] + code + program[end:]
+
+    prelude = backend.prelude()
+    capture = backend.capture(outer_declarations)
+    return (C_RUNTIME + "\nint main() {\n"
+            + "".join(f"    {line}\n" for line in prelude)
+            + program + "\n"
+            + "".join(f"    {line}\n" for line in capture)
+            + "    return 0;\n}\n")
+
+
+def transpile_statements(code: str, lang: str, state: Dict[str, Any] = None, assume_int: bool = True) -> str:
+    """Transpile a standalone nested block to C statements (no program wrapper)"""
+    backend = CBackend({}, state or {}, assume_int=assume_int)
+    body, _ = backend.site(parse_nested_block(code, lang), lang, set())
+    return ' '.join(line.strip() for line in body)